@@ -13,32 +13,105 @@ Factory Machine Monitor
 4. Open HTML report in browser
 """
 
+import time
+_T_START = time.perf_counter()      # профіль холодного старту (--profile-startup)
 import os
 import html as _html
-import time
-import sqlite3
-import csv
 import sys
 import json
-import subprocess
-import urllib.request
-import urllib.parse
+import base64
+import hashlib
+import array
+import threading
+import queue
+import atexit
 from datetime import datetime, timedelta
 from collections import defaultdict
+from bisect import bisect_left
+from itertools import accumulate
 from functools import lru_cache
+# sqlite3, urllib.request, gzip, pickle, concurrent.futures імпортуються у функціях, що їх
+# використовують: шлях від старту до першого запиту до WebAPI за них не платить
+
+_STARTUP = [("start", _T_START), ("imports", time.perf_counter())]
+
+def _startup_mark(step: str) -> None:
+    """Точка профілю холодного старту: крок step закінчився зараз."""
+    _STARTUP.append((step, time.perf_counter()))
+
+def startup_profile() -> str:
+    """'imports 12 ms, secrets 0.4 ms, …; total 38 ms' — кроки від початку імпорту модуля."""
+    steps = ", ".join(f"{name} {(t - t0) * 1000:.1f} ms"
+                      for (name, t), (_, t0) in zip(_STARTUP[1:], _STARTUP))
+    return f"{steps}; total {(_STARTUP[-1][1] - _T_START) * 1000:.1f} ms"
 
 # Selenium видалено — використовується Connect Plan WebAPI
 
 # ── Configuration ─────────────────────────────────────────────────────────────
-DOWNLOAD_DIR        = r"C:\Connectplan_raports"
+# FACTORY_MONITOR_DIR / FACTORY_MONITOR_API_BASE — перевизначення для локального прогону
+# (напр. проти stub-api), щоб не чіпати робочу папку і сервер Connect Plan
+DOWNLOAD_DIR        = os.environ.get("FACTORY_MONITOR_DIR") or r"C:\Connectplan_raports"
 OUTPUT_HTML         = os.path.join(DOWNLOAD_DIR, "index.html")
 DB_FILE             = os.path.join(DOWNLOAD_DIR, "history.db")
 LOG_FILE            = os.path.join(DOWNLOAD_DIR, "factory_monitor.log")
+# Логи: DEBUG — покрокові рядки перевірки алертів/норм по кожній програмі й простою;
+# INFO — звичайний прогін. LOG_JSON — файл у форматі JSON lines (консоль — завжди текст).
+# FACTORY_MONITOR_LOG_LEVEL / FACTORY_MONITOR_LOG_JSON=1 (або --log-level / --log-json) перевизначають.
+# Ротація factory_monitor.log → .1 … .LOG_BACKUPS: понад LOG_MAX_MB або з новою добою
+LOG_LEVEL           = os.environ.get("FACTORY_MONITOR_LOG_LEVEL", "INFO").upper()
+LOG_JSON            = os.environ.get("FACTORY_MONITOR_LOG_JSON") == "1"
+LOG_MAX_MB          = 10
+LOG_ROTATE_DAILY    = True
+LOG_BACKUPS         = 7
+# Один інстанс: factory_monitor.lock з PID і терміном лізу (без перебору процесів через wmic).
+# Власник продовжує ліз на кожному кроці main; новий запуск при живому лізі виходить,
+# прострочений ліз або мертвий PID — перехоплює
+LOCK_FILE           = os.path.join(DOWNLOAD_DIR, "factory_monitor.lock")
+LOCK_LEASE_SEC      = 900
+PROFILE_STARTUP     = False       # --profile-startup: лог кроків старту до першого запиту до WebAPI
+# Локальний read-only HTTP API над history.db (serve-api): JSON з ETag/If-None-Match і gzip.
+# Діапазон дат одного запиту — не більше API_SERVER_MAX_DAYS. Поза /api/ — сам звіт (index.html, static/)
+API_SERVER_HOST     = "0.0.0.0"
+API_SERVER_PORT     = 8720
+API_SERVER_POOL     = 4           # read-only з'єднань SQLite у пулі
+API_SERVER_MAX_DAYS = 366
+# Live-режим звіту: кожен прогін пише в live_events дельту відносно попереднього знімка
+# (нові сегменти таймлайну, закриті цикли, старт/кінець простою, ефективність), serve-api
+# віддає її як SSE на /api/live, сторінка застосовує без перезавантаження.
+# LIVE_API_URL — адреса serve-api, як її бачить браузер (порожньо — сторінка без live-режиму;
+# сторінка з https:// не під'єднається до http:// — потрібен https або локальний index.html)
+LIVE_EVENTS         = True
+LIVE_EVENTS_KEEP    = 500         # скільки останніх дельт тримати в live_events
+LIVE_API_URL        = os.environ.get("FACTORY_MONITOR_LIVE_URL", "").rstrip("/")
+LIVE_POLL_SEC       = 2           # як часто SSE-потік перевіряє нові дельти
+LIVE_HEARTBEAT_SEC  = 20
 HOURS_BACK          = 24
+# Look-back запас (хв) перед початком періоду: рядки попередньої доби лише "розігрівають"
+# машини станів, щоб цикл/простій, що тривав опівночі, мав справжній початок, а не 00:00.
+# Подія відноситься до кожної доби, з якою перетинається; hourly_stats — по перетину.
+# 0 — різати по 00:00, як раніше; максимум 1440
+ANALYSIS_LOOKBACK_MIN = 180
+# Кеш відповідей WebAPI для закритих діб — дані там уже не змінюються
+API_CACHE_DIR       = os.path.join(DOWNLOAD_DIR, "api_cache")
+API_CACHE_MAX_MB    = 256         # LRU: найдавніше використані файли видаляються понад цей розмір
+# Діапазон кешується, лише якщо EndDate старший за стільки хвилин: збирач Connect Plan дописує
+# останні рядки доби із запізненням, і вчорашня доба, запитана одразу після 00:00, ще неповна
+API_CACHE_GRACE_MIN = 120
+# Stale-while-revalidate: останній успішно проаналізований стан; якщо WebAPI не віддав дані
+# за API_FRESH_WAIT_SEC — звіт публікується зі знімка з банером "data as of", а фетч
+# повторюється у фоні з паузами API_RETRY_DELAYS (сек).
+# API_RETRY_BUDGET_SEC — стеля на всі спроби разом (з паузами й таймаутами запитів): що не
+# вклалось — лишається наступному запуску. Має бути менше інтервалу планувальника і LOCK_LEASE_SEC
+SNAPSHOT_FILE       = os.path.join(DOWNLOAD_DIR, "last_state.pickle")
+API_FRESH_WAIT_SEC  = 20
+API_RETRY_DELAYS    = (30, 60, 120, 300)
+API_RETRY_BUDGET_SEC = 240
 
 # ── Connect Plan WebAPI ───────────────────────────────────────────────────────
-API_BASE  = "http://192.168.1.210/FactoryMonitorSuiteSVC"
-# ProcResID → повна назва станку (з GetMachineList)
+_API_BASE_OVERRIDE = os.environ.get("FACTORY_MONITOR_API_BASE", "").rstrip("/")
+API_BASE  = _API_BASE_OVERRIDE or "http://192.168.1.210/FactoryMonitorSuiteSVC"
+# ProcResID → повна назва станку (з GetMachineList).
+# Вбудований список для дільниці за замовчуванням; machines.json (див. Machine registry) має пріоритет.
 PROC_RES_MAP = {
     1:  "M1_M560R-V-e_0712-100198",
     7:  "M2_M560R-V-e-M5V01235",
@@ -49,9 +122,61 @@ PROC_RES_MAP = {
 }
 ALERT_THRESHOLD_MIN = 45
 S2S_GAP_THRESHOLD_MIN = 15  # Макс. розрив між циклами для start-to-start (хв); якщо більше — цикл не розтягується
+GANTT_SESSION_GAP_MIN = 60  # Batch Gantt: цикли однієї програми з розривом ≤ N хв зливаються в один блок
+FRAGMENT_CACHE_VERSION = 1  # Підняти при зміні формату кешованих фрагментів звіту (fragment_cache)
+# Режим таймлайну станку: "svg" — <rect> на кожен сегмент (як раніше);
+# "canvas" — сегменти/маркери упаковані в base64 Int32/Uint8 масиви, малюються на одному canvas
+TIMELINE_MODE = "svg"
+# Ліниві картки станків: тіло (таймлайн, Activity Log, Target Cycle Time) іде в <template>
+# і вставляється, коли картка наближається до екрана (IntersectionObserver) або по кліку в
+# навігації; графіки Statistics будуються так само при першій появі. ?eager=1 — все одразу
+LAZY_MACHINE_CARDS = True
+# Статичні ресурси звіту: CSS, код сторінки і Chart.js — окремими файлами static/<назва>.<хеш>.<ext>
+# поруч з index.html. Файл пишеться/публікується лише коли змінився вміст (новий хеш — нова назва),
+# тож index.html несе тільки дані прогону, а браузер бере ресурси з кешу. serve-api віддає їх з
+# Cache-Control: immutable. Chart.js завантажується з CHARTJS_URL один раз; не вдалося — лишається CDN.
+# False — стилі й код inline в index.html, як раніше
+STATIC_ASSETS      = True
+STATIC_DIR         = os.path.join(DOWNLOAD_DIR, "static")
+CHARTJS_URL        = "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"
+# Поруч з index.html і static/* — стиснуті копії .gz і .br (brotli — якщо встановлено пакет brotli);
+# serve-api віддає їх за Accept-Encoding без стиснення на льоту
+REPORT_PRECOMPRESS = True
+# Бюджет розміру index.html (КБ без стиснення; 0 — без межі). Розклад по блоках (daily, hourly,
+# gantt, timeline, …) пишеться в лог кожного прогону. Понад бюджет: "warn" — лише ✗ у лозі;
+# "degrade" — вікно Batch Gantt звужується (GANTT_DAYS → 180 → 90 → 30 → 7 днів), поки не вкладеться;
+# "fail" — те саме, а якщо й 7 днів не вкладаються — звіт не пишеться і не публікується
+REPORT_BUDGET_KB   = 3072
+REPORT_BUDGET_MODE = "degrade"
+GANTT_DAYS         = 365
+# Period Trend: ряди ефективності рахуються тут (period_trend) — по днях за останні TREND_DAILY_DAYS,
+# по ISO-тижнях за TREND_WEEKLY_DAYS, по місяцях за всю історію. Графік бере найдрібніший ряд, що
+# покриває вибраний діапазон: 7d–90d — дні, 180d/1y — тижні, давніші довільні діапазони — місяці
+TREND_DAILY_DAYS   = 92
+TREND_WEEKLY_DAYS  = 372
+# Аналіз по станках (Step 3): 1 — серійно в основному процесі; N > 1 — ProcessPoolExecutor з N процесів
+# (кожен станок аналізується окремо, результати склеюються в порядку появи станків у даних)
+ANALYSIS_WORKERS = 1
+# Чекпоінт машин станів циклів/простоїв у history.db (stream_state): наступний запуск тієї ж
+# доби продовжує їх замість повторного проходу від 00:00; результат ідентичний пакетному.
+# Рядки доби з попереднього запуску лежать у STREAM_ROWS_FILE: з WebAPI тягнеться лише хвіст від
+# часу попереднього фетчу мінус STREAM_FETCH_OVERLAP_MIN, рядки в перекритті замінюються свіжими.
+# Запізнілі рядки (Date раніше чекпоінта) → станок переаналізовується пакетно від 00:00
+STREAM_ANALYSIS  = True
+STREAM_ROWS_FILE = os.path.join(DOWNLOAD_DIR, "today_rows.pickle")
+STREAM_FETCH_OVERLAP_MIN = 15
+BACKFILL_WORKERS = 3        # backfill: скільки діб тягнути з WebAPI одночасно
+# Самолікування історії: закриті робочі дні за GAP_SCAN_DAYS, де hourly_stats покриває
+# менше GAP_MIN_COVERAGE робочого вікна, перетягуються у фоні після основного запуску —
+# не більше GAP_HEAL_DAYS_PER_RUN діб за запуск і GAP_HEAL_MAX_ATTEMPTS спроб на добу
+GAP_SCAN_DAYS         = 14
+GAP_MIN_COVERAGE      = 0.9
+GAP_HEAL_DAYS_PER_RUN = 1
+GAP_HEAL_MAX_ATTEMPTS = 3
 
 # Повний список станків дільниці — використовується для графіків і розрахунку SITE
-# Станки без даних отримують ефективність 0 і відображаються на графіку
+# Станки без даних отримують ефективність 0 і відображаються на графіку.
+# Після завантаження реєстру станків перевизначається з machines.json ("chart": true).
 ALL_MACHINES = ["M1_M560R-V-e_0712-100198", "M2_M560R-V-e-M5V01235",
                 "T1_L300E-M_PEA351",        "T2_ L300-MYW-e_MYW197",
                 "T3_LB2000EXII_254633"]
@@ -69,6 +194,7 @@ def _load_secrets():
     except Exception:
         return {}
 _secrets         = _load_secrets()
+_startup_mark("secrets")
 TELEGRAM_TOKEN   = _secrets.get("telegram_token",   "")
 TELEGRAM_CHAT_ID = _secrets.get("telegram_chat_id", "")
 GITHUB_TOKEN     = _secrets.get("github_token",     "")
@@ -77,16 +203,308 @@ TARGET_TIME_FILE = r"\\wisefile\Wisefile\WF_Tootmine\Planeerimine\CNC toodete aj
 TARGET_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "target_times_cache.json")  # Кеш файл
 
 # ── Logging ───────────────────────────────────────────────────────────────────
-def log(message: str):
-    """Виводить повідомлення в консоль та зберігає у файл логів."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_line = f"[{timestamp}] {message}"
-    print(log_line)
+# log() лише ставить запис у чергу; консоль і файл пише фоновий потік log-writer
+# пачками (файл відкритий весь час). Перед виходом черга дописується (atexit → log_flush).
+# У дочірніх процесах (ProcessPoolExecutor, spawn/fork) свого потоку немає — рядок
+# дописується у файл напряму, ротацію робить лише основний процес.
+_LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+_log_queue  = queue.SimpleQueue()
+_log_lock   = threading.Lock()
+_log_writer = None
+_log_stats  = {"lines": 0, "bytes": 0, "call_sec": 0.0, "write_sec": 0.0, "rotations": 0}
+
+@lru_cache(maxsize=1)
+def _log_in_child() -> bool:
+    import multiprocessing
+    return multiprocessing.parent_process() is not None
+
+def _log_format(rec) -> tuple:
+    """Запис (datetime, level, message, thread) → (рядок консолі, рядок файлу)."""
+    ts, level, message, thread = rec
+    text = f"[{ts.strftime('%Y-%m-%d %H:%M:%S')}] " + (message if level == "INFO" else f"{level}: {message}")
+    if not LOG_JSON:
+        return text, text
+    return text, json.dumps({"ts": ts.isoformat(timespec="milliseconds"), "level": level,
+                             "msg": message, "thread": thread, "pid": os.getpid()}, ensure_ascii=False)
+
+def _log_rotate() -> None:
+    """factory_monitor.log → .1, .1 → .2 … (найстаріший понад LOG_BACKUPS видаляється)."""
+    for i in range(LOG_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{LOG_FILE}.{i}"):
+            os.replace(f"{LOG_FILE}.{i}", f"{LOG_FILE}.{i + 1}")
+    if LOG_BACKUPS > 0:
+        os.replace(LOG_FILE, f"{LOG_FILE}.1")
+    else:
+        os.remove(LOG_FILE)
+    _log_stats["rotations"] += 1
+
+def _log_writer_loop() -> None:
+    f, f_day, size = None, None, 0
+    while True:
+        batch = [_log_queue.get()]
+        try:
+            while len(batch) < 1000:
+                batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        t0 = time.perf_counter()
+        flushed = [it for it in batch if isinstance(it, threading.Event)]
+        recs    = [it for it in batch if not isinstance(it, threading.Event)]
+        if recs:
+            lines = [_log_format(rec) for rec in recs]
+            try:
+                sys.stdout.write("".join(text + "\n" for text, _ in lines))
+                sys.stdout.flush()
+            except Exception:
+                pass
+            data = "".join(line + "\n" for _, line in lines).encode("utf-8")
+            try:
+                today = recs[-1][0].date()
+                if f is None:
+                    try:
+                        st = os.stat(LOG_FILE)
+                        f_day, size = datetime.fromtimestamp(st.st_mtime).date(), st.st_size
+                    except FileNotFoundError:
+                        f_day, size = today, 0
+                if size and (size + len(data) > LOG_MAX_MB * 1024 * 1024
+                             or (LOG_ROTATE_DAILY and f_day != today)):
+                    if f is not None:
+                        f.close()
+                        f = None
+                    _log_rotate()
+                    size = 0
+                if f is None:
+                    f = open(LOG_FILE, "ab")
+                f_day = today
+                f.write(data)
+                f.flush()
+                size += len(data)
+            except Exception as e:
+                print(f"Failed to write log: {e}")
+                if f is not None:
+                    try:
+                        f.close()
+                    except Exception:
+                        pass
+                f = None
+            _log_stats["lines"] += len(recs)
+            _log_stats["bytes"] += len(data)
+        _log_stats["write_sec"] += time.perf_counter() - t0
+        for ev in flushed:
+            ev.set()
+
+def log_flush(timeout: float = 5.0) -> None:
+    """Чекає, поки log-writer запише все, що вже стоїть у черзі."""
+    if _log_writer is not None and _log_writer.is_alive():
+        done = threading.Event()
+        _log_queue.put(done)
+        done.wait(timeout)
+
+def log_stats() -> dict:
+    """Лічильники логування для профілю прогону (після log_flush — точні)."""
+    return dict(_log_stats)
+
+def log(message: str, level: str = None):
+    """Виводить повідомлення в консоль та зберігає у файл логів.
+
+    level — DEBUG / INFO / WARNING / ERROR; без нього рядок з "✗" — ERROR, з "⚠" — WARNING,
+    решта INFO. Записи нижче LOG_LEVEL відкидаються одразу.
+    """
+    global _log_writer
+    t0 = time.perf_counter()
+    message = str(message)
+    if level is None:
+        head = message.lstrip()[:1]
+        level = "ERROR" if head == "✗" else "WARNING" if head == "⚠" else "INFO"
+    if _LOG_LEVELS.get(level, 20) < _LOG_LEVELS.get(LOG_LEVEL, 20):
+        return
+    rec = (datetime.now(), level, message, threading.current_thread().name)
+    if _log_in_child():
+        text, line = _log_format(rec)
+        print(text)
+        try:
+            with open(LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"Failed to write log: {e}")
+    else:
+        if _log_writer is None:
+            with _log_lock:
+                if _log_writer is None:
+                    _log_writer = threading.Thread(target=_log_writer_loop, name="log-writer", daemon=True)
+                    _log_writer.start()
+                    atexit.register(log_flush)
+        _log_queue.put(rec)
+    _log_stats["call_sec"] += time.perf_counter() - t0
+
+# ── Machine registry ──────────────────────────────────────────────────────────
+# Станки та сервери Connect Plan задаються в machines.json (поруч з history.db):
+#   {"sites": [{"site": "main", "api_base": "http://192.168.1.210/FactoryMonitorSuiteSVC",
+#               "machines": [{"id": 1, "name": "M1_M560R-V-e_0712-100198", "short": "M1"},
+#                            {"id": 12, "name": "T4_LB3000EXII_247289", "chart": false}]}]}
+# short — код станку у звіті/Excel (за замовчуванням частина назви до "_"), має бути унікальним;
+# chart=false — дані збираються, але станок не входить в ALL_MACHINES (графіки, SITE).
+# Без файлу — одна дільниця DEFAULT_SITE з API_BASE / PROC_RES_MAP / ALL_MACHINES.
+# FACTORY_MONITOR_API_BASE перекриває api_base усіх дільниць.
+MACHINES_FILE = os.path.join(DOWNLOAD_DIR, "machines.json")
+DEFAULT_SITE  = "main"
+
+def _load_machine_config() -> list:
+    """Читає список дільниць з MACHINES_FILE або будує його з вбудованих констант."""
+    try:
+        with open(MACHINES_FILE, encoding="utf-8") as f:
+            sites = json.load(f).get("sites") or []
+        if sites:
+            return sites
+        log(f"⚠ {MACHINES_FILE}: no sites defined — using built-in machine list")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"⚠ Failed to load {MACHINES_FILE}: {e} — using built-in machine list")
+    return [{
+        "site":     DEFAULT_SITE,
+        "api_base": API_BASE,
+        "machines": [{"id": pid, "name": name, "chart": name in ALL_MACHINES}
+                     for pid, name in PROC_RES_MAP.items()],
+    }]
+
+def _build_machine_registry(sites: list) -> tuple:
+    """Індекси реєстру: (site, ProcResID) → запис, назва → запис, SHORT → запис.
+
+    Запис: {"id", "name", "short", "site"}. Повертає також список станків для
+    графіків і {site: api_base}.
+    """
+    by_id, by_name, by_short, chart, bases = {}, {}, {}, [], {}
+    for site in sites:
+        sname = str(site.get("site") or DEFAULT_SITE)
+        bases[sname] = (_API_BASE_OVERRIDE or site.get("api_base") or API_BASE).rstrip("/")
+        for m in site.get("machines", []):
+            name  = m["name"]
+            short = m.get("short") or (name.split("_")[0] if "_" in name else name)
+            entry = {"id": int(m["id"]), "name": name, "short": short, "site": sname}
+            by_id[(sname, entry["id"])] = entry
+            by_name[name] = entry
+            prev = by_short.get(short.upper())
+            if prev and prev["name"] != name:
+                log(f"⚠ Duplicate machine short code {short}: {prev['name']} / {name}")
+            else:
+                by_short[short.upper()] = entry
+            if m.get("chart", True):
+                chart.append(name)
+    return by_id, by_name, by_short, chart, bases
+
+SITES = _load_machine_config()
+_MACHINE_BY_ID, _MACHINE_BY_NAME, _MACHINE_BY_SHORT, ALL_MACHINES, SITE_API_BASE = \
+    _build_machine_registry(SITES)
+_startup_mark("machine registry")
+
+def _machine_short(name: str) -> str:
+    """Короткий код станку ("M1") — з реєстру або частина назви до "_"."""
+    entry = _MACHINE_BY_NAME.get(name)
+    if entry:
+        return entry["short"]
+    return name.split("_")[0] if "_" in name else name
+
+def _machine_site(name: str) -> str:
+    entry = _MACHINE_BY_NAME.get(name)
+    return entry["site"] if entry else DEFAULT_SITE
+
+# ── Work calendar ─────────────────────────────────────────────────────────────
+# Планові зміни по днях тижня + свята. Зміна "06:30-24:30" переходить за північ:
+# хвіст 00:00–00:30 рахується в робоче вікно наступної календарної доби.
+# День без змін (вихідний, свято) — вікно за активністю: від першого до останнього
+# RunState=1 (analyze_downtime). work_calendar.json (поруч з history.db) у тому ж
+# форматі перекриває вбудований WORK_CALENDAR — зміну графіка можна внести без правки коду.
+WORK_CALENDAR_FILE = os.path.join(DOWNLOAD_DIR, "work_calendar.json")
+WORK_CALENDAR = {
+    "weekly": {"mon": ["07:00-19:00"], "tue": ["06:30-24:30"], "wed": ["06:30-24:30"],
+               "thu": ["06:30-24:30"], "fri": ["07:00-19:00"], "sat": [], "sun": []},
+    "holidays": [],          # ["2026-12-24", ...]
+}
+_WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def _parse_shift(spec: str) -> tuple:
+    """'06:30-24:30' → (390, 1470) — хвилини від 00:00 дня початку зміни."""
+    a, b = (int(t.split(":")[0]) * 60 + int(t.split(":")[1]) for t in spec.split("-"))
+    return (a, b + 1440) if b <= a else (a, b)   # "22:00-06:00" — нічна зміна
+
+def _load_work_calendar() -> tuple:
+    """(weekly — 7 кортежів змін (start_min, end_min) з пн, holidays — frozenset дат)."""
+    cal = WORK_CALENDAR
+    try:
+        with open(WORK_CALENDAR_FILE, encoding="utf-8") as f:
+            cal = json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"⚠ Failed to load {WORK_CALENDAR_FILE}: {e} — using built-in work calendar")
     try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(log_line + "\n")
+        weekly_cfg = cal.get("weekly") or WORK_CALENDAR["weekly"]
+        weekly = tuple(tuple(sorted(_parse_shift(x) for x in weekly_cfg.get(d, []))) for d in _WEEKDAYS)
+        return weekly, frozenset(cal.get("holidays", []))
     except Exception as e:
-        print(f"Failed to write log: {e}")
+        log(f"⚠ Invalid work calendar: {e} — using built-in")
+        return tuple(tuple(sorted(_parse_shift(x) for x in WORK_CALENDAR["weekly"][d]))
+                     for d in _WEEKDAYS), frozenset()
+
+WORK_WEEKLY, WORK_HOLIDAYS = _load_work_calendar()
+_startup_mark("work calendar")
+
+@lru_cache(maxsize=1024)
+def shift_intervals(date_str: str) -> tuple:
+    """Зміни, що починаються в date_str: ((start_dt, end_dt), ...); свято → ()."""
+    if date_str in WORK_HOLIDAYS:
+        return ()
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    return tuple((day + timedelta(minutes=a), day + timedelta(minutes=b))
+                 for a, b in WORK_WEEKLY[day.weekday()])
+
+@lru_cache(maxsize=1024)
+def work_intervals(date_str: str) -> tuple:
+    """Робочі інтервали всередині календарної доби [00:00, 24:00):
+    власні зміни + хвости змін попередньої доби, відсортовані."""
+    day0 = datetime.strptime(date_str, "%Y-%m-%d")
+    day1 = day0 + timedelta(days=1)
+    prev = (day0 - timedelta(days=1)).strftime("%Y-%m-%d")
+    out = []
+    for a, b in shift_intervals(prev) + shift_intervals(date_str):
+        a, b = max(a, day0), min(b, day1)
+        if b > a:
+            out.append((a, b))
+    return tuple(sorted(out))
+
+def efficiency_windows(mrows, ts_list=None) -> list:
+    """Інтервали [a, b) для ефективності одного станку (mrows відсортовані за часом).
+
+    Робочі інтервали всіх діб, що є в рядках, плюс для діб без змін — від першого
+    до останнього RunState=1 на таких добах (включно). Перетини злиті.
+    """
+    if not mrows:
+        return []
+    ts_list = ts_list or [r["_ts"] for r in mrows]
+    windows, act_first, act_last = [], None, None
+    day = datetime.combine(ts_list[0].date(), datetime.min.time())
+    while day <= ts_list[-1]:
+        d_str = day.strftime("%Y-%m-%d")
+        windows.extend(work_intervals(d_str))
+        nxt = day + timedelta(days=1)
+        if not shift_intervals(d_str):
+            i, j = bisect_left(ts_list, day), bisect_left(ts_list, nxt)
+            first = next((k for k in range(i, j) if mrows[k]["RunState"] == "1"), None)
+            if first is not None:
+                last = next(k for k in range(j - 1, first - 1, -1) if mrows[k]["RunState"] == "1")
+                act_first = act_first or ts_list[first]
+                act_last  = ts_list[last]
+        day = nxt
+    if act_first:
+        windows.append((act_first, act_last + timedelta(microseconds=1)))
+    merged = []
+    for a, b in sorted(windows):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
 
 # ── Excel Target Time ─────────────────────────────────────────────────────────
 @lru_cache(maxsize=512)
@@ -435,82 +853,186 @@ def _parse_ts(s: str) -> datetime:
     return datetime.strptime(s, "%Y.%m.%d %H:%M:%S")
 
 def _canonical_machine(name: str) -> str:
-    """Повертає канонічну назву станку за першими двома символами.
-    Приклад: "M1_..." → "M1_M560R-V-e_0712-100198" (з ALL_MACHINES).
-    Якщо не знайдено в ALL_MACHINES — повертає оригінал.
+    """Повертає канонічну назву станку з реєстру за назвою або коротким кодом.
+    Приклад: "M1_..." → "M1_M560R-V-e_0712-100198".
+    Якщо не знайдено в реєстрі — повертає оригінал.
     """
-    if not name:
+    if not name or name in _MACHINE_BY_NAME:
         return name
-    prefix = name[:2].upper()
-    for canonical in ALL_MACHINES:
-        if canonical[:2].upper() == prefix:
-            return canonical
-    return name
+    entry = _MACHINE_BY_SHORT.get((name.split("_")[0] if "_" in name else name).upper())
+    return entry["name"] if entry else name
+
+@lru_cache(maxsize=1)
+def _numpy():
+    """numpy, якщо встановлений (опційна залежність, як openpyxl), інакше None."""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+def bucket_intervals(starts, ends, bucket_sec: int = 3600) -> dict:
+    """Розкладає інтервали [start, end) по відрах bucket_sec.
+
+    starts/ends — секунди від спільного початку відліку (напр. 00:00 доби, wall-clock,
+    як naive datetime). Повертає {індекс відра: секунд} лише для відер з перекриттям > 0;
+    індекс від'ємний для часу до початку відліку. З numpy — без циклу Python:
+    інтервали розгортаються по відрах (repeat), обрізаються по межах і сумуються bincount.
+    """
+    np = _numpy()
+    if np is not None:
+        s = np.asarray(starts, dtype=np.float64)
+        e = np.asarray(ends, dtype=np.float64)
+        keep = e > s
+        s, e = s[keep], e[keep]
+        if not s.size:
+            return {}
+        b0 = np.floor(s / bucket_sec).astype(np.int64)
+        n  = np.ceil(e / bucket_sec).astype(np.int64) - b0
+        rep = np.repeat(np.arange(s.size), n)
+        b   = b0[rep] + np.arange(rep.size) - np.repeat(np.cumsum(n) - n, n)
+        w   = np.minimum(e[rep], (b + 1) * bucket_sec) - np.maximum(s[rep], b * bucket_sec)
+        pos = w > 0
+        base = int(b.min())
+        sums = np.bincount(b - base, weights=np.where(pos, w, 0.0))
+        hits = np.bincount(b - base, weights=pos.astype(np.float64))
+        return {int(i) + base: float(sums[i]) for i in np.nonzero(hits)[0]}
+
+    out = {}
+    for s, e in zip(starts, ends):
+        b = int(s // bucket_sec)
+        while s < e:
+            edge = (b + 1) * bucket_sec
+            seg  = min(e, edge) - s
+            if seg > 0:
+                out[b] = out.get(b, 0.0) + seg
+            s, b = edge, b + 1
+    return out
 
 def _work_window_min(date_str: str) -> int:
-    """Повертає кількість робочих хвилин для дня тижня.
-    пн/пт: 07:00–19:00 = 720 хв; вт-чт: 06:30–00:30 = 1080 хв; сб/нд: 0.
+    """Планові робочі хвилини змін, що починаються в date_str (з робочого календаря).
+    пн/пт: 07:00–19:00 = 720 хв; вт-чт: 06:30–00:30 = 1080 хв; сб/нд/свята: 0.
     """
     try:
-        wd = datetime.strptime(date_str, "%Y-%m-%d").weekday()
-        if wd in (0, 4): return 720
-        if wd in (1, 2, 3): return 1080
+        return int(sum((b - a).total_seconds() for a, b in shift_intervals(date_str)) // 60)
     except Exception:
-        pass
-    return 0
+        return 0
 
 # =============================================================================
 # PART 1 — DOWNLOAD
 # =============================================================================
 
-def _api_get(endpoint: str, params: dict) -> list:
-    """Виконує GET запит до Connect Plan WebAPI, повертає data[]."""
-    qs = urllib.parse.urlencode(params)
-    url = f"{API_BASE}/{endpoint}?{qs}"
-    try:
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=15) as r:
-            body = json.loads(r.read().decode("utf-8"))
-        code = body.get("d", {}).get("code", -1)
-        if str(code) != "0":
-            log(f"✗ API error {code}: {body.get('d', {}).get('message')}")
+def _api_get(endpoint: str, params: dict, base: str = None) -> list:
+    """Виконує GET запит до Connect Plan WebAPI (base — сервер дільниці), повертає data[].
+
+    Посторінкова відповідь (d.next — зсув наступної сторінки) дотягується до кінця;
+    помилка на будь-якій сторінці → [].
+    """
+    import urllib.request
+    import urllib.parse
+    data, params = [], dict(params)
+    while True:
+        qs = urllib.parse.urlencode(params)
+        url = f"{base or API_BASE}/{endpoint}?{qs}"
+        try:
+            req = urllib.request.Request(url)
+            if PROFILE_STARTUP and not any(n == "first API request" for n, _t in _STARTUP):
+                _startup_mark("first API request")
+                log(f"Startup profile: {startup_profile()}")
+            with urllib.request.urlopen(req, timeout=15) as r:
+                body = json.loads(r.read().decode("utf-8"))
+            code = body.get("d", {}).get("code", -1)
+            if str(code) != "0":
+                log(f"✗ API error {code}: {body.get('d', {}).get('message')}")
+                return []
+            data.extend(body["d"]["data"])
+            nxt = body["d"].get("next")
+        except Exception as e:
+            log(f"✗ API request failed ({endpoint}): {e}")
             return []
-        return body["d"]["data"]
+        if nxt in (None, ""):
+            return data
+        params["Offset"] = nxt
+
+
+def _api_cache_path(endpoint: str, params: dict, base: str) -> str:
+    """Шлях у кеші: ключ — (сервер, endpoint, набір ProcResID, StartDate, EndDate)."""
+    ids = ",".join(sorted(str(params.get("ID", "")).split(","), key=lambda x: (len(x), x)))
+    key = json.dumps([base, endpoint, params.get("Specify"), ids,
+                      params.get("StartDate"), params.get("EndDate"), params.get("Sort")])
+    return os.path.join(API_CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json.gz")
+
+
+def _api_cache_trim() -> None:
+    """Тримає API_CACHE_DIR в межах API_CACHE_MAX_MB, видаляючи файли з найстарішим mtime."""
+    try:
+        files = [e for e in os.scandir(API_CACHE_DIR) if e.name.endswith(".json.gz")]
+        stats = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in files))
+        total = sum(sz for _, sz, _ in stats)
+        limit = API_CACHE_MAX_MB * 1024 * 1024
+        for _, sz, path in stats:
+            if total <= limit:
+                break
+            os.remove(path)
+            total -= sz
     except Exception as e:
-        log(f"✗ API request failed ({endpoint}): {e}")
-        return []
+        log(f"api_cache trim error: {e}")
 
 
-def _api_ts(s: str) -> datetime:
-    """Парсить дату з WebAPI формату '2026.04.18 21:54:44'."""
-    return datetime.strptime(s, "%Y.%m.%d %H:%M:%S")
+def _api_get_cached(endpoint: str, params: dict, base: str = None, use_cache: bool = True) -> list:
+    """_api_get з дисковим кешем для діапазонів, що закінчились понад API_CACHE_GRACE_MIN тому.
 
+    Кешуються лише непорожні відповіді (_api_get повертає [] і на помилку).
+    Читання оновлює mtime файлу — це і є "використання" для LRU.
+    use_cache=False — кеш не читається, свіжа відповідь його перезаписує: доба, закешована
+    ще неповною (напр. вчорашня одразу після півночі), так виправляється (heal, backfill --force).
+    """
+    import gzip
+    base = base or API_BASE
+    try:
+        end_dt = datetime.strptime(params["EndDate"], "%Y/%m/%d %H:%M:%S")
+    except Exception:
+        end_dt = None
+    if end_dt is None or datetime.now() - end_dt < timedelta(minutes=API_CACHE_GRACE_MIN):
+        return _api_get(endpoint, params, base)
 
-def _fetch_range_from_api(start_dt: datetime, end_dt: datetime) -> tuple[list[dict], list[dict]]:
-    """Загальний фетч даних з WebAPI за довільний діапазон [start_dt, end_dt]."""
-    log("============================================================")
-    log("FETCHING DATA FROM CONNECT PLAN WebAPI")
-    log("============================================================")
+    path = _api_cache_path(endpoint, params, base)
+    try:
+        if use_cache:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+            log(f"  api_cache hit: {endpoint} {params.get('StartDate')} … {params.get('EndDate')}")
+            return data
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"api_cache read error ({os.path.basename(path)}): {e}")
 
-    ids = ",".join(str(i) for i in PROC_RES_MAP.keys())
-    start_s = start_dt.strftime("%Y/%m/%d %H:%M:%S")
-    end_s   = end_dt.strftime("%Y/%m/%d %H:%M:%S")
+    data = _api_get(endpoint, params, base)
+    if data:
+        try:
+            os.makedirs(API_CACHE_DIR, exist_ok=True)
+            tmp = path + ".tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, path)
+            _api_cache_trim()
+        except Exception as e:
+            log(f"api_cache write error: {e}")
+    return data
 
-    # ── 1. GetOperationResult → rows ─────────────────────────────────
-    log(f"── Fetching OperationResult {start_s} … {end_s} ──")
-    raw = _api_get("v3/GetOperationResult", {
-        "Specify":   "PROCRES",
-        "ID":        ids,
-        "StartDate": start_s,
-        "EndDate":   end_s,
-        "Sort":      0,
-    })
-    log(f"  Received {len(raw)} records")
 
+def _api_ts(s: str) -> datetime:
+    """Парсить дату з WebAPI формату '2026.04.18 21:54:44'."""
+    return datetime.strptime(s, "%Y.%m.%d %H:%M:%S")
+
+
+def _parse_operation_records(raw: list, site: str, mname_of) -> list[dict]:
+    """GetOperationResult data[] → рядки для аналізу (mname_of: ProcResID → назва станку)."""
     rows = []
     for r in raw:
-        pid = r.get("ProcResID")
-        mname = PROC_RES_MAP.get(pid, f"UNKNOWN_{pid}")
+        mname = mname_of(r.get("ProcResID"))
         try:
             ts = _api_ts(r["Date"])
         except Exception:
@@ -518,6 +1040,7 @@ def _fetch_range_from_api(start_dt: datetime, end_dt: datetime) -> tuple[list[di
         rows.append({
             "_ts":              ts,
             "Date":             r["Date"],
+            "Site":             site,
             "MachineName":      mname,
             "RunState":         str(r.get("RunState", "0")),
             "ProgramFileName":  r.get("MainProgramFileName") or r.get("ProgramFileName") or "",
@@ -534,24 +1057,15 @@ def _fetch_range_from_api(start_dt: datetime, end_dt: datetime) -> tuple[list[di
             "Wait":             str(r.get("Wait", "0")),
             "Maintenance":      str(r.get("Maintenance", "0")),
         })
+        rows[-1]["_mask"] = _state_mask(rows[-1])
+    return rows
 
-    log(f"  Parsed {len(rows)} rows for analysis")
-
-    # ── 2. GetMachiningResult → mr_data ──────────────────────────────
-    log(f"── Fetching MachiningResult ──")
-    raw_mr = _api_get("v3/GetMachiningResult", {
-        "Specify":   "PROCRES",
-        "ID":        ids,
-        "StartDate": start_s,
-        "EndDate":   end_s,
-        "Sort":      0,
-    })
-    log(f"  Received {len(raw_mr)} machining records")
 
+def _parse_machining_records(raw: list, site: str, mname_of) -> list[dict]:
+    """GetMachiningResult data[] → mr_data (лічильник циклів)."""
     mr_data = []
-    for r in raw_mr:
-        pid = r.get("ProcResID")
-        mname = PROC_RES_MAP.get(pid, f"UNKNOWN_{pid}")
+    for r in raw:
+        mname = mname_of(r.get("ProcResID"))
         try:
             ts = _api_ts(r["Date"])
         except Exception:
@@ -559,31 +1073,145 @@ def _fetch_range_from_api(start_dt: datetime, end_dt: datetime) -> tuple[list[di
         mr_data.append({
             "_ts":             ts,
             "Date":            r.get("Date", ""),
+            "Site":            site,
             "MachineName":     mname,
             "ProgramFileName": r.get("MainProgramFileName") or r.get("ProgramFileName") or "",
             "RunStateTime":    str(r.get("RunStateTime", 0)),
             "Counter":         str(r.get("WorkCountACount") or r.get("Counter") or 0),
         })
+    return mr_data
+
+
+_API_ENDPOINTS = ("v3/GetOperationResult", "v3/GetMachiningResult")
+
+def _site_query(site: str, start_s: str, end_s: str) -> dict:
+    """Параметри запиту дільниці за діапазон — вони ж ключ api_cache."""
+    return {
+        "Specify":   "PROCRES",
+        "ID":        ",".join(str(pid) for (s, pid) in _MACHINE_BY_ID if s == site),
+        "StartDate": start_s,
+        "EndDate":   end_s,
+        "Sort":      0,
+    }
+
+
+def api_cache_drop(start_dt: datetime, end_dt: datetime) -> int:
+    """Видаляє з api_cache відповіді всіх дільниць за [start_dt, end_dt]. Повертає к-сть файлів."""
+    start_s = start_dt.strftime("%Y/%m/%d %H:%M:%S")
+    end_s   = end_dt.strftime("%Y/%m/%d %H:%M:%S")
+    n = 0
+    for site, base in SITE_API_BASE.items():
+        for endpoint in _API_ENDPOINTS:
+            try:
+                os.remove(_api_cache_path(endpoint, _site_query(site, start_s, end_s), base))
+                n += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log(f"api_cache drop error: {e}")
+    return n
+
+
+def _fetch_site_range(site: str, start_s: str, end_s: str,
+                      use_cache: bool = True) -> tuple[list[dict], list[dict]]:
+    """Фетч однієї дільниці (одного сервера Connect Plan) за діапазон."""
+    base = SITE_API_BASE[site]
+    tag = f"[{site}] " if len(SITE_API_BASE) > 1 else ""
+
+    def _mname(pid):
+        entry = _MACHINE_BY_ID.get((site, pid))
+        if entry:
+            return entry["name"]
+        return f"UNKNOWN_{pid}" if site == DEFAULT_SITE else f"UNKNOWN_{site}_{pid}"
+
+    # ── 1. GetOperationResult → rows ─────────────────────────────────
+    log(f"── {tag}Fetching OperationResult {start_s} … {end_s} ──")
+    raw = _api_get_cached("v3/GetOperationResult", _site_query(site, start_s, end_s), base, use_cache)
+    log(f"  {tag}Received {len(raw)} records")
+
+    rows = _parse_operation_records(raw, site, _mname)
+    log(f"  {tag}Parsed {len(rows)} rows for analysis")
+
+    # ── 2. GetMachiningResult → mr_data ──────────────────────────────
+    log(f"── {tag}Fetching MachiningResult ──")
+    raw_mr = _api_get_cached("v3/GetMachiningResult", _site_query(site, start_s, end_s), base, use_cache)
+    log(f"  {tag}Received {len(raw_mr)} machining records")
+
+    mr_data = _parse_machining_records(raw_mr, site, _mname)
+    log(f"  {tag}Parsed {len(mr_data)} machining records")
+    return rows, mr_data
+
+
+def _fetch_range_from_api(start_dt: datetime, end_dt: datetime,
+                          use_cache: bool = True) -> tuple[list[dict], list[dict]]:
+    """Загальний фетч даних з WebAPI за довільний діапазон [start_dt, end_dt].
+
+    Дільниці (сервери Connect Plan з реєстру) опитуються паралельно;
+    результати склеюються в порядку SITES, тож вихід детермінований.
+    use_cache=False — повз api_cache (див. _api_get_cached).
+    """
+    log("============================================================")
+    log("FETCHING DATA FROM CONNECT PLAN WebAPI")
+    log("============================================================")
+
+    start_s = start_dt.strftime("%Y/%m/%d %H:%M:%S")
+    end_s   = end_dt.strftime("%Y/%m/%d %H:%M:%S")
+
+    sites = list(SITE_API_BASE)
+    if len(sites) == 1:
+        results = [_fetch_site_range(sites[0], start_s, end_s, use_cache)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(sites)) as pool:
+            results = list(pool.map(lambda s: _fetch_site_range(s, start_s, end_s, use_cache), sites))
+
+    rows, mr_data = [], []
+    for site_rows, site_mr in results:
+        rows.extend(site_rows)
+        mr_data.extend(site_mr)
 
-    log(f"  Parsed {len(mr_data)} machining records")
     log("============================================================")
     log("FETCH COMPLETE")
     log("============================================================")
     return rows, mr_data
 
 
-def fetch_from_api() -> tuple[list[dict], list[dict]]:
-    """Тягне дані сьогоднішньої доби — з 00:00 до now.
+def fetch_from_api(since: datetime = None) -> tuple[list[dict], list[dict]]:
+    """Тягне дані сьогоднішньої доби — з 00:00 (або з since, див. merge_day_rows) до now.
 
     operation_history → GetOperationResult  (всі події RunState/Alarm/тощо)
     machining_results → GetMachiningResult  (цикли з Counter)
     """
     now = datetime.now()
-    start_dt = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_dt = since or now.replace(hour=0, minute=0, second=0, microsecond=0)
     return _fetch_range_from_api(start_dt, now)
 
 
-def finalize_yesterday(conn) -> None:
+def fetch_lookback(period_from: datetime, rows=(), mr_data=()) -> tuple[list[dict], list[dict]]:
+    """Рядки і machining records look-back запасу [period_from − ANALYSIS_LOOKBACK_MIN, period_from).
+
+    Частина до 00:00 береться з відповіді WebAPI за всю попередню добу: доба закрита,
+    тож після першого запиту вона віддається з api_cache (той самий ключ, що у
+    finalize_yesterday / backfill) і з сервера повторно не тягнеться.
+    Частина після 00:00 (HOURS_BACK < 24) — з уже завантажених rows / mr_data.
+    """
+    margin = min(max(ANALYSIS_LOOKBACK_MIN, 0), 1440)
+    if not margin:
+        return [], []
+    lb_from  = period_from - timedelta(minutes=margin)
+    midnight = period_from.replace(hour=0, minute=0, second=0, microsecond=0)
+    pre    = [r for r in rows if lb_from <= r["_ts"] < period_from]
+    pre_mr = [r for r in mr_data if r.get("_ts") and lb_from <= r["_ts"] < period_from]
+    if lb_from < midnight:
+        prev_rows, prev_mr = _fetch_range_from_api(midnight - timedelta(days=1), midnight)
+        pre    = [r for r in prev_rows if r["_ts"] >= lb_from] + pre
+        pre_mr = [r for r in prev_mr if r.get("_ts") and r["_ts"] >= lb_from] + pre_mr
+    log(f"Look-back {lb_from.strftime('%d.%m %H:%M')} – {period_from.strftime('%d.%m %H:%M')}: "
+        f"{len(pre)} rows, {len(pre_mr)} machining records")
+    return pre, pre_mr
+
+
+def finalize_yesterday(conn, next_rows=()) -> None:
     """Добиває вчорашні hourly_stats: останній годинний інтервал 23:00-00:00.
 
     Основний фетч обмежений сьогоднішньою північчю, тому остання година
@@ -591,6 +1219,8 @@ def finalize_yesterday(conn) -> None:
     тій добі стався до 23:00 (звичайна ситуація для cron). Без цього на
     графіку Hourly Efficiency точка "00:00" завжди показує 0%.
     Виклик ідемпотентний: save_to_db DELETE/INSERT перезаписує всю добу.
+    next_rows — вже завантажені рядки сьогоднішньої доби: ними добігають цикли і
+    простої, що тривали опівночі (analyze_day).
     """
     yest_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
     row = conn.execute(
@@ -607,14 +1237,234 @@ def finalize_yesterday(conn) -> None:
     if not rows:
         log(f"  No data for {yest_str}")
         return
-    cycles    = analyze_cycles(rows)
-    downtimes = analyze_downtime(rows)
-    save_to_db(conn, yest_str, cycles, downtimes)
+    try:
+        pre, _pre_mr = fetch_lookback(yest_start)
+    except Exception as e:
+        log(f"  Look-back unavailable ({e}) — cycles/downtimes cut at 00:00")
+        pre = []
+    _save_day(conn, yest_str, rows, pre, _lookahead(next_rows, yest_end))
     log(f"  Yesterday {yest_str} hourly_stats saved")
 
 
+def _lookahead(rows, day_end: datetime) -> list:
+    """Рядки після кінця доби в межах ANALYSIS_LOOKBACK_MIN — для analyze_day(post_rows)."""
+    until = day_end + timedelta(minutes=min(max(ANALYSIS_LOOKBACK_MIN, 0), 1440))
+    return [r for r in rows if day_end <= r["_ts"] < until]
+
+
+def _save_day(conn, day_str: str, rows: list, pre_rows=(), post_rows=()) -> None:
+    """Аналіз закритої доби і перезапис її в history.db (як finalize_yesterday).
+    pre_rows / post_rows — запаси з сусідніх діб (analyze_day)."""
+    day0 = datetime.strptime(day_str, "%Y-%m-%d")
+    cycles, downtimes = analyze_day(rows, day0, day0 + timedelta(days=1), pre_rows, post_rows)
+    save_to_db(conn, day_str, cycles, downtimes)
+    save_state_raster(conn, day_str, rows)
+
+
+def backfill(date_from: str, date_to: str, workers: int = None, force: bool = False) -> None:
+    """Перераховує history.db за діапазон днів [date_from, date_to] (YYYY-MM-DD).
+
+    Доби тягнуться з WebAPI паралельно (не більше workers одночасно), аналіз і
+    save_to_db — послідовно в основному потоці, в порядку дат. Кожна збережена доба
+    фіксується в backfill_progress, тож перерваний запуск продовжується з місця
+    зупинки (force=True — перерахувати все). Сьогоднішня доба пропускається —
+    її веде основний запуск.
+    """
+    workers = max(1, workers or BACKFILL_WORKERS)
+    d_from = datetime.strptime(date_from, "%Y-%m-%d")
+    d_to   = datetime.strptime(date_to, "%Y-%m-%d")
+    today  = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if d_to >= today:
+        d_to = today - timedelta(days=1)
+        log(f"Backfill: range clipped to {d_to.strftime('%Y-%m-%d')} (today is handled by the live run)")
+
+    conn = init_db()
+    done = set() if force else {
+        d for (d,) in conn.execute("SELECT date FROM backfill_progress WHERE status='done'")}
+    days = []
+    d = d_from
+    while d <= d_to:
+        if d.strftime("%Y-%m-%d") not in done:
+            days.append(d)
+        d += timedelta(days=1)
+    n_total = (d_to - d_from).days + 1
+    log("=" * 60)
+    log(f"BACKFILL {date_from} … {d_to.strftime('%Y-%m-%d')}: {len(days)} of {max(n_total, 0)} day(s) to do, "
+        f"{workers} concurrent fetch(es)")
+    log("=" * 60)
+    if not days:
+        conn.close()
+        return
+
+    def _fetch_day(day):
+        return _fetch_range_from_api(day, day + timedelta(days=1), use_cache=not force)
+
+    t0 = time.perf_counter()
+    saved = empty = 0
+    prev_day, prev_rows = None, []
+    # Ковзне вікно: в польоті не більше workers діб, результати обробляються в порядку дат.
+    # Запаси через північ — з сусідніх діб цього ж прогону (попередня вже в пам'яті,
+    # наступна вже в польоті); для першої доби look-back — з попередньої доби (api_cache).
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [(day, pool.submit(_fetch_day, day)) for day in days[:workers]]
+        next_i  = len(pending)
+        while pending:
+            day, fut = pending.pop(0)
+            if next_i < len(days):
+                pending.append((days[next_i], pool.submit(_fetch_day, days[next_i])))
+                next_i += 1
+            day_str = day.strftime("%Y-%m-%d")
+            try:
+                rows, _mr = fut.result()
+                if rows:
+                    if prev_day == day - timedelta(days=1):
+                        pre = [r for r in prev_rows
+                               if r["_ts"] >= day - timedelta(minutes=ANALYSIS_LOOKBACK_MIN)]
+                    else:
+                        pre, _pre_mr = fetch_lookback(day)
+                    post = []
+                    if pending and pending[0][0] == day + timedelta(days=1):
+                        try:
+                            post = _lookahead(pending[0][1].result()[0], day + timedelta(days=1))
+                        except Exception:
+                            pass   # помилку наступної доби залогує її власна ітерація
+                    _save_day(conn, day_str, rows, pre, post)
+                    saved += 1
+                else:
+                    empty += 1
+                prev_day, prev_rows = day, rows
+                # empty не вважається виконаним — при наступному запуску доба запитується знову
+                conn.execute(
+                    "INSERT OR REPLACE INTO backfill_progress (date,status,rows,updated_at) VALUES (?,?,?,?)",
+                    (day_str, "done" if rows else "empty", len(rows),
+                     datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+            except Exception as e:
+                log(f"✗ Backfill {day_str} failed: {e}")
+                continue
+            elapsed = time.perf_counter() - t0
+            n_done  = saved + empty
+            log(f"Backfill [{n_done}/{len(days)}] {day_str}: {len(rows)} rows — "
+                f"{n_done / elapsed * 60:.1f} days/min")
+
+    elapsed = time.perf_counter() - t0
+    log("=" * 60)
+    log(f"BACKFILL COMPLETE: {saved} day(s) saved, {empty} without data, "
+        f"{elapsed:.0f} s ({(saved + empty) / elapsed * 60 if elapsed else 0:.1f} days/min)")
+    log("=" * 60)
+    conn.close()
+
+
+def _window_minutes_by_hour(date_str: str) -> dict:
+    """{hour: хвилин робочого вікна в цій годині доби} — з інтервалів робочого календаря."""
+    day0 = datetime.strptime(date_str, "%Y-%m-%d")
+    ivs  = work_intervals(date_str)
+    buckets = bucket_intervals([(a - day0).total_seconds() for a, _ in ivs],
+                               [(b - day0).total_seconds() for _, b in ivs])
+    return {h: sec / 60 for h, sec in sorted(buckets.items())}
+
+
+def find_history_gaps(conn, days: int = GAP_SCAN_DAYS) -> list:
+    """Шукає закриті робочі дні з неповним hourly_stats.
+
+    Покриття доби — найкраще серед станків Σ min(total_min[h], вікно[h]) по годинах
+    робочого вікна (_work_window_min ≠ 0). Якщо воно < GAP_MIN_COVERAGE вікна —
+    доба є пропуском; missing_hours — години вікна, не покриті жодним станком.
+    Дні до першого запису в історії не скануються.
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = (today - timedelta(days=days)).strftime("%Y-%m-%d")
+    first = conn.execute("SELECT MIN(date) FROM daily_summary").fetchone()[0]
+    if not first:
+        return []
+    since = max(since, first)
+
+    cover = defaultdict(lambda: defaultdict(dict))   # date → machine → {hour: total_min}
+    for d, m, h, t in conn.execute(
+            "SELECT date,machine,hour,total_min FROM hourly_stats WHERE date>=? AND date<?",
+            (since, today.strftime("%Y-%m-%d"))):
+        cover[d][m][h] = t or 0
+
+    gaps = []
+    day = datetime.strptime(since, "%Y-%m-%d")
+    while day < today:
+        d_str = day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+        if not _work_window_min(d_str):
+            continue
+        window   = _window_minutes_by_hour(d_str)
+        expected = sum(window.values())
+        machines = cover.get(d_str, {}).values()
+        best = max((sum(min(hrs.get(h, 0), wm) for h, wm in window.items()) for hrs in machines),
+                   default=0)
+        if best >= GAP_MIN_COVERAGE * expected:
+            continue
+        missing = [h for h, wm in sorted(window.items())
+                   if max((hrs.get(h, 0) for hrs in machines), default=0) < GAP_MIN_COVERAGE * wm]
+        gaps.append({"date": d_str, "coverage": round(best / expected * 100, 1),
+                     "missing_hours": missing})
+    return gaps
+
+
+def heal_history_gaps(max_days: int = GAP_HEAL_DAYS_PER_RUN) -> None:
+    """Перетягує з WebAPI найсвіжіші пропуски з find_history_gaps.
+
+    Перезаписується вся доба (save_to_db працює подобово), missing_hours лише
+    логуються. Черга і лічильник спроб — таблиця history_gaps; доба, що після
+    GAP_HEAL_MAX_ATTEMPTS спроб так і лишилась неповною (немає даних на сервері),
+    більше не запитується. Власне з'єднання з БД — викликається з фонового потоку.
+    """
+    conn = init_db()
+    try:
+        gaps = find_history_gaps(conn)
+        now_s = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        gap_dates = [g["date"] for g in gaps]
+        conn.execute(f"DELETE FROM history_gaps WHERE date NOT IN ({','.join('?' * len(gap_dates))})",
+                     gap_dates)
+        for g in gaps:
+            conn.execute(
+                "INSERT INTO history_gaps (date,coverage,missing_hours) VALUES (?,?,?) "
+                "ON CONFLICT(date) DO UPDATE SET coverage=excluded.coverage, "
+                "missing_hours=excluded.missing_hours",
+                (g["date"], g["coverage"], ",".join(map(str, g["missing_hours"]))))
+        conn.commit()
+        if not gaps:
+            return
+        # Закешована неповна доба інакше поверталась би finalize_yesterday / fetch_lookback / backfill
+        for g in gaps:
+            day = datetime.strptime(g["date"], "%Y-%m-%d")
+            if api_cache_drop(day, day + timedelta(days=1)):
+                log(f"  api_cache: dropped short day {g['date']}")
+        todo = [d for (d,) in conn.execute(
+            "SELECT date FROM history_gaps WHERE attempts<? ORDER BY date DESC LIMIT ?",
+            (GAP_HEAL_MAX_ATTEMPTS, max_days))]
+        log(f"History gaps: {len(gaps)} day(s) — "
+            + ", ".join(f"{g['date']} ({g['coverage']}%)" for g in gaps)
+            + (f"; refetching {', '.join(todo)}" if todo else "; retry limit reached"))
+        for d_str in todo:
+            conn.execute("UPDATE history_gaps SET attempts=attempts+1, last_attempt=? WHERE date=?",
+                         (now_s, d_str))
+            conn.commit()
+            day  = datetime.strptime(d_str, "%Y-%m-%d")
+            # Повз api_cache: інакше неповна відповідь, закешована при першому фетчі, поверталась би щоразу
+            rows, _mr = _fetch_range_from_api(day, day + timedelta(days=1), use_cache=False)
+            if rows:
+                pre, _pre_mr = fetch_lookback(day)
+                _save_day(conn, d_str, rows, pre)
+                log(f"  Gap {d_str} refetched: {len(rows)} rows")
+            else:
+                log(f"  Gap {d_str}: no data on server")
+    except Exception as e:
+        log(f"✗ Gap heal error: {e}")
+    finally:
+        conn.close()
+
+
 # ── Telegram ──────────────────────────────────────────────────────────────────
 def send_telegram(message: str):
+    import urllib.request
+    import urllib.parse
     try:
         url  = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
         data = urllib.parse.urlencode({
@@ -628,37 +1478,125 @@ def send_telegram(message: str):
         log(f"Telegram error: {e}")
 
 # ── SQLite ────────────────────────────────────────────────────────────────────
-def init_db() -> sqlite3.Connection:
+def init_db() -> "sqlite3.Connection":
+    import sqlite3
     conn = sqlite3.connect(DB_FILE)
     conn.execute("""
         CREATE TABLE IF NOT EXISTS daily_summary (
             date TEXT, machine TEXT, run_min INTEGER, down_min INTEGER,
             total_min INTEGER, cycles INTEGER, avg_cycle REAL, efficiency REAL,
+            site TEXT,
             PRIMARY KEY (date, machine)
         )""")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS downtime_events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT, machine TEXT, start_time TEXT, end_time TEXT,
-            duration INTEGER, reason TEXT
+            duration INTEGER, reason TEXT, site TEXT
         )""")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS cycle_events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT, machine TEXT, program TEXT, start_time TEXT, end_time TEXT,
-            duration INTEGER
+            duration INTEGER, site TEXT
         )""")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS hourly_stats (
             date TEXT, machine TEXT, hour INTEGER,
-            run_min REAL, total_min REAL,
+            run_min REAL, total_min REAL, site TEXT,
             PRIMARY KEY (date, machine, hour)
         )""")
+    # Міграція старих БД: колонка site (мульти-дільниця)
+    for table in ("daily_summary", "downtime_events", "cycle_events", "hourly_stats"):
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if "site" not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN site TEXT")
+            conn.execute(f"UPDATE {table} SET site=?", (DEFAULT_SITE,))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            date TEXT PRIMARY KEY, status TEXT, rows INTEGER, updated_at TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stream_state (
+            date TEXT PRIMARY KEY, state TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS state_raster (
+            date TEXT, machine TEXT, site TEXT, planes BLOB,
+            PRIMARY KEY (date, machine)
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_gaps (
+            date TEXT PRIMARY KEY, coverage REAL, missing_hours TEXT,
+            attempts INTEGER DEFAULT 0, last_attempt TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fragment_cache (
+            section TEXT, date TEXT, version TEXT, payload TEXT,
+            PRIMARY KEY (section, date)
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS live_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, date TEXT, payload TEXT
+        )""")
     conn.commit()
     return conn
 
 
+# ── Fragment cache ────────────────────────────────────────────────────────────
+# Готові шматки даних звіту для закритих днів (Period Trend, Gantt, Hourly),
+# щоб generate_html() не перераховував всю історію на кожному запуску.
+# Ключ: (section, date) + version — хеш формату і параметрів, від яких залежить
+# фрагмент (напр. список станків, коди реєстру machines.json, робочий календар).
+# Інвалідація — save_to_db() для своєї дати; зміна конфігу — через version.
+def _fragment_version(section: str, *parts) -> str:
+    raw = repr((FRAGMENT_CACHE_VERSION, section) + parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def _registry_key() -> tuple:
+    """Те з machines.json, що потрапляє у фрагменти: назви, короткі коди, дільниці."""
+    return tuple(sorted((e["name"], e["short"], e["site"]) for e in _MACHINE_BY_NAME.values()))
+
+def _calendar_key() -> tuple:
+    return WORK_WEEKLY, tuple(sorted(WORK_HOLIDAYS))
+
+
+def load_fragments(conn, section: str, version: str, since: str = "") -> dict:
+    """Повертає {date: payload} для section з актуальною версією."""
+    try:
+        return {
+            d: json.loads(p) for d, p in conn.execute(
+                "SELECT date, payload FROM fragment_cache "
+                "WHERE section=? AND version=? AND date>=? ORDER BY date",
+                (section, version, since))
+        }
+    except Exception as e:
+        log(f"fragment_cache load error ({section}): {e}")
+        return {}
+
+
+def store_fragments(conn, section: str, version: str, frags: dict) -> None:
+    """Зберігає {date: payload}; фрагменти цієї section зі старою версією видаляються."""
+    try:
+        conn.execute("DELETE FROM fragment_cache WHERE section=? AND version<>?", (section, version))
+        conn.executemany(
+            "INSERT OR REPLACE INTO fragment_cache (section,date,version,payload) VALUES (?,?,?,?)",
+            [(section, d, version, json.dumps(p)) for d, p in frags.items()])
+        conn.commit()
+    except Exception as e:
+        log(f"fragment_cache store error ({section}): {e}")
+
+
 def save_to_db(conn, date_str, cycles, downtimes):
+    # Події, що перетинають північ, є в обох добах (analyze_day / look-back):
+    # у списках — обидві доби, обрізані по цій добі (00:00 / 24:00), цикл у daily_summary —
+    # доба, в яку він закінчився, hourly_stats — тільки перетин з добою.
+    day0 = datetime.strptime(date_str, "%Y-%m-%d")
+    day1 = day0 + timedelta(days=1)
+    def _hm_start(t):
+        return "00:00" if t < day0 else t.strftime("%H:%M")
+    def _hm_end(t):
+        return "24:00" if t >= day1 else t.strftime("%H:%M")
     for mname in cycles:
         c_list    = cycles[mname]
         d_data    = downtimes[mname]
@@ -667,64 +1605,72 @@ def save_to_db(conn, date_str, cycles, downtimes):
         total_min = _work_window_min(date_str) or d_data.get("total_min", 0)
         run_min_working = d_data["total_run"]
         eff       = round(run_min_working / total_min * 100, 1) if total_min else 0
-        avg_cycle = round(sum(c["duration"] for c in c_list) / len(c_list), 1) if c_list else 0
+        c_done    = [c for c in c_list if not c.get("end") or c["end"] <= day1]
+        avg_cycle = round(sum(c["duration"] for c in c_done) / len(c_done), 1) if c_done else 0
+        site      = _machine_site(mname)
         conn.execute("""
             INSERT OR REPLACE INTO daily_summary
-            (date,machine,run_min,down_min,total_min,cycles,avg_cycle,efficiency)
-            VALUES (?,?,?,?,?,?,?,?)
-        """, (date_str, mname, run_min, down_min, total_min, len(c_list), avg_cycle, eff))
+            (date,machine,run_min,down_min,total_min,cycles,avg_cycle,efficiency,site)
+            VALUES (?,?,?,?,?,?,?,?,?)
+        """, (date_str, mname, run_min, down_min, total_min, len(c_done), avg_cycle, eff, site))
         conn.execute("DELETE FROM cycle_events WHERE date=? AND machine=?", (date_str, mname))
         for c in c_list:
             conn.execute("""
                 INSERT INTO cycle_events
-                (date,machine,program,start_time,end_time,duration)
-                VALUES (?,?,?,?,?,?)
+                (date,machine,program,start_time,end_time,duration,site)
+                VALUES (?,?,?,?,?,?,?)
             """, (date_str, mname, c.get("program", "—"),
-                  c["start"].strftime("%H:%M") if c.get("start") else "—",
-                  c["end"].strftime("%H:%M") if c.get("end") else "—",
-                  c["duration"]))
+                  _hm_start(c["start"]) if c.get("start") else "—",
+                  _hm_end(c["end"]) if c.get("end") else "—",
+                  c["duration"], site))
         conn.execute("DELETE FROM downtime_events WHERE date=? AND machine=?", (date_str, mname))
         for d in d_data["downtimes"]:
             conn.execute("""
                 INSERT INTO downtime_events
-                (date,machine,start_time,end_time,duration,reason)
-                VALUES (?,?,?,?,?,?)
+                (date,machine,start_time,end_time,duration,reason,site)
+                VALUES (?,?,?,?,?,?,?)
             """, (date_str, mname,
-                  d["start"].strftime("%H:%M"),
-                  d["end"].strftime("%H:%M") if d.get("end") else "ongoing",
-                  d["duration"], d["reason"]))
+                  _hm_start(d["start"]),
+                  _hm_end(d["end"]) if d.get("end") else "ongoing",
+                  d["duration"], d["reason"], site))
+
+    # Дата перезаписана — кешовані фрагменти звіту для неї більше не актуальні
+    conn.execute("DELETE FROM fragment_cache WHERE date=?", (date_str,))
 
     # Hourly stats — розподіл run/total по годинах для кожної машини.
     # Використовується Today-графіком для відображення 7-денної історії.
-    hr_run   = defaultdict(lambda: defaultdict(float))
-    hr_total = defaultdict(lambda: defaultdict(float))
-    def _spread(mname, start_dt, end_dt, is_run):
-        cur = start_dt
-        while cur < end_dt:
-            hr_end = cur.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-            seg_min = (min(end_dt, hr_end) - cur).total_seconds() / 60
-            if is_run:
-                hr_run[mname][cur.hour] += seg_min
-            hr_total[mname][cur.hour] += seg_min
-            cur = hr_end
-    for mname, c_list in cycles.items():
-        for c in c_list:
-            if c.get("start") and c.get("duration"):
-                c_end = c.get("end") or (c["start"] + timedelta(minutes=c["duration"]))
-                _spread(mname, c["start"], c_end, True)
-    for mname, d_data in downtimes.items():
-        for d in d_data.get("downtimes", []):
-            if d.get("start") and d.get("duration"):
-                d_end = d.get("end") or (d["start"] + timedelta(minutes=d["duration"]))
-                _spread(mname, d["start"], d_end, False)
+    # Інтервали — секунди від 00:00 date_str, обрізані по добі; година = індекс відра mod 24.
+    def _intervals(items):
+        starts, ends = [], []
+        for it in items:
+            if it.get("start") and it.get("duration"):
+                it_end = it.get("end") or (it["start"] + timedelta(minutes=it["duration"]))
+                a, b = max(it["start"], day0), min(it_end, day1)
+                if b > a:
+                    starts.append((a - day0).total_seconds())
+                    ends.append((b - day0).total_seconds())
+        return starts, ends
+    def _by_hour(buckets):
+        hours = defaultdict(float)
+        for b, sec in buckets.items():
+            hours[b % 24] += sec
+        return hours
+    hr_run, hr_total = {}, {}
+    for mname in list(cycles) + [m for m in downtimes if m not in cycles]:
+        run_s, run_e   = _intervals(cycles.get(mname, []))
+        down_s, down_e = _intervals(downtimes.get(mname, {}).get("downtimes", []))
+        total = _by_hour(bucket_intervals(run_s + down_s, run_e + down_e))
+        if total:
+            hr_run[mname]   = _by_hour(bucket_intervals(run_s, run_e))
+            hr_total[mname] = total
     conn.execute("DELETE FROM hourly_stats WHERE date=?", (date_str,))
     for mname, hr_map in hr_total.items():
         for h, total in hr_map.items():
-            run = hr_run[mname].get(h, 0)
+            run = hr_run[mname].get(h, 0) / 60
             conn.execute(
                 "INSERT OR REPLACE INTO hourly_stats "
-                "(date,machine,hour,run_min,total_min) VALUES (?,?,?,?,?)",
-                (date_str, mname, h, round(run, 2), round(total, 2))
+                "(date,machine,hour,run_min,total_min,site) VALUES (?,?,?,?,?,?)",
+                (date_str, mname, h, round(run, 2), round(total / 60, 2), _machine_site(mname))
             )
 
     conn.commit()
@@ -738,6 +1684,161 @@ def load_history(conn, machine: str, days: int = 7) -> list:
     return list(reversed(cur.fetchall()))
 
 
+# ── Downtime reasons ──────────────────────────────────────────────────────────
+# Причина простою (RunState=0) — одна таблиця на обидва місця, де вона потрібна
+# (analyze_downtime, build_timeline_data). Прапорці рядка → бітова маска, маска →
+# готовий рядок причини з _REASON_TABLE; пріоритет задається порядком _REASON_FLAGS.
+# Текст аварії інтернується: однакові причини — один об'єкт str на всі рядки.
+_REASON_FLAGS = (                      # (поле, значення, причина; None — текст аварії)
+    ("AlarmState",       "1", None),
+    ("PowerOn",          "0", "Power off"),
+    ("SetUp",            "1", "Setup"),
+    ("Maintenance",      "1", "Maintenance"),
+    ("NoOperator",       "1", "No operator"),
+    ("Wait",             "1", "Waiting"),
+    ("FeedHoldState",    "1", "Feed Hold"),
+    ("ProgramStopState", "1", "Program Stop"),
+)
+
+def _build_reason_table() -> tuple:
+    table = []
+    for mask in range(1 << len(_REASON_FLAGS)):
+        bit = (mask & -mask).bit_length() - 1          # найстарший за пріоритетом (молодший) біт
+        table.append(_REASON_FLAGS[bit][2] if mask else "Idle")
+    return tuple(table)
+
+_REASON_TABLE = _build_reason_table()
+_startup_mark("reason table")
+
+def _state_mask(r) -> int:
+    """Біти в порядку _REASON_FLAGS. Рахується раз на рядок у _parse_operation_records
+    (r["_mask"]); downtime_reason і растр лише дивляться в таблицю."""
+    return ((r["AlarmState"] == "1")
+            | (r["PowerOn"] == "0") << 1
+            | (r["SetUp"] == "1") << 2
+            | (r["Maintenance"] == "1") << 3
+            | (r["NoOperator"] == "1") << 4
+            | (r["Wait"] == "1") << 5
+            | (r["FeedHoldState"] == "1") << 6
+            | (r["ProgramStopState"] == "1") << 7)
+
+@lru_cache(maxsize=4096)
+def _alarm_reason(message: str, alarm_no: str) -> str:
+    return sys.intern("Alarm: " + (message or alarm_no or "—"))
+
+def downtime_reason(r) -> str:
+    """Причина простою для рядка з RunState=0."""
+    reason = _REASON_TABLE[r["_mask"]]
+    return reason if reason is not None else _alarm_reason(r["AlarmMessage"], r["AlarmNo"])
+
+
+# ── State raster ──────────────────────────────────────────────────────────────
+# Хвилинний растр стану станку за добу: 1440 слотів на кожну площину
+# (run / alarm / setup / idle), площина — бітова маска int (біт m = хвилина m від 00:00).
+# Будується з інтервалів між змінами стану (як analyze_downtime): кожен інтервал —
+# одна операція OR над маскою, а не цикл по хвилинах. Площини не перетинаються;
+# пріоритет як у analyze_downtime: Alarm → Power off (idle) → Setup → решта = idle.
+# В БД — BLOB 4 × 180 байт (state_raster). Хвилини у вікні — popcount зрізу маски.
+RASTER_PLANES = ("run", "alarm", "setup", "idle")
+RASTER_SLOTS  = 1440
+_RASTER_BYTES = RASTER_SLOTS // 8
+
+def _row_plane(r) -> str:
+    if r["RunState"] == "1":
+        return "run"
+    reason = _REASON_TABLE[r["_mask"]]
+    return "alarm" if reason is None else ("setup" if reason == "Setup" else "idle")
+
+
+def build_state_raster(rows, date_str: str) -> dict:
+    """{machine: {plane: mask}} для доби date_str з рядків GetOperationResult."""
+    day0 = datetime.strptime(date_str, "%Y-%m-%d")
+    machines = defaultdict(list)
+    for r in rows:
+        machines[r["MachineName"]].append(r)
+    result = {}
+    for mname, mrows in machines.items():
+        mrows.sort(key=lambda r: r["Date"])
+        planes = dict.fromkeys(RASTER_PLANES, 0)
+        seg_plane, seg_start = None, None
+        for r in mrows + [None]:
+            plane = _row_plane(r) if r else None
+            if plane == seg_plane:
+                continue
+            if seg_plane is not None:
+                end_ts = r["_ts"] if r else mrows[-1]["_ts"]
+                a = max(0, min(RASTER_SLOTS, round((seg_start - day0).total_seconds() / 60)))
+                b = max(0, min(RASTER_SLOTS, round((end_ts - day0).total_seconds() / 60)))
+                if b > a:
+                    planes[seg_plane] |= ((1 << (b - a)) - 1) << a
+            if r:
+                seg_plane, seg_start = plane, r["_ts"]
+        result[mname] = planes
+    return result
+
+
+def raster_to_blob(planes: dict) -> bytes:
+    return b"".join(planes.get(p, 0).to_bytes(_RASTER_BYTES, "little") for p in RASTER_PLANES)
+
+
+def raster_from_blob(blob: bytes) -> dict:
+    return {p: int.from_bytes(blob[i * _RASTER_BYTES:(i + 1) * _RASTER_BYTES], "little")
+            for i, p in enumerate(RASTER_PLANES)}
+
+
+def raster_minutes(mask: int, start_min: int = 0, end_min: int = RASTER_SLOTS) -> int:
+    """Кількість хвилин площини у вікні [start_min, end_min) від 00:00."""
+    if end_min <= start_min:
+        return 0
+    return ((mask >> start_min) & ((1 << (end_min - start_min)) - 1)).bit_count()
+
+
+def raster_runs(mask: int) -> list:
+    """Суцільні відрізки площини: [[start_min, end_min), ...] від 00:00."""
+    runs = []
+    while mask:
+        a = (mask & -mask).bit_length() - 1
+        t = mask >> a
+        n = (t ^ (t + 1)).bit_length() - 1          # кількість одиниць підряд від біта a
+        runs.append([a, a + n])
+        mask &= ~(((1 << n) - 1) << a)
+    return runs
+
+
+def raster_buckets(mask: int, bucket_min: int = 60) -> list:
+    """Хвилини площини по відрах bucket_min (60 → 24 години, 15 → 96 чвертей)."""
+    return [raster_minutes(mask, a, min(a + bucket_min, RASTER_SLOTS))
+            for a in range(0, RASTER_SLOTS, bucket_min)]
+
+
+def save_state_raster(conn, date_str: str, rows) -> None:
+    rasters = build_state_raster(rows, date_str)
+    conn.executemany(
+        "INSERT OR REPLACE INTO state_raster (date,machine,site,planes) VALUES (?,?,?,?)",
+        [(date_str, m, _machine_site(m), raster_to_blob(pl)) for m, pl in rasters.items()])
+    conn.commit()
+
+
+def load_raster_window(conn, date_from: str, date_to: str,
+                       start_min: int = 0, end_min: int = RASTER_SLOTS,
+                       machine: str = None, site: str = None) -> dict:
+    """{machine: {plane: хвилин}} — сума по дням [date_from, date_to] у вікні доби
+    [start_min, end_min) (напр. зміна 07:00–19:00 → 420, 1140). Джерело /api/utilization."""
+    sql, args = "SELECT machine, planes FROM state_raster WHERE date>=? AND date<=?", [date_from, date_to]
+    if machine:
+        sql += " AND machine=?"
+        args.append(machine)
+    if site:
+        sql += " AND site=?"
+        args.append(site)
+    out = defaultdict(lambda: dict.fromkeys(RASTER_PLANES, 0))
+    for m, blob in conn.execute(sql, args):
+        acc = out[_canonical_machine(m)]
+        for p, mask in raster_from_blob(blob).items():
+            acc[p] += raster_minutes(mask, start_min, end_min)
+    return dict(out)
+
+
 # ── Data processing ───────────────────────────────────────────────────────────
 def get_counter_markers(mr_data, cycles_dict):
     """Повертає {machine_name: [datetime, ...]} — моменти COUNTER.MIN що реально
@@ -990,123 +2091,327 @@ def filter_last_hours(rows, hours):
         cutoff = last_ts - timedelta(hours=hours)
     return [r for r in rows if r["_ts"] >= cutoff], cutoff, last_ts
 
-def analyze_cycles(rows):
-    machines = defaultdict(list)
+# ── Cycle / downtime state machines ───────────────────────────────────────────
+# Стан кожного станку — простий dict, який можна зберегти (JSON) і продовжити
+# наступним запуском: _feed_* приймає лише нові рядки, _*_result дає той самий
+# результат, що й пакетна обробка всієї доби (analyze_cycles / analyze_downtime
+# — це свіжий стан + всі рядки). Рядки з Date ≤ вже оброблених пропускаються;
+# n_in — скільки рядків станку стан уже бачив: якщо з тих самих Date їх тепер інша
+# кількість (запізнілі рядки), _analyze_rows скидає стан і станок іде пакетно.
+def _cycle_state() -> dict:
+    return {"prev_run": None, "prev_prog": None, "cycle_start": None, "cycle_prog": "",
+            "cycles": [], "last_ts": None, "last_date": "", "last_date_n": 0}
+
+def _downtime_state() -> dict:
+    return {"prev_run": None, "dt_start": None, "dt_reason": "", "downtimes": [],
+            "last_ts": None, "last_date": "", "last_date_n": 0, "run_all": 0,
+            "win": [0, 0, 0],        # рядки / run / down у робочому вікні
+            "pend": [0, 0, 0],       # рядки після act_first, ще не підтверджені run-рядком
+            "act_first": None, "act_last": None}
+
+def _new_rows(st, mrows):
+    """Рядки після останнього обробленого (Date, кількість рядків з цим Date)."""
+    last, n_seen = st["last_date"], st["last_date_n"]
+    out = []
+    for r in mrows:
+        d = r["Date"]
+        if d < last:
+            continue
+        if d == last and n_seen:
+            n_seen -= 1
+            continue
+        out.append(r)
+    if out:
+        last_d = out[-1]["Date"]
+        st["last_date_n"] = sum(1 for r in out if r["Date"] == last_d) + (
+            st["last_date_n"] if last_d == st["last_date"] else 0)
+        st["last_date"] = last_d
+    return out
+
+def _feed_cycles(st, mrows) -> int:
+    """Продовжує стан циклів рядками mrows (відсортованими). Повертає к-сть нових закритих циклів."""
+    rows = _new_rows(st, mrows)
+    cycles = st["cycles"]
+    n0 = len(cycles)
+    prev_run, prev_prog_parsed = st["prev_run"], st["prev_prog"]
+    cycle_start, cycle_prog = st["cycle_start"], st["cycle_prog"]
     for r in rows:
-        machines[r["MachineName"]].append(r)
-    result = {}
-    for mname, mrows in machines.items():
-        mrows.sort(key=lambda r: r["Date"])
-        cycles, prev_run, prev_prog_parsed, cycle_start, cycle_prog = [], None, None, None, ""
-        for r in mrows:
-            ts, run, prog = r["_ts"], r["RunState"], r["ProgramFileName"]
-            prog_parsed = parse_program_name(prog)  # (base, operation)
-
-            if run == "1":
-                if prev_run in (None, "0"):
-                    cycle_start, cycle_prog = ts, prog
-                elif prev_run == "1" and prog_parsed != prev_prog_parsed and cycle_start:
-                    cycles.append({"start": cycle_start, "end": ts, "program": cycle_prog,
-                                    "duration": round((ts - cycle_start).total_seconds() / 60, 2)})
-                    cycle_start, cycle_prog = ts, prog
-            elif prev_run == "1" and run == "0" and cycle_start:
+        ts, run, prog = r["_ts"], r["RunState"], r["ProgramFileName"]
+        prog_parsed = parse_program_name(prog)  # (base, operation)
+
+        if run == "1":
+            if prev_run in (None, "0"):
+                cycle_start, cycle_prog = ts, prog
+            elif prev_run == "1" and prog_parsed != prev_prog_parsed and cycle_start:
                 cycles.append({"start": cycle_start, "end": ts, "program": cycle_prog,
                                 "duration": round((ts - cycle_start).total_seconds() / 60, 2)})
-                cycle_start = None
-
-            prev_run = run
-            prev_prog_parsed = prog_parsed
-
-        if cycle_start:
-            last_ts = mrows[-1]["_ts"]
-            cycles.append({"start": cycle_start, "end": None, "program": cycle_prog,
-                           "duration": round((last_ts - cycle_start).total_seconds() / 60, 2),
-                           "ongoing": True})
-        result[mname] = cycles
-    return result
-
-def _is_in_efficiency_window(ts, weekend_first, weekend_last):
-    """Перевіряє чи timestamp потрапляє в робоче вікно дня тижня."""
-    wd   = ts.weekday()
-    hour = ts.hour + ts.minute / 60.0 + ts.second / 3600.0
-    if wd in (2, 3, 4) and hour < 0.5: return True        # ніч 00:00–00:30 після Вт/Ср/Чт
-    if wd in (0, 4):    return 7.0 <= hour < 19.0         # Пн, Пт: 07:00–19:00
-    if wd in (1, 2, 3): return hour >= 6.5                # Вт-Чт: 06:30–00:00
-    if wd in (5, 6):                                       # Сб, Нд
-        if weekend_first is None or weekend_last is None:
-            return False
-        return weekend_first <= ts <= weekend_last
-    return False
+                cycle_start, cycle_prog = ts, prog
+        elif prev_run == "1" and run == "0" and cycle_start:
+            cycles.append({"start": cycle_start, "end": ts, "program": cycle_prog,
+                            "duration": round((ts - cycle_start).total_seconds() / 60, 2)})
+            cycle_start = None
+
+        prev_run = run
+        prev_prog_parsed = prog_parsed
+    if rows:
+        st["last_ts"] = rows[-1]["_ts"]
+    st["prev_run"], st["prev_prog"] = prev_run, prev_prog_parsed
+    st["cycle_start"], st["cycle_prog"] = cycle_start, cycle_prog
+    return len(cycles) - n0
+
+def _cycles_result(st) -> list:
+    cycles = list(st["cycles"])
+    if st["cycle_start"]:
+        cycles.append({"start": st["cycle_start"], "end": None, "program": st["cycle_prog"],
+                       "duration": round((st["last_ts"] - st["cycle_start"]).total_seconds() / 60, 2),
+                       "ongoing": True})
+    return cycles
+
+def _feed_downtime(st, mrows) -> int:
+    """Продовжує стан простоїв і лічильників робочого вікна. Повертає к-сть нових закритих простоїв.
+
+    Робоче вікно — як efficiency_windows(): рядок у інтервалі змін календаря, або між
+    першим і останнім (включно) RunState=1 на добах без змін. Рядки після першого
+    такого run копляться в pend і зараховуються, коли з'являється наступний run.
+    """
+    rows = _new_rows(st, mrows)
+    downtimes = st["downtimes"]
+    n0 = len(downtimes)
+    prev_run, dt_start, dt_reason = st["prev_run"], st["dt_start"], st["dt_reason"]
+    win, pend = st["win"], st["pend"]
+    act_first, act_last = st["act_first"], st["act_last"]
+    day_key, ivs, off_day = None, (), False
+    for r in rows:
+        ts, run = r["_ts"], r["RunState"]
+        is_run, is_down = run == "1", run == "0"
+        st["run_all"] += is_run
+
+        if r["Date"][:10] != day_key:
+            day_key = r["Date"][:10]
+            d_str   = day_key.replace(".", "-")
+            ivs, off_day = work_intervals(d_str), not shift_intervals(d_str)
+        if off_day and is_run:
+            if act_first is None:
+                act_first = ts
+            act_last = ts
+            win[0] += pend[0] + 1; win[1] += pend[1] + 1; win[2] += pend[2]
+            pend[0] = pend[1] = pend[2] = 0
+        elif any(a <= ts < b for a, b in ivs):
+            win[0] += 1; win[1] += is_run; win[2] += is_down
+        elif act_first is not None:
+            if ts == act_last:                 # межа вікна включна
+                win[0] += 1; win[1] += is_run; win[2] += is_down
+            else:
+                pend[0] += 1; pend[1] += is_run; pend[2] += is_down
 
-def analyze_downtime(rows):
+        reason = downtime_reason(r) if is_down else ""
+        if prev_run in (None, "1") and is_down:
+            dt_start, dt_reason = ts, reason
+        elif prev_run == "0" and is_run and dt_start:
+            dur = round((ts - dt_start).total_seconds() / 60, 2)
+            if dur > 0:
+                downtimes.append({"start": dt_start, "end": ts,
+                                  "duration": dur, "reason": dt_reason})
+            dt_start = None
+        prev_run = run
+    if rows:
+        st["last_ts"] = rows[-1]["_ts"]
+    st["prev_run"], st["dt_start"], st["dt_reason"] = prev_run, dt_start, dt_reason
+    st["act_first"], st["act_last"] = act_first, act_last
+    return len(downtimes) - n0
+
+def _downtime_result(st) -> dict:
+    downtimes = list(st["downtimes"])
+    if st["dt_start"]:
+        dur = round((st["last_ts"] - st["dt_start"]).total_seconds() / 60, 2)
+        if dur > 0:
+            downtimes.append({"start": st["dt_start"], "end": None, "duration": dur,
+                              "reason": st["dt_reason"], "ongoing": True})
+    return {
+        "downtimes":  downtimes,
+        "total_run":  st["win"][1],
+        "total_down": st["win"][2],
+        "total_min":  st["win"][0],
+        "total_run_all": st["run_all"],
+    }
+
+def _rows_by_machine(rows) -> dict:
     machines = defaultdict(list)
     for r in rows:
         machines[r["MachineName"]].append(r)
-    result = {}
-    for mname, mrows in machines.items():
+    for mrows in machines.values():
         mrows.sort(key=lambda r: r["Date"])
-        downtimes, prev_run, dt_start, dt_reason = [], None, None, ""
+    return machines
 
-        # Знаходимо межі вихідного дня (перший/останній запис RunState=1)
-        weekend_first = weekend_last = None
-        for r in mrows:
-            ts = r["_ts"]
-            if ts.weekday() in (5, 6) and r["RunState"] == "1":
-                if weekend_first is None:
-                    weekend_first = ts
-                weekend_last = ts
-
-        filtered_rows = [
-            r for r in mrows
-            if _is_in_efficiency_window(r["_ts"], weekend_first, weekend_last)
-        ]
+def _dump_stream_json(states: dict) -> str:
+    return json.dumps(states, default=lambda o: {"$dt": o.isoformat()}, separators=(",", ":"))
 
-        for r in mrows:
-            ts, run = r["_ts"], r["RunState"]
-            if run == "0":
-                if   r["AlarmState"]       == "1": reason = "Alarm: " + (r["AlarmMessage"] or r["AlarmNo"] or "—")
-                elif r["PowerOn"]          == "0": reason = "Power off"
-                elif r["SetUp"]            == "1": reason = "Setup"
-                elif r["Maintenance"]      == "1": reason = "Maintenance"
-                elif r["NoOperator"]       == "1": reason = "No operator"
-                elif r["Wait"]             == "1": reason = "Waiting"
-                elif r["FeedHoldState"]    == "1": reason = "Feed Hold"
-                elif r["ProgramStopState"] == "1": reason = "Program Stop"
-                else:                              reason = "Idle"
-            else:
-                reason = ""
-            if prev_run in (None, "1") and run == "0":
-                dt_start, dt_reason = ts, reason
-            elif prev_run == "0" and run == "1" and dt_start:
-                dur = round((ts - dt_start).total_seconds() / 60, 2)
-                if dur > 0:
-                    downtimes.append({"start": dt_start, "end": ts,
-                                      "duration": dur, "reason": dt_reason})
-                dt_start = None
-            prev_run = run
-        if dt_start:
-            last_ts = mrows[-1]["_ts"]
-            dur = round((last_ts - dt_start).total_seconds() / 60, 2)
-            if dur > 0:
-                downtimes.append({"start": dt_start, "end": None, "duration": dur,
-                                  "reason": dt_reason, "ongoing": True})
-
-        result[mname] = {
-            "downtimes":  downtimes,
-            "total_run":  sum(1 for r in filtered_rows if r["RunState"] == "1"),
-            "total_down": sum(1 for r in filtered_rows if r["RunState"] == "0"),
-            "total_min":  len(filtered_rows),
-            "total_run_all": sum(1 for r in mrows if r["RunState"] == "1"),
-        }
-    return result
+def _load_stream_json(raw: str) -> dict:
+    states = json.loads(raw, object_hook=lambda d: datetime.fromisoformat(d["$dt"])
+                        if len(d) == 1 and "$dt" in d else d)
+    for st in states.values():
+        if st["c"]["prev_prog"] is not None:
+            st["c"]["prev_prog"] = tuple(st["c"]["prev_prog"])   # parse_program_name → tuple
+    return states
 
-def split_timeline_by_counter(timeline_data, counter_markers, period_from, period_to):
-    """Розрізає зелені сегменти таймлайну по мітках COUNTER.MIN.
+def load_stream_state(conn, date_str: str) -> dict:
+    """Збережені стани машин станів за добу date_str ({} — почати з 00:00)."""
+    try:
+        row = conn.execute("SELECT state FROM stream_state WHERE date=?", (date_str,)).fetchone()
+        states = _load_stream_json(row[0]) if row else {}
+        return {m: st for m, st in states.items() if "n_in" in st}   # чекпоінт без n_in — з 00:00
+    except Exception as e:
+        log(f"stream_state load error: {e}")
+        return {}
 
-    COUNTER.MIN записується в кінці циклу, тому використовуємо вікно:
-    [seg_start+30s ... seg_end+60s] - аналогічно до split_cycles_by_counter.
-    """
-    total_sec = max((period_to - period_from).total_seconds(), 1)
+def save_stream_state(conn, date_str: str, states: dict) -> None:
+    """Чекпоінт станів; стани попередніх діб більше не потрібні."""
+    try:
+        conn.execute("DELETE FROM stream_state WHERE date<>?", (date_str,))
+        conn.execute("INSERT OR REPLACE INTO stream_state (date,state) VALUES (?,?)",
+                     (date_str, _dump_stream_json(states)))
+        conn.commit()
+    except Exception as e:
+        log(f"stream_state save error: {e}")
+
+def load_day_rows(date_str: str):
+    """Рядки доби date_str з попереднього запуску: {"rows", "mr", "fetched_at"} або None."""
+    import pickle
+    try:
+        with open(STREAM_ROWS_FILE, "rb") as f:
+            cache = pickle.load(f)
+        return cache if cache.get("date") == date_str else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log(f"day rows load error: {e}")
+        return None
+
+def save_day_rows(date_str: str, rows, mr_data, fetched_at: datetime) -> None:
+    import pickle
+    try:
+        tmp = STREAM_ROWS_FILE + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"date": date_str, "rows": rows, "mr": mr_data, "fetched_at": fetched_at},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, STREAM_ROWS_FILE)
+    except Exception as e:
+        log(f"day rows save error: {e}")
+
+def day_rows_since(cache) -> datetime:
+    """З якого моменту тягнути хвіст: попередній фетч мінус перекриття, не раніше 00:00."""
+    at = cache["fetched_at"]
+    return max(at - timedelta(minutes=STREAM_FETCH_OVERLAP_MIN),
+               at.replace(hour=0, minute=0, second=0, microsecond=0))
+
+def merge_day_rows(cache, rows, mr_data, since: datetime) -> tuple:
+    """Збережені рядки до since + свіжий хвіст [since, now] → рядки всієї доби."""
+    rows = [r for r in cache["rows"] if r["_ts"] < since] + [r for r in rows if r["_ts"] >= since]
+    mr   = [r for r in cache["mr"] if r.get("_ts") and r["_ts"] < since] + list(mr_data)
+    return rows, mr
+
+def analyze_cycles(rows):
+    result = {}
+    for mname, mrows in _rows_by_machine(rows).items():
+        st = _cycle_state()
+        _feed_cycles(st, mrows)
+        result[mname] = _cycles_result(st)
+    return result
+
+def analyze_downtime(rows):
+    result = {}
+    for mname, mrows in _rows_by_machine(rows).items():
+        st = _downtime_state()
+        _feed_downtime(st, mrows)
+        result[mname] = _downtime_result(st)
+    return result
+
+def stream_analyze(states: dict, rows) -> tuple:
+    """analyze_cycles + analyze_downtime, що продовжують збережені стани.
+
+    states — {machine: {"c": стан циклів, "d": стан простоїв}} (змінюється на місці).
+    Повертає (cycles, downtimes, нових закритих циклів, нових закритих простоїв);
+    результат по станках зі станом — як пакетний аналіз усіх рядків від 00:00.
+    """
+    new_c = new_d = 0
+    by_machine = _rows_by_machine(rows)
+    for mname, mrows in by_machine.items():
+        st = states.setdefault(mname, {"c": _cycle_state(), "d": _downtime_state()})
+        new_c += _feed_cycles(st["c"], mrows)
+        new_d += _feed_downtime(st["d"], mrows)
+    for mname, st in states.items():
+        st["n_in"] = len(by_machine.get(mname, ()))
+    order = list(by_machine) + [m for m in states if m not in by_machine]
+    cycles    = {m: _cycles_result(states[m]["c"]) for m in order}
+    downtimes = {m: _downtime_result(states[m]["d"]) for m in order}
+    return cycles, downtimes, new_c, new_d
+
+# Лічильники робочого вікна стану простоїв — належать тій добі, з якої рахувались
+_WINDOW_KEYS = ("win", "pend", "run_all", "act_first", "act_last")
+
+def _prime_state(pre_rows, day_start: datetime, keep: bool = False):
+    """Свіжий стан станку, прогнаний look-back рядками (до day_start).
+
+    Лишаються незакриті на day_start цикл/простій і події, що перетинають day_start;
+    лічильники робочого вікна обнуляються. None — якщо станок нічого не переносить
+    (keep=True — повернути стан все одно: попередній RunState визначає першу подію).
+    """
+    st = {"c": _cycle_state(), "d": _downtime_state()}
+    _feed_cycles(st["c"], pre_rows)
+    _feed_downtime(st["d"], pre_rows)
+    st["c"]["cycles"]    = [c for c in st["c"]["cycles"] if c["end"] > day_start]
+    st["d"]["downtimes"] = [d for d in st["d"]["downtimes"] if d["end"] > day_start]
+    st["d"].update({k: v for k, v in _downtime_state().items() if k in _WINDOW_KEYS})
+    if not (keep or st["c"]["cycle_start"] or st["d"]["dt_start"]
+            or st["c"]["cycles"] or st["d"]["downtimes"]):
+        return None
+    return st
+
+def prime_states(states: dict, pre_rows, day_start: datetime, machines=()) -> None:
+    """Додає в states стани станків, яких там ще немає, з look-back рядків.
+
+    machines — станки з рядками в самому періоді: їм стан потрібен навіть без
+    перенесених подій. Станки без рядків у періоді додаються, лише якщо щось переносять.
+    """
+    for mname, mrows in _rows_by_machine(pre_rows).items():
+        st = states.get(mname)
+        if st is not None and st["c"]["last_date"]:
+            continue                       # вже продовжується з чекпоінта
+        primed = _prime_state(mrows, day_start, keep=mname in machines)
+        if primed is not None:
+            states[mname] = primed
+
+def analyze_day(rows, day_start: datetime, day_end: datetime, pre_rows=(), post_rows=()) -> tuple:
+    """analyze_cycles + analyze_downtime для доби [day_start, day_end) з запасами через північ.
+
+    pre_rows (до day_start) і post_rows (після day_end) лише продовжують цикл/простій,
+    що тривав опівночі, — лічильники робочого вікна рахуються тільки з rows.
+    Повертає всі події, що перетинають добу, з їх справжніми початком і кінцем.
+    """
+    states = {}
+    prime_states(states, pre_rows, day_start, {r["MachineName"] for r in rows})
+    cycles, downtimes, _new_c, _new_d = stream_analyze(states, rows)
+    for mname, mrows in _rows_by_machine(post_rows).items():
+        st = states.get(mname)
+        if not st or not (st["c"]["cycle_start"] or st["d"]["dt_start"]):
+            continue
+        counters = {k: list(v) if isinstance(v, list) else v
+                    for k, v in st["d"].items() if k in _WINDOW_KEYS}
+        _feed_cycles(st["c"], mrows)
+        _feed_downtime(st["d"], mrows)
+        st["d"].update(counters)
+        cycles[mname] = [c for c in _cycles_result(st["c"]) if c["start"] < day_end]
+        downtimes[mname] = dict(_downtime_result(st["d"]), downtimes=[
+            d for d in _downtime_result(st["d"])["downtimes"] if d["start"] < day_end])
+    return cycles, downtimes
+
+def split_timeline_by_counter(timeline_data, counter_markers, period_from, period_to):
+    """Розрізає зелені сегменти таймлайну по мітках COUNTER.MIN.
+
+    COUNTER.MIN записується в кінці циклу, тому використовуємо вікно:
+    [seg_start+30s ... seg_end+60s] - аналогічно до split_cycles_by_counter.
+    """
+    total_sec = max((period_to - period_from).total_seconds(), 1)
     TOL_AFTER = timedelta(seconds=60)
     TOL_MIN   = timedelta(seconds=30)
 
@@ -1180,18 +2485,9 @@ def build_timeline_data(rows, period_from, period_to):
         seg_idx   = 0
 
         def _get_label(r):
-            run = r["RunState"]
-            if run == "1":
+            if r["RunState"] == "1":
                 return r["ProgramFileName"] or "Running"
-            if   r["AlarmState"]       == "1": return "Alarm: " + (r["AlarmMessage"] or r["AlarmNo"] or "—")
-            elif r["PowerOn"]          == "0": return "Power off"
-            elif r["SetUp"]            == "1": return "Setup"
-            elif r["Maintenance"]      == "1": return "Maintenance"
-            elif r["NoOperator"]       == "1": return "No operator"
-            elif r["Wait"]             == "1": return "Waiting"
-            elif r["FeedHoldState"]    == "1": return "Feed Hold"
-            elif r["ProgramStopState"] == "1": return "Program Stop"
-            return "Idle"
+            return downtime_reason(r)
 
         for r in mrows:
             if r["ProgramFileName"].upper().startswith("COUNTER"):
@@ -1202,38 +2498,176 @@ def build_timeline_data(rows, period_from, period_to):
                 seg_state, seg_start, seg_label = run, ts, lbl
             elif run != seg_state or (run == "1" and lbl != seg_label):
                 # нова програма або зміна стану — закриваємо сегмент
-                x = (seg_start - period_from).total_seconds() / total_sec * 100
-                w = (ts - seg_start).total_seconds() / total_sec * 100
+                # (сегмент з look-back рядків обрізається по period_from)
+                s0 = max(seg_start, period_from)
+                x = (s0 - period_from).total_seconds() / total_sec * 100
+                w = (ts - s0).total_seconds() / total_sec * 100
                 if w > 0.05:
                     segments.append({
                         "x": x, "w": w, "state": seg_state,
                         "label": seg_label,
-                        "start": seg_start.strftime("%H:%M"),
+                        "start": s0.strftime("%H:%M"),
                         "end":   ts.strftime("%H:%M"),
-                        "id":    f"{mname.split('_')[0]}_{seg_idx}",
+                        "id":    f"{_machine_short(mname)}_{seg_idx}",
                     })
                     seg_idx += 1
                 seg_start, seg_state, seg_label = ts, run, lbl
 
         if seg_state is not None:
-            x = (seg_start - period_from).total_seconds() / total_sec * 100
-            w = (period_to - seg_start).total_seconds() / total_sec * 100
+            s0 = max(seg_start, period_from)
+            x = (s0 - period_from).total_seconds() / total_sec * 100
+            w = (period_to - s0).total_seconds() / total_sec * 100
             if w > 0.05:
                 segments.append({
                     "x": x, "w": w, "state": seg_state,
                     "label": seg_label,
-                    "start": seg_start.strftime("%H:%M"),
+                    "start": s0.strftime("%H:%M"),
                     "end":   period_to.strftime("%H:%M"),
-                    "id":    f"{mname.split('_')[0]}_{seg_idx}",
+                    "id":    f"{_machine_short(mname)}_{seg_idx}",
                 })
         result[mname] = segments
     return result
 
+# ── Per-machine analysis ──────────────────────────────────────────────────────
+# Усі кроки Step 3 незалежні між станками, тому дані шардуються по MachineName.
+# У воркер передаються компактні кортежі замість dict (менше pickle-трафіку),
+# MachineName — один раз на шард.
+_ROW_FIELDS = ("_ts", "Date", "RunState", "ProgramFileName", "PowerOn", "AlarmState",
+               "AlarmNo", "AlarmMessage", "LimitState", "ProgramStopState", "FeedHoldState",
+               "STMState", "SetUp", "NoOperator", "Wait", "Maintenance", "_mask")
+_MR_FIELDS  = ("_ts", "Date", "ProgramFileName", "RunStateTime", "Counter")
+
+def _analyze_rows(rows, mr_data, period_from, period_to, states=None):
+    """Step 3 для набору рядків: цикли, лічильник, простої, таймлайн.
+
+    states — чекпоінт машин станів (stream_analyze), оновлюється на місці.
+    Рядки до period_from — look-back запас (fetch_lookback): ними продовжуються
+    цикл/простій, що тривали на початок періоду, і стан таймлайну на period_from.
+    """
+    pre = [r for r in rows if r["_ts"] < period_from]
+    if pre:
+        rows = [r for r in rows if r["_ts"] >= period_from]
+    if states:
+        for mname, mrows in _rows_by_machine(rows).items():
+            st = states.get(mname)
+            if st is None or not st["c"]["last_date"]:
+                continue
+            last = st["c"]["last_date"]
+            if st.get("n_in") != sum(1 for r in mrows if r["Date"] <= last):
+                log(f"  {mname}: late rows before {last} — re-analyzing from {period_from.strftime('%H:%M')}")
+                del states[mname]
+    if states is None and not pre:
+        cycles, downtimes = analyze_cycles(rows), analyze_downtime(rows)
+    else:
+        states = {} if states is None else states
+        prime_states(states, pre, period_from, {r["MachineName"] for r in rows})
+        cycles, downtimes, _new_c, _new_d = stream_analyze(states, rows)
+    counter_markers = get_counter_markers(mr_data, cycles)
+    counter_machines = set(counter_markers.keys())
+    cycles = split_cycles_by_counter(cycles, counter_markers)
+    cycles, counter_markers = apply_start_to_start_cycles(cycles, counter_markers, mr_data)
+    counter_markers = add_runstate_boundary_markers(counter_markers, rows, counter_machines)
+    if pre:   # мітки перенесених циклів до початку періоду на таймлайн не потрапляють
+        counter_markers = {k: [m for m in v if m >= period_from] if isinstance(v, list) else v
+                           for k, v in counter_markers.items()}
+    timeline_data = build_timeline_data(pre + rows, period_from, period_to)
+    timeline_data = split_timeline_by_counter(timeline_data, counter_markers, period_from, period_to)
+    return cycles, downtimes, timeline_data, counter_markers, counter_machines
+
+def _analyze_shard(shard):
+    """Воркер ProcessPoolExecutor: розпаковує шард одного станку і аналізує його.
+    Повертає результат і оновлений стан машин станів цього станку (або None)."""
+    mname, row_t, mr_t, period_from, period_to, state = shard
+    rows = [dict(zip(_ROW_FIELDS, t), MachineName=mname) for t in row_t]
+    mr   = [dict(zip(_MR_FIELDS, t), MachineName=mname) for t in mr_t]
+    states = None if state is None else {mname: state}
+    result = _analyze_rows(rows, mr, period_from, period_to, states)
+    return result, (states or {}).get(mname)
+
+def analyze_all(rows, mr_data, period_from, period_to, workers=None, states=None, strict=False):
+    """Step 3 — серійно або по процесу на станок (workers > 1).
+
+    Результат ідентичний серійному: той самий набір ключів, станки в порядку
+    першої появи в rows. Якщо пул не стартував або воркер впав — відкат на серійний
+    режим; strict=True — виняток летить далі (bench-analysis, тести).
+    states — чекпоінт машин станів (див. stream_analyze), оновлюється на місці.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    if workers <= 1:
+        return _analyze_rows(rows, mr_data, period_from, period_to, states)
+
+    by_machine = defaultdict(list)
+    for r in rows:
+        by_machine[r["MachineName"]].append(tuple(r.get(k) for k in _ROW_FIELDS))
+    mr_by_machine = defaultdict(list)
+    for r in mr_data:
+        mr_by_machine[r.get("MachineName", "")].append(tuple(r.get(k) for k in _MR_FIELDS))
+    shards = [(m, by_machine[m], mr_by_machine.get(m, []), period_from, period_to,
+               None if states is None else states.get(m, {"c": _cycle_state(), "d": _downtime_state()}))
+              for m in by_machine]
+    if not shards:
+        return _analyze_rows(rows, mr_data, period_from, period_to, states)
+
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            parts = list(pool.map(_analyze_shard, shards))
+    except Exception as e:
+        if strict:
+            raise
+        log(f"✗ Process pool analysis failed ({e}) — falling back to serial")
+        return _analyze_rows(rows, mr_data, period_from, period_to, states)
+
+    cycles, downtimes, timeline_data, counter_markers = {}, {}, {}, {}
+    counter_machines = set()
+    for (mname, *_rest), ((c, d, t, cm, cms), state) in zip(shards, parts):
+        if states is not None and state is not None:
+            states[mname] = state
+        cycles.update(c)
+        downtimes.update(d)
+        timeline_data.update(t)
+        counter_markers.update(cm)
+        counter_machines |= cms
+    return cycles, downtimes, timeline_data, counter_markers, counter_machines
+
 # ── GitHub Pages publish ──────────────────────────────────────────────────────
+def _publish_static(html: str, headers: dict) -> None:
+    """Завантажує на Pages static/<назва> з html, яких там ще немає. Назва містить хеш вмісту,
+    тож кожен файл іде один раз; опубліковані записуються в static/manifest.json."""
+    import re
+    import urllib.request
+    import urllib.error
+    names = sorted(set(re.findall(r'(?:src|href)="static/([\w.-]+)"', html)))
+    if not names:
+        return
+    manifest = _static_manifest()
+    done = set(manifest.get("published", []))
+    for name in names:
+        if name in done:
+            continue
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            data = f.read()
+        payload = {"message": f"static {name}", "content": base64.b64encode(data).decode(), "branch": "main"}
+        req = urllib.request.Request(
+            f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/static/{name}",
+            data=json.dumps(payload).encode(), headers=headers, method="PUT")
+        try:
+            with urllib.request.urlopen(req, timeout=60):
+                pass
+            log(f"Uploaded static/{name} ({len(data)} bytes)")
+        except urllib.error.HTTPError as e:
+            if e.code != 422:                 # 422 — файл з цим хешем уже є в репозиторії
+                raise
+        done.add(name)
+        manifest["published"] = sorted(done)
+        _save_static_manifest(manifest)
+
 def publish_to_github(html: str) -> bool:
     """Push index.html to GitHub Pages via API — no git install required."""
     import base64
     import traceback
+    import urllib.request
+    import urllib.error
     try:
         api     = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/index.html"
         headers = {
@@ -1245,6 +2679,10 @@ def publish_to_github(html: str) -> bool:
         log(f"GitHub User: {GITHUB_USER}")
         log(f"GitHub Repo: {GITHUB_REPO}")
         
+        # Спершу ресурси static/, на які посилається сторінка, — інакше новий index.html
+        # на мить посилався б на файли, яких на Pages ще немає
+        _publish_static(html, headers)
+
         # Отримуємо SHA якщо файл вже існує
         sha = None
         try:
@@ -1379,19 +2817,19 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
     log(f"Checking downtimes for {len(downtimes)} machines...")
     for mname, dd in downtimes.items():
         machine_downtimes = dd.get("downtimes", [])
-        log(f"  {mname}: {len(machine_downtimes)} downtime events")
+        log(f"  {mname}: {len(machine_downtimes)} downtime events", "DEBUG")
         
         for d in machine_downtimes:
             duration = d["duration"]
             is_ongoing = not d.get("end")
-            log(f"    - Duration: {duration} min, Ongoing: {is_ongoing}, Threshold: {ALERT_THRESHOLD_MIN} min")
+            log(f"    - Duration: {duration} min, Ongoing: {is_ongoing}, Threshold: {ALERT_THRESHOLD_MIN} min", "DEBUG")
             
             if duration >= ALERT_THRESHOLD_MIN:
                 # Унікальний ключ: машина + час початку (не змінюється для ongoing)
                 alert_key = f"downtime_{mname}_{d['start'].strftime('%Y-%m-%d_%H:%M')}"
                 already_sent = alert_key in sent_alerts
                 
-                log(f"    - Qualifies for alert! Key: {alert_key}, Already sent: {already_sent}")
+                log(f"    - Qualifies for alert! Key: {alert_key}, Already sent: {already_sent}", "DEBUG")
                 
                 # Перевіряємо чи вже відправляли алерт для цього простою
                 if already_sent:
@@ -1401,23 +2839,23 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
                         prev_duration = prev_alert.get("duration", 0)
                         additional_duration = duration - prev_duration
                         
-                        log(f"    - Ongoing: prev_duration={prev_duration}, additional={additional_duration}")
+                        log(f"    - Ongoing: prev_duration={prev_duration}, additional={additional_duration}", "DEBUG")
                         
                         # Якщо протривав ще мінімум 45 хв - повторюємо алерт
                         if additional_duration >= 45:
-                            log(f"    - ✓ Adding repeat alert (additional {additional_duration} min)")
+                            log(f"    - ✓ Adding repeat alert (additional {additional_duration} min)", "DEBUG")
                             downtime_alerts.append((mname, d, alert_key, True))  # True = repeat
                         else:
-                            log(f"    - ✗ Not enough additional time ({additional_duration} < 45 min)")
+                            log(f"    - ✗ Not enough additional time ({additional_duration} < 45 min)", "DEBUG")
                     else:
-                        log(f"    - ✗ Downtime finished, not repeating")
+                        log(f"    - ✗ Downtime finished, not repeating", "DEBUG")
                     # Якщо простій закінчився (є end) - НЕ повторюємо, пропускаємо
                 else:
                     # Новий простій - відправляємо
-                    log(f"    - ✓ Adding new alert")
+                    log(f"    - ✓ Adding new alert", "DEBUG")
                     downtime_alerts.append((mname, d, alert_key, False))  # False = new
             else:
-                log(f"    - ✗ Below threshold ({duration} < {ALERT_THRESHOLD_MIN} min)")
+                log(f"    - ✗ Below threshold ({duration} < {ALERT_THRESHOLD_MIN} min)", "DEBUG")
     
     log(f"Found {len(downtime_alerts)} downtime alerts")
     
@@ -1436,11 +2874,11 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
     ]
     # DEBUG: показуємо зразок машин з Excel
     unique_machines_excel = sorted(set(em for _, _, em, _ in excel_norm))
-    log(f"  Excel machine norms (sample): {unique_machines_excel[:10]}")
+    log(f"  Excel machine norms (sample): {unique_machines_excel[:10]}", "DEBUG")
     for mname, c_list in cycles.items():
-        machine_short = mname.split("_")[0] if "_" in mname else mname
+        machine_short = _machine_short(mname)
         machine_norm = normalize_program_name(machine_short)
-        log(f"  Machine: {machine_short} → norm={machine_norm}")
+        log(f"  Machine: {machine_short} → norm={machine_norm}", "DEBUG")
 
         # Групуємо по програмах
         by_prog = {}
@@ -1479,9 +2917,9 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
             excel_target = None
             prog_hits = [(ep, eop, em, t) for ep, eop, em, t in excel_norm if ep == prog_normalized]
             if not prog_hits:
-                log(f"    {prog} (norm={prog_normalized}, machine={machine_norm}, op={op_num}): No prog match in Excel")
+                log(f"    {prog} (norm={prog_normalized}, machine={machine_norm}, op={op_num}): No prog match in Excel", "DEBUG")
             else:
-                log(f"    {prog} (norm={prog_normalized}, machine={machine_norm}, op={op_num}): {len(prog_hits)} prog matches, machines={[x[2] for x in prog_hits[:5]]}")
+                log(f"    {prog} (norm={prog_normalized}, machine={machine_norm}, op={op_num}): {len(prog_hits)} prog matches, machines={[x[2] for x in prog_hits[:5]]}", "DEBUG")
             for ep_norm, eop, em_norm, time_val in excel_norm:
                 if prog_normalized == ep_norm and op_num == eop and machine_norm == em_norm:
                     excel_target = time_val
@@ -1491,17 +2929,17 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
             if excel_target:
                 machines_checked.add(machine_short)  # Додаємо до перевірених
                 diff_pct = ((calc_target - excel_target) / excel_target) * 100
-                log(f"    {prog}: Calculated={calc_target}, Target={excel_target}, Diff={round(diff_pct, 1)}%")
+                log(f"    {prog}: Calculated={calc_target}, Target={excel_target}, Diff={round(diff_pct, 1)}%", "DEBUG")
 
                 if abs(diff_pct) > 5:
-                    log(f"    ✓ Adding target alert (difference >5%)")
+                    log(f"    ✓ Adding target alert (difference >5%)", "DEBUG")
                     target_alerts.append((machine_short, prog, calc_target, excel_target, diff_pct, len(prog_cycles)))
                     machines_with_issues.add(machine_short)
                 else:
-                    log(f"    ✓ On target (difference ≤5%)")
+                    log(f"    ✓ On target (difference ≤5%)", "DEBUG")
                     on_target.append((machine_short, prog, calc_target, excel_target, diff_pct, len(prog_cycles)))
             else:
-                log(f"    {prog}: No target found in Excel")
+                log(f"    {prog}: No target found in Excel", "DEBUG")
                 no_norm_alerts.append((machine_short, prog, calc_target, len(prog_cycles)))
                 machines_no_norm.add(machine_short)
     
@@ -1516,7 +2954,7 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
     # Збираємо ВСІ поточні простої (ongoing) для включення в будь-яке повідомлення
     all_ongoing = []
     for mname, dd in downtimes.items():
-        short = mname.split("_")[0] if "_" in mname else mname
+        short = _machine_short(mname)
         for d in dd.get("downtimes", []):
             if not d.get("end"):  # тільки ongoing
                 all_ongoing.append((short, d))
@@ -1628,1864 +3066,3678 @@ def check_and_alert(downtimes, period_to, cycles, excel_targets):
 def fmt_time(dt):   return dt.strftime("%H:%M") if dt else "—"
 def eff_color(pct): return "#22c55e" if pct >= 75 else ("#f59e0b" if pct >= 50 else "#ef4444")
 
-def generate_html(cycles, downtimes, period_from, period_to, timeline_data, conn, excel_targets, counter_markers=None):
-    generated  = datetime.now().strftime("%d.%m.%Y %H:%M")
-    period_str = f"{fmt_time(period_from)} – {fmt_time(period_to)}"
-    today_str  = datetime.now().strftime("%Y-%m-%d")
-    _gen_hm    = period_to.strftime("%H:%M") if period_to else datetime.now().strftime("%H:%M")
+def _b64_array(typecode: str, values) -> str:
+    """Пакує список чисел у base64 масив (little-endian), який JS читає як TypedArray."""
+    arr = array.array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return base64.b64encode(arr.tobytes()).decode("ascii")
 
-    # ── Stats data ──────────────────────────────────────────────────────
-    # Повний список: ALL_MACHINES з конфігу + всі що є в БД + поточні дані
-    _all_known_machines = set(ALL_MACHINES) | set(cycles.keys()) | set(downtimes.keys())
-    try:
-        if conn:
-            for _r in conn.execute("SELECT DISTINCT machine FROM daily_summary").fetchall():
-                _all_known_machines.add(_canonical_machine(_r[0]))
-    except: pass
-    _n_known = len(_all_known_machines) if _all_known_machines else 1
+def _pack_timeline(segs, markers, period_from, period_to, short):
+    """Пакує сегменти таймлайну одного станку для canvas-режиму.
 
-    # Годинні дані з БД за останні 7 днів (hourly_stats).
-    # save_to_db() перезаписує today, тому current-run теж включено.
-    _hourly_cutoff = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
-    _hr_by_date = {}   # {date: {machine: {hour: {"r": run, "t": total}}}}
-    try:
-        if conn:
-            for _r in conn.execute(
-                "SELECT date,machine,hour,run_min,total_min FROM hourly_stats "
-                "WHERE date >= ? ORDER BY date,machine,hour",
-                (_hourly_cutoff,)
-            ).fetchall():
-                _d, _mraw, _h, _run, _tot = _r
-                _m = _canonical_machine(_mraw)
-                _hr_by_date.setdefault(_d, {}).setdefault(_m, {})[int(_h)] = {"r": _run or 0, "t": _tot or 0}
-    except Exception as _e:
-        log(f"hourly_stats load error: {_e}")
+    Час сегментів — секунди від period_from (Int32), стан — Uint8,
+    мітка — індекс у словнику lbl (Int32). ID сегменту "M1_12" / "M1_12_3"
+    розкладається на b=12, k=3 (k=-1 якщо сегмент не розрізаний по COUNTER).
+    """
+    total_sec = max((period_to - period_from).total_seconds(), 1)
+    labels, lbl_idx = [], {}
+    s_arr, e_arr, st_arr, l_arr, b_arr, k_arr = [], [], [], [], [], []
+    for s in segs:
+        sec0 = round(s["x"] / 100 * total_sec)
+        s_arr.append(sec0)
+        e_arr.append(max(round((s["x"] + s["w"]) / 100 * total_sec), sec0))
+        st_arr.append(1 if s["state"] == "1" else 0)
+        li = lbl_idx.get(s["label"])
+        if li is None:
+            li = lbl_idx[s["label"]] = len(labels)
+            labels.append(s["label"])
+        l_arr.append(li)
+        parts = s["id"].split("_")[1:]
+        b_arr.append(int(parts[0]))
+        k_arr.append(int(parts[1]) if len(parts) > 1 else -1)
+    mk_arr = []
+    for ct in markers:
+        sec = (ct - period_from).total_seconds()
+        if 0 <= sec <= total_sec:
+            mk_arr.append(int(sec))
+    return {
+        "t0":   period_from.hour * 3600 + period_from.minute * 60 + period_from.second,
+        "span": int(total_sec),
+        "pfx":  short,
+        "s":    _b64_array("i", s_arr),
+        "e":    _b64_array("i", e_arr),
+        "st":   _b64_array("B", st_arr),
+        "l":    _b64_array("i", l_arr),
+        "b":    _b64_array("i", b_arr),
+        "k":    _b64_array("i", k_arr),
+        "mk":   _b64_array("i", mk_arr),
+        "lbl":  labels,
+    }
+
+def _encode_gantt(rows, session_gap=GANTT_SESSION_GAP_MIN):
+    """Колонкове кодування cycle_events для Batch Gantt.
+
+    rows — [(date "YYYY-MM-DD", machine_short, program, start_min, end_min, dur)],
+    відсортовані за (date, machine, start). Повертає:
+        P/M  — словники програм і станків, p/m — індекси в них
+        d0   — перша дата, dd — приріст дати в днях від попереднього запису
+        s    — старт у хв від 00:00; в межах того ж (дата, станок) — приріст від попереднього старту
+        l    — end - start (хв, може бути < 0 для циклів через північ)
+        u    — сумарна тривалість (dur)
+    Сусідні цикли тієї ж програми з розривом ≤ session_gap зливаються в один запис:
+    buildFromRange() у JS однаково об'єднав би їх в одну сесію, тож картина не змінюється.
+    """
+    recs = []
+    for date_s, mach, prog, s_min, e_min, dur in rows:
+        last = recs[-1] if recs else None
+        if (last and last[0] == date_s and last[1] == mach and last[2] == prog
+                and s_min - last[4] <= session_gap):
+            last[4] = max(last[4], e_min)
+            last[5] = round(last[5] + dur, 2)
+            continue
+        recs.append([date_s, mach, prog, s_min, e_min, dur])
+
+    progs, prog_idx, machs, mach_idx = [], {}, [], {}
+    dd, mm, pp, ss, ll, uu = [], [], [], [], [], []
+    d0 = recs[0][0] if recs else ""
+    prev_ord = datetime.strptime(d0, "%Y-%m-%d").toordinal() if recs else 0
+    prev_key, prev_s = None, 0
+    for date_s, mach, prog, s_min, e_min, dur in recs:
+        o = datetime.strptime(date_s, "%Y-%m-%d").toordinal()
+        dd.append(o - prev_ord)
+        prev_ord = o
+        mi = mach_idx.get(mach)
+        if mi is None:
+            mi = mach_idx[mach] = len(machs)
+            machs.append(mach)
+        pi = prog_idx.get(prog)
+        if pi is None:
+            pi = prog_idx[prog] = len(progs)
+            progs.append(prog)
+        mm.append(mi)
+        pp.append(pi)
+        ss.append(s_min - prev_s if (o, mi) == prev_key else s_min)
+        prev_key, prev_s = (o, mi), s_min
+        ll.append(e_min - s_min)
+        uu.append(dur)
+    return {"d0": d0, "P": progs, "M": machs,
+            "dd": dd, "m": mm, "p": pp, "s": ss, "l": ll, "u": uu}
+
+def period_trend(daily: dict, machines: list, today_str: str) -> dict:
+    """Готові ряди Period Trend з daily_summary ({дата: {станок: eff %}}) — графік лише вибирає ряд.
+
+        d — по днях за останні TREND_DAILY_DAYS (d0 — перша дата)
+        w — по ISO-тижнях за TREND_WEEKLY_DAYS (w0 — понеділок першого, wn — номери тижнів)
+        m — по місяцях за всю історію (m0 — "YYYY-MM" першого)
+    Тиждень / місяць = сума денних ефективностей / кількість робочих днів календаря в ньому
+    (лише дні історії до сьогодні): робота у вихідні додає, а не розбавляє; не більше 100.
+    Ряд "SITE" — середнє по станках, як крива SITE на графіку при всіх вибраних станках.
+    Тиждень / місяць без жодного дня історії — None.
+    """
+    today = datetime.strptime(today_str, "%Y-%m-%d")
+    first = min(daily) if daily else today_str
+    work = {}
+
+    def _bucket(days):
+        days = [d for d in days if first <= d <= today_str]
+        if not days:
+            return {k: None for k in machines + ["SITE"]}
+        for d in days:
+            if d not in work:
+                work[d] = _work_window_min(d) > 0
+        n = max(1, sum(work[d] for d in days))
+        vals = {k: min(100.0, sum((daily.get(d) or {}).get(k) or 0 for d in days) / n) for k in machines}
+        vals["SITE"] = sum(vals.values()) / len(vals) if vals else 0
+        return {k: round(v, 1) for k, v in vals.items()}
+
+    def _iso(dt):
+        return dt.strftime("%Y-%m-%d")
+
+    def _series(buckets):
+        out = {k: [] for k in machines + ["SITE"]}
+        for b in buckets:
+            for k, v in b.items():
+                out[k].append(v)
+        return out
+
+    d0 = today - timedelta(days=TREND_DAILY_DAYS)
+    d_days = [_iso(d0 + timedelta(days=i)) for i in range(TREND_DAILY_DAYS + 1)]
+    d_ser = {k: [(daily.get(d) or {}).get(k) or 0 for d in d_days] for k in machines}
+    d_ser["SITE"] = [round(sum(col) / len(col)) if col else 0 for col in zip(*d_ser.values())] \
+        if machines else [0] * len(d_days)
+
+    w0 = today - timedelta(days=TREND_WEEKLY_DAYS)
+    w0 -= timedelta(days=w0.weekday())
+    weeks, wn, wk = [], [], w0
+    while wk <= today:
+        weeks.append(_bucket([_iso(wk + timedelta(days=i)) for i in range(7)]))
+        wn.append(wk.isocalendar()[1])
+        wk += timedelta(days=7)
+
+    y, m = int(first[:4]), int(first[5:7])
+    m0, months = f"{y:04d}-{m:02d}", []
+    while (y, m) <= (today.year, today.month):
+        nxt = (y + m // 12, m % 12 + 1)
+        span = (datetime(*nxt, 1) - datetime(y, m, 1)).days
+        months.append(_bucket([f"{y:04d}-{m:02d}-{i:02d}" for i in range(1, span + 1)]))
+        y, m = nxt
+
+    return {"d0": _iso(d0), "d": d_ser, "w0": _iso(w0), "wn": wn, "w": _series(weeks),
+            "m0": m0, "m": _series(months)}
+
+# JS canvas-таймлайну (TIMELINE_MODE="canvas"). Звичайний рядок, не f-string —
+# дані підставляються окремо як var TLPACK={uid: _pack_timeline(...)}.
+# Canvas завжди шириною видимої області (sticky), ширина .tl-track = zoom;
+# малюються лише видимі сегменти (бінарний пошук по кінцях сегментів).
+_TL_CANVAS_JS = r"""
+// ── Canvas timeline ───────────────────────────────────────────────
+(function(){
+  if(!window.TLPACK) return;
+  var tip=document.getElementById("tl-tooltip");
+  var VH=44, TH=26;
+  function unpack(b64,T){
+    var bin=atob(b64),n=bin.length,u8=new Uint8Array(n);
+    for(var i=0;i<n;i++) u8[i]=bin.charCodeAt(i);
+    return new T(u8.buffer);
+  }
+  function hm(t0,s){
+    var m=Math.floor((((t0+s)%86400)+86400)%86400/60),h=Math.floor(m/60);m=m%60;
+    return (h<10?'0':'')+h+':'+(m<10?'0':'')+m;
+  }
+  var byId={},tls=[],pending={};
+  function unpackTl(cv){
+    var p=TLPACK[cv.dataset.uid];if(!p) return null;
+    var tl={cv:cv,wrapper:cv.closest(".tl-scroll-wrapper"),track:cv.parentElement,
+      t0:p.t0,span:p.span||1,pfx:p.pfx,lbl:p.lbl,
+      s:unpack(p.s,Int32Array),e:unpack(p.e,Int32Array),st:unpack(p.st,Uint8Array),
+      l:unpack(p.l,Int32Array),b:unpack(p.b,Int32Array),k:unpack(p.k,Int32Array),
+      mk:unpack(p.mk,Int32Array),hl:null,width:0,raf:null};
+    tl.n=tl.s.length;tl.ids=new Array(tl.n);
+    for(var i=0;i<tl.n;i++){
+      var id=tl.pfx+'_'+tl.b[i]+(tl.k[i]>=0?'_'+tl.k[i]:'');
+      tl.ids[i]=id;byId[id]={tl:tl,i:i};
+    }
+    return tl;
+  }
+  function fullW(tl){return tl.width||tl.wrapper.clientWidth||800;}
+  function draw(tl){
+    var vw=tl.wrapper.clientWidth||800,W=fullW(tl),off=tl.wrapper.scrollLeft;
+    var dpr=window.devicePixelRatio||1,H=VH+TH,cv=tl.cv;
+    if(cv.width!==Math.round(vw*dpr)||cv.height!==Math.round(H*dpr)){
+      cv.style.width=vw+"px";cv.style.height=H+"px";
+      cv.width=Math.round(vw*dpr);cv.height=Math.round(H*dpr);
+    }
+    var ctx=cv.getContext("2d");ctx.setTransform(dpr,0,0,dpr,0,0);
+    ctx.clearRect(0,0,vw,H);
+    ctx.fillStyle="#f1f5f9";ctx.fillRect(0,0,vw,VH);
+    var k=W/tl.span,t=off/k,lo=0,hi=tl.n;
+    while(lo<hi){var mid=(lo+hi)>>1;if(tl.e[mid]<t) lo=mid+1;else hi=mid;}
+    for(var i=lo;i<tl.n;i++){
+      var x=tl.s[i]*k-off;if(x>vw) break;
+      var on=tl.hl&&tl.hl[i];
+      ctx.globalAlpha=(tl.hl&&!on)?0.25:1;
+      ctx.fillStyle=tl.st[i]?(on?"#4ade80":"#22c55e"):(on?"#f87171":"#ef4444");
+      ctx.fillRect(x,0,Math.max((tl.e[i]-tl.s[i])*k,0.5),VH);
+    }
+    ctx.globalAlpha=1;
+    ctx.strokeStyle="#a855f7";ctx.lineWidth=1;ctx.beginPath();
+    for(var j=0;j<tl.mk.length;j++){
+      var mx=Math.round(tl.mk[j]*k-off)+0.5;
+      if(mx<-1||mx>vw+1) continue;
+      ctx.moveTo(mx,0);ctx.lineTo(mx,VH);
+    }
+    ctx.stroke();
+    ctx.font="10px sans-serif";ctx.textAlign="center";
+    for(var m=0;m<=tl.span/60;m+=15){
+      var tx=m*60*k-off;if(tx<-30||tx>vw+30) continue;
+      var major=(m%30===0);
+      ctx.beginPath();ctx.moveTo(tx,VH);ctx.lineTo(tx,VH+(major?7:4));
+      ctx.strokeStyle="#cbd5e1";ctx.lineWidth=major?1.5:1;ctx.stroke();
+      if(major){ctx.fillStyle="#64748b";ctx.fillText(hm(tl.t0,m*60),tx,VH+18);}
+    }
+  }
+  function redraw(tl){
+    if(tl.raf) return;
+    tl.raf=requestAnimationFrame(function(){tl.raf=null;draw(tl);});
+  }
+  function hit(tl,e){
+    var r=tl.cv.getBoundingClientRect();
+    if(e.clientY-r.top>VH) return -1;
+    var t=(e.clientX-r.left+tl.wrapper.scrollLeft)/fullW(tl)*tl.span;
+    var lo=0,hi=tl.n-1,ans=-1;
+    while(lo<=hi){var mid=(lo+hi)>>1;if(tl.s[mid]<=t){ans=mid;lo=mid+1;}else hi=mid-1;}
+    return (ans>=0&&t<=tl.e[ans])?ans:-1;
+  }
+  function tipText(tl,i){return hm(tl.t0,tl.s[i])+"–"+hm(tl.t0,tl.e[i])+" | "+tl.lbl[tl.l[i]];}
+  function rowsFor(id){
+    var out=[];
+    document.querySelectorAll(".tl-row").forEach(function(r){
+      var ids=r.dataset.id?r.dataset.id.split(" "):[];
+      if(ids.indexOf(id)!==-1) out.push(r);
+    });
+    return out;
+  }
+  function setHl(tl,i){
+    if(tl.hlIdx===i) return;
+    if(tl.hlIdx!=null&&tl.hlIdx>=0) rowsFor(tl.ids[tl.hlIdx]).forEach(function(r){r.classList.remove("highlight");});
+    tl.hlIdx=i;
+    if(i>=0){var h={};h[i]=1;tl.hl=h;rowsFor(tl.ids[i]).forEach(function(r){r.classList.add("highlight");});}
+    else tl.hl=null;
+    redraw(tl);
+  }
+  function scrollToRow(tl,i){
+    var rows=rowsFor(tl.ids[i]);
+    if(!rows.length&&window.actLogReveal){var rv=window.actLogReveal(tl.ids[i]);if(rv) rows=[rv];}
+    if(!rows.length) return;
+    var tr=rows[rows.length-1],sc=tr.closest(".scroll-tbody-wrap");
+    if(sc){var rr=tr.getBoundingClientRect(),cr=sc.getBoundingClientRect();sc.scrollTo({top:sc.scrollTop+(rr.top-cr.top)-(cr.height/2)+(rr.height/2),behavior:"smooth"});}
+    else window.scrollTo({top:tr.getBoundingClientRect().top+window.scrollY-window.innerHeight/2,behavior:"smooth"});
+    tr.classList.add("highlight");
+    setTimeout(function(){tr.classList.remove("highlight");},1500);
+  }
+  function bindTl(tl){
+    var cv=tl.cv,wrapper=tl.wrapper;
+    draw(tl);
+    wrapper.addEventListener("scroll",function(){redraw(tl);});
+    // ── Hover / click ─────────────────────────────────────────────
+    var isDown=false,isDragging=false,startX,slStart;
+    cv.addEventListener("mousemove",function(e){
+      if(isDown) return;
+      var i=hit(tl,e);setHl(tl,i);
+      if(i<0){tip.style.display="none";return;}
+      tip.textContent=tipText(tl,i);tip.style.display="block";
+      tip.style.left=(e.clientX+14)+"px";tip.style.top=(e.clientY-32)+"px";
+    });
+    cv.addEventListener("mouseleave",function(){tip.style.display="none";setHl(tl,-1);});
+    cv.addEventListener("click",function(e){
+      if(isDragging) return;
+      var i=hit(tl,e);if(i>=0) scrollToRow(tl,i);
+    });
+    // ── Drag to scroll ────────────────────────────────────────────
+    cv.addEventListener("mousedown",function(e){isDown=true;isDragging=false;startX=e.pageX;slStart=wrapper.scrollLeft;wrapper.style.cursor="grabbing";});
+    document.addEventListener("mousemove",function(e){if(!isDown) return;e.preventDefault();isDragging=true;wrapper.scrollLeft=slStart+(startX-e.pageX)*2;});
+    document.addEventListener("mouseup",function(){if(isDown){isDown=false;wrapper.style.cursor="";setTimeout(function(){isDragging=false;},50);}});
+    var txStart=null,tsLeft,tt,tm=false;
+    cv.addEventListener("touchstart",function(e){
+      txStart=e.touches[0].pageX;tsLeft=wrapper.scrollLeft;tt=Date.now();tm=false;
+      var i=hit(tl,e.touches[0]);setHl(tl,i);
+      if(i>=0){tip.textContent=tipText(tl,i);tip.style.display="block";}
+    },{passive:true});
+    cv.addEventListener("touchmove",function(e){if(txStart==null) return;tm=true;wrapper.scrollLeft=tsLeft+(txStart-e.touches[0].pageX)*2;},{passive:true});
+    cv.addEventListener("touchend",function(){
+      txStart=null;
+      var i=tl.hlIdx;
+      if(!tm&&(Date.now()-tt)<300&&i!=null&&i>=0) scrollToRow(tl,i);
+      setTimeout(function(){tip.style.display="none";setHl(tl,-1);},1400);
+    });
+    // ── Ctrl+Wheel zoom ───────────────────────────────────────────
+    var BASE=wrapper.offsetWidth||800,MIN=BASE,MAX=BASE*20;
+    wrapper.addEventListener("wheel",function(e){
+      if(!e.ctrlKey) return;e.preventDefault();
+      var cur=fullW(tl),rect=wrapper.getBoundingClientRect();
+      var nw=Math.round(Math.min(MAX,Math.max(MIN,cur*(e.deltaY<0?1.15:1/1.15))));
+      if(nw===cur) return;
+      var ratio=(e.clientX-rect.left+wrapper.scrollLeft)/cur;
+      tl.width=nw;tl.track.style.width=nw+"px";
+      wrapper.scrollLeft=Math.round(ratio*nw-(e.clientX-rect.left));
+      draw(tl);
+    },{passive:false});
+  }
+  function initCv(cv){
+    if(cv._tl) return;
+    var tl=unpackTl(cv);if(!tl) return;
+    cv._tl=tl;tls.push(tl);bindTl(tl);
+    // дельти, що прийшли до гідратації картки
+    (pending[cv.dataset.uid]||[]).forEach(function(a){window.tlCanvasLive.apply(null,a);});
+    delete pending[cv.dataset.uid];
+  }
+  window.addEventListener("resize",function(){tls.forEach(redraw);});
+  // ── Live-оновлення: сегменти з індексу from замінюються новими ────
+  window.tlCanvasLive=function(uid,span,from,segs,mk){
+    var tl=null;tls.forEach(function(t){if(t.cv.dataset.uid===uid) tl=t;});
+    if(!tl){(pending[uid]=pending[uid]||[]).push([uid,span,from,segs,mk]);return;}
+    var f=Math.min(from,tl.n),n=f+segs.length;
+    function keep(a,T){var b=new T(n);b.set(a.subarray(0,f));return b;}
+    var s=keep(tl.s,Int32Array),e=keep(tl.e,Int32Array),st=keep(tl.st,Uint8Array),
+        l=keep(tl.l,Int32Array),b=keep(tl.b,Int32Array),k=keep(tl.k,Int32Array);
+    for(var i=f;i<tl.n;i++) delete byId[tl.ids[i]];
+    tl.ids.length=f;
+    segs.forEach(function(sg,j){
+      var i=f+j,li=tl.lbl.indexOf(sg[3]),parts=sg[4].split("_").slice(1);
+      if(li<0){li=tl.lbl.length;tl.lbl.push(sg[3]);}
+      s[i]=sg[0];e[i]=sg[1];st[i]=sg[2];l[i]=li;
+      b[i]=+parts[0];k[i]=parts.length>1?+parts[1]:-1;
+      tl.ids[i]=sg[4];byId[sg[4]]={tl:tl,i:i};
+    });
+    if(mk&&mk.length){var m2=new Int32Array(tl.mk.length+mk.length);m2.set(tl.mk);m2.set(mk,tl.mk.length);tl.mk=m2;}
+    tl.s=s;tl.e=e;tl.st=st;tl.l=l;tl.b=b;tl.k=k;tl.n=n;tl.span=span||1;
+    tl.hl=null;tl.hlIdx=null;redraw(tl);
+  };
+  // ── Highlight при наведенні на рядок таблиці ──────────────────────
+  function bindRow(row){
+    function segsOf(){
+      var ids=row.dataset.id?row.dataset.id.split(" "):[],out=[];
+      ids.forEach(function(id){if(byId[id]) out.push(byId[id]);});
+      return out;
+    }
+    row.addEventListener("mouseenter",function(){
+      var segs=segsOf();if(!segs.length) return;
+      var tl=segs[0].tl,h={};
+      segs.forEach(function(sg){if(sg.tl===tl) h[sg.i]=1;});
+      tl.hl=h;redraw(tl);
+      tip.textContent=tipText(tl,segs[0].i);tip.style.display="block";
+      tip.style.left=(row.getBoundingClientRect().right+10)+"px";
+      tip.style.top=(row.getBoundingClientRect().top+window.scrollY)+"px";
+    });
+    row.addEventListener("mouseleave",function(){
+      segsOf().forEach(function(sg){sg.tl.hl=null;sg.tl.hlIdx=null;redraw(sg.tl);});
+      tip.style.display="none";
+    });
+    row.addEventListener("click",function(){
+      var segs=segsOf();if(!segs.length) return;
+      var tl=segs[0].tl,i=segs[0].i,k=fullW(tl)/tl.span;
+      var x=tl.s[i]*k,w=(tl.e[i]-tl.s[i])*k;
+      tl.wrapper.scrollTo({left:x-(tl.wrapper.clientWidth/2)+(w/2),behavior:"smooth"});
+    });
+  }
+  window.tlCanvasBindRow=bindRow;
+  window.tlCanvasBind=function(root){
+    root.querySelectorAll(".tl-cv").forEach(initCv);
+  };
+  window.tlCanvasBind(document);
+})();
+"""
 
-    _hdata_all = {}
-    for _d2, _per_m in _hr_by_date.items():
-        _all_h = set()
-        for _m in _per_m: _all_h |= set(_per_m[_m].keys())
-        _day_hd = {}
-        for _mn in _all_known_machines:
-            _day_hd[_mn] = {}
-            _mdata = _per_m.get(_mn, {})
-            for _h in _all_h:
-                _hd = _mdata.get(_h, {"r": 0, "t": 0})
-                _day_hd[_mn][str(_h)] = round(_hd["r"]/_hd["t"]*100) if _hd["t"] else 0
-        _day_hd["SITE"] = {}
-        for _h in _all_h:
-            _active_tot = sum(_per_m[_m].get(_h,{}).get("t",0) for _m in _per_m if _per_m[_m].get(_h,{}).get("t",0)>0)
-            _n_active = sum(1 for _m in _per_m if _per_m[_m].get(_h,{}).get("t",0)>0)
-            _run2 = sum(_per_m[_m].get(_h,{}).get("r",0) for _m in _per_m)
-            _avg_t = (_active_tot / _n_active) if _n_active else 0
-            _site_denom = _avg_t * _n_known
-            _day_hd["SITE"][str(_h)] = min(100, round(_run2/_site_denom*100)) if _site_denom else 0
-        _hdata_all[_d2] = _day_hd
-    _hourly_js = json.dumps(_hdata_all)
-    # Ефективність за робочі години (filtered) для плашки під графіком
-    _today_eff = {}
-    for _mn in _all_known_machines:
-        _dd = downtimes.get(_mn, {})
-        _r = _dd.get("total_run", 0)
-        _t = _dd.get("total_min", 0)
-        _today_eff[_mn] = round(_r / _t * 100) if _t else 0
-    _today_eff_js = json.dumps(_today_eff)
-    # Денні дані з DB
-    _all_daily = {}; _mk_set = set(_all_known_machines)
-    try:
-        if conn:
-            for _r in conn.execute("SELECT date,machine,run_min,down_min,total_min,efficiency FROM daily_summary ORDER BY date").fetchall():
-                _d2, _m2_raw, _ru, _dm, _tm, _ef = _r
-                _m2 = _canonical_machine(_m2_raw)
-                if _d2 not in _all_daily: _all_daily[_d2] = {}
-                if _tm or _ru:
-                    if _ef and _ef > 0:
-                        _all_daily[_d2][_m2] = round(_ef)
-                    elif _ru and _ru > 0:
-                        # Вихідні або зламані дані — перерахувати з run/(run+down)
-                        _denom = (_ru or 0) + (_dm or 0)
-                        _all_daily[_d2][_m2] = round(_ru / _denom * 100) if _denom > 0 else 0
-                    else:
-                        _all_daily[_d2][_m2] = 0
-                    _all_daily[_d2].setdefault("__s__",{"r":0})
-                    _all_daily[_d2]["__s__"]["r"] += _ru or 0
-                _mk_set.add(_m2)
-    except: pass
-    _n_machines = len(_mk_set)
-    for _d2 in _all_daily:
-        for _m2 in _mk_set:
-            if _m2 not in _all_daily[_d2]:
-                _all_daily[_d2][_m2] = 0
-        _sd = _all_daily[_d2].pop("__s__",{})
-        _ww = _work_window_min(_d2)
-        if _ww > 0:
-            _site_t = _ww * _n_machines
-            _all_daily[_d2]["SITE"] = min(100, round(_sd.get("r",0) / _site_t * 100))
-        else:
-            # сб/нд: тільки активні станки (робота у вихідні — бонус)
-            _active_eff = [v for k,v in _all_daily[_d2].items() if k != "SITE" and v is not None and v > 0]
-            _all_daily[_d2]["SITE"] = round(sum(_active_eff) / len(_active_eff)) if _active_eff else 0
-    _mk_list  = sorted(_mk_set) + ["SITE"]
-    _sk_list  = [(_m.split("_")[0] if "_" in _m else _m) for _m in _mk_list[:-1]] + ["Avg"]
-    _col_list = ["#3b82f6","#22c55e","#f59e0b","#ef4444","#a855f7","#06b6d4","#f97316","#ec4899"][:len(_mk_list)]
-    _daily_js = json.dumps(_all_daily)
-    _mk_js    = json.dumps([str(_m) for _m in _mk_list])
-    _sk_js    = json.dumps(_sk_list)
-    _col_js   = json.dumps(_col_list)
-    # Cycle events for Batch Gantt — останні 30 днів
-    _cdata = []
-    try:
-        if conn:
-            _gantt_cutoff = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
-            for _r in conn.execute(
-                "SELECT date,machine,program,start_time,end_time,duration "
-                "FROM cycle_events WHERE program NOT LIKE 'COUNTER%' AND date >= ? "
-                "ORDER BY date,machine,start_time",
-                (_gantt_cutoff,)
-            ).fetchall():
-                _s = _r[3] if _r[3] and _r[3] != "—" else None
-                if not _s:
-                    continue  # skip records without valid start time (renders at 00:00)
-                _e = _r[4] if _r[4] and _r[4] != "—" else None
-                if not _e:
-                    # Ongoing cycle: use generation time for today, 23:59 for past days
-                    if _r[0] == today_str:
-                        _e = datetime.now().strftime("%H:%M")
-                    else:
-                        _e = "23:59"
-                _dc = _r[0]  # "2026-04-19" → "260419"
-                _d_short = _dc[2:4] + _dc[5:7] + _dc[8:10]
-                _s_short = _s.replace(":", "")  # "08:30" → "0830"
-                _e_short = _e.replace(":", "") if _e else _e
-                # Стискаємо ім'я програми: "WF330-903B.MIN" → "330-903B"
-                _prog = _r[2] or ""
-                _pu = _prog.upper()
-                if _pu.startswith("WF"):
-                    _prog = _prog[2:]
-                if _pu.endswith(".MIN"):
-                    _prog = _prog[:-4]
-                _cdata.append({
-                    "d": _d_short,
-                    "m": (_r[1].split("_")[0] if "_" in _r[1] else _r[1]),
-                    "p": _prog, "s": _s_short, "e": _e_short, "dur": _r[5]
-                })
-    except Exception as _e:
-        log(f"  gantt SQL error: {_e}")
-    log(f"  gantt: {len(_cdata)} records (last 365 days)")
-    _cdata_js = json.dumps(_cdata)
-    # ────────────────────────────────────────────────────────────────────
+# Віртуальний Activity Log: рядки з <script type="application/json" id="activity-scroll-…-data">
+# (формат — activity_section()), у DOM лише видимі ± OVERSCAN; висоти рядків міряються після
+# рендеру, відступи .act-pad тримають повну висоту прокрутки. Голова блоку (rowspan Cycle)
+# рендериться завжди разом з його рядками. actLogReveal(id) — прокрутити до рядка сегмента,
+# actLogLive(id, events) — live-дельта (до ініціалізації — у черзі).
+_ACTLOG_JS = r"""
+// ── Activity Log (virtual) ────────────────────────────────────────
+(function(){
+  var ROW_H=37,SEP_H=3,OVERSCAN=12,MAX_H=350,logs={},pending={};
+  function esc(v){
+    return String(v==null?"":v).replace(/[&<>"']/g,function(c){
+      return {"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[c];});
+  }
+  function rowHtml(r){
+    if(r===0) return '<tr style="height:3px;padding:0;line-height:0;"><td colspan="6" style="height:3px;padding:0;background:#a855f7;border:none;"></td></tr>';
+    var cell="",c=r[7];
+    if(c) cell=c[1]!=null
+      ?'<td rowspan="'+c[0]+'" style="color:#7c3aed;font-weight:700;text-align:center;vertical-align:middle;white-space:nowrap;border-left:1px solid #000;">'+esc(c[1])+' min</td>'
+      :'<td rowspan="'+c[0]+'" style="border-left:1px solid #000;"></td>';
+    return '<tr class="tl-row '+(r[0]===1?"activity-run":"activity-down")+'" data-id="'+esc(r[6])+'">'
+      +"<td>"+esc(r[1])+"</td><td>"+(r[0]===1?"🟢":"🔴")+"</td><td>"+esc(r[2])+"</td>"
+      +"<td>"+(r[3]!=null?esc(r[3]):"…")+(r[5]?' <span class="badge ongoing">ongoing</span>':"")+"</td>"
+      +"<td><strong>"+esc(r[4])+" min</strong></td>"+cell+"</tr>";
+  }
+  function layout(L){
+    var n=L.rows.length;L.top=new Array(n+1);L.top[0]=0;
+    for(var i=0;i<n;i++){
+      if(L.h[i]==null) L.h[i]=L.rows[i]===0?SEP_H:ROW_H;
+      L.top[i+1]=L.top[i]+L.h[i];
+    }
+  }
+  function at(L,y){
+    var lo=0,hi=L.rows.length-1,ans=0;
+    while(lo<=hi){var mid=(lo+hi)>>1;if(L.top[mid]<=y){ans=mid;lo=mid+1;}else hi=mid-1;}
+    return ans;
+  }
+  function pads(L){
+    L.padTop.style.height=L.top[L.lo]+"px";
+    L.padBot.style.height=(L.top[L.rows.length]-L.top[L.hi])+"px";
+  }
+  function render(L,force){
+    var st=L.wrap.scrollTop,vh=L.wrap.clientHeight||MAX_H,n=L.rows.length;
+    var lo=Math.max(0,at(L,st)-OVERSCAN),hi=Math.min(n,at(L,st+vh)+1+OVERSCAN);
+    while(lo>0&&L.rows[lo]!==0&&!L.rows[lo][7]) lo--;     // з голови блоку (rowspan)
+    if(!force&&lo===L.lo&&hi===L.hi) return;
+    L.lo=lo;L.hi=hi;
+    var html="";
+    for(var i=lo;i<hi;i++) html+=rowHtml(L.rows[i]);
+    L.tb.innerHTML=html;
+    var trs=L.tb.children,changed=false;
+    for(var j=0;j<trs.length;j++){
+      var tr=trs[j],hh=tr.offsetHeight;
+      if(hh&&hh!==L.h[lo+j]){L.h[lo+j]=hh;changed=true;}
+      if(L.rows[lo+j]!==0){
+        if(window.tlBindRow) window.tlBindRow(tr);
+        if(window.tlCanvasBindRow) window.tlCanvasBindRow(tr);
+      }
+    }
+    if(changed) layout(L);
+    pads(L);
+  }
+  function fit(L){
+    var outer=document.getElementById("rs-"+L.wrap.id),ch=L.top[L.rows.length]+44;   // 44px — thead
+    if(outer) outer.style.height=Math.min(ch,MAX_H)+"px";
+  }
+  // Live: ongoing-рядки попереднього прогону замінюються, нові події дописуються в кінець
+  function apply(L,events){
+    var rows=L.rows,head=-1,i;
+    for(i=rows.length-1;i>=0;i--){
+      var r=rows[i];if(r===0||!r[5]) continue;
+      if(!r[7]){for(var p=i-1;p>=0;p--){if(rows[p]!==0&&rows[p][7]){rows[p][7][0]=Math.max(rows[p][7][0]-1,1);break;}}}
+      rows.splice(i,1);L.h.splice(i,1);
+      if(r[7]&&i>0&&rows[i-1]===0){rows.splice(i-1,1);L.h.splice(i-1,1);i--;}
+    }
+    for(i=rows.length-1;i>=0;i--){if(rows[i]!==0&&rows[i][7]){head=i;break;}}
+    events.forEach(function(ev){
+      var cyc=ev.type==="cycle",cell=null;
+      if(cyc){if(rows.length){rows.push(0);L.h.push(null);}cell=[1,ev.cycle];}
+      else if(head>=0) rows[head][7][0]+=1;
+      else cell=[1,null];
+      rows.push([cyc?1:2,ev.detail,ev.start,ev.end,ev.dur,ev.ongoing?1:0,ev.ids,cell]);L.h.push(null);
+      if(cell) head=rows.length-1;
+    });
+    var atEnd=L.wrap.scrollTop+L.wrap.clientHeight>=L.wrap.scrollHeight-4;
+    layout(L);fit(L);
+    if(atEnd) L.wrap.scrollTop=L.wrap.scrollHeight;
+    render(L,true);
+  }
+  function init(wrap){
+    if(logs[wrap.id]) return;
+    var src=document.getElementById(wrap.id+"-data");if(!src) return;
+    var L={wrap:wrap,tb:wrap.querySelector("tbody"),rows:JSON.parse(src.textContent),h:[],lo:-1,hi:-1,
+           padTop:wrap.firstElementChild,padBot:wrap.lastElementChild,raf:null};
+    logs[wrap.id]=L;
+    layout(L);fit(L);render(L,true);fit(L);
+    wrap.addEventListener("scroll",function(){
+      if(!L.raf) L.raf=requestAnimationFrame(function(){L.raf=null;render(L);});
+    },{passive:true});
+    (pending[wrap.id]||[]).forEach(function(ev){apply(L,ev);});
+    delete pending[wrap.id];
+  }
+  window.actLogInit=function(root){root.querySelectorAll(".act-log").forEach(init);};
+  window.actLogLive=function(id,events){
+    if(logs[id]) apply(logs[id],events);
+    else (pending[id]=pending[id]||[]).push(events);
+  };
+  // Рядок сегмента id (останній з таких): прокрутити до нього, відрендерити і повернути <tr>
+  window.actLogReveal=function(id){
+    for(var k in logs){
+      var L=logs[k];
+      for(var i=L.rows.length-1;i>=0;i--){
+        var r=L.rows[i];
+        if(r===0||(" "+r[6]+" ").indexOf(" "+id+" ")<0) continue;
+        L.wrap.scrollTop=Math.max(0,L.top[i]-L.wrap.clientHeight/2);
+        render(L,true);
+        return L.tb.children[i-L.lo]||null;
+      }
+    }
+    return null;
+  };
+  window.actLogInit(document);
+})();
+"""
 
-    def timeline_bar(mname):
-        segs         = timeline_data.get(mname, [])
-        total_sec_tl = max((period_to - period_from).total_seconds(), 1)
-        total_min    = total_sec_tl / 60
-        VW, VH       = 10000, 44
+# JS live-режиму (LIVE_API_URL): EventSource на /api/live, дельти з record_live_delta()
+# застосовуються до таймлайну (SVG або canvas), Activity Log, плашки ефективності й Today-графіка.
+# Звичайний рядок; перед ним generate_html() підставляє var LIVE={url, seq, date, span}.
+_LIVE_JS = r"""
+// ── Live updates (SSE) ────────────────────────────────────────────
+(function(){
+  if(!window.EventSource||!window.LIVE||!LIVE.url) return;
+  var span=LIVE.span,t0=LIVE.t0,reloadT=null,SVGNS="http://www.w3.org/2000/svg",VW=10000,VH=44;
+  // Елемент картки: у DOM або ще в <template> лінивої картки (оновлюється там до гідратації)
+  function find(short,id){
+    var el=document.getElementById(id);if(el) return el;
+    var r=window.lazyRoot&&window.lazyRoot(short);
+    return r?r.getElementById(id):null;
+  }
+  function retick(outer){
+    if(!outer._ticks||outer._span===span) return;
+    var t=outer._ticks;t.length=0;outer._span=span;
+    for(var mi=0;mi<=span/60;mi+=15){var major=(mi%30===0);t.push({p:mi*60/span*100,t:major?hm(t0,mi*60):"",major:major});}
+    var svg=outer.querySelector("svg");
+    outer._redrawTicks(svg.getBoundingClientRect().width||svg.offsetWidth);
+  }
+  // Після гідратації лінивої картки: тіки з HTML могли застаріти
+  window.liveRetick=function(root){
+    root.querySelectorAll(".tl-outer-wrap").forEach(function(o){if(o._ticks&&span!==LIVE.span) retick(o);});
+  };
+  function hm(t0,s){
+    var m=Math.floor((((t0+s)%86400)+86400)%86400/60),h=Math.floor(m/60);m=m%60;
+    return (h<10?"0":"")+h+":"+(m<10?"0":"")+m;
+  }
+  function effColor(p){return p>=75?"#22c55e":(p>=50?"#f59e0b":"#ef4444");}
+  function reloadSoon(){
+    // нова доба / пропущені дельти: чекаємо, поки звіт перегенерується й опублікується
+    if(!reloadT) reloadT=setTimeout(function(){location.reload();},60000);
+  }
+  function timeline(m,d,k){
+    if(window.tlCanvasLive){window.tlCanvasLive(m.uid,d.span,m.from,m.segs,m.mk);return;}
+    var svg=find(m.short,"svg_"+m.uid);if(!svg) return;
+    if(k!==1){
+      svg.querySelectorAll(".tl-seg").forEach(function(r){
+        r.setAttribute("x",+r.getAttribute("x")*k);
+        r.setAttribute("width",Math.max(+r.getAttribute("width")*k,0.5));
+      });
+      svg.querySelectorAll("line").forEach(function(ln){
+        ln.setAttribute("x1",+ln.getAttribute("x1")*k);ln.setAttribute("x2",+ln.getAttribute("x2")*k);
+      });
+    }
+    var old=svg.querySelectorAll(".tl-seg");
+    for(var i=m.from;i<old.length;i++) old[i].remove();
+    var before=svg.querySelector("line");
+    m.segs.forEach(function(sg){
+      var r=document.createElementNS(SVGNS,"rect");
+      r.setAttribute("class","tl-seg");r.dataset.id=sg[4];
+      r.dataset.tip=hm(d.t0,sg[0])+"–"+hm(d.t0,sg[1])+" | "+sg[3];
+      r.setAttribute("x",sg[0]/d.span*VW);r.setAttribute("y",0);
+      r.setAttribute("width",Math.max((sg[1]-sg[0])/d.span*VW,0.5));r.setAttribute("height",VH);
+      r.setAttribute("fill",sg[2]?"#22c55e":"#ef4444");r.setAttribute("cursor","pointer");
+      svg.insertBefore(r,before);
+      if(svg.isConnected&&window.tlBindSeg) window.tlBindSeg(r);
+    });
+    m.mk.forEach(function(sec){
+      var x=sec/d.span*VW,ln=document.createElementNS(SVGNS,"line");
+      ln.setAttribute("x1",x);ln.setAttribute("x2",x);ln.setAttribute("y1",0);ln.setAttribute("y2",VH);
+      ln.setAttribute("stroke","#a855f7");ln.setAttribute("stroke-width",1);ln.setAttribute("pointer-events","none");
+      svg.appendChild(ln);
+    });
+    var outer=svg.closest(".tl-outer-wrap");
+    if(outer) retick(outer);
+  }
+  function activity(name,m){
+    if(window.actLogLive) window.actLogLive("activity-scroll-"+name.replace(/_/g,"-"),m.events);
+  }
+  function badge(m){
+    var card=document.getElementById("machine-"+m.short);
+    var b=card&&card.querySelector(".eff-badge");if(!b) return;
+    b.style.background=effColor(m.eff);
+    b.innerHTML="Efficiency: "+m.eff+'%\n<span class="eff-detail">('+m.run+" / "+m.total+" min)</span>";
+  }
+  var es=new EventSource(LIVE.url+(LIVE.url.indexOf("?")<0?"?":"&")+"since="+LIVE.seq);
+  es.onmessage=function(msg){
+    var d;try{d=JSON.parse(msg.data);}catch(e){return;}
+    if(d.type==="reload"||d.date!==LIVE.date){if(d.date!==LIVE.date) reloadSoon();return;}
+    var k=span/d.span;span=d.span;t0=d.t0;
+    Object.keys(d.machines).forEach(function(name){
+      var m=d.machines[name];
+      timeline(m,d,k);activity(name,m);badge(m);
+    });
+    var pr=document.getElementById("report-period");
+    if(pr) pr.textContent=hm(d.t0,0)+" – "+d.hm;
+    if(window.liveStats) window.liveStats(d.date,d.hourly,d.teff,d.hm);
+  };
+})();
+"""
 
-        def to_x(pct):
-            return round(pct / 100 * VW, 2)
+# ── Report assets ──────────────────────────────────────────────────────────────
+# Незмінна частина сторінки: стилі й код. Дані прогону (REPORT, TLPACK, LIVE, gantt-data)
+# ідуть у index.html окремо — див. static_assets()
+_REPORT_CSS = r"""
+  *{box-sizing:border-box;margin:0;padding:0}
+  body{font-family:'Roboto','Segoe UI',Arial,sans-serif;background:#ffffff;color:#212121;font-size:15px;margin:0;-webkit-font-smoothing:antialiased;-moz-osx-font-smoothing:grayscale;text-rendering:optimizeLegibility}
 
-        # ── сегменти ──────────────────────────────────────────────────
-        rects = ""
-        for s in segs:
-            color  = "#22c55e" if s["state"] == "1" else "#ef4444"
-            seg_id = s["id"]
-            label  = s["label"].replace('"', "&quot;").replace("'", "&#39;")
-            tip    = f'{s["start"]}\u2013{s["end"]} | {label}'
-            x  = to_x(s["x"])
-            w  = max(to_x(s["w"]), 0.5)
-            rects += (
-                f'<rect class="tl-seg" data-id="{seg_id}" data-tip="{tip}" '
-                f'x="{x}" y="0" width="{w}" height="{VH}" fill="{color}" cursor="pointer"/>')
+  /* ── Header ── */
+  .header{background:#1450CF;color:white;padding:10px 20px;display:flex;justify-content:space-between;align-items:center;flex-wrap:wrap;gap:8px;box-shadow:0 2px 4px rgba(0,0,0,.2)}
+  .header h1{font-size:1.2rem;font-weight:500}
+  .header .meta{font-size:.8rem;opacity:.9;text-align:right}
+  .stale-banner{background:#fef3c7;color:#92400e;border-bottom:1px solid #f59e0b;padding:6px 20px;font-size:.85rem;font-weight:600}
+  .header-tabs{display:flex;gap:4px;align-items:center}
 
+  /* ── Layout ── */
+  .container{max-width:1100px;margin:16px auto;padding:0 12px}
 
+  /* ── Machine card ── */
+  .machine-card{background:#FFFFFF;border-radius:2px;box-shadow:0 2px 4px rgba(0,0,0,.3);margin-bottom:16px;overflow:hidden}
+  .machine-header{background:#1e293b;color:white;padding:14px 16px;display:flex;justify-content:space-between;align-items:center;flex-wrap:wrap;gap:8px}
+  .machine-title{display:flex;flex-direction:column;gap:2px}
+  .machine-id{font-size:1.1rem;font-weight:500}
+  .machine-full{font-size:.7rem;opacity:.8;word-break:break-all}
+  .eff-badge{padding:5px 12px;border-radius:2px;font-weight:500;font-size:.85rem;color:white;white-space:nowrap}
+  .eff-detail{font-size:.72rem;font-weight:400;opacity:.9;margin-left:4px}
 
-        markers_svg = ""
-        if counter_markers:
-            for ct in counter_markers.get(mname, []):
-                ct_sec = (ct - period_from).total_seconds()
-                pct = ct_sec / total_sec_tl * 100
-                if 0 <= pct <= 100:
-                    cx = to_x(pct)
-                    markers_svg += (
-                        f'<line x1="{cx}" y1="0" x2="{cx}" y2="{VH}" '
-                        f'stroke="#a855f7" stroke-width="1" opacity="1" pointer-events="none"/>')
+  /* ── Section title ── */
+  .section-title{padding:10px 16px 5px;font-weight:500;font-size:.8rem;color:#757575;border-top:1px solid #E0E0E0;text-transform:uppercase;letter-spacing:.05em}
 
-        # ── тіки — JSON масив для JS ───────────────────────────────────
-        ticks_json = []
-        for i in range(0, int(total_min) + 1, 15):
-            pct  = round(i / total_min * 100, 4)
-            t    = (period_from + timedelta(minutes=i)).strftime("%H:%M")
-            is30 = (i % 30 == 0)
-            ticks_json.append({"p": pct, "t": t if is30 else "", "major": is30})
+  /* ── Tables (desktop) ── */
+  table{width:100%;border-collapse:collapse;font-size:.85rem}
+  th{background:#F8F9FA;padding:8px 12px;text-align:left;font-weight:500;color:#495057;border-bottom:2px solid #DEE2E6;white-space:nowrap}
+  td{padding:8px 12px;border-bottom:1px solid #DEE2E6;word-break:break-word}
+  tr:last-child td{border-bottom:none}
+  tr:hover td{background:#E9ECEF}
+  .tl-row{cursor:pointer;transition:background-color 0.2s ease}
+  .tl-row:hover td{background:#E3F2FD!important}
+  .activity-run td{background:#E8F5E9}
+  .activity-down td{background:#FFEBEE}
+  .activity-run:hover td{background:#C8E6C9!important}
+  .activity-down:hover td{background:#FFCDD2!important}
 
-        short  = mname.split("_")[0] if "_" in mname else mname
-        uid    = mname.replace(" ", "_").replace("-", "_")
+  /* ── Scrollable tables ── */
+  .scroll-table-wrap{width:100%;border-bottom:1px solid #e2e8f0}
+  .scroll-table{width:100%;border-collapse:collapse;table-layout:fixed;font-size:.85rem}
+  .scroll-table th,.scroll-table td{padding:8px 12px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap}
+  .scroll-table thead th{background:#F8F9FA;font-weight:500;color:#495057;border-bottom:2px solid #DEE2E6;position:sticky;top:0;z-index:1}
+  .scroll-table tbody tr:last-child td{border-bottom:none}
+  .scroll-table tbody tr:hover td{background:#E9ECEF}
+  .scroll-tbody-wrap{display:block}
+  .scroll-tbody-wrap::-webkit-scrollbar{width:5px}
+  .scroll-tbody-wrap::-webkit-scrollbar-track{background:#F8F9FA}
+  .scroll-tbody-wrap::-webkit-scrollbar-thumb{background:#ADB5BD;border-radius:2px}
+  
+  /* ── Resizable Activity Log ── */
+  .resizable-section{
+    position:relative;
+    overflow:auto;
+    border:1px solid #e2e8f0;
+    border-radius:6px;
+    background:#fff;
+    resize:vertical;
+    min-height:150px;
+  }
+  .resizable-section::-webkit-resizer{
+    background:#cbd5e1;
+    border-radius:3px;
+  }
 
-        # SVG — тільки бари, початкова ширина 100%
-        svg = (
-            f'<svg class="tl-svg" id="svg_{uid}" data-machine="{short}" '
-            f'viewBox="0 0 {VW} {VH}" preserveAspectRatio="none" '
-            f'style="width:100%;height:{VH}px;display:block;background:#f1f5f9">'
-            f'{rects}{markers_svg}'
-            f'</svg>')
+  /* ── Timeline ── */
+  .tl-scroll-wrapper{overflow-x:auto;overflow-y:hidden;position:relative;margin:0 -12px;padding:0 12px}
+  .tl-scroll-wrapper::-webkit-scrollbar{height:8px}
+  .tl-scroll-wrapper::-webkit-scrollbar-track{background:#f1f5f9}
+  .tl-scroll-wrapper::-webkit-scrollbar-thumb{background:#cbd5e1;border-radius:4px}
+  .tl-svg{display:block;border-radius:4px;user-select:none;cursor:grab}
 
-        # Canvas — тіки, завжди 100% ширини зовнішнього контейнера (не scroll-wrapper)
-        # Canvas всередині scroll-wrapper, ширина = SVG ширина при zoom
-        canvas = f'<canvas id="tc_{uid}" style="display:block;height:26px"></canvas>'
-
-        ticks_js = (
-            f'<script>(function(){{'
-            f'var ticks={json.dumps(ticks_json)};'
-            f'var cv=document.getElementById("tc_{uid}");'
-            f'var svg=document.getElementById("svg_{uid}");'
-            f'function drawTicks(w){{'
-            f'  var dpr=window.devicePixelRatio||1;'
-            f'  cv.style.width=w+"px";'
-            f'  cv.width=Math.round(w*dpr);cv.height=Math.round(26*dpr);'
-            f'  var ctx=cv.getContext("2d");ctx.scale(dpr,dpr);'
-            f'  ctx.clearRect(0,0,w,26);'
-            f'  ticks.forEach(function(tk){{'
-            f'    var x=tk.p/100*w;'
-            f'    ctx.beginPath();ctx.moveTo(x,0);ctx.lineTo(x,tk.major?7:4);'
-            f'    ctx.strokeStyle="#cbd5e1";ctx.lineWidth=tk.major?1.5:1;ctx.stroke();'
-            f'    if(tk.t){{'
-            f'      ctx.font="10px sans-serif";ctx.fillStyle="#64748b";'
-            f'      ctx.textAlign="center";ctx.fillText(tk.t,x,18);'
-            f'    }}'
-            f'  }});'
-            f'}}'
-            f'var outer=cv.closest(".tl-outer-wrap");'
-            f'if(outer) outer._redrawTicks=drawTicks;'
-            f'drawTicks(svg.offsetWidth||outer.offsetWidth||800);'
-            f'}})();</script>')
-
-        return (
-            f'<div class="tl-outer-wrap" style="width:100%">'
-            f'<div class="tl-scroll-wrapper" data-machine="{short}" '
-            f'style="overflow-x:auto;overflow-y:hidden;width:100%">'
-            f'{svg}'
-            f'{canvas}'
-            f'</div>'
-            f'{ticks_js}'
-            f'</div>')
+  /* ── Legend ── */
+  .legend{display:flex;gap:14px;padding:4px 16px 10px;font-size:.78rem;flex-wrap:wrap;color:#212121}
+  .legend span{display:flex;align-items:center;gap:4px}
+  .dot{width:11px;height:11px;border-radius:2px;display:inline-block;flex-shrink:0}
 
-    def activity_section(c_list, d_list, mname):
-        """Об'єднана таблиця циклів та простоїв, відсортована за часом"""
-        segs = timeline_data.get(mname, [])
-        
-        # Функція пошуку ID для циклів
-        def find_cycle_ids(cycle):
-            c_start = cycle.get("start")
-            if not c_start:
-                return ""
-            c_end = cycle.get("end") or datetime.now()
-            ids = []
-            for s in segs:
-                if s["state"] != "1":
-                    continue
-                s_start = datetime.strptime(f"{c_start.strftime('%Y.%m.%d')} {s['start']}", "%Y.%m.%d %H:%M")
-                s_end   = datetime.strptime(f"{c_start.strftime('%Y.%m.%d')} {s['end']}", "%Y.%m.%d %H:%M")
-                # Округлюємо до хвилини (сегменти таймлайну %H:%M, підцикли до секунди)
-                c_end_m   = c_end.replace(second=0, microsecond=0)
-                c_start_m = c_start.replace(second=0, microsecond=0)
-                if s_start < c_end_m and s_end > c_start_m:
-                    ids.append(s["id"])
-            return " ".join(ids) if ids else ""
-        
-        # Функція пошуку ID для простоїв
-        def find_down_id(down):
-            for s in segs:
-                if s["state"] == "0" and s["start"] == down["start"].strftime("%H:%M"):
-                    return s["id"]
-                if s["state"] == "0" and s["start"] <= down["start"].strftime("%H:%M") <= s["end"]:
-                    return s["id"]
-            return ""
-        
-        # Об'єднуємо всі події
-        events = []
+  /* ── Misc ── */
+  .badge{display:inline-block;padding:2px 7px;border-radius:10px;font-size:.72rem;font-weight:600;margin-left:3px}
+  .badge.ongoing{background:#dbeafe;color:#1d4ed8}
+  .empty{padding:12px 16px;color:#94a3b8;font-style:italic;font-size:.85rem}
+  .footer{text-align:center;color:#94a3b8;font-size:.75rem;padding:16px;word-break:break-all}
 
-        for c in c_list:
-            if c.get("program", "").upper().startswith("COUNTER"):
-                continue
-            cycle_start = c["start"] if c.get("start") else datetime.now()
-            events.append({
-                "type": "cycle",
-                "start": cycle_start,
-                "end": c.get("end"),
-                "duration": c["duration"],
-                "cycle_time": c.get("cycle_time"),
-                "program": c.get("program", "—"),
-                "ongoing": c.get("ongoing", False),
-                "ids": find_cycle_ids(c)
-            })
+  /* ── Tooltip ── */
+  #tl-tooltip{
+    position:fixed;pointer-events:none;z-index:9999;
+    background:#1e293b;color:white;
+    padding:6px 10px;border-radius:6px;font-size:.78rem;
+    box-shadow:0 4px 12px rgba(0,0,0,.3);
+    display:none;max-width:240px;white-space:normal;line-height:1.4
+  }
 
-        for d in d_list:
-            events.append({
-                "type": "downtime",
-                "start": d["start"],
-                "end": d.get("end"),
-                "duration": d["duration"],
-                "reason": d["reason"],
-                "ongoing": d.get("ongoing", False),
-                "ids": find_down_id(d)
-            })
+  /* ── Highlight ── */
+  .tl-seg.dim{opacity:.25}
+  .tl-seg.highlight{opacity:1;filter:brightness(1.18)}
+  .tl-row{transition:background-color 0.2s ease}
+  .tl-row.highlight td{background:#fde047!important;font-weight:600}
+  .tl-row:hover td{background:#f0f9ff!important}
 
-        events.sort(key=lambda e: e["start"])
+  /* ══════════════════════════════════════════
+     MOBILE  ≤ 600px
+  ══════════════════════════════════════════ */
+  @media(max-width:600px){
+    body{font-size:14px}
+    .header{padding:10px 12px}
+    .header h1{font-size:0.95rem}
+    .header-tabs{gap:3px}
+    .tab-btn{padding:4px 10px;font-size:0.75rem}
+    .container{padding:0 6px;margin:8px auto}
+    .machine-card{border-radius:6px;margin-bottom:10px}
+    /* machine-header — стак вертикально */
+    .machine-header{padding:10px 12px;flex-direction:column;align-items:flex-start;gap:6px}
+    .eff-badge{font-size:.8rem;padding:4px 10px;align-self:stretch;text-align:center}
+    .eff-detail{display:none}
+    .section-title{padding:7px 12px 4px;font-size:.72rem}
+    /* Таблиці */
+    .table-scroll-x{overflow-x:auto;-webkit-overflow-scrolling:touch}
+    table,.scroll-table{font-size:.75rem;min-width:300px}
+    th,td,.scroll-table th,.scroll-table td{padding:6px 8px}
+    /* Resizable — прибираємо resize handle на touch */
+    .resizable-section{resize:none}
+    /* Tooltip */
+    #tl-tooltip{
+      position:fixed;bottom:16px;left:50%;transform:translateX(-50%);
+      top:auto!important;max-width:92vw;text-align:center
+    }
+    .legend{padding:4px 10px 8px;font-size:.72rem;gap:8px}
+    .footer{font-size:.7rem;padding:10px 10px 20px}
+    /* Stats */
+    .chart-wrap{height:220px}
+    .chart-panel{padding:12px 10px}
+    .stats-controls{gap:6px}
+    .stats-controls label{font-size:0.78rem}
+    .stats-controls input[type=date]{font-size:0.78rem;padding:4px 6px;max-width:130px}
+    .stats-controls button{padding:5px 10px;font-size:0.75rem}
+    .stats-table th,.stats-table td{padding:4px 4px;font-size:0.75rem;white-space:nowrap;overflow:hidden}
+    .chart-legend{gap:6px}
+    .leg-item{font-size:0.72rem}
+    /* Scroll-top */
+    #scroll-top{right:12px;left:auto;bottom:20px;width:40px;height:40px;font-size:1.2rem}
+  }
+  /* Nav drawer (all screens) */
+  .nav-sidebar{
+    position:fixed;top:0;left:0;bottom:0;width:fit-content;
+    transform:translateX(-100%);
+    transition:transform .25s ease;
+    display:flex;flex-direction:column;
+    background:transparent;padding:60px 8px 16px;gap:6px;
+    z-index:1500;overflow-y:auto;
+  }
+  .nav-sidebar.open{transform:translateX(0)}
+  #nav-overlay{display:none;position:fixed;inset:0;background:rgba(0,0,0,.45);z-index:1400;}
+  #nav-overlay.open{display:block}
+  #nav-toggle{
+    display:flex;position:fixed;left:0;top:50%;transform:translateY(-50%);
+    width:26px;height:52px;background:#1e293b;color:#fff;
+    border:none;border-radius:0 8px 8px 0;font-size:1rem;cursor:pointer;
+    z-index:1600;align-items:center;justify-content:center;
+    box-shadow:2px 0 8px rgba(0,0,0,.35);
+  }
+  .nav-btn{display:block;padding:14px 10px;font-size:1.1rem;white-space:nowrap;border-radius:10px;width:100%;text-align:center;background:#1e293b;color:#fff;font-weight:800;text-decoration:none;box-shadow:0 2px 8px rgba(0,0,0,0.35);transition:background .15s,box-shadow .15s;letter-spacing:0.04em}
+  .nav-btn:hover{background:#3b82f6;box-shadow:0 4px 14px rgba(59,130,246,0.4)}
+  .nav-tab-btn{background:#1450CF!important;color:#fff!important}
+  .nav-tab-btn.active{background:#3b82f6!important;box-shadow:0 0 0 2px #fff}
+  /* scroll top */
+  #scroll-top{position:fixed;bottom:24px;left:8px;width:44px;height:44px;border-radius:50%;background:#1e293b;color:#fff;border:none;font-size:1.4rem;cursor:pointer;box-shadow:0 4px 12px rgba(0,0,0,.3);display:none;align-items:center;justify-content:center;z-index:2000;transition:background .15s}
+  #scroll-top:hover{background:#3b82f6}
+  #scroll-top.visible{display:flex}
+  /* stats */
+  .stats-controls{display:flex;align-items:center;gap:12px;flex-wrap:wrap;padding:12px 0}
+  .stats-controls label{font-size:0.85rem;color:#475569;display:flex;align-items:center;gap:6px}
+  .stats-controls input[type=date]{padding:5px 8px;border:1px solid #cbd5e1;border-radius:6px;font-size:0.85rem}
+  .stats-controls button{padding:6px 14px;background:#1e293b;color:#fff;border:none;border-radius:6px;cursor:pointer;font-size:0.82rem;font-weight:600}
+  .stats-controls button:hover{background:#3b82f6}
+  .two-charts{display:flex;flex-direction:column;gap:20px;margin-top:12px}
+  .chart-panel{background:#fff;border-radius:8px;box-shadow:0 2px 8px rgba(0,0,0,.1);padding:16px}
+  .chart-title{font-size:0.9rem;font-weight:700;color:#1e293b;margin-bottom:10px}
+  .chart-scroll-outer{overflow-x:auto;-webkit-overflow-scrolling:touch;border:1px solid red;margin-left:-16px;margin-right:-16px}
+  .chart-wrap{position:relative;height:350px;min-width:600px;background:#f8fafc}
+  .chart-legend{display:flex;flex-wrap:wrap;gap:10px;margin-top:8px}
+  .leg-item{display:flex;align-items:center;gap:5px;font-size:0.8rem;color:#334155;font-weight:500}
+  .leg-dot{width:11px;height:11px;border-radius:50%;display:inline-block}
+  .stats-table{border-collapse:collapse;font-size:0.96rem;width:100%;margin-top:16px;table-layout:fixed}
+  .stats-table th{background:#1e293b;color:#fff;padding:6px 12px;text-align:center}
+  .stats-table td{padding:5px 12px;text-align:center;border-bottom:1px solid #e2e8f0}
+  @media(max-width:900px){.two-charts{grid-template-columns:1fr}}
+  /* ── Block dividers ── */
+  .block-header{background:#1e293b;color:#fff;padding:10px 16px;border-radius:6px;margin:20px 0 12px;display:flex;align-items:center;gap:8px;font-size:0.9rem;font-weight:700;letter-spacing:0.04em}
+  .block-header.machines{background:#1e293b;margin-top:28px}
+  /* ── Machine separator ── */
+  .machine-sep{display:flex;align-items:center;gap:10px;margin:24px 0 10px;font-size:0.72rem;color:#94a3b8;font-weight:700;letter-spacing:0.1em;text-transform:uppercase}
+  .machine-sep::before,.machine-sep::after{content:'';flex:1;height:1px;background:#e2e8f0}
+  .machine-card{border-top:3px solid #3DA9D7}
+"""
 
-        if not events:
-            return '<p class="empty">No activity detected</p>'
+_REPORT_JS_HEAD = r"""
+function localISO(d){var y=d.getFullYear(),m=d.getMonth()+1,dd=d.getDate();return y+'-'+(m<10?'0':'')+m+'-'+(dd<10?'0':'')+dd;}
+(function(){
+  var tip = document.getElementById("tl-tooltip");
 
-        # Групуємо: кожен зелений (цикл) + наступні червоні до наступного зеленого = один блок.
-        # Один блок = один цикл деталі: виконання програми + заміна деталі.
-        # Cycle = cycle_time зеленого рядка (start-to-start, вже розраховано).
-        blocks = []
-        i = 0
-        while i < len(events):
-            e = events[i]
-            if e["type"] == "cycle":
-                block_events = [e]
-                j = i + 1
-                while j < len(events) and events[j]["type"] != "cycle":
-                    block_events.append(events[j])
-                    j += 1
-                total_block_dur = round(sum(ev.get("duration", 0) for ev in block_events), 2)
-                blocks.append({"events": block_events, "cycle_time": total_block_dur})
-                i = j
-            else:
-                # Червоні події до першого зеленого — окремий блок без cycle
-                block_events = []
-                while i < len(events) and events[i]["type"] != "cycle":
-                    block_events.append(events[i])
-                    i += 1
-                if block_events:
-                    blocks.append({"events": block_events, "cycle_time": None})
+  // ── Tooltip + highlight при наведенні на сегмент таймлайну ────────────────
+  function bindSeg(seg){
+    seg.addEventListener("mouseenter", function(e){
+      var id=seg.dataset.id, txt=seg.dataset.tip;
+      tip.textContent=txt; tip.style.display="block";
+      var svg=seg.closest("svg");
+      svg.querySelectorAll(".tl-seg").forEach(function(s){ s.classList.add("dim"); });
+      seg.classList.remove("dim"); seg.classList.add("highlight");
+      if(id) document.querySelectorAll('.tl-row').forEach(function(r){
+        var ids=r.dataset.id?r.dataset.id.split(' '):[];
+        if(ids.indexOf(id)!==-1) r.classList.add("highlight");
+      });
+    });
+    seg.addEventListener("mousemove", function(e){
+      tip.style.left=(e.clientX+14)+"px"; tip.style.top=(e.clientY-32)+"px";
+    });
+    seg.addEventListener("mouseleave", function(){
+      tip.style.display="none";
+      var svg=seg.closest("svg");
+      svg.querySelectorAll(".tl-seg").forEach(function(s){ s.classList.remove("dim","highlight"); });
+      var id=seg.dataset.id;
+      if(id) document.querySelectorAll('.tl-row').forEach(function(r){
+        var ids=r.dataset.id?r.dataset.id.split(' '):[];
+        if(ids.indexOf(id)!==-1) r.classList.remove("highlight");
+      });
+    });
+    seg.addEventListener("click", function(){
+      var id=seg.dataset.id; if(!id) return;
+      var targetRow=null;
+      document.querySelectorAll('.tl-row').forEach(function(r){
+        var ids=r.dataset.id?r.dataset.id.split(' '):[];
+        if(ids.indexOf(id)!==-1) targetRow=r;
+      });
+      if(!targetRow&&window.actLogReveal) targetRow=window.actLogReveal(id);   // рядок поза віртуальним вікном
+      if(!targetRow) return;
+      var sc=targetRow.closest(".scroll-tbody-wrap");
+      if(sc){ var rr=targetRow.getBoundingClientRect(),cr=sc.getBoundingClientRect(); sc.scrollTo({top:sc.scrollTop+(rr.top-cr.top)-(cr.height/2)+(rr.height/2),behavior:'smooth'}); }
+      else { window.scrollTo({top:targetRow.getBoundingClientRect().top+window.scrollY-window.innerHeight/2,behavior:'smooth'}); }
+      targetRow.classList.add("highlight");
+      setTimeout(function(){ targetRow.classList.remove("highlight"); },1500);
+    });
+    var _tt,_tm=false;
+    seg.addEventListener("touchstart",function(e){
+      _tt=Date.now();_tm=false;e.preventDefault();
+      tip.textContent=seg.dataset.tip;tip.style.display="block";
+      var svg=seg.closest("svg");
+      svg.querySelectorAll(".tl-seg").forEach(function(s){s.classList.add("dim");});
+      seg.classList.remove("dim");seg.classList.add("highlight");
+      var id=seg.dataset.id;
+      if(id) document.querySelectorAll('.tl-row').forEach(function(r){
+        var ids=r.dataset.id?r.dataset.id.split(' '):[];
+        if(ids.indexOf(id)!==-1) r.classList.add("highlight");
+      });
+    },{passive:false});
+    seg.addEventListener("touchmove",function(){_tm=true;});
+    seg.addEventListener("touchend",function(){
+      var id=seg.dataset.id;
+      if(!_tm&&(Date.now()-_tt)<300&&id){
+        var tr=null;
+        document.querySelectorAll('.tl-row').forEach(function(r){
+          var ids=r.dataset.id?r.dataset.id.split(' '):[];
+          if(ids.indexOf(id)!==-1) tr=r;
+        });
+        if(!tr&&window.actLogReveal) tr=window.actLogReveal(id);
+        if(tr){
+          var sc=tr.closest(".scroll-tbody-wrap");
+          if(sc){var rr=tr.getBoundingClientRect(),cr=sc.getBoundingClientRect();sc.scrollTo({top:sc.scrollTop+(rr.top-cr.top)-(cr.height/2),behavior:'smooth'});}
+          else{window.scrollTo({top:tr.getBoundingClientRect().top+window.scrollY-window.innerHeight/2,behavior:'smooth'});}
+          tr.classList.add("highlight");setTimeout(function(){tr.classList.remove("highlight");},1500);
+        }
+      }
+      setTimeout(function(){
+        tip.style.display="none";
+        var svg=seg.closest("svg");
+        svg.querySelectorAll(".tl-seg").forEach(function(s){s.classList.remove("dim","highlight");});
+        if(id) document.querySelectorAll('.tl-row').forEach(function(r){
+          var ids=r.dataset.id?r.dataset.id.split(' '):[];
+          if(ids.indexOf(id)!==-1) r.classList.remove("highlight");
+        });
+      },1400);
+    });
+  }
+  window.tlBindSeg=bindSeg;   // сегменти, додані live-оновленням
 
-        rows_html = ""
-        for bi, blk in enumerate(blocks):
-            blk_events = blk["events"]
-            cycle_time = blk["cycle_time"]
-            n = len(blk_events)
+  // ── Highlight при наведенні на рядок таблиці ──────────────────────
+  function bindRow(row){
+    row.addEventListener("mouseenter",function(){
+      var ids=row.dataset.id?row.dataset.id.split(' '):[];
+      if(!ids.length) return;
+      var svg=null,segs=[];
+      ids.forEach(function(id){
+        var seg=document.querySelector('.tl-seg[data-id="'+id+'"]');
+        if(seg){if(!svg)svg=seg.closest("svg");segs.push(seg);}
+      });
+      if(!segs.length) return;
+      svg.querySelectorAll(".tl-seg").forEach(function(s){s.classList.add("dim");});
+      segs.forEach(function(s){s.classList.remove("dim");s.classList.add("highlight");});
+      tip.textContent=segs[0].dataset.tip;tip.style.display="block";
+      tip.style.left=(row.getBoundingClientRect().right+10)+"px";
+      tip.style.top=(row.getBoundingClientRect().top+window.scrollY)+"px";
+    });
+    row.addEventListener("mouseleave",function(){
+      var ids=row.dataset.id?row.dataset.id.split(' '):[];
+      ids.forEach(function(id){
+        var seg=document.querySelector('.tl-seg[data-id="'+id+'"]');
+        if(seg){var svg=seg.closest("svg");svg.querySelectorAll(".tl-seg").forEach(function(s){s.classList.remove("dim","highlight");});}
+      });
+      tip.style.display="none";
+    });
+    row.addEventListener("click",function(){
+      var ids=row.dataset.id?row.dataset.id.split(' '):[];
+      if(!ids.length) return;
+      var fs=document.querySelector('.tl-seg[data-id="'+ids[0]+'"]');
+      if(!fs) return;
+      var wrapper=fs.closest(".tl-scroll-wrapper");
+      if(!wrapper) return;
+      var sr=fs.getBoundingClientRect(),wr=wrapper.getBoundingClientRect();
+      wrapper.scrollTo({left:wrapper.scrollLeft+(sr.left-wr.left)-(wr.width/2)+(sr.width/2),behavior:'smooth'});
+    });
+  }
+  window.tlBindRow=bindRow;
 
-            if bi > 0:
-                rows_html += (
-                    f'<tr style="height:3px;padding:0;line-height:0;">'
-                    f'<td colspan="6" style="height:3px;padding:0;background:#a855f7;border:none;"></td></tr>'
-                )
+  // ── Drag to scroll ─────────────────────────────────────────────────
+  function bindDrag(wrapper){
+    var svg=wrapper.querySelector("svg");if(!svg) return;
+    var isDown=false,startX,slStart,isDragging=false;
+    svg.addEventListener("mousedown",function(e){isDown=true;isDragging=false;startX=e.pageX;slStart=wrapper.scrollLeft;wrapper.style.cursor="grabbing";});
+    document.addEventListener("mousemove",function(e){if(!isDown) return;e.preventDefault();isDragging=true;wrapper.scrollLeft=slStart+(startX-e.pageX)*2;});
+    document.addEventListener("mouseup",function(){if(isDown){isDown=false;wrapper.style.cursor="";setTimeout(function(){isDragging=false;},50);}});
+    svg.addEventListener("click",function(e){if(isDragging){e.stopPropagation();e.preventDefault();}},true);
+    var txStart,tsLeft;
+    svg.addEventListener("touchstart",function(e){txStart=e.touches[0].pageX;tsLeft=wrapper.scrollLeft;},{passive:true});
+    svg.addEventListener("touchmove",function(e){if(!txStart) return;wrapper.scrollLeft=tsLeft+(txStart-e.touches[0].pageX)*2;},{passive:true});
+    svg.addEventListener("touchend",function(){txStart=null;});
+  }
 
-            for idx, e in enumerate(blk_events):
-                badge = ' <span class="badge ongoing">ongoing</span>' if e.get("ongoing") else ""
+  // ── Ctrl+Wheel zoom ─────────────────────────────────────────────────
+  // Zoom: SVG розтягується (бари), canvas перемальовується (тіки завжди чіткі)
+  function bindZoom(outer){
+    var wrapper=outer.querySelector(".tl-scroll-wrapper");
+    var svg=wrapper?wrapper.querySelector("svg"):null;
+    if(!svg) return;
+    var BASE=wrapper.offsetWidth||800,cur=BASE,MIN=BASE,MAX=BASE*20;
+    wrapper.addEventListener("wheel",function(e){
+      if(!e.ctrlKey) return;e.preventDefault();
+      var rect=svg.getBoundingClientRect();
+      var nw=Math.round(Math.min(MAX,Math.max(MIN,cur*(e.deltaY<0?1.15:1/1.15))));
+      if(nw===cur) return;
+      var ratio=(e.clientX-rect.left+wrapper.scrollLeft)/cur;
+      cur=nw;svg.style.width=nw+"px";
+      wrapper.scrollLeft=Math.round(ratio*nw-(e.clientX-rect.left));
+      // Canvas тіки: передаємо точну ширину SVG
+      if(outer._redrawTicks) outer._redrawTicks(nw);
+    },{passive:false});
+  }
+
+  // Прив'язка обробників у root — document при завантаженні або тіло лінивої картки
+  function bindTimeline(root){
+    root.querySelectorAll(".tl-seg").forEach(bindSeg);
+    root.querySelectorAll(".tl-scroll-wrapper").forEach(bindDrag);
+    root.querySelectorAll(".tl-outer-wrap").forEach(bindZoom);
+  }
+  window.tlBind=bindTimeline;
+  bindTimeline(document);
+})();
+"""
 
-                if e["type"] == "cycle":
-                    icon = "🟢"
-                    _prog_disp = e["program"] or "—"
-                    if _prog_disp.upper().endswith(".MIN"):
-                        _prog_disp = _prog_disp[:-4]
-                    detail = _prog_disp
-                    row_class = "activity-run"
-                else:
-                    icon = "🔴"
-                    detail = e["reason"]
-                    row_class = "activity-down"
-
-                start_s = fmt_time(e["start"])
-                end_s = "…" if not e.get("end") else fmt_time(e["end"])
-
-                if idx == 0:
-                    if cycle_time is not None:
-                        cycle_td = (
-                            f'<td rowspan="{n}" style="'
-                            f'color:#7c3aed;font-weight:700;'
-                            f'text-align:center;vertical-align:middle;'
-                            f'white-space:nowrap;border-left:1px solid #000;">'
-                            f'{cycle_time} min</td>'
-                        )
-                    else:
-                        cycle_td = f'<td rowspan="{n}" style="border-left:1px solid #000;"></td>'
-                else:
-                    cycle_td = ""
-
-                rows_html += (
-                    f'<tr class="tl-row {row_class}" data-id="{e["ids"]}">'
-                    f'<td>{detail}</td>'
-                    f'<td>{icon}</td>'
-                    f'<td>{start_s}</td>'
-                    f'<td>{end_s}{badge}</td>'
-                    f'<td><strong>{e["duration"]} min</strong></td>'
-                    f'{cycle_td}</tr>'
-                )
+_REPORT_JS_TAIL = r"""
+
+// ── Lazy machine cards ────────────────────────────────────────────
+// Тіло картки лежить у <template id="tpl-…"> і вставляється перед появою на екрані;
+// inline-скрипти (тіки, висота Activity Log) виконуються вже після вставки
+var EAGER=/[?&]eager=1/.test(location.search);
+(function(){
+  var bodies=document.querySelectorAll('.machine-body[data-lazy]');
+  function hydrate(body){
+    var short=body.dataset.lazy;if(!short) return;
+    body.removeAttribute('data-lazy');
+    var tpl=document.getElementById('tpl-'+short);if(!tpl) return;
+    var frag=tpl.content,codes=[];
+    frag.querySelectorAll('script:not([type])').forEach(function(sc){codes.push(sc.textContent);sc.remove();});
+    body.appendChild(frag);
+    tpl.remove();
+    body.style.minHeight='';
+    codes.forEach(function(code){var sc=document.createElement('script');sc.textContent=code;body.appendChild(sc);});
+    if(window.actLogInit) window.actLogInit(body);
+    if(window.tlBind) window.tlBind(body);
+    if(window.tlCanvasBind) window.tlCanvasBind(body);
+    if(window.liveRetick) window.liveRetick(body);
+  }
+  window.hydrateMachine=function(short){
+    var b=document.querySelector('.machine-body[data-lazy="'+short+'"]');if(b) hydrate(b);
+  };
+  window.lazyRoot=function(short){var t=document.getElementById('tpl-'+short);return t?t.content:null;};
+  if(EAGER||!('IntersectionObserver' in window)){bodies.forEach(hydrate);return;}
+  var io=new IntersectionObserver(function(entries){
+    entries.forEach(function(en){if(en.isIntersecting){io.unobserve(en.target);hydrate(en.target);}});
+  },{rootMargin:'600px 0px'});
+  bodies.forEach(function(b){io.observe(b);});
+  // Навігація: картка гідратується до переходу за якорем
+  document.querySelectorAll('.nav-btn').forEach(function(a){
+    a.addEventListener('click',function(){window.hydrateMachine(a.getAttribute('href').replace('#machine-',''));});
+  });
+  if(location.hash.indexOf('#machine-')===0) window.hydrateMachine(location.hash.slice(9));
+})();
 
-        # Унікальний ID для цього блоку
-        scroll_id = f"activity-scroll-{mname.replace('_', '-')}"
-        return (
-            f'<div class="resizable-section" id="rs-{scroll_id}" style="height:350px">'
-            f'<div class="table-scroll-x" style="height:100%;overflow:hidden"><div class="scroll-table-wrap" style="height:100%">'
-            f'<table class="scroll-table"><thead><tr><th>Details</th><th></th><th>Start</th><th>End</th><th>Duration</th><th style="color:#7c3aed;border-left:1px solid #000;text-align:center;">Cycle</th></tr></thead></table>'
-            f'<div id="{scroll_id}" class="scroll-tbody-wrap" style="height:calc(100% - 40px);overflow-y:auto">'
-            f'<table class="scroll-table"><tbody>{rows_html}</tbody></table>'
-            f'</div></div></div></div>'
-            f'<script>(function(){{'
-            f'var wrap=document.getElementById("{scroll_id}");'
-            f'var outer=document.getElementById("rs-{scroll_id}");'
-            f'if(!wrap||!outer) return;'
-            f'var inner=wrap.querySelector("table");'
-            f'if(!inner) return;'
-            f'var contentH=inner.offsetHeight+44;'  # 44px = thead
-            f'if(contentH<350) outer.style.height=contentH+"px";'
-            f'}})();</script>'
-        )
+// ── Stats charts ──────────────────────────────────────────────────
+(function(){
+  var TR    = REPORT.trend;
+  var HDATA = REPORT.hourly;
+  var TEFF  = REPORT.teff;
+  var MK    = REPORT.mk;
+  var SK    = REPORT.sk;
+  var COLS  = REPORT.cols;
+  var REPORT_HM = REPORT.hm;
+  var tCh=null, pCh=null;
 
-    def cycles_section(c_list, mname, excel_targets):
-        """Генерує Target Cycle Time з порівнянням з Excel"""
-        if not c_list:
-            return ""
+  // Plugin: тонка червона вертикальна лінія у момент генерації звіту.
+  // Малюється на позиції лейблу REPORT_HM (напр. "14:28"), який окремо додано в labels —
+  // тому криві дотягуються до неї, а нативний tooltip працює як на звичайних точках.
+  var reportLinePlugin = {
+    id: 'reportLine',
+    afterDatasetsDraw: function(chart) {
+      if (!REPORT_HM) return;
+      var iLine = chart.data.labels.indexOf(REPORT_HM);
+      if (iLine < 0) return;
+      var xLine = Math.round(chart.scales.x.getPixelForValue(iLine)) + 0.5;
+      var ca = chart.chartArea;
+      var ctx = chart.ctx;
+      ctx.save();
+      ctx.strokeStyle = '#ef4444';
+      ctx.lineWidth = 1;
+      ctx.setLineDash([4,3]);
+      ctx.beginPath();
+      ctx.moveTo(xLine, ca.top);
+      ctx.lineTo(xLine, ca.bottom);
+      ctx.stroke();
+      ctx.restore();
+    }
+  };
 
-        # DEBUG: Логуємо скільки targets завантажено
-        log(f"cycles_section: machine={mname}, excel_targets count={len(excel_targets)}")
-        
-        # Витягуємо коротку назву станку (M1, M2 тощо)
-        machine_short = mname.split("_")[0] if "_" in mname else mname
-        machine_norm  = normalize_program_name(machine_short)
+  // ── Machine filter checkboxes ─────────────────────────────────────
+  (function(){
+    var fd=document.getElementById('machine-filter');
+    if(!fd) return;
+    function setAll(on){
+      var cbs=fd.querySelectorAll('input[type=checkbox]');
+      cbs.forEach(function(cb){
+        cb.checked=on;
+        var lbl=cb.parentElement;
+        lbl.style.background=on?(lbl.dataset.bg||'transparent'):'transparent';
+      });
+      if(tCh) initToday();
+      updatePeriodChart();
+    }
+    var btnStyle='cursor:pointer;font-size:0.75rem;font-weight:700;padding:4px 10px;'
+      +'border-radius:20px;border:2px solid #cbd5e1;background:#fff;color:#1e293b;'
+      +'transition:background .15s';
+    var btnAll=document.createElement('button');
+    btnAll.type='button';btnAll.textContent='All';btnAll.style.cssText=btnStyle;
+    btnAll.addEventListener('click',function(){setAll(true);});
+    var btnNone=document.createElement('button');
+    btnNone.type='button';btnNone.textContent='None';btnNone.style.cssText=btnStyle;
+    btnNone.addEventListener('click',function(){setAll(false);});
+    fd.appendChild(btnAll);fd.appendChild(btnNone);
+    MK.forEach(function(k,i){
+      var lbl=document.createElement('label');
+      lbl.dataset.bg=COLS[i]+'22';
+      lbl.style.cssText='display:flex;align-items:center;gap:4px;cursor:pointer;font-size:0.8rem;'
+        +'color:#1e293b;font-weight:600;user-select:none;padding:3px 10px 3px 6px;'
+        +'border-radius:20px;border:2px solid '+COLS[i]+';background:'+COLS[i]+'22;transition:background .15s';
+      var cb=document.createElement('input');
+      cb.type='checkbox';cb.checked=true;cb.dataset.m=k;
+      cb.style.cssText='cursor:pointer;accent-color:'+COLS[i]+';width:13px;height:13px;flex-shrink:0';
+      cb.addEventListener('change',function(){
+        lbl.style.background=cb.checked?COLS[i]+'22':'transparent';
+        if(tCh) initToday();
+        updatePeriodChart();
+      });
+      lbl.appendChild(cb);
+      var dot=document.createElement('span');
+      dot.style.cssText='width:9px;height:9px;border-radius:50%;background:'+COLS[i]+';display:inline-block;flex-shrink:0';
+      lbl.appendChild(dot);
+      lbl.appendChild(document.createTextNode('\u00a0'+SK[i]));
+      fd.appendChild(lbl);
+    });
+  })();
 
-        # Нормалізуємо ключі excel_targets один раз
-        excel_norm = [
-            (normalize_program_name(p), op, normalize_program_name(m), t, m)
-            for (p, op, m), t in excel_targets.items()
-        ]
+  function getSelected(){
+    var cbs=document.querySelectorAll('#machine-filter input[type=checkbox]');
+    var sel=[];cbs.forEach(function(cb){if(cb.checked)sel.push(cb.dataset.m);});
+    return sel;
+  }
+  // sparse — точки лише на кінцях тижнів/місяців (getFn → null між ними), лінія їх з'єднує;
+  // site — getFn знає готовий ряд 'SITE' (Period Trend), він береться, коли вибрані всі станки
+  function ds(labels,getFn,sparse,site){
+    var sel=getSelected();
+    return MK.filter(function(k){return sel.indexOf(k)!==-1;}).map(function(k){
+      var i=MK.indexOf(k);
+      var data;
+      if(k==='SITE'){
+        var selM=sel.filter(function(m){return m!=='SITE';}),all=site&&selM.length===MK.length-1;
+        data=labels.map(function(l,idx){
+          if(!selM.length) return null;
+          if(all){var v=getFn('SITE',l,idx);return v!=null?Math.round(v):(sparse?null:0);}
+          if(sparse&&getFn(selM[0],l,idx)==null) return null;
+          var sum=selM.reduce(function(s,m){var v=getFn(m,l,idx);return s+(v!=null?v:0);},0);
+          return Math.round(sum/selM.length);
+        });
+      }else{
+        data=labels.map(function(l,idx){var v=getFn(k,l,idx);return v!=null?v:(sparse?null:0);});
+      }
+      return {label:SK[i],data:data,
+        borderColor:COLS[i],backgroundColor:COLS[i]+'22',tension:0.3,
+        pointRadius:5,pointHoverRadius:7,borderWidth:k==='SITE'?4:1.5,
+        borderDash:k==='SITE'?[8,4]:[],
+        fill:false,spanGaps:!!sparse};
+    });
+  }
+  function yMax(datasets){
+    var mx=100;
+    datasets.forEach(function(d){d.data.forEach(function(v){if(v!=null&&v>mx)mx=v;});});
+    return Math.ceil(mx/10)*10+10;
+  }
+  function opts(datasets){var ym=datasets?yMax(datasets):110;return{clip:false,responsive:true,maintainAspectRatio:false,layout:{padding:0},
+    interaction:{mode:'index',intersect:false},
+    plugins:{legend:{display:false},tooltip:{callbacks:{label:function(c){return c.dataset.label+': '+(c.parsed.y!=null?c.parsed.y+'%':'—');}}}  },
+    scales:{y:{display:false,min:-5,max:ym,ticks:{callback:function(v){return v<0?'':v+'%';}},title:{display:false}},x:{display:false,offset:true,ticks:{maxRotation:45},grid:{display:false}}}};}
+  function optsToday(datasets){
+    var o=opts(datasets);
+    var ym=datasets?yMax(datasets):110;
+    o.scales.y={display:true,min:0,max:ym,ticks:{callback:function(v){return v+'%';},stepSize:10},grid:{color:'rgba(100,116,139,0.15)'}};
+    o.scales.x={display:true,offset:true,ticks:{maxRotation:0,color:'#475569',font:{size:11}},grid:{display:false}};
+    o.layout={padding:{left:4,right:12,top:4,bottom:4}};
+    return o;
+  }
+  function leg(id,ds2){
+    var el=document.getElementById(id);if(!el)return;
+    el.innerHTML=ds2.map(function(d,i){
+      var col=COLS[i]||d.borderColor||'#888';
+      return '<span class="leg-item"><span class="leg-dot" style="background:'+col+'"></span>'+d.label+'</span>';
+    }).join('');
+  }
 
-        # Групуємо цикли по програмах (COUNTER.MIN не показуємо)
-        by_prog = defaultdict(list)
-        for c in c_list:
-            prog_name = c["program"] or "—"
-            if prog_name.upper().startswith("COUNTER"):
-                continue
-            by_prog[prog_name].append(c)
+  var _selDay=null;  // обрана дата (ISO); null = today
+  function initToday(targetDate){
+    var _now=new Date();
+    var tod=localISO(_now);
+    var dayISO=targetDate||_selDay||tod;
+    _selDay=dayISO;
+    var isToday=(dayISO===tod);
+    var hd=HDATA[dayISO]||{};
+    // Carry-over з попереднього дня: bucket 23 (23→00) того дня = значення на межі опівночі.
+    // Та сама точка з'являється і як ОСТАННЯ "00:00" попереднього дня, і як ПЕРША "00:00" цього дня.
+    var _prevDt=new Date(dayISO+'T00:00:00');_prevDt.setDate(_prevDt.getDate()-1);
+    var prevISO=localISO(_prevDt);
+    var hdPrev=HDATA[prevISO]||{};
+    // Принцип: точка "HH:00" відображає ефективність попередньої години (H-1 … H).
+    // Для сьогодні — поточна (неповна) година _rh представлена окремою точкою REPORT_HM.
+    // Для минулих днів — всі години вважаються завершеними.
+    var _rh = isToday ? (REPORT_HM ? parseInt(REPORT_HM.split(':')[0],10) : _now.getHours()) : 24;
+    // Фіксований діапазон годин 0.._rh-1 (включно з 00→01 і 23→00 для минулих днів).
+    // Якщо в HDATA для якоїсь години немає запису — точка стає 0%, а не пропадає.
+    var hours=[]; for(var _hh=0; _hh<_rh; _hh++) hours.push(_hh);
+    // Перша точка "00:00" — carry-over з попереднього дня (bucket 23).
+    var labels=['00:00'].concat(hours.map(function(h){var e=(h+1)%24;return (e<10?'0':'')+e+':00';}));
+    if(isToday&&REPORT_HM) labels.push(REPORT_HM);
+    var d2=ds(labels,function(k,lbl,idx){
+      // idx===0 — carry-over: bucket 23 попереднього дня.
+      if(idx===0) return (hdPrev[k]&&hdPrev[k]['23']!=null)?hdPrev[k]['23']:0;
+      var h;
+      if(isToday&&lbl===REPORT_HM){ h=_rh; }
+      else { h=parseInt(lbl,10)-1; if(h<0) h=23; }
+      return (hd[k]&&hd[k][String(h)]!=null)?hd[k][String(h)]:0;
+    });
+    if(tCh)tCh.destroy();
+    var ctx=document.getElementById('effChartToday');if(!ctx)return;
+    var _plugins=isToday?[reportLinePlugin]:[];
+    tCh=new Chart(ctx.getContext('2d'),{type:'line',data:{labels:labels,datasets:d2},options:optsToday(d2),plugins:_plugins});
+    requestAnimationFrame(function(){tCh.resize();var sc=ctx.closest('.chart-scroll-outer');if(sc)sc.scrollLeft=sc.scrollWidth;});
+    leg('legend-today',d2);
+    var tt=document.getElementById('today-chart-title');
+    if(tt){
+      var dStr=dayISO.slice(8,10)+'.'+dayISO.slice(5,7)+'.'+dayISO.slice(0,4);
+      tt.textContent=(isToday?'Today':dStr)+' — Hourly Efficiency';
+    }
+    var ttb=document.getElementById('today-table-wrap');
+    if(ttb){
+      var sel=getSelected();
+      var selM=sel.filter(function(k){return k!=='SITE';});
+      var mAvgs={};
+      selM.forEach(function(k){
+        if(isToday) mAvgs[k]=(TEFF&&TEFF[k]!=null)?TEFF[k]:0;
+        else        mAvgs[k]=dayVal(k,dayISO);
+      });
+      var grandAvg=selM.length?Math.round(selM.reduce(function(s,k){return s+mAvgs[k];},0)/selM.length):0;
+      var dayStr=dayISO.slice(8,10)+'.'+dayISO.slice(5,7)+'.'+dayISO.slice(0,4);
+      var hdr=sel.map(function(k){var si=MK.indexOf(k);return '<th>'+SK[si]+'</th>';}).join('');
+      var cells=sel.map(function(k){
+        var avg=k==='SITE'?grandAvg:(mAvgs[k]||0);
+        var col=avg>=75?'#22c55e':avg>=50?'#f59e0b':'#ef4444';
+        return '<td><b style="color:'+col+'">'+avg+'%</b></td>';
+      }).join('');
+      ttb.innerHTML=
+        '<table class="stats-table"><thead><tr><th>Date</th>'+hdr+'</tr></thead>'+
+        '<tbody><tr><td><b>'+dayStr+'</b></td>'+cells+'</tr></tbody></table>';
+    }
+  }
 
-        # Для кожної програми використовуємо нову логіку вибірки
-        target_rows = []
-        for prog, current_cycles in by_prog.items():
-            # Визначаємо операцію
-            op_num = get_operation_number(prog)
+  // Селектор днів над Today-графіком: вантажимо ISO-дати з HDATA за останні 7 днів.
+  function _initDaySelector(){
+    var el=document.getElementById('today-day-selector');
+    if(!el) return;
+    el.innerHTML='';
+    var todISO=localISO(new Date());
+    // Показуємо останні 7 днів завжди (навіть якщо в HDATA нема даних для якогось дня —
+    // кнопка буде, чарт покаже порожньо).
+    var days=[];
+    for(var i=0;i<7;i++){
+      var dt=new Date();dt.setDate(dt.getDate()-i);
+      days.push(localISO(dt));
+    }
+    days.forEach(function(d){
+      var btn=document.createElement('button');
+      btn.type='button';
+      var isTod=(d===todISO);
+      btn.textContent=isTod?'Today':(d.slice(8,10)+'.'+d.slice(5,7));
+      btn.dataset.date=d;
+      btn.style.cssText='cursor:pointer;font-size:0.75rem;font-weight:700;padding:4px 10px;'
+        +'border-radius:20px;border:2px solid #cbd5e1;background:#fff;color:#1e293b;transition:background .15s';
+      btn.addEventListener('click',function(){
+        _selDay=btn.dataset.date;
+        Array.prototype.forEach.call(el.querySelectorAll('button'),function(b){
+          var on=(b.dataset.date===_selDay);
+          b.style.background=on?'#3b82f6':'#fff';
+          b.style.color=on?'#fff':'#1e293b';
+          b.style.borderColor=on?'#3b82f6':'#cbd5e1';
+        });
+        initToday(_selDay);
+      });
+      el.appendChild(btn);
+    });
+    // Вибираємо today за замовчуванням
+    var todBtn=el.querySelector('button[data-date="'+todISO+'"]');
+    if(todBtn){
+      todBtn.style.background='#3b82f6';
+      todBtn.style.color='#fff';
+      todBtn.style.borderColor='#3b82f6';
+    }
+  }
+
+  // Ряди Period Trend готує period_trend() у Python; тут лише вибір і індексація.
+  // pMeta — колонки поточного графіка: день тижня і індекс ISO-тижня в TR.w (null — поза рядом)
+  var pMeta=[];
+  function isoAdd(iso,n){var dt=new Date(iso+'T00:00:00');dt.setDate(dt.getDate()+n);return localISO(dt);}
+  function dayIdx(a,b){return Math.round((new Date(b+'T00:00:00')-new Date(a+'T00:00:00'))/86400000);}
+  function dayVal(k,iso){var s=TR.d[k],i=dayIdx(TR.d0,iso);return s&&i>=0&&i<s.length?s[i]:0;}
+  var weekendPeriodPlugin={
+    id:'weekendPeriod',
+    afterLayout(chart){
+      var ca=chart.chartArea;
+      ca.left=0;ca.right=chart.width;ca.width=chart.width;
+      ca.top=0;ca.bottom=chart.height;ca.height=chart.height;
+      var xS=chart.scales.x;
+      if(xS){xS.left=0;xS.right=chart.width;xS.width=chart.width;xS._startPixel=0;xS._endPixel=chart.width;xS._length=chart.width;}
+      var yS=chart.scales.y;
+      if(yS){yS.top=0;yS.bottom=chart.height;yS.height=chart.height;yS._startPixel=0;yS._endPixel=chart.height;yS._length=chart.height;}
+    },
+    beforeDraw(chart){
+      var c=chart.chartArea,xScale=chart.scales.x;
+      if(!c) return;
+      var ctx2=chart.ctx;
+      ctx2.save();ctx2.fillStyle='#f8fafc';ctx2.fillRect(0,0,chart.width,chart.height);ctx2.restore();
+      // Horizontal percentage grid lines (10%…100%)
+      var yS2=chart.scales.y;
+      [0,10,20,30,40,50,60,70,80,90,100].forEach(function(pct){
+        var yPx=yS2.getPixelForValue(pct);
+        ctx2.save();
+        ctx2.strokeStyle='rgba(100,116,139,0.18)';ctx2.lineWidth=1;ctx2.setLineDash([]);
+        ctx2.beginPath();ctx2.moveTo(0,yPx);ctx2.lineTo(chart.width,yPx);ctx2.stroke();
+        ctx2.fillStyle='rgba(100,116,139,0.5)';ctx2.font='9px sans-serif';ctx2.textAlign='left';
+        ctx2.fillText(pct+'%',3,yPx-2);
+        ctx2.restore();
+      });
+      var labels=chart.data.labels,n=labels.length;if(n<2)return;
+      var step=xScale.getPixelForValue(1)-xScale.getPixelForValue(0);
+      // Weekend shading + SAT/SUN label + day separator lines + date labels
+      var dayStep=step>=28?1:Math.ceil(28/step);
+      labels.forEach(function(lbl,i){
+        var dow=pMeta[i].dow;
+        var cx=xScale.getPixelForValue(i);
+        if(dow===0||dow===6){
+          ctx2.save();
+          ctx2.fillStyle='rgba(255,180,0,0.18)';
+          ctx2.fillRect(cx-step/2,0,step,chart.height);
+          ctx2.fillStyle='rgba(180,100,0,0.6)';
+          ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
+          ctx2.fillText(dow===6?'SAT':'SUN',cx,c.top+11);
+          ctx2.restore();
+        }else if(i%dayStep===0){
+          var dn=['SUN','MON','TUE','WED','THU','FRI','SAT'][dow];
+          ctx2.save();
+          ctx2.fillStyle='rgba(100,116,139,0.55)';
+          ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
+          ctx2.fillText(dn,cx,c.top+11);
+          ctx2.restore();
+        }
+        // Day separator line at left edge of each column (between prev day and this day)
+        if(i>0){
+          var sepX=cx-step/2;
+          ctx2.save();
+          ctx2.strokeStyle='#475569'; ctx2.lineWidth=1;
+          ctx2.setLineDash([]);
+          ctx2.beginPath();ctx2.moveTo(sepX,0);ctx2.lineTo(sepX,chart.height);ctx2.stroke();
+          ctx2.restore();
+        }
+      });
+    },
+    afterDraw(chart){
+      var xScale=chart.scales.x;
+      var labels=chart.data.labels;
+      if(!labels||labels.length<2)return;
+      var ctx2=chart.ctx;
+      var step=xScale.getPixelForValue(1)-xScale.getPixelForValue(0);
+      // Week number labels + dashed separators
+      var wg={};
+      labels.forEach(function(lbl,i){
+        var w=pMeta[i].w;if(w==null) return;
+        if(!wg[w])wg[w]=[];wg[w].push(i);
+      });
+      var weeks=Object.entries(wg).sort(function(a,b){return Number(a[0])-Number(b[0]);});
+      weeks.forEach(function(entry,gi){
+        var wn=TR.wn[entry[0]],idxs=entry[1];
+        var avgX=idxs.reduce(function(s,i){return s+xScale.getPixelForValue(i);},0)/idxs.length;
+        ctx2.save();
+        ctx2.fillStyle='rgba(248,250,252,0.8)';
+        ctx2.fillRect(avgX-14,chart.height-12,28,12);
+        ctx2.fillStyle='rgba(80,80,180,0.85)';
+        ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
+        ctx2.fillText('W'+wn,avgX,chart.height-3);
+        if(gi>0){
+          var prev=weeks[gi-1][1];
+          var sepX=(xScale.getPixelForValue(idxs[0])+xScale.getPixelForValue(prev[prev.length-1]))/2;
+          ctx2.strokeStyle='rgba(80,80,180,0.55)';ctx2.lineWidth=3;
+          ctx2.setLineDash([6,3]);ctx2.beginPath();
+          ctx2.moveTo(sepX,0);ctx2.lineTo(sepX,chart.height);ctx2.stroke();
+        }
+        ctx2.restore();
+      });
+    }
+  };
+  function euToISO(s){var p=s.split('.');return p.length===3?p[2]+'-'+p[1]+'-'+p[0]:s;}
+  function isoToEu(s){return s.slice(8,10)+'.'+s.slice(5,7)+'.'+s.slice(0,4);}
+  function updatePeriodChart(){
+    var from=euToISO(document.getElementById('stat-from').value);
+    var to=euToISO(document.getElementById('stat-to').value);
+    // Generate ALL dates in range so both Period Trend and Batch Timeline
+    // have identical column counts — required for x-axis alignment
+    var dates=[];
+    {var _c=new Date(from+'T00:00:00'),_e=new Date(to+'T00:00:00');
+      while(_c<=_e){dates.push(localISO(_c));_c.setDate(_c.getDate()+1);}}
+    function fmtDate(s){return s.slice(8,10)+'.'+s.slice(5,7)+'.'+s.slice(0,4);}
+    // Найдрібніший готовий ряд, що покриває діапазон: дні (точка з датою D — ефективність
+    // попереднього дня, інтервал D-1 00:00 … D 00:00), ISO-тижні або місяці. Тиждень/місяць
+    // агрегується за повний період, а точка ставиться на його останню дату в діапазоні ("кінець періоду").
+    var gran=isoAdd(from,-1)>=TR.d0?'d':(from>=TR.w0?'w':'m');
+    var mY=+TR.m0.slice(0,4),mM=+TR.m0.slice(5,7);
+    function perIdx(g,d){return g==='w'?Math.floor(dayIdx(TR.w0,d)/7):(+d.slice(0,4)-mY)*12+(+d.slice(5,7)-mM);}
+    function endVal(g,k,d,i){
+      var p=perIdx(g,d);
+      if(i<dates.length-1&&perIdx(g,dates[i+1])===p) return null;
+      var s=TR[g][k];return s&&p>=0&&p<s.length?s[p]:null;
+    }
+    function atEnd(g,k,d,i){var v=endVal(g,k,d,i);return v!=null?Math.round(v):null;}
+    var dow0=dates.length?new Date(dates[0]+'T00:00:00').getDay():0;
+    pMeta=dates.map(function(d,i){
+      var w=d>=TR.w0?perIdx('w',d):-1;
+      return {dow:(dow0+i)%7,w:(w>=0&&w<TR.wn.length)?w:null};
+    });
+    var d2=gran==='d'
+      ?ds(dates,function(k,d){return dayVal(k,isoAdd(d,-1));},false,true)
+      :ds(dates,function(k,d,i){return atEnd(gran,k,d,i);},true,true);
+    // Weekly average curve (у денному режимі; у тижневому криві станків уже тижневі)
+    if(gran==='d') (function(){
+      var sel=getSelected();
+      var selM=sel.filter(function(k){return k!=='SITE';});
+      if(!selM.length)return;
+      var all=selM.length===MK.length-1;
+      // Середнє вибраних станків за тиждень — з готового ряду TR.w (SITE — коли вибрані всі)
+      var weekData=dates.map(function(d,i){
+        if(all) return atEnd('w','SITE',d,i);
+        var vs=selM.map(function(k){return endVal('w',k,d,i);});
+        if(vs[0]==null) return null;
+        return Math.min(100,Math.round(vs.reduce(function(a,b){return a+(b||0);},0)/vs.length));
+      });
+      d2.push({
+        label:'Week avg',data:weekData,
+        borderColor:'rgba(30,41,59,0.85)',backgroundColor:'rgba(30,41,59,0.06)',
+        tension:0.4,pointRadius:5,pointHoverRadius:7,
+        pointBackgroundColor:'rgba(30,41,59,0.85)',
+        borderWidth:2.5,borderDash:[6,3],
+        stepped:false,fill:false,spanGaps:true,order:10
+      });
+    })();
+    if(pCh)pCh.destroy();
+    var ctx=document.getElementById('effChartPeriod');if(!ctx)return;
+    var _wrap=ctx.closest('.chart-wrap');
+    var _minW=Math.max(600,dates.length*22);
+    if(_wrap){_wrap.style.width='';_wrap.style.minWidth=_minW+'px';}
+    pCh=new Chart(ctx.getContext('2d'),{type:'line',plugins:[weekendPeriodPlugin],data:{labels:dates.map(fmtDate),datasets:d2},options:opts(d2)});
+    requestAnimationFrame(function(){
+      var _actualW=(_wrap&&_wrap.offsetWidth>0)?_wrap.offsetWidth:_minW;
+      if(_wrap)_wrap.style.width=_actualW+'px';
+      if(pCh)pCh.resize(_actualW,350);
+      if(window.updateBatchGantt)window.updateBatchGantt(from,to,_actualW);
+      // Auto-scroll both panels to end when content overflows
+      var _pSc=ctx.closest('.chart-scroll-outer');
+      var _gSc=document.getElementById('gantt-scroll-outer');
+      if(_pSc&&_pSc.scrollWidth>_pSc.clientWidth){_pSc.scrollLeft=_pSc.scrollWidth;}
+      if(_gSc&&_gSc.scrollWidth>_gSc.clientWidth){_gSc.scrollLeft=_gSc.scrollWidth;}
+    });
+    leg('legend-period',d2);
+  }
 
-            # Calculated = повний час блоку (run + setup) = start-to-start між
-            # послідовними циклами тієї ж програми, без обмеження порогом.
-            # Це збігається з колонкою Cycle у Activity Log.
-            sorted_cc = sorted(current_cycles, key=lambda c: c["start"])
-            block_times = []
-            for idx_c, cc in enumerate(sorted_cc):
-                if idx_c + 1 < len(sorted_cc) and cc.get("start") and sorted_cc[idx_c + 1].get("start"):
-                    bt = round((sorted_cc[idx_c + 1]["start"] - cc["start"]).total_seconds() / 60, 2)
-                    if bt > 0:
-                        block_times.append(bt)
-                else:
-                    # Останній цикл — використовуємо cycle_time або duration
-                    ct = cc.get("cycle_time") or cc.get("duration", 0)
-                    if ct and ct > 0:
-                        block_times.append(ct)
-
-            if block_times:
-                calc_target = calculate_real_cycle_time(block_times)
-            else:
-                calc_target = None
-
-            if calc_target is None:
-                continue
-
-            info_text = f"{len(current_cycles)} cycles today"
-
-            # Шукаємо Excel Target з урахуванням станку та операції
-            excel_target = None
-            prog_normalized = normalize_program_name(prog)
-            found_for_other_machine = None
+  window.initToday=initToday;
+  window.initDaySelector=_initDaySelector;
+  window.updatePeriodChart=updatePeriodChart;
+  // Live-дельта: погодинна ефективність доби + ефективність станків → перемалювати Today
+  window.liveStats=function(day,hourly,teff,hm){
+    var hd=HDATA[day]=HDATA[day]||{};
+    Object.keys(hourly||{}).forEach(function(k){hd[k]=hourly[k];});
+    Object.keys(teff||{}).forEach(function(k){TEFF[k]=teff[k];});
+    if(hm) REPORT_HM=hm;
+    if(tCh&&_selDay===day) initToday();
+  };
+  window.setRange=function(n){
+    var to=new Date(),from=new Date();from.setDate(to.getDate()-n+1);
+    document.getElementById('stat-from').value=isoToEu(localISO(from));
+    document.getElementById('stat-to').value=isoToEu(localISO(to));
+    updatePeriodChart();
+  };
+  // Scroll-to-top
+  var stBtn=document.getElementById('scroll-top');
+  if(stBtn) window.addEventListener('scroll',function(){stBtn.classList.toggle('visible',window.scrollY>400);});
+})();
 
-            for ep_norm, eop, em_norm, time_val, em_orig in excel_norm:
-                if prog_normalized == ep_norm and op_num == eop:
-                    if machine_norm == em_norm:
-                        excel_target = time_val
-                        break
-                    else:
-                        found_for_other_machine = em_orig
-            
-            # Порівняння
-            if excel_target:
-                diff = round(calc_target - excel_target, 2)  # Округлення до сотих
-                diff_pct = round((diff / excel_target) * 100, 2) if excel_target else 0
-                sign = f'+{diff}' if diff > 0 else str(diff)
-                sign_pct = f'+{diff_pct}' if diff_pct > 0 else str(diff_pct)
-                if abs(diff_pct) <= 5:
-                    comparison = f'<span style="color:#22c55e">{sign} min ({sign_pct}%)</span>'
-                elif diff > 0:
-                    comparison = f'<span style="color:#ef4444">{sign} min ({sign_pct}%)</span>'
-                else:
-                    comparison = f'<span style="color:#3b82f6">{sign} min ({sign_pct}%)</span>'
-                excel_col = f'{excel_target} min'
-            else:
-                # Якщо не знайшли для цього станку, але є для іншого
-                if found_for_other_machine:
-                    comparison = '<span style="color:#f59e0b">Wrong machine</span>'
-                    excel_col = f'No norm for {machine_short}'
-                else:
-                    comparison = '<span style="color:#94a3b8">No data</span>'
-                    excel_col = '—'
-            
-            target_rows.append(
-                f'<tr><td><em>{prog[:-4] if prog.upper().endswith(".MIN") else prog}</em></td>'
-                f'<td><span class="badge" style="background:#3F51B5;color:white;padding:2px 8px;border-radius:2px">OP{op_num}</span></td>'
-                f'<td>{len(current_cycles)}</td>'
-                f'<td><strong>{calc_target} min</strong></td>'
-                f'<td>{excel_col}</td>'
-                f'<td>{comparison}</td>'
-                f'<td style="font-size:0.75rem;color:#64748b">{info_text}</td></tr>'
-            )
+// ── Batch Gantt ──────────────────────────────────────────────────
+(function(){
+  // Розпаковуємо колонкове кодування (_encode_gantt) у записи {d,m,p,s,e,dur}.
+  // Дані — <script type="application/json" id="gantt-data">, розбираються при першій побудові
+  function decodeGantt(G){
+    var out=[],n=G.dd.length;if(!n) return out;
+    var p0=G.d0.split('-'),day=new Date(+p0[0],+p0[1]-1,+p0[2]),iso=localISO(day);
+    var s=0,pm=-1;
+    function hm(v){if(v===1440) return '24:00';v=((v%1440)+1440)%1440;var h=Math.floor(v/60),m=v%60;return (h<10?'0':'')+h+':'+(m<10?'0':'')+m;}
+    for(var i=0;i<n;i++){
+      if(G.dd[i]){day.setDate(day.getDate()+G.dd[i]);iso=localISO(day);}
+      s=(i>0&&G.dd[i]===0&&G.m[i]===pm)?s+G.s[i]:G.s[i];
+      pm=G.m[i];
+      out.push({d:iso,m:G.M[G.m[i]],p:G.P[G.p[i]],s:hm(s),e:hm(s+G.l[i]),dur:G.u[i]});
+    }
+    return out;
+  }
+  var RAW_ALL=null,progList=[],progColor={};
+  var PALETTE=['#3b82f6','#22c55e','#f59e0b','#0ea5e9','#a855f7','#06b6d4','#f97316','#65a30d','#84cc16','#14b8a6'];
+  function rawAll(){
+    if(RAW_ALL) return RAW_ALL;
+    var el=document.getElementById('gantt-data');
+    RAW_ALL=el?decodeGantt(JSON.parse(el.textContent)):[];
+    RAW_ALL.forEach(function(c){
+      if(progList.indexOf(c.p)===-1){progList.push(c.p);progColor[c.p]=PALETTE[(progList.length-1)%PALETTE.length];}
+    });
+    return RAW_ALL;
+  }
 
-        return (
-            f'<div class="section-title" style="border-top:2px dashed #e2e8f0">🎯 Target Cycle Time</div>'
-            f'<div class="table-scroll-x"><table><thead><tr><th>Program</th><th>OP</th><th>Total</th><th>Calculated</th><th>Target</th><th>Difference</th><th>Info</th></tr></thead>'
-            f'<tbody>{"".join(target_rows)}</tbody></table></div>'
-        )
+  var ROW_H=32, PAD=4, LABEL_W=0, TICK_H=22;
+  var PX_PER_DAY=28;
+  var cv=document.getElementById('batchGantt');
+  var tip=document.getElementById('batch-tooltip');
+  var barMeta=[], gapMeta=[], CDATA=[], machines=[], dates=[];
 
-    machines_html = ""
-    machine_names = sorted(cycles.keys())
-    nav_buttons = (
-        '<div style="border-top:1px solid #475569;margin:4px 0"></div>\n'
-    ) + "".join(
-        f'<a href="#machine-{mn.split("_")[0] if "_" in mn else mn}" class="nav-btn">{mn.split("_")[0] if "_" in mn else mn}</a>\n'
-        for mn in machine_names
-    )
-    for i, mname in enumerate(machine_names):
-        c_list     = cycles.get(mname, [])
-        d_data     = downtimes.get(mname, {})
-        d_list     = d_data.get("downtimes", [])
-        total_min  = d_data.get("total_min", 1)
-        total_run  = d_data.get("total_run", 0)
-        total_down = d_data.get("total_down", 0)
-        eff        = round(total_run / total_min * 100) if total_min else 0
-        short_name = mname.split("_")[0] if "_" in mname else mname
+  function buildFromRange(from, to, forcedW){
+    // Filter RAW_ALL by date range
+    var raw=rawAll().filter(function(c){return (!from||c.d>=from)&&(!to||c.d<=to);});
+    // Session-based grouping: merge consecutive cycles of the same program
+    // into one block if the gap between end of previous and start of next is ≤SESSION_GAP min.
+    // Cycles with gaps > SESSION_GAP become separate blocks (separate production runs).
+    var SESSION_GAP=REPORT.gantt_gap;
+    var WORK_WEEK=REPORT.work_week, HOLIDAYS=REPORT.holidays;
+    // Робочі інтервали доби в годинах [0, 24] — як work_intervals() у Python:
+    // власні зміни + хвіст змін попередньої доби (напр. вт 06:30–24:30 → ср 00:00–00:30)
+    function workHours(d){
+      var dt=new Date(d+'T00:00:00'), pv=new Date(dt), out=[];
+      pv.setDate(pv.getDate()-1);
+      function add(list,off){list.forEach(function(iv){
+        var a=Math.max(0,iv[0]+off), b=Math.min(24,iv[1]+off);
+        if(b>a) out.push([a,b]);
+      });}
+      if(!HOLIDAYS[localISO(pv)]) add(WORK_WEEK[pv.getDay()],-24);
+      if(!HOLIDAYS[d]) add(WORK_WEEK[dt.getDay()],0);
+      return out;
+    }
+    var sorted=raw.slice().sort(function(a,b){
+      if(a.d!==b.d) return a.d<b.d?-1:1;
+      if(a.m!==b.m) return a.m<b.m?-1:1;
+      return (a.s||'')<(b.s||'')?-1:1;
+    });
+    CDATA=[];
+    var sessMap={};
+    sorted.forEach(function(c){
+      var key=c.m+'|'+c.d+'|'+c.p;
+      var sess=sessMap[key];
+      // Cross-midnight merge: if no session found for this date, check previous day
+      if(!sess&&c.s){
+        var _pd=new Date(c.d+'T00:00:00');_pd.setDate(_pd.getDate()-1);
+        var _prevKey=c.m+'|'+localISO(_pd)+'|'+c.p;
+        var _prevSess=sessMap[_prevKey];
+        if(_prevSess){
+          var _sh=parseInt(c.s.split(':')[0]),_sm=parseInt(c.s.split(':')[1]||0);
+          var _startMin=_sh*60+_sm;
+          if(!_prevSess.e){
+            // Previous session was still ongoing at midnight (end_time="—") — this IS the cross-midnight case
+            if(_startMin<=SESSION_GAP){sess=_prevSess;sessMap[key]=_prevSess;}
+          } else {
+            var _eh=parseInt(_prevSess.e.split(':')[0]),_em=parseInt(_prevSess.e.split(':')[1]||0);
+            var _gap=_startMin+1440-(_eh*60+_em);
+            if(_gap<=SESSION_GAP){sess=_prevSess;sessMap[key]=_prevSess;}
+          }
+        }
+      }
+      if(sess&&c.s){
+        var canExtend=false;
+        if(!sess.e){
+          // ongoing session — allow extending only if start is not too far ahead
+          var sh2=parseInt(c.s.split(':')[0]),sm2=parseInt(c.s.split(':')[1]||0);
+          var sh0=parseInt(sess.s.split(':')[0]),sm0=parseInt(sess.s.split(':')[1]||0);
+          canExtend=((sh2*60+sm2)-(sh0*60+sm0)<=SESSION_GAP*4);
+        }
+        else{
+          var eh2=parseInt(sess.e.split(':')[0]),em2=parseInt(sess.e.split(':')[1]||0);
+          var sh2=parseInt(c.s.split(':')[0]),sm2=parseInt(c.s.split(':')[1]||0);
+          var gap=(sh2*60+sm2)-(eh2*60+em2);
+          // allow small overlap (gap<0) as well as normal gap
+          canExtend=(gap<=SESSION_GAP);
+        }
+        if(canExtend){
+          if(c.e&&(!sess.e_d||c.d>sess.e_d||(c.d===sess.e_d&&c.e>sess.e))){sess.e=c.e;sess.e_d=c.d;}
+          sess.dur=(sess.dur||0)+(c.dur||0);
+          return;
+        }
+      }
+      var ns={d:c.d,m:c.m,p:c.p,s:c.s,e:c.e,dur:c.dur||0,e_d:c.d};
+      CDATA.push(ns);
+      sessMap[key]=ns;
+    });
+    CDATA.sort(function(a,b){return a.d<b.d?-1:a.d>b.d?1:0;});
+    machines=[];
+    CDATA.forEach(function(c){
+      if(machines.indexOf(c.m)===-1)machines.push(c.m);
+    });
+    machines.sort();
+    // Generate ALL dates in range (not just dates with data) so columns
+    // match the Period Trend chart which shows every date in the range
+    dates=[];
+    if(from&&to){
+      var cur=new Date(from+'T00:00:00');
+      var end=new Date(to+'T00:00:00');
+      while(cur<=end){
+        dates.push(localISO(cur));
+        cur.setDate(cur.getDate()+1);
+      }
+    } else {
+      var dateSet={};
+      CDATA.forEach(function(c){dateSet[c.d]=1;});
+      dates=Object.keys(dateSet).sort();
+    }
+    // Compute PX_PER_DAY from Period Trend chart-wrap width (forcedW passed directly avoids offsetWidth timing issues)
+    if(dates.length){
+      var _availW=forcedW||0;
+      if(!_availW){var _chartEl=document.getElementById('effChartPeriod');var _cw=_chartEl?_chartEl.closest('.chart-wrap'):null;_availW=(_cw&&_cw.offsetWidth>0)?_cw.offsetWidth:0;}
+      if(!_availW)_availW=Math.max(600,dates.length*22+60);
+      PX_PER_DAY=_availW/Math.max(dates.length,1);
+    }
+  }
 
-        sep = f'<div class="machine-sep">{short_name}</div>' if i > 0 else ''
-        machines_html += sep + f"""
-        <div class="machine-card" id="machine-{short_name}">
-          <div class="machine-header">
-            <div class="machine-title">
-              <span class="machine-id">{short_name}</span>
-              <span class="machine-full">{mname}</span>
-            </div>
-            <div class="eff-badge" style="background:{eff_color(eff)}">
-              Efficiency: {eff}%
-              <span class="eff-detail">({total_run} / {total_min} min)</span>
-            </div>
-          </div>
-          <div class="section-title">⏱ Timeline</div>
-          <div style="padding:10px 20px 4px">{timeline_bar(mname)}</div>
-          <div class="section-title">📋 Activity Log — {len(c_list)} cycles, {len(d_list)} downtimes ({total_down} min)</div>
-          <div style="padding:0 0 4px">{activity_section(c_list, d_list, mname)}</div>
-          {cycles_section(c_list, mname, excel_targets)}
-        </div>"""
+  function drawGantt(forcedW){
+    if(!dates.length){ cv.style.width='0'; cv.style.height='0'; return; }
+    var canvasW=forcedW||0;
+    if(!canvasW){var _chartEl=document.getElementById('effChartPeriod');var _cw2=_chartEl?_chartEl.closest('.chart-wrap'):null;canvasW=(_cw2&&_cw2.offsetWidth>0)?_cw2.offsetWidth:0;}
+    if(!canvasW)canvasW=Math.max(600,dates.length*22+60);
+    // Sync Gantt chart-wrap width to match Period Trend exactly
+    var _gcw=cv.closest('.chart-wrap');
+    if(_gcw){_gcw.style.minWidth=canvasW+'px';_gcw.style.width=canvasW+'px';}
+    var canvasH=350;
+    if(machines.length>0){ROW_H=Math.max(14,Math.floor((canvasH-TICK_H-PAD*(machines.length+1))/machines.length));}
+    var dpr=window.devicePixelRatio||1;
+    cv.style.width=canvasW+'px'; cv.style.height=canvasH+'px';
+    cv.width=Math.round(canvasW*dpr); cv.height=Math.round(canvasH*dpr);
+    var ctx=cv.getContext('2d'); ctx.scale(dpr,dpr);
+    barMeta=[];
 
-    return f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<title>Machine Report — {generated}</title>
-<script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>
-<style>
-  *{{box-sizing:border-box;margin:0;padding:0}}
-  body{{font-family:'Roboto','Segoe UI',Arial,sans-serif;background:#ffffff;color:#212121;font-size:15px;margin:0;-webkit-font-smoothing:antialiased;-moz-osx-font-smoothing:grayscale;text-rendering:optimizeLegibility}}
+    ctx.fillStyle='#f8fafc'; ctx.fillRect(0,0,canvasW,canvasH);
 
-  /* ── Header ── */
-  .header{{background:#1450CF;color:white;padding:10px 20px;display:flex;justify-content:space-between;align-items:center;flex-wrap:wrap;gap:8px;box-shadow:0 2px 4px rgba(0,0,0,.2)}}
-  .header h1{{font-size:1.2rem;font-weight:500}}
-  .header .meta{{font-size:.8rem;opacity:.9;text-align:right}}
-  .header-tabs{{display:flex;gap:4px;align-items:center}}
+    dates.forEach(function(d,i){
+      var x=LABEL_W+i*PX_PER_DAY;
+      var dow=new Date(d+'T00:00:00').getDay();
+      var wh=workHours(d);
+      if(!wh.length){
+        // Вихідний / свято — без планових змін
+        ctx.fillStyle='rgba(255,180,0,0.18)';
+        ctx.fillRect(x,0,PX_PER_DAY,canvasH-TICK_H);
+        ctx.save();ctx.fillStyle='rgba(180,100,0,0.6)';ctx.font='bold 10px sans-serif';ctx.textAlign='center';
+        ctx.fillText(HOLIDAYS[d]?'HOL':(dow===6?'SAT':(dow===0?'SUN':'OFF')),x+PX_PER_DAY/2,11);ctx.restore();
+      } else {
+        // Non-working hours: dark gray fill; working hours from the work calendar: white
+        // (program bars will cover it)
+        ctx.fillStyle='rgba(71,85,105,0.45)';
+        ctx.fillRect(x,0,PX_PER_DAY,canvasH-TICK_H);
+        ctx.fillStyle='rgba(255,255,255,1)';
+        wh.forEach(function(iv){
+          var x0=Math.round(iv[0]/24*PX_PER_DAY), x1=Math.round(iv[1]/24*PX_PER_DAY);
+          ctx.fillRect(x+x0,0,x1-x0,canvasH-TICK_H);
+        });
+      }
+      ctx.strokeStyle='#475569'; ctx.lineWidth=1; ctx.setLineDash([]);
+      ctx.beginPath(); ctx.moveTo(x+0.5,0); ctx.lineTo(x+0.5,canvasH-TICK_H); ctx.stroke();
+      var step=PX_PER_DAY>=28?1:Math.ceil(28/PX_PER_DAY);
+      if(i%step===0){
+        ctx.fillStyle='#64748b'; ctx.font='10px sans-serif'; ctx.textAlign='center';
+        ctx.fillText(d.slice(8)+'.'+d.slice(5,7), x+PX_PER_DAY/2, canvasH-6);
+      }
+    });
 
-  /* ── Layout ── */
-  .container{{max-width:1100px;margin:16px auto;padding:0 12px}}
+    // ── Machine separator lines ─────────────────────────────────────
+    machines.forEach(function(m,ri){
+      var y=PAD+ri*(ROW_H+PAD);
+      ctx.strokeStyle='#475569'; ctx.lineWidth=1; ctx.setLineDash([]);
+      ctx.beginPath(); ctx.moveTo(0,y+ROW_H+PAD/2); ctx.lineTo(canvasW,y+ROW_H+PAD/2); ctx.stroke();
+    });
 
-  /* ── Machine card ── */
-  .machine-card{{background:#FFFFFF;border-radius:2px;box-shadow:0 2px 4px rgba(0,0,0,.3);margin-bottom:16px;overflow:hidden}}
-  .machine-header{{background:#1e293b;color:white;padding:14px 16px;display:flex;justify-content:space-between;align-items:center;flex-wrap:wrap;gap:8px}}
-  .machine-title{{display:flex;flex-direction:column;gap:2px}}
-  .machine-id{{font-size:1.1rem;font-weight:500}}
-  .machine-full{{font-size:.7rem;opacity:.8;word-break:break-all}}
-  .eff-badge{{padding:5px 12px;border-radius:2px;font-weight:500;font-size:.85rem;color:white;white-space:nowrap}}
-  .eff-detail{{font-size:.72rem;font-weight:400;opacity:.9;margin-left:4px}}
+    // ── Collect gap metadata (idle between programs, same machine+day) ─
+    var byMD={};
+    CDATA.forEach(function(c){
+      var k=c.m+'|'+c.d;
+      if(!byMD[k])byMD[k]=[];
+      byMD[k].push(c);
+    });
+    gapMeta=[];
+    Object.keys(byMD).forEach(function(k){
+      var items=byMD[k].slice().sort(function(a,b){return (a.s||'')<(b.s||'')?-1:1;});
+      var parts=k.split('|'), m=parts[0], d=parts[1];
+      var ri=machines.indexOf(m), di=dates.indexOf(d);
+      if(ri===-1||di===-1) return;
+      var x=LABEL_W+di*PX_PER_DAY;
+      var y=PAD+ri*(ROW_H+PAD);
+      for(var i=0;i<items.length-1;i++){
+        var cur=items[i],nxt=items[i+1];
+        if(!cur.e||!nxt.s) continue;
+        var ceh=parseInt(cur.e.split(':')[0]),cem=parseInt(cur.e.split(':')[1]||0);
+        var nsh=parseInt(nxt.s.split(':')[0]),nsm=parseInt(nxt.s.split(':')[1]||0);
+        var gapMin=(nsh*60+nsm)-(ceh*60+cem);
+        if(gapMin<15) continue;
+        var gx=x+Math.round((ceh*60+cem)/1440*PX_PER_DAY);
+        var gex=x+Math.round((nsh*60+nsm)/1440*PX_PER_DAY);
+        var gw=Math.max(gex-gx,2);
+        gapMeta.push({x:gx,y:y+3,w:gw,h:ROW_H-6,gapMin:gapMin,m:m,d:d,s:cur.e,e:nxt.s});
+      }
+    });
 
-  /* ── Section title ── */
-  .section-title{{padding:10px 16px 5px;font-weight:500;font-size:.8rem;color:#757575;border-top:1px solid #E0E0E0;text-transform:uppercase;letter-spacing:.05em}}
+    // ── Program bars (multi-day aware) ────────────────────────────────
+    CDATA.forEach(function(c){
+      var ri=machines.indexOf(c.m); if(ri===-1) return;
+      var startDi=dates.indexOf(c.d); if(startDi===-1) return;
+      if(!c.s) return;
+      var sh=parseInt(c.s.split(':')[0]),sm=parseInt(c.s.split(':')[1]||0);
+      var eh=c.e?parseInt(c.e.split(':')[0]):sh, em=c.e?parseInt(c.e.split(':')[1]||0):sm;
+      var endDi=c.e_d?dates.indexOf(c.e_d):startDi;
+      if(endDi===-1) endDi=startDi;
+      var y=PAD+ri*(ROW_H+PAD);
+      for(var dayIdx=startDi;dayIdx<=Math.min(endDi,dates.length-1);dayIdx++){
+        var x_d=LABEL_W+dayIdx*PX_PER_DAY;
+        var segS=(dayIdx===startDi)?sh*60+sm:0;
+        var segE=(dayIdx===endDi)?eh*60+em:1440;
+        if(segS>=segE) continue;
+        var bx=x_d+Math.round(segS/1440*PX_PER_DAY);
+        var ex2=x_d+Math.round(segE/1440*PX_PER_DAY);
+        var bw=Math.max(ex2-bx,4);
+        ctx.fillStyle=progColor[c.p]||'#94a3b8';
+        ctx.beginPath(); ctx.roundRect(bx,y+3,bw,ROW_H-6,3); ctx.fill();
+        if(bw>36){
+          ctx.fillStyle='rgba(255,255,255,0.92)';
+          ctx.font='bold 9px sans-serif'; ctx.textAlign='left';
+          ctx.save(); ctx.beginPath(); ctx.rect(bx+2,y+3,bw-4,ROW_H-6); ctx.clip();
+          ctx.fillText(c.p,bx+5,y+ROW_H/2+3);
+          ctx.restore();
+        }
+        barMeta.push({x:bx,y:y+3,w:bw,h:ROW_H-6,c:c});
+      }
+    });
 
-  /* ── Tables (desktop) ── */
-  table{{width:100%;border-collapse:collapse;font-size:.85rem}}
-  th{{background:#F8F9FA;padding:8px 12px;text-align:left;font-weight:500;color:#495057;border-bottom:2px solid #DEE2E6;white-space:nowrap}}
-  td{{padding:8px 12px;border-bottom:1px solid #DEE2E6;word-break:break-word}}
-  tr:last-child td{{border-bottom:none}}
-  tr:hover td{{background:#E9ECEF}}
-  .tl-row{{cursor:pointer;transition:background-color 0.2s ease}}
-  .tl-row:hover td{{background:#E3F2FD!important}}
-  .activity-run td{{background:#E8F5E9}}
-  .activity-down td{{background:#FFEBEE}}
-  .activity-run:hover td{{background:#C8E6C9!important}}
-  .activity-down:hover td{{background:#FFCDD2!important}}
+    // Save clean canvas (without machine names) for sticky redraw on scroll
+    _ganttClean=ctx.getImageData(0,0,cv.width,cv.height);
+    _drawMachineNames();
+  }
 
-  /* ── Scrollable tables ── */
-  .scroll-table-wrap{{width:100%;border-bottom:1px solid #e2e8f0}}
-  .scroll-table{{width:100%;border-collapse:collapse;table-layout:fixed;font-size:.85rem}}
-  .scroll-table th,.scroll-table td{{padding:8px 12px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap}}
-  .scroll-table thead th{{background:#F8F9FA;font-weight:500;color:#495057;border-bottom:2px solid #DEE2E6;position:sticky;top:0;z-index:1}}
-  .scroll-table tbody tr:last-child td{{border-bottom:none}}
-  .scroll-table tbody tr:hover td{{background:#E9ECEF}}
-  .scroll-tbody-wrap{{display:block}}
-  .scroll-tbody-wrap::-webkit-scrollbar{{width:5px}}
-  .scroll-tbody-wrap::-webkit-scrollbar-track{{background:#F8F9FA}}
-  .scroll-tbody-wrap::-webkit-scrollbar-thumb{{background:#ADB5BD;border-radius:2px}}
-  
-  /* ── Resizable Activity Log ── */
-  .resizable-section{{
-    position:relative;
-    overflow:auto;
-    border:1px solid #e2e8f0;
-    border-radius:6px;
-    background:#fff;
-    resize:vertical;
-    min-height:150px;
-  }}
-  .resizable-section::-webkit-resizer{{
-    background:#cbd5e1;
-    border-radius:3px;
-  }}
-
-  /* ── Timeline ── */
-  .tl-scroll-wrapper{{overflow-x:auto;overflow-y:hidden;position:relative;margin:0 -12px;padding:0 12px}}
-  .tl-scroll-wrapper::-webkit-scrollbar{{height:8px}}
-  .tl-scroll-wrapper::-webkit-scrollbar-track{{background:#f1f5f9}}
-  .tl-scroll-wrapper::-webkit-scrollbar-thumb{{background:#cbd5e1;border-radius:4px}}
-  .tl-svg{{display:block;border-radius:4px;user-select:none;cursor:grab}}
-
-  /* ── Legend ── */
-  .legend{{display:flex;gap:14px;padding:4px 16px 10px;font-size:.78rem;flex-wrap:wrap;color:#212121}}
-  .legend span{{display:flex;align-items:center;gap:4px}}
-  .dot{{width:11px;height:11px;border-radius:2px;display:inline-block;flex-shrink:0}}
+  // ── Sticky machine labels (redrawn on scroll) ─────────────────────
+  var _ganttClean=null;
+  function _drawMachineNames(){
+    if(!_ganttClean||!machines.length)return;
+    var _ctx=cv.getContext('2d');
+    _ctx.putImageData(_ganttClean,0,0);
+    var _gSc2=document.getElementById('gantt-scroll-outer');
+    var _scrollX=_gSc2?_gSc2.scrollLeft:0;
+    machines.forEach(function(m,ri){
+      var y=PAD+ri*(ROW_H+PAD);
+      var shortM=m.indexOf('_')!==-1?m.split('_')[0]:m;
+      _ctx.save();
+      _ctx.font='bold 16px sans-serif';_ctx.textAlign='left';
+      _ctx.shadowColor='rgba(0,0,0,0.8)';_ctx.shadowBlur=4;
+      _ctx.lineWidth=3;_ctx.strokeStyle='rgba(0,0,0,0.6)';
+      _ctx.strokeText(shortM,_scrollX+6,y+ROW_H/2+4);
+      _ctx.fillStyle='#ffffff';_ctx.shadowBlur=0;
+      _ctx.fillText(shortM,_scrollX+6,y+ROW_H/2+4);
+      _ctx.restore();
+    });
+  }
+  (function(){
+    var _gSc3=document.getElementById('gantt-scroll-outer');
+    if(_gSc3){var _raf;_gSc3.addEventListener('scroll',function(){
+      if(_raf)return;_raf=requestAnimationFrame(function(){_drawMachineNames();_raf=null;});
+    });}
+  })();
 
-  /* ── Misc ── */
-  .badge{{display:inline-block;padding:2px 7px;border-radius:10px;font-size:.72rem;font-weight:600;margin-left:3px}}
-  .badge.ongoing{{background:#dbeafe;color:#1d4ed8}}
-  .empty{{padding:12px 16px;color:#94a3b8;font-style:italic;font-size:.85rem}}
-  .footer{{text-align:center;color:#94a3b8;font-size:.75rem;padding:16px;word-break:break-all}}
+  // Initial draw: last 7 days
+  (function(){
+    var to=new Date(),from=new Date();from.setDate(to.getDate()-6);
+    buildFromRange(localISO(from), localISO(to));
+    drawGantt();
+  })();
 
-  /* ── Tooltip ── */
-  #tl-tooltip{{
-    position:fixed;pointer-events:none;z-index:9999;
-    background:#1e293b;color:white;
-    padding:6px 10px;border-radius:6px;font-size:.78rem;
-    box-shadow:0 4px 12px rgba(0,0,0,.3);
-    display:none;max-width:240px;white-space:normal;line-height:1.4
-  }}
+  // Exposed so Period Trend controls can sync this chart
+  window.updateBatchGantt=function(from,to,forcedW){
+    buildFromRange(from,to,forcedW);
+    drawGantt(forcedW);
+  };
 
-  /* ── Highlight ── */
-  .tl-seg.dim{{opacity:.25}}
-  .tl-seg.highlight{{opacity:1;filter:brightness(1.18)}}
-  .tl-row{{transition:background-color 0.2s ease}}
-  .tl-row.highlight td{{background:#fde047!important;font-weight:600}}
-  .tl-row:hover td{{background:#f0f9ff!important}}
+  // Tooltip
+  cv.addEventListener('mousemove',function(e){
+    var rect=cv.getBoundingClientRect();
+    var scaleX=parseFloat(cv.style.width)/rect.width;
+    var mx=(e.clientX-rect.left)*scaleX, my=(e.clientY-rect.top)*scaleX;
+    // Check program bars first
+    var found=null;
+    for(var i=barMeta.length-1;i>=0;i--){
+      var b=barMeta[i];
+      if(mx>=b.x&&mx<=b.x+b.w&&my>=b.y&&my<=b.y+b.h){found=b;break;}
+    }
+    function showTip(html, cx, cy){
+      tip.style.display='block';
+      tip.innerHTML=html;
+      var tw=tip.offsetWidth||200, th=tip.offsetHeight||70;
+      var tx=cx+14, ty=cy-32;
+      if(tx+tw>window.innerWidth-8) tx=cx-tw-14;
+      if(tx<8) tx=8;
+      if(ty+th>window.innerHeight-8) ty=cy-th-8;
+      if(ty<8) ty=cy+14;
+      tip.style.left=tx+'px'; tip.style.top=ty+'px';
+    }
+    if(found){
+      var dm=found.c.dur?Math.round(found.c.dur):0;
+      var durStr=dm>0?(dm>=60?(Math.floor(dm/60)+'h'+(dm%60?'\u00a0'+dm%60+'m':'')):dm+'\u00a0min'):'';
+      showTip('<b>'+found.c.m+'</b> — '+found.c.p+'<br>'+found.c.d+'&nbsp;'+found.c.s+'–'+(found.c.e||'…')+(durStr?'<br>'+durStr:''),e.clientX,e.clientY);
+      return;
+    }
+    // Check gap bars
+    var foundGap=null;
+    for(var j=gapMeta.length-1;j>=0;j--){
+      var g=gapMeta[j];
+      if(mx>=g.x&&mx<=g.x+g.w&&my>=g.y&&my<=g.y+g.h){foundGap=g;break;}
+    }
+    if(foundGap){
+      var h=Math.floor(foundGap.gapMin/60),m2=foundGap.gapMin%60;
+      var durStr=h>0?(h+'h '+(m2?m2+'m':'')):m2+'m';
+      showTip('⏸ <b>Idle: '+durStr+'</b><br>'+foundGap.m+' &nbsp;'+foundGap.d+'<br>'+foundGap.s+' – '+foundGap.e,e.clientX,e.clientY);
+    } else tip.style.display='none';
+  });
+  cv.addEventListener('mouseleave',function(){tip.style.display='none';});
+})();
 
-  /* ══════════════════════════════════════════
-     MOBILE  ≤ 600px
-  ══════════════════════════════════════════ */
-  @media(max-width:600px){{
-    body{{font-size:14px}}
-    .header{{padding:10px 12px}}
-    .header h1{{font-size:0.95rem}}
-    .header-tabs{{gap:3px}}
-    .tab-btn{{padding:4px 10px;font-size:0.75rem}}
-    .container{{padding:0 6px;margin:8px auto}}
-    .machine-card{{border-radius:6px;margin-bottom:10px}}
-    /* machine-header — стак вертикально */
-    .machine-header{{padding:10px 12px;flex-direction:column;align-items:flex-start;gap:6px}}
-    .eff-badge{{font-size:.8rem;padding:4px 10px;align-self:stretch;text-align:center}}
-    .eff-detail{{display:none}}
-    .section-title{{padding:7px 12px 4px;font-size:.72rem}}
-    /* Таблиці */
-    .table-scroll-x{{overflow-x:auto;-webkit-overflow-scrolling:touch}}
-    table,.scroll-table{{font-size:.75rem;min-width:300px}}
-    th,td,.scroll-table th,.scroll-table td{{padding:6px 8px}}
-    /* Resizable — прибираємо resize handle на touch */
-    .resizable-section{{resize:none}}
-    /* Tooltip */
-    #tl-tooltip{{
-      position:fixed;bottom:16px;left:50%;transform:translateX(-50%);
-      top:auto!important;max-width:92vw;text-align:center
-    }}
-    .legend{{padding:4px 10px 8px;font-size:.72rem;gap:8px}}
-    .footer{{font-size:.7rem;padding:10px 10px 20px}}
-    /* Stats */
-    .chart-wrap{{height:220px}}
-    .chart-panel{{padding:12px 10px}}
-    .stats-controls{{gap:6px}}
-    .stats-controls label{{font-size:0.78rem}}
-    .stats-controls input[type=date]{{font-size:0.78rem;padding:4px 6px;max-width:130px}}
-    .stats-controls button{{padding:5px 10px;font-size:0.75rem}}
-    .stats-table th,.stats-table td{{padding:4px 4px;font-size:0.75rem;white-space:nowrap;overflow:hidden}}
-    .chart-legend{{gap:6px}}
-    .leg-item{{font-size:0.72rem}}
-    /* Scroll-top */
-    #scroll-top{{right:12px;left:auto;bottom:20px;width:40px;height:40px;font-size:1.2rem}}
-  }}
-  /* Nav drawer (all screens) */
-  .nav-sidebar{{
-    position:fixed;top:0;left:0;bottom:0;width:fit-content;
-    transform:translateX(-100%);
-    transition:transform .25s ease;
-    display:flex;flex-direction:column;
-    background:transparent;padding:60px 8px 16px;gap:6px;
-    z-index:1500;overflow-y:auto;
-  }}
-  .nav-sidebar.open{{transform:translateX(0)}}
-  #nav-overlay{{display:none;position:fixed;inset:0;background:rgba(0,0,0,.45);z-index:1400;}}
-  #nav-overlay.open{{display:block}}
-  #nav-toggle{{
-    display:flex;position:fixed;left:0;top:50%;transform:translateY(-50%);
-    width:26px;height:52px;background:#1e293b;color:#fff;
-    border:none;border-radius:0 8px 8px 0;font-size:1rem;cursor:pointer;
-    z-index:1600;align-items:center;justify-content:center;
-    box-shadow:2px 0 8px rgba(0,0,0,.35);
-  }}
-  .nav-btn{{display:block;padding:14px 10px;font-size:1.1rem;white-space:nowrap;border-radius:10px;width:100%;text-align:center;background:#1e293b;color:#fff;font-weight:800;text-decoration:none;box-shadow:0 2px 8px rgba(0,0,0,0.35);transition:background .15s,box-shadow .15s;letter-spacing:0.04em}}
-  .nav-btn:hover{{background:#3b82f6;box-shadow:0 4px 14px rgba(59,130,246,0.4)}}
-  .nav-tab-btn{{background:#1450CF!important;color:#fff!important}}
-  .nav-tab-btn.active{{background:#3b82f6!important;box-shadow:0 0 0 2px #fff}}
-  /* scroll top */
-  #scroll-top{{position:fixed;bottom:24px;left:8px;width:44px;height:44px;border-radius:50%;background:#1e293b;color:#fff;border:none;font-size:1.4rem;cursor:pointer;box-shadow:0 4px 12px rgba(0,0,0,.3);display:none;align-items:center;justify-content:center;z-index:2000;transition:background .15s}}
-  #scroll-top:hover{{background:#3b82f6}}
-  #scroll-top.visible{{display:flex}}
-  /* stats */
-  .stats-controls{{display:flex;align-items:center;gap:12px;flex-wrap:wrap;padding:12px 0}}
-  .stats-controls label{{font-size:0.85rem;color:#475569;display:flex;align-items:center;gap:6px}}
-  .stats-controls input[type=date]{{padding:5px 8px;border:1px solid #cbd5e1;border-radius:6px;font-size:0.85rem}}
-  .stats-controls button{{padding:6px 14px;background:#1e293b;color:#fff;border:none;border-radius:6px;cursor:pointer;font-size:0.82rem;font-weight:600}}
-  .stats-controls button:hover{{background:#3b82f6}}
-  .two-charts{{display:flex;flex-direction:column;gap:20px;margin-top:12px}}
-  .chart-panel{{background:#fff;border-radius:8px;box-shadow:0 2px 8px rgba(0,0,0,.1);padding:16px}}
-  .chart-title{{font-size:0.9rem;font-weight:700;color:#1e293b;margin-bottom:10px}}
-  .chart-scroll-outer{{overflow-x:auto;-webkit-overflow-scrolling:touch;border:1px solid red;margin-left:-16px;margin-right:-16px}}
-  .chart-wrap{{position:relative;height:350px;min-width:600px;background:#f8fafc}}
-  .chart-legend{{display:flex;flex-wrap:wrap;gap:10px;margin-top:8px}}
-  .leg-item{{display:flex;align-items:center;gap:5px;font-size:0.8rem;color:#334155;font-weight:500}}
-  .leg-dot{{width:11px;height:11px;border-radius:50%;display:inline-block}}
-  .stats-table{{border-collapse:collapse;font-size:0.96rem;width:100%;margin-top:16px;table-layout:fixed}}
-  .stats-table th{{background:#1e293b;color:#fff;padding:6px 12px;text-align:center}}
-  .stats-table td{{padding:5px 12px;text-align:center;border-bottom:1px solid #e2e8f0}}
-  @media(max-width:900px){{.two-charts{{grid-template-columns:1fr}}}}
-  /* ── Block dividers ── */
-  .block-header{{background:#1e293b;color:#fff;padding:10px 16px;border-radius:6px;margin:20px 0 12px;display:flex;align-items:center;gap:8px;font-size:0.9rem;font-weight:700;letter-spacing:0.04em}}
-  .block-header.machines{{background:#1e293b;margin-top:28px}}
-  /* ── Machine separator ── */
-  .machine-sep{{display:flex;align-items:center;gap:10px;margin:24px 0 10px;font-size:0.72rem;color:#94a3b8;font-weight:700;letter-spacing:0.1em;text-transform:uppercase}}
-  .machine-sep::before,.machine-sep::after{{content:'';flex:1;height:1px;background:#e2e8f0}}
-  .machine-card{{border-top:3px solid #3DA9D7}}
-</style>
-</head>
-<body>
-<div class="header">
-  <h1>📊 Machine Report</h1>
-  <div class="meta">
-    Period: {period_str}<br>
-    Generated: {generated}
-  </div>
-</div>
-<div class="container">
-  <div class="block-header">📊 Statistics</div>
-  <div id="machine-filter" style="display:flex;flex-wrap:wrap;gap:6px;padding:6px 0 8px"></div>
-  <div class="two-charts">
-    <div class="chart-panel">
-      <h3 class="chart-title" id="today-chart-title">Today — Hourly Efficiency</h3>
-      <div id="today-day-selector" style="display:flex;gap:6px;flex-wrap:wrap;padding:4px 0 10px"></div>
-      <div class="chart-scroll-outer"><div class="chart-wrap"><canvas id="effChartToday"></canvas></div></div>
-      <div id="today-table-wrap"></div>
-    </div>
-    <div class="chart-panel">
-      <h3 class="chart-title">Period Trend</h3>
-      <div class="stats-controls">
-        <label>From: <input type="text" id="stat-from" placeholder="dd.mm.yyyy" value="{(datetime.now()-timedelta(days=6)).strftime('%d.%m.%Y')}" style="width:90px"></label>
-        <label>To: <input type="text" id="stat-to" placeholder="dd.mm.yyyy" value="{datetime.now().strftime('%d.%m.%Y')}" style="width:90px"></label>
-        <button onclick="updatePeriodChart()">Apply</button>
-        <button onclick="setRange(7)">7d</button>
-        <button onclick="setRange(30)">30d</button>
-        <button onclick="setRange(90)">90d</button>
-        <button onclick="setRange(180)">180d</button>
-        <button onclick="setRange(365)">1y</button>
-      </div>
-      <div class="chart-scroll-outer">
-        <div class="chart-wrap"><canvas id="effChartPeriod"></canvas></div>
-      </div>
-      <div style="margin-top:6px;font-size:0.75rem;font-weight:700;color:#475569;padding:4px 0 2px;text-transform:uppercase;letter-spacing:.05em">Batch Gantt</div>
-      <div id="gantt-scroll-outer" class="chart-scroll-outer">
-        <div class="chart-wrap"><canvas id="batchGantt" style="display:block"></canvas></div>
-      </div>
-    </div>
-  </div>
-  <div id="batch-tooltip" style="position:fixed;pointer-events:none;z-index:9999;background:#1e293b;color:white;padding:6px 10px;border-radius:6px;font-size:.78rem;box-shadow:0 4px 12px rgba(0,0,0,.3);display:none;max-width:240px;white-space:normal;line-height:1.4"></div>
-  <div class="block-header machines">🏭 Machines
-    <span style="margin-left:auto;font-weight:400;font-size:0.78rem;opacity:0.8">
-      <span class="dot" style="background:#4CAF50;border-radius:2px"></span> Running &nbsp;
-      <span class="dot" style="background:#F44336;border-radius:2px"></span> Downtime
-    </span>
-  </div>
-  {machines_html}
-</div>
-<div id="nav-overlay"></div>
-<button id="nav-toggle" title="Навігація">&#9776;</button>
-<div class="nav-sidebar" id="nav-sidebar">
-{nav_buttons}
-</div>
-<button id="scroll-top" onclick="window.scrollTo({{top:0,behavior:'smooth'}})" title="↑">↑</button>
-<div class="footer">Source: Connect Plan WebAPI ({API_BASE}) &nbsp;|&nbsp; DB: {DB_FILE}</div>
-<div id="tl-tooltip"></div>
-<script>
-function localISO(d){{var y=d.getFullYear(),m=d.getMonth()+1,dd=d.getDate();return y+'-'+(m<10?'0':'')+m+'-'+(dd<10?'0':'')+dd;}}
-(function(){{
-  var tip = document.getElementById("tl-tooltip");
+// ── Nav drawer (mobile) ───────────────────────────────────────────
+(function(){
+  var toggle=document.getElementById('nav-toggle');
+  var sidebar=document.getElementById('nav-sidebar');
+  var overlay=document.getElementById('nav-overlay');
+  if(!toggle||!sidebar||!overlay) return;
+  function openNav(){sidebar.classList.add('open');overlay.classList.add('open');}
+  function closeNav(){sidebar.classList.remove('open');overlay.classList.remove('open');}
+  toggle.addEventListener('click',function(){
+    sidebar.classList.contains('open')?closeNav():openNav();
+  });
+  overlay.addEventListener('click',closeNav);
+  sidebar.querySelectorAll('.nav-btn').forEach(function(btn){
+    btn.addEventListener('click',closeNav);
+  });
+})();
 
-  // ── Tooltip + highlight при наведенні на сегмент таймлайну ────────────────
-  document.querySelectorAll(".tl-seg").forEach(function(seg){{
-    seg.addEventListener("mouseenter", function(e){{
-      var id=seg.dataset.id, txt=seg.dataset.tip;
-      tip.textContent=txt; tip.style.display="block";
-      var svg=seg.closest("svg");
-      svg.querySelectorAll(".tl-seg").forEach(function(s){{ s.classList.add("dim"); }});
-      seg.classList.remove("dim"); seg.classList.add("highlight");
-      if(id) document.querySelectorAll('.tl-row').forEach(function(r){{
-        var ids=r.dataset.id?r.dataset.id.split(' '):[];
-        if(ids.indexOf(id)!==-1) r.classList.add("highlight");
-      }});
-    }});
-    seg.addEventListener("mousemove", function(e){{
-      tip.style.left=(e.clientX+14)+"px"; tip.style.top=(e.clientY-32)+"px";
-    }});
-    seg.addEventListener("mouseleave", function(){{
-      tip.style.display="none";
-      var svg=seg.closest("svg");
-      svg.querySelectorAll(".tl-seg").forEach(function(s){{ s.classList.remove("dim","highlight"); }});
-      var id=seg.dataset.id;
-      if(id) document.querySelectorAll('.tl-row').forEach(function(r){{
-        var ids=r.dataset.id?r.dataset.id.split(' '):[];
-        if(ids.indexOf(id)!==-1) r.classList.remove("highlight");
-      }});
-    }});
-    seg.addEventListener("click", function(){{
-      var id=seg.dataset.id; if(!id) return;
-      var targetRow=null;
-      document.querySelectorAll('.tl-row').forEach(function(r){{
-        var ids=r.dataset.id?r.dataset.id.split(' '):[];
-        if(ids.indexOf(id)!==-1) targetRow=r;
-      }});
-      if(!targetRow) return;
-      var sc=targetRow.closest(".scroll-tbody-wrap");
-      if(sc){{ var rr=targetRow.getBoundingClientRect(),cr=sc.getBoundingClientRect(); sc.scrollTo({{top:sc.scrollTop+(rr.top-cr.top)-(cr.height/2)+(rr.height/2),behavior:'smooth'}}); }}
-      else {{ window.scrollTo({{top:targetRow.getBoundingClientRect().top+window.scrollY-window.innerHeight/2,behavior:'smooth'}}); }}
-      targetRow.classList.add("highlight");
-      setTimeout(function(){{ targetRow.classList.remove("highlight"); }},1500);
-    }});
-    var _tt,_tm=false;
-    seg.addEventListener("touchstart",function(e){{
-      _tt=Date.now();_tm=false;e.preventDefault();
-      tip.textContent=seg.dataset.tip;tip.style.display="block";
-      var svg=seg.closest("svg");
-      svg.querySelectorAll(".tl-seg").forEach(function(s){{s.classList.add("dim");}});
-      seg.classList.remove("dim");seg.classList.add("highlight");
-      var id=seg.dataset.id;
-      if(id) document.querySelectorAll('.tl-row').forEach(function(r){{
-        var ids=r.dataset.id?r.dataset.id.split(' '):[];
-        if(ids.indexOf(id)!==-1) r.classList.add("highlight");
-      }});
-    }},{{passive:false}});
-    seg.addEventListener("touchmove",function(){{_tm=true;}});
-    seg.addEventListener("touchend",function(){{
-      var id=seg.dataset.id;
-      if(!_tm&&(Date.now()-_tt)<300&&id){{
-        var tr=null;
-        document.querySelectorAll('.tl-row').forEach(function(r){{
-          var ids=r.dataset.id?r.dataset.id.split(' '):[];
-          if(ids.indexOf(id)!==-1) tr=r;
-        }});
-        if(tr){{
-          var sc=tr.closest(".scroll-tbody-wrap");
-          if(sc){{var rr=tr.getBoundingClientRect(),cr=sc.getBoundingClientRect();sc.scrollTo({{top:sc.scrollTop+(rr.top-cr.top)-(cr.height/2),behavior:'smooth'}});}}
-          else{{window.scrollTo({{top:tr.getBoundingClientRect().top+window.scrollY-window.innerHeight/2,behavior:'smooth'}});}}
-          tr.classList.add("highlight");setTimeout(function(){{tr.classList.remove("highlight");}},1500);
-        }}
-      }}
-      setTimeout(function(){{
-        tip.style.display="none";
-        var svg=seg.closest("svg");
-        svg.querySelectorAll(".tl-seg").forEach(function(s){{s.classList.remove("dim","highlight");}});
-        if(id) document.querySelectorAll('.tl-row').forEach(function(r){{
-          var ids=r.dataset.id?r.dataset.id.split(' '):[];
-          if(ids.indexOf(id)!==-1) r.classList.remove("highlight");
-        }});
-      }},1400);
-    }});
-  }});
+document.addEventListener('DOMContentLoaded',function(){
+  // Scroll sync: Period Trend ↔ Batch Gantt
+  (function(){
+    var pEl=document.getElementById('effChartPeriod');
+    var pSc=pEl?pEl.closest('.chart-scroll-outer'):null;
+    var gSc=document.getElementById('gantt-scroll-outer');
+    if(!pSc||!gSc) return;
+    var _sy=false;
+    pSc.addEventListener('scroll',function(){if(_sy)return;_sy=true;gSc.scrollLeft=pSc.scrollLeft;_sy=false;});
+    gSc.addEventListener('scroll',function(){if(_sy)return;_sy=true;pSc.scrollLeft=gSc.scrollLeft;_sy=false;});
+  })();
+  // Графіки будуються при першій появі панелі на екрані (на телефоні Period Trend — нижче згину)
+  function whenVisible(el,fn){
+    if(!el) return;
+    if(EAGER||!('IntersectionObserver' in window)){requestAnimationFrame(fn);return;}
+    var io=new IntersectionObserver(function(entries){
+      if(entries.some(function(en){return en.isIntersecting;})){io.disconnect();fn();}
+    },{rootMargin:'200px 0px'});
+    io.observe(el);
+  }
+  whenVisible(document.getElementById('effChartToday'),function(){
+    if(window.initDaySelector) window.initDaySelector();
+    if(window.initToday) window.initToday();
+  });
+  whenVisible(document.getElementById('effChartPeriod'),function(){
+    if(window.setRange)  window.setRange(7);
+  });
+});
+"""
 
-  // ── Highlight при наведенні на рядок таблиці ──────────────────────
-  document.querySelectorAll(".tl-row").forEach(function(row){{
-    row.addEventListener("mouseenter",function(){{
-      var ids=row.dataset.id?row.dataset.id.split(' '):[];
-      if(!ids.length) return;
-      var svg=null,segs=[];
-      ids.forEach(function(id){{
-        var seg=document.querySelector('.tl-seg[data-id="'+id+'"]');
-        if(seg){{if(!svg)svg=seg.closest("svg");segs.push(seg);}}
-      }});
-      if(!segs.length) return;
-      svg.querySelectorAll(".tl-seg").forEach(function(s){{s.classList.add("dim");}});
-      segs.forEach(function(s){{s.classList.remove("dim");s.classList.add("highlight");}});
-      tip.textContent=segs[0].dataset.tip;tip.style.display="block";
-      tip.style.left=(row.getBoundingClientRect().right+10)+"px";
-      tip.style.top=(row.getBoundingClientRect().top+window.scrollY)+"px";
-    }});
-    row.addEventListener("mouseleave",function(){{
-      var ids=row.dataset.id?row.dataset.id.split(' '):[];
-      ids.forEach(function(id){{
-        var seg=document.querySelector('.tl-seg[data-id="'+id+'"]');
-        if(seg){{var svg=seg.closest("svg");svg.querySelectorAll(".tl-seg").forEach(function(s){{s.classList.remove("dim","highlight");}});}}
-      }});
-      tip.style.display="none";
-    }});
-    row.addEventListener("click",function(){{
-      var ids=row.dataset.id?row.dataset.id.split(' '):[];
-      if(!ids.length) return;
-      var fs=document.querySelector('.tl-seg[data-id="'+ids[0]+'"]');
-      if(!fs) return;
-      var wrapper=fs.closest(".tl-scroll-wrapper");
-      if(!wrapper) return;
-      var sr=fs.getBoundingClientRect(),wr=wrapper.getBoundingClientRect();
-      wrapper.scrollTo({{left:wrapper.scrollLeft+(sr.left-wr.left)-(wr.width/2)+(sr.width/2),behavior:'smooth'}});
-    }});
-  }});
+_REPORT_JS = _REPORT_JS_HEAD + _TL_CANVAS_JS + _ACTLOG_JS + _LIVE_JS + _REPORT_JS_TAIL
 
-  // ── Drag to scroll ─────────────────────────────────────────────────
-  document.querySelectorAll(".tl-scroll-wrapper").forEach(function(wrapper){{
-    var svg=wrapper.querySelector("svg");if(!svg) return;
-    var isDown=false,startX,slStart,isDragging=false;
-    svg.addEventListener("mousedown",function(e){{isDown=true;isDragging=false;startX=e.pageX;slStart=wrapper.scrollLeft;wrapper.style.cursor="grabbing";}});
-    document.addEventListener("mousemove",function(e){{if(!isDown) return;e.preventDefault();isDragging=true;wrapper.scrollLeft=slStart+(startX-e.pageX)*2;}});
-    document.addEventListener("mouseup",function(){{if(isDown){{isDown=false;wrapper.style.cursor="";setTimeout(function(){{isDragging=false;}},50);}}}});
-    svg.addEventListener("click",function(e){{if(isDragging){{e.stopPropagation();e.preventDefault();}}}},true);
-    var txStart,tsLeft;
-    svg.addEventListener("touchstart",function(e){{txStart=e.touches[0].pageX;tsLeft=wrapper.scrollLeft;}},{{passive:true}});
-    svg.addEventListener("touchmove",function(e){{if(!txStart) return;wrapper.scrollLeft=tsLeft+(txStart-e.touches[0].pageX)*2;}},{{passive:true}});
-    svg.addEventListener("touchend",function(){{txStart=null;}});
-  }});
+_STATIC_MANIFEST = "manifest.json"   # {"chartjs": {url: назва}, "chartjs_fail": ts, "published": [назви]}
+_static_names = {}                   # назви ресурсів цього процесу (вміст не змінюється між прогонами)
 
-  // ── Ctrl+Wheel zoom ─────────────────────────────────────────────────
-  // Zoom: SVG розтягується (бари), canvas перемальовується (тіки завжди чіткі)
-  document.querySelectorAll(".tl-outer-wrap").forEach(function(outer){{
-    var wrapper=outer.querySelector(".tl-scroll-wrapper");
-    var svg=wrapper?wrapper.querySelector("svg"):null;
-    if(!svg) return;
-    var BASE=wrapper.offsetWidth||800,cur=BASE,MIN=BASE,MAX=BASE*20;
-    wrapper.addEventListener("wheel",function(e){{
-      if(!e.ctrlKey) return;e.preventDefault();
-      var rect=svg.getBoundingClientRect();
-      var nw=Math.round(Math.min(MAX,Math.max(MIN,cur*(e.deltaY<0?1.15:1/1.15))));
-      if(nw===cur) return;
-      var ratio=(e.clientX-rect.left+wrapper.scrollLeft)/cur;
-      cur=nw;svg.style.width=nw+"px";
-      wrapper.scrollLeft=Math.round(ratio*nw-(e.clientX-rect.left));
-      // Canvas тіки: передаємо точну ширину SVG
-      if(outer._redrawTicks) outer._redrawTicks(nw);
-    }},{{passive:false}});
-  }});
-}})();
+def _static_manifest() -> dict:
+    try:
+        with open(os.path.join(STATIC_DIR, _STATIC_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-// ── Stats charts ──────────────────────────────────────────────────
-(function(){{
-  var ALL   = {_daily_js};
-  var HDATA = {_hourly_js};
-  var TEFF  = {_today_eff_js};
-  var MK    = {_mk_js};
-  var SK    = {_sk_js};
-  var COLS  = {_col_js};
-  var REPORT_HM = "{_gen_hm}";
-  var tCh=null, pCh=null;
+def _save_static_manifest(manifest: dict) -> None:
+    path = os.path.join(STATIC_DIR, _STATIC_MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def _write_asset(stem: str, ext: str, data: bytes) -> str:
+    """static/<stem>.<хеш>.<ext> — пишеться, лише якщо такого вмісту ще немає."""
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+    path = os.path.join(STATIC_DIR, name)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        log(f"Static asset written: static/{name} ({len(data)} bytes)")
+    if REPORT_PRECOMPRESS and not os.path.exists(path + ".gz"):
+        _write_precompressed(path, data, best=True)
+    return name
 
-  // Plugin: тонка червона вертикальна лінія у момент генерації звіту.
-  // Малюється на позиції лейблу REPORT_HM (напр. "14:28"), який окремо додано в labels —
-  // тому криві дотягуються до неї, а нативний tooltip працює як на звичайних точках.
-  var reportLinePlugin = {{
-    id: 'reportLine',
-    afterDatasetsDraw: function(chart) {{
-      if (!REPORT_HM) return;
-      var iLine = chart.data.labels.indexOf(REPORT_HM);
-      if (iLine < 0) return;
-      var xLine = Math.round(chart.scales.x.getPixelForValue(iLine)) + 0.5;
-      var ca = chart.chartArea;
-      var ctx = chart.ctx;
-      ctx.save();
-      ctx.strokeStyle = '#ef4444';
-      ctx.lineWidth = 1;
-      ctx.setLineDash([4,3]);
-      ctx.beginPath();
-      ctx.moveTo(xLine, ca.top);
-      ctx.lineTo(xLine, ca.bottom);
-      ctx.stroke();
-      ctx.restore();
-    }}
-  }};
+def _vendor_chartjs(manifest: dict):
+    """Локальна копія Chart.js (один раз з CHARTJS_URL). None — поки недоступна, сторінка бере CDN;
+    невдала спроба повторюється не частіше ніж раз на годину."""
+    import urllib.request
+    name = manifest.get("chartjs", {}).get(CHARTJS_URL)
+    if name and os.path.exists(os.path.join(STATIC_DIR, name)):
+        return name
+    if time.time() - manifest.get("chartjs_fail", 0) < 3600:
+        return None
+    try:
+        with urllib.request.urlopen(CHARTJS_URL, timeout=15) as r:
+            data = r.read()
+        if not data:
+            raise ValueError("empty response")
+    except Exception as e:
+        log(f"⚠ Chart.js download failed ({e}) — page uses CDN")
+        manifest["chartjs_fail"] = round(time.time())
+        return None
+    name = _write_asset("chart", "js", data)
+    manifest.setdefault("chartjs", {})[CHARTJS_URL] = name
+    manifest.pop("chartjs_fail", None)
+    return name
 
-  // ── Machine filter checkboxes ─────────────────────────────────────
-  (function(){{
-    var fd=document.getElementById('machine-filter');
-    if(!fd) return;
-    function setAll(on){{
-      var cbs=fd.querySelectorAll('input[type=checkbox]');
-      cbs.forEach(function(cb){{
-        cb.checked=on;
-        var lbl=cb.parentElement;
-        lbl.style.background=on?(lbl.dataset.bg||'transparent'):'transparent';
-      }});
-      if(tCh) initToday();
-      updatePeriodChart();
-    }}
-    var btnStyle='cursor:pointer;font-size:0.75rem;font-weight:700;padding:4px 10px;'
-      +'border-radius:20px;border:2px solid #cbd5e1;background:#fff;color:#1e293b;'
-      +'transition:background .15s';
-    var btnAll=document.createElement('button');
-    btnAll.type='button';btnAll.textContent='All';btnAll.style.cssText=btnStyle;
-    btnAll.addEventListener('click',function(){{setAll(true);}});
-    var btnNone=document.createElement('button');
-    btnNone.type='button';btnNone.textContent='None';btnNone.style.cssText=btnStyle;
-    btnNone.addEventListener('click',function(){{setAll(false);}});
-    fd.appendChild(btnAll);fd.appendChild(btnNone);
-    MK.forEach(function(k,i){{
-      var lbl=document.createElement('label');
-      lbl.dataset.bg=COLS[i]+'22';
-      lbl.style.cssText='display:flex;align-items:center;gap:4px;cursor:pointer;font-size:0.8rem;'
-        +'color:#1e293b;font-weight:600;user-select:none;padding:3px 10px 3px 6px;'
-        +'border-radius:20px;border:2px solid '+COLS[i]+';background:'+COLS[i]+'22;transition:background .15s';
-      var cb=document.createElement('input');
-      cb.type='checkbox';cb.checked=true;cb.dataset.m=k;
-      cb.style.cssText='cursor:pointer;accent-color:'+COLS[i]+';width:13px;height:13px;flex-shrink:0';
-      cb.addEventListener('change',function(){{
-        lbl.style.background=cb.checked?COLS[i]+'22':'transparent';
-        if(tCh) initToday();
-        updatePeriodChart();
-      }});
-      lbl.appendChild(cb);
-      var dot=document.createElement('span');
-      dot.style.cssText='width:9px;height:9px;border-radius:50%;background:'+COLS[i]+';display:inline-block;flex-shrink:0';
-      lbl.appendChild(dot);
-      lbl.appendChild(document.createTextNode('\u00a0'+SK[i]));
-      fd.appendChild(lbl);
-    }});
-  }})();
+def static_assets() -> dict:
+    """{"css", "js", "chart"} → назви файлів у STATIC_DIR ("chart" може бути None — CDN).
+    None — ресурси записати не вдалося, звіт іде з inline-стилями й кодом."""
+    if _static_names.get("chart"):
+        return _static_names
+    try:
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        manifest = _static_manifest()
+        before = json.dumps(manifest, sort_keys=True)
+        _static_names.update(css=_write_asset("report", "css", _REPORT_CSS.encode("utf-8")),
+                             js=_write_asset("report", "js", _REPORT_JS.encode("utf-8")),
+                             chart=_vendor_chartjs(manifest))
+        if json.dumps(manifest, sort_keys=True) != before:
+            _save_static_manifest(manifest)
+    except OSError as e:
+        log(f"✗ Static assets unavailable ({e}) — inline CSS/JS")
+        _static_names.clear()
+        return None
+    return _static_names
 
-  function getSelected(){{
-    var cbs=document.querySelectorAll('#machine-filter input[type=checkbox]');
-    var sel=[];cbs.forEach(function(cb){{if(cb.checked)sel.push(cb.dataset.m);}});
-    return sel;
-  }}
-  function ds(labels,getFn){{
-    var sel=getSelected();
-    return MK.filter(function(k){{return sel.indexOf(k)!==-1;}}).map(function(k){{
-      var i=MK.indexOf(k);
-      var data;
-      if(k==='SITE'){{
-        var selM=sel.filter(function(m){{return m!=='SITE';}});
-        data=labels.map(function(l,idx){{
-          if(!selM.length) return null;
-          var sum=selM.reduce(function(s,m){{var v=getFn(m,l,idx);return s+(v!=null?v:0);}},0);
-          return Math.round(sum/selM.length);
-        }});
-      }}else{{
-        data=labels.map(function(l,idx){{var v=getFn(k,l,idx);return v!=null?v:0;}});
-      }}
-      return {{label:SK[i],data:data,
-        borderColor:COLS[i],backgroundColor:COLS[i]+'22',tension:0.3,
-        pointRadius:5,pointHoverRadius:7,borderWidth:k==='SITE'?4:1.5,
-        borderDash:k==='SITE'?[8,4]:[],
-        fill:false,spanGaps:false}};
-    }});
-  }}
-  function yMax(datasets){{
-    var mx=100;
-    datasets.forEach(function(d){{d.data.forEach(function(v){{if(v!=null&&v>mx)mx=v;}});}});
-    return Math.ceil(mx/10)*10+10;
-  }}
-  function opts(datasets){{var ym=datasets?yMax(datasets):110;return{{clip:false,responsive:true,maintainAspectRatio:false,layout:{{padding:0}},
-    interaction:{{mode:'index',intersect:false}},
-    plugins:{{legend:{{display:false}},tooltip:{{callbacks:{{label:function(c){{return c.dataset.label+': '+(c.parsed.y!=null?c.parsed.y+'%':'—');}}}}}}  }},
-    scales:{{y:{{display:false,min:-5,max:ym,ticks:{{callback:function(v){{return v<0?'':v+'%';}}}},title:{{display:false}}}},x:{{display:false,offset:true,ticks:{{maxRotation:45}},grid:{{display:false}}}}}}}};}}
-  function optsToday(datasets){{
-    var o=opts(datasets);
-    var ym=datasets?yMax(datasets):110;
-    o.scales.y={{display:true,min:0,max:ym,ticks:{{callback:function(v){{return v+'%';}},stepSize:10}},grid:{{color:'rgba(100,116,139,0.15)'}}}};
-    o.scales.x={{display:true,offset:true,ticks:{{maxRotation:0,color:'#475569',font:{{size:11}}}},grid:{{display:false}}}};
-    o.layout={{padding:{{left:4,right:12,top:4,bottom:4}}}};
-    return o;
-  }}
-  function leg(id,ds2){{
-    var el=document.getElementById(id);if(!el)return;
-    el.innerHTML=ds2.map(function(d,i){{
-      var col=COLS[i]||d.borderColor||'#888';
-      return '<span class="leg-item"><span class="leg-dot" style="background:'+col+'"></span>'+d.label+'</span>';
-    }}).join('');
-  }}
+@lru_cache(maxsize=1)
+def _brotli():
+    """brotli, якщо встановлений (опційна залежність, як numpy), інакше None — лише .gz."""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
 
-  var _selDay=null;  // обрана дата (ISO); null = today
-  function initToday(targetDate){{
-    var _now=new Date();
-    var tod=localISO(_now);
-    var dayISO=targetDate||_selDay||tod;
-    _selDay=dayISO;
-    var isToday=(dayISO===tod);
-    var hd=HDATA[dayISO]||{{}};
-    // Carry-over з попереднього дня: bucket 23 (23→00) того дня = значення на межі опівночі.
-    // Та сама точка з'являється і як ОСТАННЯ "00:00" попереднього дня, і як ПЕРША "00:00" цього дня.
-    var _prevDt=new Date(dayISO+'T00:00:00');_prevDt.setDate(_prevDt.getDate()-1);
-    var prevISO=localISO(_prevDt);
-    var hdPrev=HDATA[prevISO]||{{}};
-    // Принцип: точка "HH:00" відображає ефективність попередньої години (H-1 … H).
-    // Для сьогодні — поточна (неповна) година _rh представлена окремою точкою REPORT_HM.
-    // Для минулих днів — всі години вважаються завершеними.
-    var _rh = isToday ? (REPORT_HM ? parseInt(REPORT_HM.split(':')[0],10) : _now.getHours()) : 24;
-    // Фіксований діапазон годин 0.._rh-1 (включно з 00→01 і 23→00 для минулих днів).
-    // Якщо в HDATA для якоїсь години немає запису — точка стає 0%, а не пропадає.
-    var hours=[]; for(var _hh=0; _hh<_rh; _hh++) hours.push(_hh);
-    // Перша точка "00:00" — carry-over з попереднього дня (bucket 23).
-    var labels=['00:00'].concat(hours.map(function(h){{var e=(h+1)%24;return (e<10?'0':'')+e+':00';}}));
-    if(isToday&&REPORT_HM) labels.push(REPORT_HM);
-    var d2=ds(labels,function(k,lbl,idx){{
-      // idx===0 — carry-over: bucket 23 попереднього дня.
-      if(idx===0) return (hdPrev[k]&&hdPrev[k]['23']!=null)?hdPrev[k]['23']:0;
-      var h;
-      if(isToday&&lbl===REPORT_HM){{ h=_rh; }}
-      else {{ h=parseInt(lbl,10)-1; if(h<0) h=23; }}
-      return (hd[k]&&hd[k][String(h)]!=null)?hd[k][String(h)]:0;
-    }});
-    if(tCh)tCh.destroy();
-    var ctx=document.getElementById('effChartToday');if(!ctx)return;
-    var _plugins=isToday?[reportLinePlugin]:[];
-    tCh=new Chart(ctx.getContext('2d'),{{type:'line',data:{{labels:labels,datasets:d2}},options:optsToday(d2),plugins:_plugins}});
-    requestAnimationFrame(function(){{tCh.resize();var sc=ctx.closest('.chart-scroll-outer');if(sc)sc.scrollLeft=sc.scrollWidth;}});
-    leg('legend-today',d2);
-    var tt=document.getElementById('today-chart-title');
-    if(tt){{
-      var dStr=dayISO.slice(8,10)+'.'+dayISO.slice(5,7)+'.'+dayISO.slice(0,4);
-      tt.textContent=(isToday?'Today':dStr)+' — Hourly Efficiency';
-    }}
-    var ttb=document.getElementById('today-table-wrap');
-    if(ttb){{
-      var sel=getSelected();
-      var selM=sel.filter(function(k){{return k!=='SITE';}});
-      var mAvgs={{}};
-      selM.forEach(function(k){{
-        if(isToday) mAvgs[k]=(TEFF&&TEFF[k]!=null)?TEFF[k]:0;
-        else        mAvgs[k]=(ALL[dayISO]&&ALL[dayISO][k]!=null)?ALL[dayISO][k]:0;
-      }});
-      var grandAvg=selM.length?Math.round(selM.reduce(function(s,k){{return s+mAvgs[k];}},0)/selM.length):0;
-      var dayStr=dayISO.slice(8,10)+'.'+dayISO.slice(5,7)+'.'+dayISO.slice(0,4);
-      var hdr=sel.map(function(k){{var si=MK.indexOf(k);return '<th>'+SK[si]+'</th>';}}).join('');
-      var cells=sel.map(function(k){{
-        var avg=k==='SITE'?grandAvg:(mAvgs[k]||0);
-        var col=avg>=75?'#22c55e':avg>=50?'#f59e0b':'#ef4444';
-        return '<td><b style="color:'+col+'">'+avg+'%</b></td>';
-      }}).join('');
-      ttb.innerHTML=
-        '<table class="stats-table"><thead><tr><th>Date</th>'+hdr+'</tr></thead>'+
-        '<tbody><tr><td><b>'+dayStr+'</b></td>'+cells+'</tr></tbody></table>';
-    }}
-  }}
+def _write_precompressed(path: str, data: bytes, best: bool = False) -> dict:
+    """path.gz і path.br поруч з path → {".gz": байти, ".br": байти}. best — максимальне стиснення
+    (для static/, що пишуться один раз); index.html перезаписується щопрогону — рівень нижчий."""
+    import gzip
+    out = {".gz": gzip.compress(data, 9 if best else 6, mtime=0)}
+    br = _brotli()
+    if br:
+        out[".br"] = br.compress(data, quality=11 if best else 9)
+    for ext, blob in out.items():
+        with open(path + ext + ".tmp", "wb") as f:
+            f.write(blob)
+        os.replace(path + ext + ".tmp", path + ext)
+    return {ext: len(blob) for ext, blob in out.items()}
+
+def save_report(html: str, label: str = "Report") -> None:
+    """OUTPUT_HTML + стиснуті копії (REPORT_PRECOMPRESS). Копії пишуться після index.html —
+    serve-api віддає .gz/.br, лише якщо вони не старші за нього."""
+    data = html.encode("utf-8")
+    with open(OUTPUT_HTML, "wb") as f:
+        f.write(data)
+    packed = {}
+    if REPORT_PRECOMPRESS:
+        try:
+            packed = _write_precompressed(OUTPUT_HTML, data)
+        except OSError as e:
+            log(f"✗ Pre-compressed report not written: {e}")
+    sizes = "".join(f", {ext[1:]} {n / 1024:.0f} KB" for ext, n in packed.items())
+    log(f"{label} saved: {OUTPUT_HTML} ({len(data) / 1024:.0f} KB{sizes})")
+
+def _report_budget(total: int, sizes: dict, gantt_days: int) -> bool:
+    """Лог розкладу index.html по блоках; True — понад REPORT_BUDGET_KB."""
+    parts = sorted(sizes.items(), key=lambda kv: -kv[1]) + [("other", total - sum(sizes.values()))]
+    line = ", ".join(f"{name} {n / 1024:.0f}" for name, n in parts)
+    budget = f" of {REPORT_BUDGET_KB}" if REPORT_BUDGET_KB else ""
+    cached = ""
+    if STATIC_ASSETS and _static_names:
+        cached = "; static (cached): " + ", ".join(
+            f"{kind} {os.path.getsize(os.path.join(STATIC_DIR, name)) / 1024:.0f} KB"
+            for kind, name in _static_names.items()
+            if name and os.path.exists(os.path.join(STATIC_DIR, name)))
+    log(f"  size: index.html {total / 1024:.0f}{budget} KB — {line} KB (gantt {gantt_days} days){cached}")
+    return bool(REPORT_BUDGET_KB) and total > REPORT_BUDGET_KB * 1024
+
+
+def generate_html(cycles, downtimes, period_from, period_to, timeline_data, conn, excel_targets, counter_markers=None,
+                  data_as_of=None):
+    """data_as_of — звіт зібраний зі знімка (WebAPI недоступний): показується банер з часом даних."""
+    generated  = datetime.now().strftime("%d.%m.%Y %H:%M")
+    _stale_banner = (
+        f'<div class="stale-banner">⚠ Connect Plan WebAPI unavailable — data as of '
+        f'{data_as_of.strftime("%d.%m.%Y %H:%M")}, refresh pending</div>'
+    ) if data_as_of else ""
+    period_str = f"{fmt_time(period_from)} – {fmt_time(period_to)}"
+    today_str  = datetime.now().strftime("%Y-%m-%d")
+    _gen_hm    = period_to.strftime("%H:%M") if period_to else datetime.now().strftime("%H:%M")
 
-  // Селектор днів над Today-графіком: вантажимо ISO-дати з HDATA за останні 7 днів.
-  function _initDaySelector(){{
-    var el=document.getElementById('today-day-selector');
-    if(!el) return;
-    el.innerHTML='';
-    var todISO=localISO(new Date());
-    // Показуємо останні 7 днів завжди (навіть якщо в HDATA нема даних для якогось дня —
-    // кнопка буде, чарт покаже порожньо).
-    var days=[];
-    for(var i=0;i<7;i++){{
-      var dt=new Date();dt.setDate(dt.getDate()-i);
-      days.push(localISO(dt));
-    }}
-    days.forEach(function(d){{
-      var btn=document.createElement('button');
-      btn.type='button';
-      var isTod=(d===todISO);
-      btn.textContent=isTod?'Today':(d.slice(8,10)+'.'+d.slice(5,7));
-      btn.dataset.date=d;
-      btn.style.cssText='cursor:pointer;font-size:0.75rem;font-weight:700;padding:4px 10px;'
-        +'border-radius:20px;border:2px solid #cbd5e1;background:#fff;color:#1e293b;transition:background .15s';
-      btn.addEventListener('click',function(){{
-        _selDay=btn.dataset.date;
-        Array.prototype.forEach.call(el.querySelectorAll('button'),function(b){{
-          var on=(b.dataset.date===_selDay);
-          b.style.background=on?'#3b82f6':'#fff';
-          b.style.color=on?'#fff':'#1e293b';
-          b.style.borderColor=on?'#3b82f6':'#cbd5e1';
-        }});
-        initToday(_selDay);
-      }});
-      el.appendChild(btn);
-    }});
-    // Вибираємо today за замовчуванням
-    var todBtn=el.querySelector('button[data-date="'+todISO+'"]');
-    if(todBtn){{
-      todBtn.style.background='#3b82f6';
-      todBtn.style.color='#fff';
-      todBtn.style.borderColor='#3b82f6';
-    }}
-  }}
-
-  function parseLblDate(lbl){{
-    var p=lbl.split('.');return new Date(Number(p[2]),Number(p[1])-1,Number(p[0]));
-  }}
-  function getISOWeek(d){{
-    var tmp=new Date(d.getFullYear(),d.getMonth(),d.getDate());
-    var dayNum=tmp.getDay()||7;tmp.setDate(tmp.getDate()+4-dayNum);
-    var y0=new Date(tmp.getFullYear(),0,1);
-    return Math.ceil((((tmp-y0)/86400000)+1)/7);
-  }}
-  var weekendPeriodPlugin={{
-    id:'weekendPeriod',
-    afterLayout(chart){{
-      var ca=chart.chartArea;
-      ca.left=0;ca.right=chart.width;ca.width=chart.width;
-      ca.top=0;ca.bottom=chart.height;ca.height=chart.height;
-      var xS=chart.scales.x;
-      if(xS){{xS.left=0;xS.right=chart.width;xS.width=chart.width;xS._startPixel=0;xS._endPixel=chart.width;xS._length=chart.width;}}
-      var yS=chart.scales.y;
-      if(yS){{yS.top=0;yS.bottom=chart.height;yS.height=chart.height;yS._startPixel=0;yS._endPixel=chart.height;yS._length=chart.height;}}
-    }},
-    beforeDraw(chart){{
-      var c=chart.chartArea,xScale=chart.scales.x;
-      if(!c) return;
-      var ctx2=chart.ctx;
-      ctx2.save();ctx2.fillStyle='#f8fafc';ctx2.fillRect(0,0,chart.width,chart.height);ctx2.restore();
-      // Horizontal percentage grid lines (10%…100%)
-      var yS2=chart.scales.y;
-      [0,10,20,30,40,50,60,70,80,90,100].forEach(function(pct){{
-        var yPx=yS2.getPixelForValue(pct);
-        ctx2.save();
-        ctx2.strokeStyle='rgba(100,116,139,0.18)';ctx2.lineWidth=1;ctx2.setLineDash([]);
-        ctx2.beginPath();ctx2.moveTo(0,yPx);ctx2.lineTo(chart.width,yPx);ctx2.stroke();
-        ctx2.fillStyle='rgba(100,116,139,0.5)';ctx2.font='9px sans-serif';ctx2.textAlign='left';
-        ctx2.fillText(pct+'%',3,yPx-2);
-        ctx2.restore();
-      }});
-      var labels=chart.data.labels,n=labels.length;if(n<2)return;
-      var step=xScale.getPixelForValue(1)-xScale.getPixelForValue(0);
-      // Weekend shading + SAT/SUN label + day separator lines + date labels
-      var dayStep=step>=28?1:Math.ceil(28/step);
-      labels.forEach(function(lbl,i){{
-        var dow=parseLblDate(lbl).getDay();
-        var cx=xScale.getPixelForValue(i);
-        if(dow===0||dow===6){{
-          ctx2.save();
-          ctx2.fillStyle='rgba(255,180,0,0.18)';
-          ctx2.fillRect(cx-step/2,0,step,chart.height);
-          ctx2.fillStyle='rgba(180,100,0,0.6)';
-          ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
-          ctx2.fillText(dow===6?'SAT':'SUN',cx,c.top+11);
-          ctx2.restore();
-        }}else if(i%dayStep===0){{
-          var dn=['SUN','MON','TUE','WED','THU','FRI','SAT'][dow];
-          ctx2.save();
-          ctx2.fillStyle='rgba(100,116,139,0.55)';
-          ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
-          ctx2.fillText(dn,cx,c.top+11);
-          ctx2.restore();
-        }}
-        // Day separator line at left edge of each column (between prev day and this day)
-        if(i>0){{
-          var sepX=cx-step/2;
-          ctx2.save();
-          ctx2.strokeStyle='#475569'; ctx2.lineWidth=1;
-          ctx2.setLineDash([]);
-          ctx2.beginPath();ctx2.moveTo(sepX,0);ctx2.lineTo(sepX,chart.height);ctx2.stroke();
-          ctx2.restore();
-        }}
-      }});
-    }},
-    afterDraw(chart){{
-      var xScale=chart.scales.x;
-      var labels=chart.data.labels;
-      if(!labels||labels.length<2)return;
-      var ctx2=chart.ctx;
-      var step=xScale.getPixelForValue(1)-xScale.getPixelForValue(0);
-      // Week number labels + dashed separators
-      var wg={{}};
-      labels.forEach(function(lbl,i){{
-        var wn=getISOWeek(parseLblDate(lbl));
-        if(!wg[wn])wg[wn]=[];wg[wn].push(i);
-      }});
-      var weeks=Object.entries(wg).sort(function(a,b){{return Number(a[0])-Number(b[0]);}});
-      weeks.forEach(function(entry,gi){{
-        var wn=entry[0],idxs=entry[1];
-        var avgX=idxs.reduce(function(s,i){{return s+xScale.getPixelForValue(i);}},0)/idxs.length;
-        ctx2.save();
-        ctx2.fillStyle='rgba(248,250,252,0.8)';
-        ctx2.fillRect(avgX-14,chart.height-12,28,12);
-        ctx2.fillStyle='rgba(80,80,180,0.85)';
-        ctx2.font='bold 10px sans-serif';ctx2.textAlign='center';
-        ctx2.fillText('W'+wn,avgX,chart.height-3);
-        if(gi>0){{
-          var prev=weeks[gi-1][1];
-          var sepX=(xScale.getPixelForValue(idxs[0])+xScale.getPixelForValue(prev[prev.length-1]))/2;
-          ctx2.strokeStyle='rgba(80,80,180,0.55)';ctx2.lineWidth=3;
-          ctx2.setLineDash([6,3]);ctx2.beginPath();
-          ctx2.moveTo(sepX,0);ctx2.lineTo(sepX,chart.height);ctx2.stroke();
-        }}
-        ctx2.restore();
-      }});
-    }}
-  }};
-  function euToISO(s){{var p=s.split('.');return p.length===3?p[2]+'-'+p[1]+'-'+p[0]:s;}}
-  function isoToEu(s){{return s.slice(8,10)+'.'+s.slice(5,7)+'.'+s.slice(0,4);}}
-  function updatePeriodChart(){{
-    var from=euToISO(document.getElementById('stat-from').value);
-    var to=euToISO(document.getElementById('stat-to').value);
-    // Generate ALL dates in range so both Period Trend and Batch Timeline
-    // have identical column counts — required for x-axis alignment
-    var dates=[];
-    {{var _c=new Date(from+'T00:00:00'),_e=new Date(to+'T00:00:00');
-      while(_c<=_e){{dates.push(localISO(_c));_c.setDate(_c.getDate()+1);}}}}
-    function fmtDate(s){{return s.slice(8,10)+'.'+s.slice(5,7)+'.'+s.slice(0,4);}}
-    // Принцип: точка з датою D відображає ефективність попереднього дня (інтервал D-1 00:00 … D 00:00).
-    function _prevDay(iso){{var dt=new Date(iso+'T00:00:00');dt.setDate(dt.getDate()-1);return localISO(dt);}}
-    var d2=ds(dates,function(k,d){{var pd=_prevDay(d);return ALL[pd]&&ALL[pd][k]!=null?ALL[pd][k]:0;}});
-    // Weekly average curve
-    (function(){{
-      var sel=getSelected();
-      var selM=sel.filter(function(k){{return k!=='SITE';}});
-      if(!selM.length)return;
-      // Group dates by ISO week (year+week key to handle year boundaries).
-      // Агрегація проводиться за повним тижнем (дані дня D), а лише ПОЗИЦІЯ точки
-      // зсувається на кінець тижня відповідно до принципу "кінець періоду".
-      var weekGroups={{}};
-      dates.forEach(function(d){{
-        var dt=new Date(d+'T00:00:00');
-        var wn=getISOWeek(dt);
-        var yr=dt.getFullYear();
-        if(wn>=52&&dt.getMonth()===0)yr--;
-        if(wn===1&&dt.getMonth()===11)yr++;
-        var wk=yr+'_'+wn;
-        if(!weekGroups[wk])weekGroups[wk]=[];
-        weekGroups[wk].push(d);
-      }});
-      // Per-week average: mean of daily averages (each day first averaged across machines)
-      var weekAvg={{}};
-      Object.keys(weekGroups).forEach(function(wk){{
-        var dayAvgs=[];
-        weekGroups[wk].forEach(function(d){{
-          var vals=selM.map(function(k){{return (ALL[d]&&ALL[d][k]!=null)?ALL[d][k]:0;}});
-          var dayAvg=vals.reduce(function(a,b){{return a+b;}},0)/vals.length;
-          // Include only days when machines actually worked (weekdays always, weekends only if dayAvg > 0)
-          var dow=new Date(d+'T00:00:00').getDay();
-          if((dow===0||dow===6)&&dayAvg===0) return;
-          dayAvgs.push(dayAvg);
-        }});
-        // Always divide by 5 (standard work week): weekday work is expected,
-        // weekend work adds bonus without inflating the denominator
-        weekAvg[wk]=Math.min(100,Math.round(dayAvgs.reduce(function(a,b){{return a+b;}},0)/5));
-      }});
-      // Принцип "кінець періоду": ставимо середньотижневу точку на останню дату групи
-      // (межа "кінець тижня" в шкалі labels).
-      var weekCenter={{}};
-      Object.keys(weekGroups).forEach(function(wk){{
-        var wdates=weekGroups[wk];
-        var end=wdates[wdates.length-1];
-        weekCenter[end]=weekAvg[wk];
-      }});
-      var weekData=dates.map(function(d){{
-        return (weekCenter[d]!=null)?weekCenter[d]:null;
-      }});
-      d2.push({{
-        label:'Week avg',data:weekData,
-        borderColor:'rgba(30,41,59,0.85)',backgroundColor:'rgba(30,41,59,0.06)',
-        tension:0.4,pointRadius:5,pointHoverRadius:7,
-        pointBackgroundColor:'rgba(30,41,59,0.85)',
-        borderWidth:2.5,borderDash:[6,3],
-        stepped:false,fill:false,spanGaps:true,order:10
-      }});
-    }})();
-    if(pCh)pCh.destroy();
-    var ctx=document.getElementById('effChartPeriod');if(!ctx)return;
-    var _wrap=ctx.closest('.chart-wrap');
-    var _minW=Math.max(600,dates.length*22);
-    if(_wrap){{_wrap.style.width='';_wrap.style.minWidth=_minW+'px';}}
-    pCh=new Chart(ctx.getContext('2d'),{{type:'line',plugins:[weekendPeriodPlugin],data:{{labels:dates.map(fmtDate),datasets:d2}},options:opts(d2)}});
-    requestAnimationFrame(function(){{
-      var _actualW=(_wrap&&_wrap.offsetWidth>0)?_wrap.offsetWidth:_minW;
-      if(_wrap)_wrap.style.width=_actualW+'px';
-      if(pCh)pCh.resize(_actualW,350);
-      if(window.updateBatchGantt)window.updateBatchGantt(from,to,_actualW);
-      // Auto-scroll both panels to end when content overflows
-      var _pSc=ctx.closest('.chart-scroll-outer');
-      var _gSc=document.getElementById('gantt-scroll-outer');
-      if(_pSc&&_pSc.scrollWidth>_pSc.clientWidth){{_pSc.scrollLeft=_pSc.scrollWidth;}}
-      if(_gSc&&_gSc.scrollWidth>_gSc.clientWidth){{_gSc.scrollLeft=_gSc.scrollWidth;}}
-    }});
-    leg('legend-period',d2);
-  }}
+    # ── Stats data ──────────────────────────────────────────────────────
+    # Повний список: ALL_MACHINES з конфігу + всі що є в БД + поточні дані
+    _all_known_machines = set(ALL_MACHINES) | set(cycles.keys()) | set(downtimes.keys())
+    try:
+        if conn:
+            for _r in conn.execute("SELECT DISTINCT machine FROM daily_summary").fetchall():
+                _all_known_machines.add(_canonical_machine(_r[0]))
+    except: pass
+    _n_known = len(_all_known_machines) if _all_known_machines else 1
 
-  window.initToday=initToday;
-  window.initDaySelector=_initDaySelector;
-  window.updatePeriodChart=updatePeriodChart;
-  window.setRange=function(n){{
-    var to=new Date(),from=new Date();from.setDate(to.getDate()-n+1);
-    document.getElementById('stat-from').value=isoToEu(localISO(from));
-    document.getElementById('stat-to').value=isoToEu(localISO(to));
-    updatePeriodChart();
-  }};
-  // Scroll-to-top
-  var stBtn=document.getElementById('scroll-top');
-  if(stBtn) window.addEventListener('scroll',function(){{stBtn.classList.toggle('visible',window.scrollY>400);}});
-}})();
+    # Годинні дані з БД за останні 7 днів (hourly_stats).
+    # save_to_db() перезаписує today, тому current-run теж включено.
+    # Закриті дні беруться з fragment_cache, з БД читаються лише решта (today).
+    _hourly_cutoff = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
+    _hourly_ver = _fragment_version("hourly", sorted(_all_known_machines), _registry_key())
+    _hourly_cached = load_fragments(conn, "hourly", _hourly_ver, _hourly_cutoff) if conn else {}
+    _hr_by_date = {}   # {date: {machine: {hour: {"r": run, "t": total}}}}
+    try:
+        if conn:
+            for _r in conn.execute(
+                "SELECT date,machine,hour,run_min,total_min FROM hourly_stats "
+                "WHERE date >= ? AND date NOT IN "
+                "(SELECT date FROM fragment_cache WHERE section='hourly' AND version=?) "
+                "ORDER BY date,machine,hour",
+                (_hourly_cutoff, _hourly_ver)
+            ).fetchall():
+                _d, _mraw, _h, _run, _tot = _r
+                _m = _canonical_machine(_mraw)
+                _hr_by_date.setdefault(_d, {}).setdefault(_m, {})[int(_h)] = {"r": _run or 0, "t": _tot or 0}
+    except Exception as _e:
+        log(f"hourly_stats load error: {_e}")
+
+    _hdata_all = {}
+    for _d2, _per_m in _hr_by_date.items():
+        _all_h = set()
+        for _m in _per_m: _all_h |= set(_per_m[_m].keys())
+        _day_hd = {}
+        for _mn in _all_known_machines:
+            _day_hd[_mn] = {}
+            _mdata = _per_m.get(_mn, {})
+            for _h in _all_h:
+                _hd = _mdata.get(_h, {"r": 0, "t": 0})
+                _day_hd[_mn][str(_h)] = round(_hd["r"]/_hd["t"]*100) if _hd["t"] else 0
+        _day_hd["SITE"] = {}
+        for _h in _all_h:
+            _active_tot = sum(_per_m[_m].get(_h,{}).get("t",0) for _m in _per_m if _per_m[_m].get(_h,{}).get("t",0)>0)
+            _n_active = sum(1 for _m in _per_m if _per_m[_m].get(_h,{}).get("t",0)>0)
+            _run2 = sum(_per_m[_m].get(_h,{}).get("r",0) for _m in _per_m)
+            _avg_t = (_active_tot / _n_active) if _n_active else 0
+            _site_denom = _avg_t * _n_known
+            _day_hd["SITE"][str(_h)] = min(100, round(_run2/_site_denom*100)) if _site_denom else 0
+        _hdata_all[_d2] = _day_hd
+    if conn:
+        store_fragments(conn, "hourly", _hourly_ver,
+                        {_d2: _v for _d2, _v in _hdata_all.items() if _d2 < today_str})
+    _hdata_all = dict(sorted({**_hourly_cached, **_hdata_all}.items()))
+    log(f"  hourly: {len(_hourly_cached)} days cached, {len(_hr_by_date)} recomputed")
+    _hourly_js = json.dumps(_hdata_all)
+    # Ефективність за робочі години (filtered) для плашки під графіком
+    _today_eff = {}
+    for _mn in _all_known_machines:
+        _dd = downtimes.get(_mn, {})
+        _r = _dd.get("total_run", 0)
+        _t = _dd.get("total_min", 0)
+        _today_eff[_mn] = round(_r / _t * 100) if _t else 0
+    _today_eff_js = json.dumps(_today_eff)
+    # Денні дані з DB
+    _all_daily = {}; _mk_set = set(_all_known_machines)
+    _daily_ver = _fragment_version("daily", sorted(_mk_set), _registry_key(), _calendar_key())
+    _daily_cached = load_fragments(conn, "daily", _daily_ver) if conn else {}
+    try:
+        if conn:
+            for _r in conn.execute(
+                "SELECT date,machine,run_min,down_min,total_min,efficiency FROM daily_summary "
+                "WHERE date NOT IN (SELECT date FROM fragment_cache WHERE section='daily' AND version=?) "
+                "ORDER BY date",
+                (_daily_ver,)
+            ).fetchall():
+                _d2, _m2_raw, _ru, _dm, _tm, _ef = _r
+                _m2 = _canonical_machine(_m2_raw)
+                if _d2 not in _all_daily: _all_daily[_d2] = {}
+                if _tm or _ru:
+                    if _ef and _ef > 0:
+                        _all_daily[_d2][_m2] = round(_ef)
+                    elif _ru and _ru > 0:
+                        # Вихідні або зламані дані — перерахувати з run/(run+down)
+                        _denom = (_ru or 0) + (_dm or 0)
+                        _all_daily[_d2][_m2] = round(_ru / _denom * 100) if _denom > 0 else 0
+                    else:
+                        _all_daily[_d2][_m2] = 0
+                    _all_daily[_d2].setdefault("__s__",{"r":0})
+                    _all_daily[_d2]["__s__"]["r"] += _ru or 0
+                _mk_set.add(_m2)
+    except: pass
+    _n_machines = len(_mk_set)
+    for _d2 in _all_daily:
+        for _m2 in _mk_set:
+            if _m2 not in _all_daily[_d2]:
+                _all_daily[_d2][_m2] = 0
+        _sd = _all_daily[_d2].pop("__s__",{})
+        _ww = _work_window_min(_d2)
+        if _ww > 0:
+            _site_t = _ww * _n_machines
+            _all_daily[_d2]["SITE"] = min(100, round(_sd.get("r",0) / _site_t * 100))
+        else:
+            # сб/нд: тільки активні станки (робота у вихідні — бонус)
+            _active_eff = [v for k,v in _all_daily[_d2].items() if k != "SITE" and v is not None and v > 0]
+            _all_daily[_d2]["SITE"] = round(sum(_active_eff) / len(_active_eff)) if _active_eff else 0
+    if conn:
+        store_fragments(conn, "daily", _daily_ver,
+                        {_d2: _v for _d2, _v in _all_daily.items() if _d2 < today_str})
+    log(f"  daily: {len(_daily_cached)} days cached, {len(_all_daily)} recomputed")
+    _all_daily = dict(sorted({**_daily_cached, **_all_daily}.items()))
+    _mk_list  = sorted(_mk_set) + ["SITE"]
+    _sk_list  = [_machine_short(_m) for _m in _mk_list[:-1]] + ["Avg"]
+    _palette  = ["#3b82f6","#22c55e","#f59e0b","#ef4444","#a855f7","#06b6d4","#f97316","#ec4899"]
+    _col_list = [_palette[_i % len(_palette)] for _i in range(len(_mk_list))]
+    _trend_js = json.dumps(period_trend(_all_daily, sorted(_mk_set), today_str), separators=(",", ":"))
+    _mk_js    = json.dumps([str(_m) for _m in _mk_list])
+    _sk_js    = json.dumps(_sk_list)
+    _col_js   = json.dumps(_col_list)
+    # Cycle events for Batch Gantt — останні GANTT_DAYS днів, колонкове кодування (_encode_gantt)
+    _gantt_cutoff = (datetime.now() - timedelta(days=GANTT_DAYS)).strftime("%Y-%m-%d")
+    _gantt_ver = _fragment_version("gantt", _registry_key())
+    _gantt_cached = load_fragments(conn, "gantt", _gantt_ver, _gantt_cutoff) if conn else {}
+    _crows = []
+    try:
+        if conn:
+            for _r in conn.execute(
+                "SELECT date,machine,program,start_time,end_time,duration "
+                "FROM cycle_events WHERE program NOT LIKE 'COUNTER%' AND date >= ? "
+                "AND date NOT IN (SELECT date FROM fragment_cache WHERE section='gantt' AND version=?) "
+                "ORDER BY date,machine,start_time",
+                (_gantt_cutoff, _gantt_ver)
+            ).fetchall():
+                _s = _r[3] if _r[3] and _r[3] != "—" else None
+                if not _s:
+                    continue  # skip records without valid start time (renders at 00:00)
+                _e = _r[4] if _r[4] and _r[4] != "—" else None
+                if not _e:
+                    # Ongoing cycle: use generation time for today, 23:59 for past days
+                    if _r[0] == today_str:
+                        _e = datetime.now().strftime("%H:%M")
+                    else:
+                        _e = "23:59"
+                # Ім'я програми без суфіксу .MIN: "WF330-903B.MIN" → "WF330-903B"
+                _prog = _r[2] or ""
+                if _prog.upper().endswith(".MIN"):
+                    _prog = _prog[:-4]
+                _crows.append((
+                    _r[0],
+                    _machine_short(_canonical_machine(_r[1])),
+                    _prog,
+                    int(_s[:2]) * 60 + int(_s[3:5]),
+                    int(_e[:2]) * 60 + int(_e[3:5]),
+                    _r[5] or 0,
+                ))
+    except Exception as _e:
+        log(f"  gantt SQL error: {_e}")
+    _crows_by_date = defaultdict(list)
+    for _cr in _crows:
+        _crows_by_date[_cr[0]].append(_cr)
+    if conn:
+        store_fragments(conn, "gantt", _gantt_ver,
+                        {_d2: _v for _d2, _v in _crows_by_date.items() if _d2 < today_str})
+    log(f"  gantt: {len(_gantt_cached)} days cached, {len(_crows_by_date)} recomputed")
+    for _d2, _v in _gantt_cached.items():
+        _crows_by_date[_d2] = [tuple(_cr) for _cr in _v]
+    _crows = [_cr for _d2 in sorted(_crows_by_date) for _cr in _crows_by_date[_d2]]
+    _cdata = _encode_gantt(_crows)
+    log(f"  gantt: {len(_crows)} records → {len(_cdata['dd'])} blocks (last {GANTT_DAYS} days)")
+    _cdata_js = json.dumps(_cdata, separators=(",", ":")).replace("</", "<\\/")
+    # Робочий календар для фону Batch Gantt: зміни в годинах, індекс — JS getDay() (0 = нд)
+    _work_week_js = json.dumps([[[a / 60, b / 60] for a, b in WORK_WEEKLY[(jd - 1) % 7]] for jd in range(7)])
+    _holidays_js  = json.dumps({d: 1 for d in sorted(WORK_HOLIDAYS)})
+    # ────────────────────────────────────────────────────────────────────
+
+    _tl_pack = {}   # canvas-режим: {uid: упаковані сегменти}, заповнює timeline_bar()
+
+    def timeline_bar(mname):
+        segs         = timeline_data.get(mname, [])
+        total_sec_tl = max((period_to - period_from).total_seconds(), 1)
+        total_min    = total_sec_tl / 60
+        VW, VH       = 10000, 44
+
+        def to_x(pct):
+            return round(pct / 100 * VW, 2)
+
+        short  = _machine_short(mname)
+        uid    = mname.replace(" ", "_").replace("-", "_")
+
+        if TIMELINE_MODE == "canvas":
+            # Без DOM-вузлів на сегмент: дані йдуть в TLPACK, малює _TL_CANVAS_JS
+            _tl_pack[uid] = _pack_timeline(
+                segs, (counter_markers or {}).get(mname, []), period_from, period_to, short)
+            return (
+                f'<div class="tl-outer-wrap" style="width:100%">'
+                f'<div class="tl-scroll-wrapper" data-machine="{short}" '
+                f'style="overflow-x:auto;overflow-y:hidden;width:100%;margin:0;padding:0">'
+                f'<div class="tl-track" style="width:100%;height:{VH + 26}px">'
+                f'<canvas class="tl-cv" data-uid="{uid}" '
+                f'style="position:sticky;left:0;display:block;height:{VH + 26}px;cursor:grab"></canvas>'
+                f'</div></div></div>')
+
+        # ── сегменти ──────────────────────────────────────────────────
+        rects = ""
+        for s in segs:
+            color  = "#22c55e" if s["state"] == "1" else "#ef4444"
+            seg_id = s["id"]
+            label  = s["label"].replace('"', "&quot;").replace("'", "&#39;")
+            tip    = f'{s["start"]}\u2013{s["end"]} | {label}'
+            x  = to_x(s["x"])
+            w  = max(to_x(s["w"]), 0.5)
+            rects += (
+                f'<rect class="tl-seg" data-id="{seg_id}" data-tip="{tip}" '
+                f'x="{x}" y="0" width="{w}" height="{VH}" fill="{color}" cursor="pointer"/>')
+
+
+
+        markers_svg = ""
+        if counter_markers:
+            for ct in counter_markers.get(mname, []):
+                ct_sec = (ct - period_from).total_seconds()
+                pct = ct_sec / total_sec_tl * 100
+                if 0 <= pct <= 100:
+                    cx = to_x(pct)
+                    markers_svg += (
+                        f'<line x1="{cx}" y1="0" x2="{cx}" y2="{VH}" '
+                        f'stroke="#a855f7" stroke-width="1" opacity="1" pointer-events="none"/>')
+
+        # ── тіки — JSON масив для JS ───────────────────────────────────
+        ticks_json = []
+        for i in range(0, int(total_min) + 1, 15):
+            pct  = round(i / total_min * 100, 4)
+            t    = (period_from + timedelta(minutes=i)).strftime("%H:%M")
+            is30 = (i % 30 == 0)
+            ticks_json.append({"p": pct, "t": t if is30 else "", "major": is30})
+
+        # SVG — тільки бари, початкова ширина 100%
+        svg = (
+            f'<svg class="tl-svg" id="svg_{uid}" data-machine="{short}" '
+            f'viewBox="0 0 {VW} {VH}" preserveAspectRatio="none" '
+            f'style="width:100%;height:{VH}px;display:block;background:#f1f5f9">'
+            f'{rects}{markers_svg}'
+            f'</svg>')
+
+        # Canvas — тіки, завжди 100% ширини зовнішнього контейнера (не scroll-wrapper)
+        # Canvas всередині scroll-wrapper, ширина = SVG ширина при zoom
+        canvas = f'<canvas id="tc_{uid}" style="display:block;height:26px"></canvas>'
+
+        ticks_js = (
+            f'<script>(function(){{'
+            f'var ticks={json.dumps(ticks_json)};'
+            f'var cv=document.getElementById("tc_{uid}");'
+            f'var svg=document.getElementById("svg_{uid}");'
+            f'function drawTicks(w){{'
+            f'  var dpr=window.devicePixelRatio||1;'
+            f'  cv.style.width=w+"px";'
+            f'  cv.width=Math.round(w*dpr);cv.height=Math.round(26*dpr);'
+            f'  var ctx=cv.getContext("2d");ctx.scale(dpr,dpr);'
+            f'  ctx.clearRect(0,0,w,26);'
+            f'  ticks.forEach(function(tk){{'
+            f'    var x=tk.p/100*w;'
+            f'    ctx.beginPath();ctx.moveTo(x,0);ctx.lineTo(x,tk.major?7:4);'
+            f'    ctx.strokeStyle="#cbd5e1";ctx.lineWidth=tk.major?1.5:1;ctx.stroke();'
+            f'    if(tk.t){{'
+            f'      ctx.font="10px sans-serif";ctx.fillStyle="#64748b";'
+            f'      ctx.textAlign="center";ctx.fillText(tk.t,x,18);'
+            f'    }}'
+            f'  }});'
+            f'}}'
+            f'var outer=cv.closest(".tl-outer-wrap");'
+            f'if(outer){{outer._redrawTicks=drawTicks;outer._ticks=ticks;}}'
+            f'drawTicks(svg.offsetWidth||outer.offsetWidth||800);'
+            f'}})();</script>')
+
+        return (
+            f'<div class="tl-outer-wrap" style="width:100%">'
+            f'<div class="tl-scroll-wrapper" data-machine="{short}" '
+            f'style="overflow-x:auto;overflow-y:hidden;width:100%">'
+            f'{svg}'
+            f'{canvas}'
+            f'</div>'
+            f'{ticks_js}'
+            f'</div>')
+
+    def activity_section(c_list, d_list, mname):
+        """Об'єднана таблиця циклів та простоїв, відсортована за часом"""
+        segs = timeline_data.get(mname, [])
+        
+        # Функція пошуку ID для циклів
+        def find_cycle_ids(cycle):
+            c_start = cycle.get("start")
+            if not c_start:
+                return ""
+            c_end = cycle.get("end") or datetime.now()
+            ids = []
+            for s in segs:
+                if s["state"] != "1":
+                    continue
+                s_start = datetime.strptime(f"{c_start.strftime('%Y.%m.%d')} {s['start']}", "%Y.%m.%d %H:%M")
+                s_end   = datetime.strptime(f"{c_start.strftime('%Y.%m.%d')} {s['end']}", "%Y.%m.%d %H:%M")
+                # Округлюємо до хвилини (сегменти таймлайну %H:%M, підцикли до секунди)
+                c_end_m   = c_end.replace(second=0, microsecond=0)
+                c_start_m = c_start.replace(second=0, microsecond=0)
+                if s_start < c_end_m and s_end > c_start_m:
+                    ids.append(s["id"])
+            return " ".join(ids) if ids else ""
+        
+        # Функція пошуку ID для простоїв
+        def find_down_id(down):
+            for s in segs:
+                if s["state"] == "0" and s["start"] == down["start"].strftime("%H:%M"):
+                    return s["id"]
+                if s["state"] == "0" and s["start"] <= down["start"].strftime("%H:%M") <= s["end"]:
+                    return s["id"]
+            return ""
+        
+        # Об'єднуємо всі події
+        events = []
+
+        for c in c_list:
+            if c.get("program", "").upper().startswith("COUNTER"):
+                continue
+            cycle_start = c["start"] if c.get("start") else datetime.now()
+            events.append({
+                "type": "cycle",
+                "start": cycle_start,
+                "end": c.get("end"),
+                "duration": c["duration"],
+                "cycle_time": c.get("cycle_time"),
+                "program": c.get("program", "—"),
+                "ongoing": c.get("ongoing", False),
+                "ids": find_cycle_ids(c)
+            })
+
+        for d in d_list:
+            events.append({
+                "type": "downtime",
+                "start": d["start"],
+                "end": d.get("end"),
+                "duration": d["duration"],
+                "reason": d["reason"],
+                "ongoing": d.get("ongoing", False),
+                "ids": find_down_id(d)
+            })
+
+        events.sort(key=lambda e: e["start"])
+
+        if not events:
+            return '<p class="empty">No activity detected</p>'
+
+        # Групуємо: кожен зелений (цикл) + наступні червоні до наступного зеленого = один блок.
+        # Один блок = один цикл деталі: виконання програми + заміна деталі.
+        # Cycle = cycle_time зеленого рядка (start-to-start, вже розраховано).
+        blocks = []
+        i = 0
+        while i < len(events):
+            e = events[i]
+            if e["type"] == "cycle":
+                block_events = [e]
+                j = i + 1
+                while j < len(events) and events[j]["type"] != "cycle":
+                    block_events.append(events[j])
+                    j += 1
+                total_block_dur = round(sum(ev.get("duration", 0) for ev in block_events), 2)
+                blocks.append({"events": block_events, "cycle_time": total_block_dur})
+                i = j
+            else:
+                # Червоні події до першого зеленого — окремий блок без cycle
+                block_events = []
+                while i < len(events) and events[i]["type"] != "cycle":
+                    block_events.append(events[i])
+                    i += 1
+                if block_events:
+                    blocks.append({"events": block_events, "cycle_time": None})
+
+        # Рядки — компактний JSON, DOM будує віртуальний скролер (_ACTLOG_JS) лише для видимих:
+        #   0 — фіолетовий роздільник блоків;
+        #   [1 цикл / 2 простій, деталі, старт, кінець|null, тривалість, ongoing, ids, cycle]
+        #   cycle — [rowspan, хв|null] у першому рядку блоку, null в інших
+        rows = []
+        for bi, blk in enumerate(blocks):
+            blk_events = blk["events"]
+            if bi > 0:
+                rows.append(0)
+            for idx, e in enumerate(blk_events):
+                if e["type"] == "cycle":
+                    detail = e["program"] or "—"
+                    if detail.upper().endswith(".MIN"):
+                        detail = detail[:-4]
+                else:
+                    detail = e["reason"]
+                rows.append([1 if e["type"] == "cycle" else 2, detail, fmt_time(e["start"]),
+                             fmt_time(e["end"]) if e.get("end") else None, e["duration"],
+                             1 if e.get("ongoing") else 0, e["ids"],
+                             [len(blk_events), blk["cycle_time"]] if idx == 0 else None])
+
+        # Унікальний ID для цього блоку
+        scroll_id = f"activity-scroll-{mname.replace('_', '-')}"
+        rows_json = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+        return (
+            f'<div class="resizable-section" id="rs-{scroll_id}" style="height:350px">'
+            f'<div class="table-scroll-x" style="height:100%;overflow:hidden"><div class="scroll-table-wrap" style="height:100%">'
+            f'<table class="scroll-table"><thead><tr><th>Details</th><th></th><th>Start</th><th>End</th><th>Duration</th><th style="color:#7c3aed;border-left:1px solid #000;text-align:center;">Cycle</th></tr></thead></table>'
+            f'<div id="{scroll_id}" class="scroll-tbody-wrap act-log" style="height:calc(100% - 40px);overflow-y:auto">'
+            f'<div class="act-pad"></div><table class="scroll-table"><tbody></tbody></table><div class="act-pad"></div>'
+            f'</div></div></div></div>'
+            f'<script type="application/json" id="{scroll_id}-data">{rows_json}</script>'
+        )
+
+    def cycles_section(c_list, mname, excel_targets):
+        """Генерує Target Cycle Time з порівнянням з Excel"""
+        if not c_list:
+            return ""
 
-// ── Batch Gantt ──────────────────────────────────────────────────
-(function(){{
-  var RAW_ALL={_cdata_js};
-  // Розпаковуємо стислі поля: дата "260419"→"2026-04-19", час "0830"→"08:30",
-  // програма "330-903B" → "WF330-903B" (без суфіксу .MIN)
-  RAW_ALL.forEach(function(c){{
-    if(c.d&&c.d.length===6) c.d='20'+c.d.substr(0,2)+'-'+c.d.substr(2,2)+'-'+c.d.substr(4,2);
-    if(c.s&&c.s.length===4) c.s=c.s.substr(0,2)+':'+c.s.substr(2,2);
-    if(c.e&&c.e.length===4) c.e=c.e.substr(0,2)+':'+c.e.substr(2,2);
-    if(c.p) c.p='WF'+c.p;
-  }});
-  var progList=[],progColor={{}};
-  var PALETTE=['#3b82f6','#22c55e','#f59e0b','#0ea5e9','#a855f7','#06b6d4','#f97316','#65a30d','#84cc16','#14b8a6'];
-  RAW_ALL.forEach(function(c){{
-    if(progList.indexOf(c.p)===-1){{progList.push(c.p);progColor[c.p]=PALETTE[(progList.length-1)%PALETTE.length];}}
-  }});
+        # DEBUG: Логуємо скільки targets завантажено
+        log(f"cycles_section: machine={mname}, excel_targets count={len(excel_targets)}", "DEBUG")
+        
+        # Витягуємо коротку назву станку (M1, M2 тощо)
+        machine_short = _machine_short(mname)
+        machine_norm  = normalize_program_name(machine_short)
 
-  var ROW_H=32, PAD=4, LABEL_W=0, TICK_H=22;
-  var PX_PER_DAY=28;
-  var cv=document.getElementById('batchGantt');
-  var tip=document.getElementById('batch-tooltip');
-  var barMeta=[], gapMeta=[], CDATA=[], machines=[], dates=[];
+        # Нормалізуємо ключі excel_targets один раз
+        excel_norm = [
+            (normalize_program_name(p), op, normalize_program_name(m), t, m)
+            for (p, op, m), t in excel_targets.items()
+        ]
 
-  function buildFromRange(from, to, forcedW){{
-    // Filter RAW_ALL by date range
-    var raw=RAW_ALL.filter(function(c){{return (!from||c.d>=from)&&(!to||c.d<=to);}});
-    // Session-based grouping: merge consecutive cycles of the same program
-    // into one block if the gap between end of previous and start of next is ≤SESSION_GAP min.
-    // Cycles with gaps > SESSION_GAP become separate blocks (separate production runs).
-    var SESSION_GAP=60;
-    var sorted=raw.slice().sort(function(a,b){{
-      if(a.d!==b.d) return a.d<b.d?-1:1;
-      if(a.m!==b.m) return a.m<b.m?-1:1;
-      return (a.s||'')<(b.s||'')?-1:1;
-    }});
-    CDATA=[];
-    var sessMap={{}};
-    sorted.forEach(function(c){{
-      var key=c.m+'|'+c.d+'|'+c.p;
-      var sess=sessMap[key];
-      // Cross-midnight merge: if no session found for this date, check previous day
-      if(!sess&&c.s){{
-        var _pd=new Date(c.d+'T00:00:00');_pd.setDate(_pd.getDate()-1);
-        var _prevKey=c.m+'|'+localISO(_pd)+'|'+c.p;
-        var _prevSess=sessMap[_prevKey];
-        if(_prevSess){{
-          var _sh=parseInt(c.s.split(':')[0]),_sm=parseInt(c.s.split(':')[1]||0);
-          var _startMin=_sh*60+_sm;
-          if(!_prevSess.e){{
-            // Previous session was still ongoing at midnight (end_time="—") — this IS the cross-midnight case
-            if(_startMin<=SESSION_GAP){{sess=_prevSess;sessMap[key]=_prevSess;}}
-          }} else {{
-            var _eh=parseInt(_prevSess.e.split(':')[0]),_em=parseInt(_prevSess.e.split(':')[1]||0);
-            var _gap=_startMin+1440-(_eh*60+_em);
-            if(_gap<=SESSION_GAP){{sess=_prevSess;sessMap[key]=_prevSess;}}
-          }}
-        }}
-      }}
-      if(sess&&c.s){{
-        var canExtend=false;
-        if(!sess.e){{
-          // ongoing session — allow extending only if start is not too far ahead
-          var sh2=parseInt(c.s.split(':')[0]),sm2=parseInt(c.s.split(':')[1]||0);
-          var sh0=parseInt(sess.s.split(':')[0]),sm0=parseInt(sess.s.split(':')[1]||0);
-          canExtend=((sh2*60+sm2)-(sh0*60+sm0)<=SESSION_GAP*4);
-        }}
-        else{{
-          var eh2=parseInt(sess.e.split(':')[0]),em2=parseInt(sess.e.split(':')[1]||0);
-          var sh2=parseInt(c.s.split(':')[0]),sm2=parseInt(c.s.split(':')[1]||0);
-          var gap=(sh2*60+sm2)-(eh2*60+em2);
-          // allow small overlap (gap<0) as well as normal gap
-          canExtend=(gap<=SESSION_GAP);
-        }}
-        if(canExtend){{
-          if(c.e&&(!sess.e_d||c.d>sess.e_d||(c.d===sess.e_d&&c.e>sess.e))){{sess.e=c.e;sess.e_d=c.d;}}
-          sess.dur=(sess.dur||0)+(c.dur||0);
-          return;
-        }}
-      }}
-      var ns={{d:c.d,m:c.m,p:c.p,s:c.s,e:c.e,dur:c.dur||0,e_d:c.d}};
-      CDATA.push(ns);
-      sessMap[key]=ns;
-    }});
-    CDATA.sort(function(a,b){{return a.d<b.d?-1:a.d>b.d?1:0;}});
-    machines=[];
-    CDATA.forEach(function(c){{
-      if(machines.indexOf(c.m)===-1)machines.push(c.m);
-    }});
-    machines.sort();
-    // Generate ALL dates in range (not just dates with data) so columns
-    // match the Period Trend chart which shows every date in the range
-    dates=[];
-    if(from&&to){{
-      var cur=new Date(from+'T00:00:00');
-      var end=new Date(to+'T00:00:00');
-      while(cur<=end){{
-        dates.push(localISO(cur));
-        cur.setDate(cur.getDate()+1);
-      }}
-    }} else {{
-      var dateSet={{}};
-      CDATA.forEach(function(c){{dateSet[c.d]=1;}});
-      dates=Object.keys(dateSet).sort();
-    }}
-    // Compute PX_PER_DAY from Period Trend chart-wrap width (forcedW passed directly avoids offsetWidth timing issues)
-    if(dates.length){{
-      var _availW=forcedW||0;
-      if(!_availW){{var _chartEl=document.getElementById('effChartPeriod');var _cw=_chartEl?_chartEl.closest('.chart-wrap'):null;_availW=(_cw&&_cw.offsetWidth>0)?_cw.offsetWidth:0;}}
-      if(!_availW)_availW=Math.max(600,dates.length*22+60);
-      PX_PER_DAY=_availW/Math.max(dates.length,1);
-    }}
-  }}
+        # Групуємо цикли по програмах (COUNTER.MIN не показуємо)
+        by_prog = defaultdict(list)
+        for c in c_list:
+            prog_name = c["program"] or "—"
+            if prog_name.upper().startswith("COUNTER"):
+                continue
+            by_prog[prog_name].append(c)
+
+        # Для кожної програми використовуємо нову логіку вибірки
+        target_rows = []
+        for prog, current_cycles in by_prog.items():
+            # Визначаємо операцію
+            op_num = get_operation_number(prog)
+
+            # Calculated = повний час блоку (run + setup) = start-to-start між
+            # послідовними циклами тієї ж програми, без обмеження порогом.
+            # Це збігається з колонкою Cycle у Activity Log.
+            sorted_cc = sorted(current_cycles, key=lambda c: c["start"])
+            block_times = []
+            for idx_c, cc in enumerate(sorted_cc):
+                if idx_c + 1 < len(sorted_cc) and cc.get("start") and sorted_cc[idx_c + 1].get("start"):
+                    bt = round((sorted_cc[idx_c + 1]["start"] - cc["start"]).total_seconds() / 60, 2)
+                    if bt > 0:
+                        block_times.append(bt)
+                else:
+                    # Останній цикл — використовуємо cycle_time або duration
+                    ct = cc.get("cycle_time") or cc.get("duration", 0)
+                    if ct and ct > 0:
+                        block_times.append(ct)
+
+            if block_times:
+                calc_target = calculate_real_cycle_time(block_times)
+            else:
+                calc_target = None
+
+            if calc_target is None:
+                continue
+
+            info_text = f"{len(current_cycles)} cycles today"
+
+            # Шукаємо Excel Target з урахуванням станку та операції
+            excel_target = None
+            prog_normalized = normalize_program_name(prog)
+            found_for_other_machine = None
+
+            for ep_norm, eop, em_norm, time_val, em_orig in excel_norm:
+                if prog_normalized == ep_norm and op_num == eop:
+                    if machine_norm == em_norm:
+                        excel_target = time_val
+                        break
+                    else:
+                        found_for_other_machine = em_orig
+            
+            # Порівняння
+            if excel_target:
+                diff = round(calc_target - excel_target, 2)  # Округлення до сотих
+                diff_pct = round((diff / excel_target) * 100, 2) if excel_target else 0
+                sign = f'+{diff}' if diff > 0 else str(diff)
+                sign_pct = f'+{diff_pct}' if diff_pct > 0 else str(diff_pct)
+                if abs(diff_pct) <= 5:
+                    comparison = f'<span style="color:#22c55e">{sign} min ({sign_pct}%)</span>'
+                elif diff > 0:
+                    comparison = f'<span style="color:#ef4444">{sign} min ({sign_pct}%)</span>'
+                else:
+                    comparison = f'<span style="color:#3b82f6">{sign} min ({sign_pct}%)</span>'
+                excel_col = f'{excel_target} min'
+            else:
+                # Якщо не знайшли для цього станку, але є для іншого
+                if found_for_other_machine:
+                    comparison = '<span style="color:#f59e0b">Wrong machine</span>'
+                    excel_col = f'No norm for {machine_short}'
+                else:
+                    comparison = '<span style="color:#94a3b8">No data</span>'
+                    excel_col = '—'
+            
+            target_rows.append(
+                f'<tr><td><em>{prog[:-4] if prog.upper().endswith(".MIN") else prog}</em></td>'
+                f'<td><span class="badge" style="background:#3F51B5;color:white;padding:2px 8px;border-radius:2px">OP{op_num}</span></td>'
+                f'<td>{len(current_cycles)}</td>'
+                f'<td><strong>{calc_target} min</strong></td>'
+                f'<td>{excel_col}</td>'
+                f'<td>{comparison}</td>'
+                f'<td style="font-size:0.75rem;color:#64748b">{info_text}</td></tr>'
+            )
+
+        return (
+            f'<div class="section-title" style="border-top:2px dashed #e2e8f0">🎯 Target Cycle Time</div>'
+            f'<div class="table-scroll-x"><table><thead><tr><th>Program</th><th>OP</th><th>Total</th><th>Calculated</th><th>Target</th><th>Difference</th><th>Info</th></tr></thead>'
+            f'<tbody>{"".join(target_rows)}</tbody></table></div>'
+        )
+
+    _sizes = defaultdict(int)           # розклад index.html по блоках (байти UTF-8) — див. _report_budget
+
+    def _nbytes(text):
+        return len(text.encode("utf-8"))
+
+    def _card_body(mname, c_list, d_list, total_down):
+        """Timeline + Activity Log + Target Cycle Time; при LAZY_MACHINE_CARDS — у <template>,
+        який _LAZY_JS вставляє, коли картка наближається до видимої області."""
+        short = _machine_short(mname)
+        tl, act, cyc = timeline_bar(mname), activity_section(c_list, d_list, mname), \
+            cycles_section(c_list, mname, excel_targets)
+        _sizes["timeline"] += _nbytes(tl)
+        _sizes["activity"] += _nbytes(act)
+        _sizes["targets"] += _nbytes(cyc)
+        body = (
+            f'<div class="section-title">⏱ Timeline</div>'
+            f'<div style="padding:10px 20px 4px">{tl}</div>'
+            f'<div class="section-title">📋 Activity Log — {len(c_list)} cycles, {len(d_list)} downtimes ({total_down} min)</div>'
+            f'<div style="padding:0 0 4px">{act}</div>'
+            f'{cyc}')
+        if not LAZY_MACHINE_CARDS:
+            return body
+        # Орієнтовна висота тіла картки — щоб смуга прокрутки і якорі не стрибали при гідратації
+        n_progs = len({c.get("program") for c in c_list})
+        est = 150 + min(350, 44 + 33 * (len(c_list) + len(d_list))) + (60 + 37 * n_progs if c_list else 0)
+        return (f'<div class="machine-body" data-lazy="{short}" style="min-height:{est}px"></div>'
+                f'<template id="tpl-{short}">{body}</template>')
+
+    machines_html = ""
+    machine_names = sorted(cycles.keys())
+    nav_buttons = (
+        '<div style="border-top:1px solid #475569;margin:4px 0"></div>\n'
+    ) + "".join(
+        f'<a href="#machine-{_machine_short(mn)}" class="nav-btn">{_machine_short(mn)}</a>\n'
+        for mn in machine_names
+    )
+    for i, mname in enumerate(machine_names):
+        c_list     = cycles.get(mname, [])
+        d_data     = downtimes.get(mname, {})
+        d_list     = d_data.get("downtimes", [])
+        total_min  = d_data.get("total_min", 1)
+        total_run  = d_data.get("total_run", 0)
+        total_down = d_data.get("total_down", 0)
+        eff        = round(total_run / total_min * 100) if total_min else 0
+        short_name = _machine_short(mname)
+
+        sep = f'<div class="machine-sep">{short_name}</div>' if i > 0 else ''
+        machines_html += sep + f"""
+        <div class="machine-card" id="machine-{short_name}">
+          <div class="machine-header">
+            <div class="machine-title">
+              <span class="machine-id">{short_name}</span>
+              <span class="machine-full">{mname}</span>
+            </div>
+            <div class="eff-badge" style="background:{eff_color(eff)}">
+              Efficiency: {eff}%
+              <span class="eff-detail">({total_run} / {total_min} min)</span>
+            </div>
+          </div>
+          {_card_body(mname, c_list, d_list, total_down)}
+        </div>"""
+
+    # Дані прогону — один inline-скрипт; код сторінки (_REPORT_JS) читає їх з REPORT / TLPACK / LIVE
+    _data_js = ('var REPORT={"trend":' + _trend_js + ',"hourly":' + _hourly_js + ',"teff":' + _today_eff_js
+                + ',"mk":' + _mk_js + ',"sk":' + _sk_js + ',"cols":' + _col_js + ',"hm":' + json.dumps(_gen_hm)
+                + ',"gantt_gap":' + json.dumps(GANTT_SESSION_GAP_MIN) + ',"work_week":' + _work_week_js
+                + ',"holidays":' + _holidays_js + '};')
+    if TIMELINE_MODE == "canvas":
+        _tlpack_js = json.dumps(_tl_pack)
+        _sizes["timeline"] += _nbytes(_tlpack_js)
+        _data_js += "var TLPACK=" + _tlpack_js + ";"
+
+    if LIVE_API_URL and conn:
+        try:
+            _live_seq = conn.execute("SELECT COALESCE(MAX(seq),0) FROM live_events").fetchone()[0]
+        except Exception as _e:
+            log(f"live_events read error: {_e}")
+            _live_seq = None
+        if _live_seq is not None:
+            _live_cfg = {"url": LIVE_API_URL + "/api/live", "seq": _live_seq,
+                         "date": period_to.strftime("%Y-%m-%d"),
+                         "t0": period_from.hour * 3600 + period_from.minute * 60 + period_from.second,
+                         "span": int(max((period_to - period_from).total_seconds(), 1))}
+            _data_js += "var LIVE=" + json.dumps(_live_cfg) + ";"
+    _data_js = "<script>" + _data_js.replace("</", "<\\/") + "</script>"
+
+    _assets = static_assets() if STATIC_ASSETS else None
+    if _assets:
+        _chart_src = f'static/{_assets["chart"]}' if _assets["chart"] else CHARTJS_URL
+        _css_tag = f'<link rel="stylesheet" href="static/{_assets["css"]}">'
+        _app_tag = f'<script defer src="static/{_assets["js"]}"></script>'
+    else:
+        _chart_src = CHARTJS_URL
+        _css_tag = "<style>" + _REPORT_CSS + "</style>"
+        _app_tag = "<script>" + _REPORT_JS + "</script>"
+
+    def _page():
+        return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<title>Machine Report — {generated}</title>
+<script>if(/[?&]tti=/.test(location.search)&&window.PerformanceObserver){{window.__lt=[];try{{new PerformanceObserver(function(l){{window.__lt.push.apply(window.__lt,l.getEntries());}}).observe({{entryTypes:['longtask']}});}}catch(e){{}}}}</script>
+<script defer src="{_chart_src}"></script>
+{_css_tag}
+</head>
+<body>
+<div class="header">
+  <h1>📊 Machine Report</h1>
+  <div class="meta">
+    Period: <span id="report-period">{period_str}</span><br>
+    Generated: {generated}
+  </div>
+</div>
+{_stale_banner}
+<div class="container">
+  <div class="block-header">📊 Statistics</div>
+  <div id="machine-filter" style="display:flex;flex-wrap:wrap;gap:6px;padding:6px 0 8px"></div>
+  <div class="two-charts">
+    <div class="chart-panel">
+      <h3 class="chart-title" id="today-chart-title">Today — Hourly Efficiency</h3>
+      <div id="today-day-selector" style="display:flex;gap:6px;flex-wrap:wrap;padding:4px 0 10px"></div>
+      <div class="chart-scroll-outer"><div class="chart-wrap"><canvas id="effChartToday"></canvas></div></div>
+      <div id="today-table-wrap"></div>
+    </div>
+    <div class="chart-panel">
+      <h3 class="chart-title">Period Trend</h3>
+      <div class="stats-controls">
+        <label>From: <input type="text" id="stat-from" placeholder="dd.mm.yyyy" value="{(datetime.now()-timedelta(days=6)).strftime('%d.%m.%Y')}" style="width:90px"></label>
+        <label>To: <input type="text" id="stat-to" placeholder="dd.mm.yyyy" value="{datetime.now().strftime('%d.%m.%Y')}" style="width:90px"></label>
+        <button onclick="updatePeriodChart()">Apply</button>
+        <button onclick="setRange(7)">7d</button>
+        <button onclick="setRange(30)">30d</button>
+        <button onclick="setRange(90)">90d</button>
+        <button onclick="setRange(180)">180d</button>
+        <button onclick="setRange(365)">1y</button>
+      </div>
+      <div class="chart-scroll-outer">
+        <div class="chart-wrap"><canvas id="effChartPeriod"></canvas></div>
+      </div>
+      <div style="margin-top:6px;font-size:0.75rem;font-weight:700;color:#475569;padding:4px 0 2px;text-transform:uppercase;letter-spacing:.05em">Batch Gantt</div>
+      <div id="gantt-scroll-outer" class="chart-scroll-outer">
+        <div class="chart-wrap"><canvas id="batchGantt" style="display:block"></canvas></div>
+      </div>
+    </div>
+  </div>
+  <div id="batch-tooltip" style="position:fixed;pointer-events:none;z-index:9999;background:#1e293b;color:white;padding:6px 10px;border-radius:6px;font-size:.78rem;box-shadow:0 4px 12px rgba(0,0,0,.3);display:none;max-width:240px;white-space:normal;line-height:1.4"></div>
+  <div class="block-header machines">🏭 Machines
+    <span style="margin-left:auto;font-weight:400;font-size:0.78rem;opacity:0.8">
+      <span class="dot" style="background:#4CAF50;border-radius:2px"></span> Running &nbsp;
+      <span class="dot" style="background:#F44336;border-radius:2px"></span> Downtime
+    </span>
+  </div>
+  {machines_html}
+</div>
+<div id="nav-overlay"></div>
+<button id="nav-toggle" title="Навігація">&#9776;</button>
+<div class="nav-sidebar" id="nav-sidebar">
+{nav_buttons}
+</div>
+<button id="scroll-top" onclick="window.scrollTo({{top:0,behavior:'smooth'}})" title="↑">↑</button>
+<div class="footer">Source: Connect Plan WebAPI ({", ".join(SITE_API_BASE.values())}) &nbsp;|&nbsp; DB: {DB_FILE}</div>
+<div id="tl-tooltip"></div>
+<script type="application/json" id="gantt-data">{_cdata_js}</script>
+{_data_js}
+{_app_tag}
+</body>
+</html>"""
+    _sizes.update(trend=_nbytes(_trend_js), hourly=_nbytes(_hourly_js), gantt=_nbytes(_cdata_js))
+    if not _assets:
+        _sizes["css/js"] = _nbytes(_REPORT_CSS) + _nbytes(_REPORT_JS)
+    html = _page()
+    # Понад бюджет — Batch Gantt за коротший період (решта сторінки від нього не залежить)
+    _days = GANTT_DAYS
+    while _report_budget(_nbytes(html), _sizes, _days):
+        _next = None if REPORT_BUDGET_MODE == "warn" else next((d for d in (180, 90, 30, 7) if d < _days), None)
+        if _next is None:
+            _msg = f"index.html {_nbytes(html) / 1024:.0f} KB is over REPORT_BUDGET_KB={REPORT_BUDGET_KB}"
+            if REPORT_BUDGET_MODE == "fail":
+                raise RuntimeError(f"{_msg} even with a {_days}-day Gantt")
+            log(f"✗ {_msg}")
+            break
+        _days = _next
+        _cut = (datetime.now() - timedelta(days=_days)).strftime("%Y-%m-%d")
+        _cdata_js = json.dumps(_encode_gantt([_cr for _cr in _crows if _cr[0] >= _cut]),
+                               separators=(",", ":")).replace("</", "<\\/")
+        _sizes["gantt"] = _nbytes(_cdata_js)
+        log(f"  gantt window reduced to {_days} days to fit REPORT_BUDGET_KB")
+        html = _page()
+    return html
+# ── Snapshot (stale-while-revalidate) ───────────────────────────────────────────
+_SNAPSHOT_FORMAT = 1
+
+def save_snapshot(state: dict) -> None:
+    """Зберігає останній проаналізований стан (cycles, downtimes, timeline, markers, period)."""
+    import pickle
+    try:
+        tmp = SNAPSHOT_FILE + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(dict(state, format=_SNAPSHOT_FORMAT), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, SNAPSHOT_FILE)
+    except Exception as e:
+        log(f"✗ Snapshot save error: {e}")
 
-  function drawGantt(forcedW){{
-    if(!dates.length){{ cv.style.width='0'; cv.style.height='0'; return; }}
-    var canvasW=forcedW||0;
-    if(!canvasW){{var _chartEl=document.getElementById('effChartPeriod');var _cw2=_chartEl?_chartEl.closest('.chart-wrap'):null;canvasW=(_cw2&&_cw2.offsetWidth>0)?_cw2.offsetWidth:0;}}
-    if(!canvasW)canvasW=Math.max(600,dates.length*22+60);
-    // Sync Gantt chart-wrap width to match Period Trend exactly
-    var _gcw=cv.closest('.chart-wrap');
-    if(_gcw){{_gcw.style.minWidth=canvasW+'px';_gcw.style.width=canvasW+'px';}}
-    var canvasH=350;
-    if(machines.length>0){{ROW_H=Math.max(14,Math.floor((canvasH-TICK_H-PAD*(machines.length+1))/machines.length));}}
-    var dpr=window.devicePixelRatio||1;
-    cv.style.width=canvasW+'px'; cv.style.height=canvasH+'px';
-    cv.width=Math.round(canvasW*dpr); cv.height=Math.round(canvasH*dpr);
-    var ctx=cv.getContext('2d'); ctx.scale(dpr,dpr);
-    barMeta=[];
 
-    ctx.fillStyle='#f8fafc'; ctx.fillRect(0,0,canvasW,canvasH);
+def load_snapshot():
+    import pickle
+    try:
+        with open(SNAPSHOT_FILE, "rb") as f:
+            state = pickle.load(f)
+        return state if state.get("format") == _SNAPSHOT_FORMAT else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log(f"✗ Snapshot load error: {e}")
+        return None
 
-    dates.forEach(function(d,i){{
-      var x=LABEL_W+i*PX_PER_DAY;
-      var dow=new Date(d+'T00:00:00').getDay();
-      if(dow===0||dow===6){{
-        ctx.fillStyle='rgba(255,180,0,0.18)';
-        ctx.fillRect(x,0,PX_PER_DAY,canvasH-TICK_H);
-        ctx.save();ctx.fillStyle='rgba(180,100,0,0.6)';ctx.font='bold 10px sans-serif';ctx.textAlign='center';
-        ctx.fillText(dow===6?'SAT':'SUN',x+PX_PER_DAY/2,11);ctx.restore();
-      }} else {{
-        // Non-working hours: dark gray fill
-        // Mon(1): dark 0-7h, 19-24h
-        // Tue(2): dark 0-6.5h (Mon ends 19:00, no carry-over)
-        // Wed(3): dark 0.5-6.5h (Tue ends 00:30 Wed, so 00:00-00:30 is working)
-        // Thu(4): dark 0.5-6.5h (Wed ends 00:30 Thu)
-        // Fri(5): dark 0.5-7h, 19-24h (Thu ends 00:30 Fri)
-        ctx.fillStyle='rgba(71,85,105,0.45)';
-        if(dow===1){{
-          ctx.fillRect(x,0,Math.round(7/24*PX_PER_DAY),canvasH-TICK_H);
-          ctx.fillRect(x+Math.round(19/24*PX_PER_DAY),0,PX_PER_DAY-Math.round(19/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else if(dow===5){{
-          ctx.fillRect(x+Math.round(0.5/24*PX_PER_DAY),0,Math.round(7/24*PX_PER_DAY)-Math.round(0.5/24*PX_PER_DAY),canvasH-TICK_H);
-          ctx.fillRect(x+Math.round(19/24*PX_PER_DAY),0,PX_PER_DAY-Math.round(19/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else if(dow===2){{
-          ctx.fillRect(x,0,Math.round(6.5/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else {{
-          // Wed(3), Thu(4): 00:30-06:30 is non-working; 00:00-00:30 is working carry-over
-          ctx.fillRect(x+Math.round(0.5/24*PX_PER_DAY),0,Math.round(6.5/24*PX_PER_DAY)-Math.round(0.5/24*PX_PER_DAY),canvasH-TICK_H);
-        }}
-        // Working hours: white background (program bars will cover it)
-        ctx.fillStyle='rgba(255,255,255,1)';
-        if(dow===1){{
-          ctx.fillRect(x+Math.round(7/24*PX_PER_DAY),0,Math.round(19/24*PX_PER_DAY)-Math.round(7/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else if(dow===5){{
-          ctx.fillRect(x,0,Math.round(0.5/24*PX_PER_DAY),canvasH-TICK_H);
-          ctx.fillRect(x+Math.round(7/24*PX_PER_DAY),0,Math.round(19/24*PX_PER_DAY)-Math.round(7/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else if(dow===2){{
-          ctx.fillRect(x+Math.round(6.5/24*PX_PER_DAY),0,PX_PER_DAY-Math.round(6.5/24*PX_PER_DAY),canvasH-TICK_H);
-        }} else {{
-          // Wed(3), Thu(4): 00:00-00:30 working + 06:30-24:00 working
-          ctx.fillRect(x,0,Math.round(0.5/24*PX_PER_DAY),canvasH-TICK_H);
-          ctx.fillRect(x+Math.round(6.5/24*PX_PER_DAY),0,PX_PER_DAY-Math.round(6.5/24*PX_PER_DAY),canvasH-TICK_H);
-        }}
-      }}
-      ctx.strokeStyle='#475569'; ctx.lineWidth=1; ctx.setLineDash([]);
-      ctx.beginPath(); ctx.moveTo(x+0.5,0); ctx.lineTo(x+0.5,canvasH-TICK_H); ctx.stroke();
-      var step=PX_PER_DAY>=28?1:Math.ceil(28/PX_PER_DAY);
-      if(i%step===0){{
-        ctx.fillStyle='#64748b'; ctx.font='10px sans-serif'; ctx.textAlign='center';
-        ctx.fillText(d.slice(8)+'.'+d.slice(5,7), x+PX_PER_DAY/2, canvasH-6);
-      }}
-    }});
 
-    // ── Machine separator lines ─────────────────────────────────────
-    machines.forEach(function(m,ri){{
-      var y=PAD+ri*(ROW_H+PAD);
-      ctx.strokeStyle='#475569'; ctx.lineWidth=1; ctx.setLineDash([]);
-      ctx.beginPath(); ctx.moveTo(0,y+ROW_H+PAD/2); ctx.lineTo(canvasW,y+ROW_H+PAD/2); ctx.stroke();
-    }});
+def publish_snapshot(snap: dict) -> None:
+    """Звіт зі знімка з банером "data as of" — поки WebAPI не відповідає. Без Telegram."""
+    import traceback as _tb
+    try:
+        conn = init_db()
+        excel_targets = load_target_times()
+        html = generate_html(snap["cycles"], snap["downtimes"], snap["period_from"], snap["period_to"],
+                             snap["timeline_data"], conn, excel_targets, snap["counter_markers"],
+                             data_as_of=snap["period_to"])
+        conn.close()
+        save_report(html, "Stale report")
+        publish_to_github(html)
+    except Exception as e:
+        log(f"✗ Snapshot report error: {e}")
+        log(_tb.format_exc())
 
-    // ── Collect gap metadata (idle between programs, same machine+day) ─
-    var byMD={{}};
-    CDATA.forEach(function(c){{
-      var k=c.m+'|'+c.d;
-      if(!byMD[k])byMD[k]=[];
-      byMD[k].push(c);
-    }});
-    gapMeta=[];
-    Object.keys(byMD).forEach(function(k){{
-      var items=byMD[k].slice().sort(function(a,b){{return (a.s||'')<(b.s||'')?-1:1;}});
-      var parts=k.split('|'), m=parts[0], d=parts[1];
-      var ri=machines.indexOf(m), di=dates.indexOf(d);
-      if(ri===-1||di===-1) return;
-      var x=LABEL_W+di*PX_PER_DAY;
-      var y=PAD+ri*(ROW_H+PAD);
-      for(var i=0;i<items.length-1;i++){{
-        var cur=items[i],nxt=items[i+1];
-        if(!cur.e||!nxt.s) continue;
-        var ceh=parseInt(cur.e.split(':')[0]),cem=parseInt(cur.e.split(':')[1]||0);
-        var nsh=parseInt(nxt.s.split(':')[0]),nsm=parseInt(nxt.s.split(':')[1]||0);
-        var gapMin=(nsh*60+nsm)-(ceh*60+cem);
-        if(gapMin<15) continue;
-        var gx=x+Math.round((ceh*60+cem)/1440*PX_PER_DAY);
-        var gex=x+Math.round((nsh*60+nsm)/1440*PX_PER_DAY);
-        var gw=Math.max(gex-gx,2);
-        gapMeta.push({{x:gx,y:y+3,w:gw,h:ROW_H-6,gapMin:gapMin,m:m,d:d,s:cur.e,e:nxt.s}});
-      }}
-    }});
+# ── Live updates ──────────────────────────────────────────────────────────────
+# Дельта прогону відносно попереднього знімка → live_events (seq, payload JSON).
+# serve-api віддає її на /api/live як SSE, _LIVE_JS на сторінці застосовує на місці:
+#   segs  — сегменти таймлайну з індексу from ([сек від period_from, сек, стан, мітка, id]),
+#           старіші сторінка вже має; мітки COUNTER — mk
+#   events — закриті з минулого прогону цикли/простої + поточні ongoing (Activity Log)
+#   eff/run/total — плашка ефективності; hourly/teff — HDATA/TEFF для initToday()
+# Нова доба (інший period_from) — {"type": "reload"}: сторінка перезавантажується.
+def _live_segs(segs, period_from, period_to) -> list:
+    total_sec = max((period_to - period_from).total_seconds(), 1)
+    out = []
+    for s in segs:
+        sec0 = round(s["x"] / 100 * total_sec)
+        out.append([sec0, max(round((s["x"] + s["w"]) / 100 * total_sec), sec0),
+                    1 if s["state"] == "1" else 0, s["label"], s["id"]])
+    return out
+
+
+def _live_events(mname, cur, prev, segs, period_from) -> list:
+    """Нові закриті + поточні ongoing цикли/простої станку для Activity Log."""
+    def sec(dt):
+        return (dt - period_from).total_seconds()
+
+    seen_c = {c["start"] for c in prev["cycles"].get(mname, []) if not c.get("ongoing")}
+    seen_d = {d["start"] for d in prev["downtimes"].get(mname, {}).get("downtimes", []) if not d.get("ongoing")}
+    events = []
+    for c in cur["cycles"].get(mname, []):
+        if not c.get("start") or c["start"] in seen_c or (c.get("program") or "").upper().startswith("COUNTER"):
+            continue
+        prog = c.get("program") or "—"
+        s0, s1 = sec(c["start"]), sec(c.get("end") or cur["period_to"])
+        events.append({"type": "cycle", "detail": prog[:-4] if prog.upper().endswith(".MIN") else prog,
+                       "start": fmt_time(c["start"]), "end": fmt_time(c["end"]) if c.get("end") else None,
+                       "dur": c["duration"], "cycle": c.get("cycle_time"), "ongoing": bool(c.get("ongoing")),
+                       "ids": " ".join(s[4] for s in segs if s[2] and s[0] < s1 and s[1] > s0),
+                       "_t": c["start"]})
+    for d in cur["downtimes"].get(mname, {}).get("downtimes", []):
+        if d["start"] in seen_d:
+            continue
+        s0 = sec(d["start"])
+        events.append({"type": "downtime", "detail": d["reason"],
+                       "start": fmt_time(d["start"]), "end": fmt_time(d["end"]) if d.get("end") else None,
+                       "dur": d["duration"], "cycle": None, "ongoing": bool(d.get("ongoing")),
+                       "ids": next((s[4] for s in segs if not s[2] and s[0] <= s0 <= s[1]), ""),
+                       "_t": d["start"]})
+    events.sort(key=lambda e: e.pop("_t"))
+    return events
+
+
+def live_delta(prev, cur, hourly=None):
+    """Дельта між двома знімками (dict як у save_snapshot) або None, якщо порівнювати нема з чим."""
+    if not prev:
+        return None
+    date_str = cur["period_to"].strftime("%Y-%m-%d")
+    if prev["period_from"] != cur["period_from"]:
+        return {"type": "reload", "date": date_str}
+    period_from, period_to = cur["period_from"], cur["period_to"]
+    machines, teff = {}, {}
+    for mname in sorted(cur["cycles"]):
+        segs = _live_segs(cur["timeline_data"].get(mname, []), period_from, period_to)
+        old  = _live_segs(prev["timeline_data"].get(mname, []), prev["period_from"], prev["period_to"])
+        i = 0
+        while i < min(len(segs), len(old)) and segs[i] == old[i]:
+            i += 1
+        old_mk = set(prev["counter_markers"].get(mname, []))
+        mk = [int((ct - period_from).total_seconds()) for ct in cur["counter_markers"].get(mname, [])
+              if ct not in old_mk and period_from <= ct <= period_to]
+        dd = cur["downtimes"].get(mname, {})
+        total_run, total_min = dd.get("total_run", 0), dd.get("total_min", 0)
+        eff = round(total_run / total_min * 100) if total_min else 0
+        teff[mname] = eff
+        machines[mname] = {"short": _machine_short(mname), "uid": mname.replace(" ", "_").replace("-", "_"),
+                           "from": i, "segs": segs[i:], "mk": mk,
+                           "events": _live_events(mname, cur, prev, segs, period_from),
+                           "eff": eff, "run": total_run, "total": total_min}
+    return {"type": "delta", "date": date_str,
+            "t0": period_from.hour * 3600 + period_from.minute * 60 + period_from.second,
+            "span": int(max((period_to - period_from).total_seconds(), 1)),
+            "hm": period_to.strftime("%H:%M"), "machines": machines,
+            "hourly": hourly or {}, "teff": teff}
+
+
+def record_live_delta(conn, prev, cur) -> None:
+    """Пише дельту прогону в live_events (після save_to_db — hourly береться з hourly_stats)."""
+    try:
+        date_str = cur["period_to"].strftime("%Y-%m-%d")
+        hourly = {}
+        for m, h, run, tot in conn.execute(
+                "SELECT machine,hour,run_min,total_min FROM hourly_stats WHERE date=?", (date_str,)):
+            hourly.setdefault(_canonical_machine(m), {})[str(h)] = round(run / tot * 100) if tot else 0
+        delta = live_delta(prev, cur, hourly)
+        if delta is None:
+            return
+        payload = json.dumps(delta, ensure_ascii=False, separators=(",", ":"), default=str)
+        cur_seq = conn.execute("INSERT INTO live_events (ts,date,payload) VALUES (?,?,?)",
+                               (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), date_str, payload)).lastrowid
+        conn.execute("DELETE FROM live_events WHERE seq<=?", (cur_seq - LIVE_EVENTS_KEEP,))
+        conn.commit()
+        log(f"Live delta #{cur_seq}: {delta['type']}, {len(payload) / 1024:.1f} KB")
+    except Exception as e:
+        log(f"✗ Live delta error: {e}")
 
-    // ── Program bars (multi-day aware) ────────────────────────────────
-    CDATA.forEach(function(c){{
-      var ri=machines.indexOf(c.m); if(ri===-1) return;
-      var startDi=dates.indexOf(c.d); if(startDi===-1) return;
-      if(!c.s) return;
-      var sh=parseInt(c.s.split(':')[0]),sm=parseInt(c.s.split(':')[1]||0);
-      var eh=c.e?parseInt(c.e.split(':')[0]):sh, em=c.e?parseInt(c.e.split(':')[1]||0):sm;
-      var endDi=c.e_d?dates.indexOf(c.e_d):startDi;
-      if(endDi===-1) endDi=startDi;
-      var y=PAD+ri*(ROW_H+PAD);
-      for(var dayIdx=startDi;dayIdx<=Math.min(endDi,dates.length-1);dayIdx++){{
-        var x_d=LABEL_W+dayIdx*PX_PER_DAY;
-        var segS=(dayIdx===startDi)?sh*60+sm:0;
-        var segE=(dayIdx===endDi)?eh*60+em:1440;
-        if(segS>=segE) continue;
-        var bx=x_d+Math.round(segS/1440*PX_PER_DAY);
-        var ex2=x_d+Math.round(segE/1440*PX_PER_DAY);
-        var bw=Math.max(ex2-bx,4);
-        ctx.fillStyle=progColor[c.p]||'#94a3b8';
-        ctx.beginPath(); ctx.roundRect(bx,y+3,bw,ROW_H-6,3); ctx.fill();
-        if(bw>36){{
-          ctx.fillStyle='rgba(255,255,255,0.92)';
-          ctx.font='bold 9px sans-serif'; ctx.textAlign='left';
-          ctx.save(); ctx.beginPath(); ctx.rect(bx+2,y+3,bw-4,ROW_H-6); ctx.clip();
-          ctx.fillText(c.p,bx+5,y+ROW_H/2+3);
-          ctx.restore();
-        }}
-        barMeta.push({{x:bx,y:y+3,w:bw,h:ROW_H-6,c:c}});
-      }}
-    }});
 
-    // Save clean canvas (without machine names) for sticky redraw on scroll
-    _ganttClean=ctx.getImageData(0,0,cv.width,cv.height);
-    _drawMachineNames();
-  }}
+def live_since(conn, since: int, limit: int = 100) -> tuple:
+    """(дельти з seq > since, чи є розрив — старіші за since+1 уже видалені)."""
+    rows = conn.execute("SELECT seq,payload FROM live_events WHERE seq>? ORDER BY seq LIMIT ?",
+                        (since, limit)).fetchall()
+    return rows, bool(since and rows and rows[0][0] > since + 1)
 
-  // ── Sticky machine labels (redrawn on scroll) ─────────────────────
-  var _ganttClean=null;
-  function _drawMachineNames(){{
-    if(!_ganttClean||!machines.length)return;
-    var _ctx=cv.getContext('2d');
-    _ctx.putImageData(_ganttClean,0,0);
-    var _gSc2=document.getElementById('gantt-scroll-outer');
-    var _scrollX=_gSc2?_gSc2.scrollLeft:0;
-    machines.forEach(function(m,ri){{
-      var y=PAD+ri*(ROW_H+PAD);
-      var shortM=m.indexOf('_')!==-1?m.split('_')[0]:m;
-      _ctx.save();
-      _ctx.font='bold 16px sans-serif';_ctx.textAlign='left';
-      _ctx.shadowColor='rgba(0,0,0,0.8)';_ctx.shadowBlur=4;
-      _ctx.lineWidth=3;_ctx.strokeStyle='rgba(0,0,0,0.6)';
-      _ctx.strokeText(shortM,_scrollX+6,y+ROW_H/2+4);
-      _ctx.fillStyle='#ffffff';_ctx.shadowBlur=0;
-      _ctx.fillText(shortM,_scrollX+6,y+ROW_H/2+4);
-      _ctx.restore();
-    }});
-  }}
-  (function(){{
-    var _gSc3=document.getElementById('gantt-scroll-outer');
-    if(_gSc3){{var _raf;_gSc3.addEventListener('scroll',function(){{
-      if(_raf)return;_raf=requestAnimationFrame(function(){{_drawMachineNames();_raf=null;}});
-    }});}}
-  }})();
+# ── Synthetic data / benchmarks ───────────────────────────────────────────────
+_SYNTH_PROGRAMS = ("WF861-100L-P2.MIN", "WF080-920-2.MIN", "WF330-903B.MIN",
+                   "WF512-200R-OP1.MIN", "WF201-044-OP2.MIN")
 
-  // Initial draw: last 7 days
-  (function(){{
-    var to=new Date(),from=new Date();from.setDate(to.getDate()-6);
-    buildFromRange(localISO(from), localISO(to));
-    drawGantt();
-  }})();
+def _synthetic_records(proc_ids, start_dt, end_dt, seed=0, step_sec=60):
+    """Синтетичні data[] у форматі GetOperationResult / GetMachiningResult.
 
-  // Exposed so Period Trend controls can sync this chart
-  window.updateBatchGantt=function(from,to,forcedW){{
-    buildFromRange(from,to,forcedW);
-    drawGantt(forcedW);
-  }};
+    Детерміновані (seed), відсортовані за Date як відповідь WebAPI з Sort=0.
+    Парні ProcResID мають лічильник (COUNTER) — щоб покрити гілку counter_markers.
+    """
+    import random
+    rnd = random.Random(seed)
+    ops, mrs = [], []
+    for pid in proc_ids:
+        t, run, prog = start_dt, "0", rnd.choice(_SYNTH_PROGRAMS)
+        while t < end_dt:
+            if rnd.random() < 0.08:
+                run = "1" if run == "0" else "0"
+                if run == "1" and rnd.random() < 0.1:
+                    prog = rnd.choice(_SYNTH_PROGRAMS)
+            alarm = run == "0" and rnd.random() < 0.03
+            date  = t.strftime("%Y.%m.%d %H:%M:%S")
+            ops.append({
+                "ProcResID": pid, "Date": date, "RunState": run, "MainProgramFileName": prog,
+                "PowerOn": 1, "AlarmState": int(alarm), "AlarmNo": 2201 if alarm else "",
+                "AlarmMessage": "DOOR INTERLOCK" if alarm else "",
+                "LimitState": 0, "ProgramStopState": 0, "FeedHoldState": 0, "STMState": 0,
+                "SetUp": int(run == "0" and rnd.random() < 0.05), "NoOperator": 0, "Wait": 0,
+                "Maintenance": 0,
+            })
+            if pid % 2 == 0 and run == "1" and rnd.random() < 0.05:
+                mrs.append({"ProcResID": pid, "Date": date, "MainProgramFileName": "COUNTER.MIN",
+                            "RunStateTime": 0, "WorkCountACount": 1})
+            t += timedelta(seconds=step_sec)
+    ops.sort(key=lambda r: r["Date"])
+    mrs.sort(key=lambda r: r["Date"])
+    return ops, mrs
+
+
+def bench_analysis(machines: int = 50, workers: int = None, hours: int = HOURS_BACK) -> None:
+    """Порівнює серійний і процесний Step 3 на синтетичних станках; перевіряє ідентичність."""
+    workers = workers or os.cpu_count() or 1
+    # Доба, що вже минула: filter_last_hours(…, 24) відраховує від 00:00 дня останнього запису
+    start_dt = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    end_dt   = start_dt + timedelta(hours=min(hours, 24))
+    pids = list(range(1001, 1001 + machines))
+    ops, mrs = _synthetic_records(pids, start_dt, end_dt)
+    name_of = lambda pid: f"S{pid}_SYNTH"
+    rows    = _parse_operation_records(ops, "bench", name_of)
+    mr_data = _parse_machining_records(mrs, "bench", name_of)
+    filtered, period_from, period_to = filter_last_hours(rows, hours)
+    log(f"Bench: {machines} machines × {hours} h = {len(filtered)} rows, {len(mr_data)} counter records")
+
+    t0 = time.perf_counter()
+    serial = analyze_all(filtered, mr_data, period_from, period_to, workers=1)
+    t_serial = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    try:
+        pooled = analyze_all(filtered, mr_data, period_from, period_to, workers=workers, strict=True)
+    except Exception as e:
+        log(f"✗ Process pool not used — {type(e).__name__}: {e}")
+        sys.exit(1)
+    t_pool = time.perf_counter() - t0
+
+    same = serial == pooled
+    if workers <= 1:
+        log("  pool not used (workers=1) — both runs are serial")
+    log(f"  serial:             {t_serial:7.2f} s")
+    log(f"  {workers:2d} processes:       {t_pool:7.2f} s  (speedup ×{t_serial / t_pool:.2f})")
+    log(f"  results identical:  {'yes' if same else 'NO'}")
+    if not same:
+        sys.exit(1)
 
-  // Tooltip
-  cv.addEventListener('mousemove',function(e){{
-    var rect=cv.getBoundingClientRect();
-    var scaleX=parseFloat(cv.style.width)/rect.width;
-    var mx=(e.clientX-rect.left)*scaleX, my=(e.clientY-rect.top)*scaleX;
-    // Check program bars first
-    var found=null;
-    for(var i=barMeta.length-1;i>=0;i--){{
-      var b=barMeta[i];
-      if(mx>=b.x&&mx<=b.x+b.w&&my>=b.y&&my<=b.y+b.h){{found=b;break;}}
-    }}
-    function showTip(html, cx, cy){{
-      tip.style.display='block';
-      tip.innerHTML=html;
-      var tw=tip.offsetWidth||200, th=tip.offsetHeight||70;
-      var tx=cx+14, ty=cy-32;
-      if(tx+tw>window.innerWidth-8) tx=cx-tw-14;
-      if(tx<8) tx=8;
-      if(ty+th>window.innerHeight-8) ty=cy-th-8;
-      if(ty<8) ty=cy+14;
-      tip.style.left=tx+'px'; tip.style.top=ty+'px';
-    }}
-    if(found){{
-      var dm=found.c.dur?Math.round(found.c.dur):0;
-      var durStr=dm>0?(dm>=60?(Math.floor(dm/60)+'h'+(dm%60?'\u00a0'+dm%60+'m':'')):dm+'\u00a0min'):'';
-      showTip('<b>'+found.c.m+'</b> — '+found.c.p+'<br>'+found.c.d+'&nbsp;'+found.c.s+'–'+(found.c.e||'…')+(durStr?'<br>'+durStr:''),e.clientX,e.clientY);
-      return;
-    }}
-    // Check gap bars
-    var foundGap=null;
-    for(var j=gapMeta.length-1;j>=0;j--){{
-      var g=gapMeta[j];
-      if(mx>=g.x&&mx<=g.x+g.w&&my>=g.y&&my<=g.y+g.h){{foundGap=g;break;}}
-    }}
-    if(foundGap){{
-      var h=Math.floor(foundGap.gapMin/60),m2=foundGap.gapMin%60;
-      var durStr=h>0?(h+'h '+(m2?m2+'m':'')):m2+'m';
-      showTip('⏸ <b>Idle: '+durStr+'</b><br>'+foundGap.m+' &nbsp;'+foundGap.d+'<br>'+foundGap.s+' – '+foundGap.e,e.clientX,e.clientY);
-    }} else tip.style.display='none';
-  }});
-  cv.addEventListener('mouseleave',function(){{tip.style.display='none';}});
-}})();
+# Time-to-interactive звіту: tti_bench.html вантажить index.html в iframe розміру телефона
+# (390×844) по черзі ліниво і з ?eager=1. Довгі задачі (> 50 мс) збирає сам звіт при ?tti
+# (PerformanceObserver у <head>). TTI — кінець останньої довгої задачі перед тихим вікном
+# 1 с, але не раніше DOMContentLoaded; TBT — сума (тривалість − 50 мс). Результат сторінка
+# надсилає POST /tti-result на той самий локальний сервер.
+_TTI_BENCH_HTML = r"""<!DOCTYPE html>
+<html><head><meta charset="UTF-8"><title>TTI bench</title></head>
+<body style="font-family:sans-serif">
+<pre id="result">running…</pre>
+<script>
+var RUNS=__RUNS__,QUIET=1000,res={lazy:[],eager:[]},queue=[];
+for(var i=0;i<RUNS;i++){queue.push("lazy");queue.push("eager");}
+function median(a){a=a.slice().sort(function(x,y){return x-y;});return a.length?Math.round(a[a.length>>1]):0;}
+function one(mode,done){
+  var f=document.createElement("iframe");f.width=390;f.height=844;
+  f.src="index.html?tti="+Date.now()+(mode==="eager"?"&eager=1":"");
+  f.onload=function(){
+    var w=f.contentWindow,seen=-1,last=0;
+    (function poll(){
+      var lt=w.__lt||[];
+      if(lt.length!==seen){seen=lt.length;last=performance.now();}
+      if(performance.now()-last<QUIET) return setTimeout(poll,100);
+      var nav=w.performance.getEntriesByType("navigation")[0]||{};
+      var dcl=nav.domContentLoadedEventEnd||0,tti=dcl,tbt=0;
+      lt.forEach(function(e){tti=Math.max(tti,e.startTime+e.duration);tbt+=Math.max(0,e.duration-50);});
+      var fcp=(w.performance.getEntriesByName("first-contentful-paint")[0]||{}).startTime||0;
+      res[mode].push({tti:tti,dcl:dcl,fcp:fcp,tbt:tbt,lt:lt.length});
+      document.body.removeChild(f);done();
+    })();
+  };
+  document.body.appendChild(f);
+}
+function next(){
+  if(queue.length) return one(queue.shift(),next);
+  var out={};
+  ["lazy","eager"].forEach(function(m){
+    var r=res[m];
+    out[m]={tti:median(r.map(function(x){return x.tti;})),dcl:median(r.map(function(x){return x.dcl;})),
+            fcp:median(r.map(function(x){return x.fcp;})),tbt:median(r.map(function(x){return x.tbt;})),
+            long_tasks:median(r.map(function(x){return x.lt;})),runs:r.length};
+  });
+  document.getElementById("result").textContent=JSON.stringify(out,null,2);
+  fetch("tti-result",{method:"POST",body:JSON.stringify(out)});
+}
+next();
+</script>
+</body></html>
+"""
 
-// ── Nav drawer (mobile) ───────────────────────────────────────────
-(function(){{
-  var toggle=document.getElementById('nav-toggle');
-  var sidebar=document.getElementById('nav-sidebar');
-  var overlay=document.getElementById('nav-overlay');
-  if(!toggle||!sidebar||!overlay) return;
-  function openNav(){{sidebar.classList.add('open');overlay.classList.add('open');}}
-  function closeNav(){{sidebar.classList.remove('open');overlay.classList.remove('open');}}
-  toggle.addEventListener('click',function(){{
-    sidebar.classList.contains('open')?closeNav():openNav();
-  }});
-  overlay.addEventListener('click',closeNav);
-  sidebar.querySelectorAll('.nav-btn').forEach(function(btn){{
-    btn.addEventListener('click',closeNav);
-  }});
-}})();
 
-document.addEventListener('DOMContentLoaded',function(){{
-  // Scroll sync: Period Trend ↔ Batch Gantt
-  (function(){{
-    var pEl=document.getElementById('effChartPeriod');
-    var pSc=pEl?pEl.closest('.chart-scroll-outer'):null;
-    var gSc=document.getElementById('gantt-scroll-outer');
-    if(!pSc||!gSc) return;
-    var _sy=false;
-    pSc.addEventListener('scroll',function(){{if(_sy)return;_sy=true;gSc.scrollLeft=pSc.scrollLeft;_sy=false;}});
-    gSc.addEventListener('scroll',function(){{if(_sy)return;_sy=true;pSc.scrollLeft=gSc.scrollLeft;_sy=false;}});
-  }})();
-  setTimeout(function(){{requestAnimationFrame(function(){{
-    if(window.initDaySelector) window.initDaySelector();
-    if(window.initToday) window.initToday();
-    if(window.setRange)  window.setRange(7);
-  }});}},80);
-}});
-</script>
-</body>
-</html>"""
+def _find_browser():
+    """Chrome / Chromium / Edge для headless-прогону (None — відкрити сторінку вручну)."""
+    import shutil
+    for name in ("chromium", "chromium-browser", "google-chrome", "chrome", "msedge"):
+        path = shutil.which(name)
+        if path:
+            return path
+    for path in (r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+                 r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+                 r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe"):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def bench_tti(runs: int = 5, port: int = 8730, timeout: int = 300) -> None:
+    """Міряє TTI останнього index.html (ліниві картки vs ?eager=1) у headless-браузері."""
+    import subprocess
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    if not os.path.exists(OUTPUT_HTML):
+        log(f"✗ {OUTPUT_HTML} not found — generate the report first")
+        sys.exit(1)
+    with open(os.path.join(DOWNLOAD_DIR, "tti_bench.html"), "w", encoding="utf-8") as f:
+        f.write(_TTI_BENCH_HTML.replace("__RUNS__", str(max(1, runs))))
+    result, done = {}, threading.Event()
+
+    class Handler(SimpleHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/").endswith("tti-result"):
+                result.update(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+                done.set()
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, fmt, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", port), partial(Handler, directory=DOWNLOAD_DIR))
+    threading.Thread(target=srv.serve_forever, name="tti-http", daemon=True).start()
+    url = f"http://127.0.0.1:{port}/tti_bench.html"
+    browser, proc = _find_browser(), None
+    if browser:
+        log(f"TTI bench: {runs} × (lazy, eager) in headless {os.path.basename(browser)}")
+        proc = subprocess.Popen([browser, "--headless=new", "--disable-gpu", "--no-first-run",
+                                 "--user-data-dir=" + os.path.join(DOWNLOAD_DIR, "tti_profile"), url],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        log(f"TTI bench: no Chrome/Edge found — open {url} in a browser")
+    try:
+        finished = done.wait(timeout)
+    finally:
+        if proc:
+            proc.kill()
+        srv.shutdown()
+    if not finished:
+        log(f"✗ TTI bench: no result in {timeout} s")
+        sys.exit(1)
+    for mode in ("lazy", "eager"):
+        r = result[mode]
+        log(f"  {mode:5s}: TTI {r['tti']} ms, DOMContentLoaded {r['dcl']} ms, FCP {r['fcp']} ms, "
+            f"TBT {r['tbt']} ms, {r['long_tasks']} long tasks (median of {r['runs']})")
+    if result["lazy"]["tti"]:
+        log(f"  eager / lazy TTI: ×{result['eager']['tti'] / result['lazy']['tti']:.2f}")
+
+# ── Connect Plan WebAPI stub ──────────────────────────────────────────────────
+# Локальний сервер з тим самим конвертом {"d": {"code", "message", "data"}} для
+# v3/GetOperationResult і v3/GetMachiningResult — для навантажувальних тестів без заводу:
+#   set FACTORY_MONITOR_DIR=C:\fm_test
+#   python factory_monitor.py stub-api --port 8710 --machines 300 --write-machines
+#   python factory_monitor.py            (в іншому вікні, з тим самим FACTORY_MONITOR_DIR)
+# Дані — записані (--data: {"GetOperationResult": [...], "GetMachiningResult": [...]})
+# або синтетичні: _synthetic_records на кожну пару (ProcResID, доба), однакові між запитами.
+def serve_stub_api(port: int = 8710, latency_ms: int = 0, jitter_ms: int = 0,
+                   error_rate: float = 0.0, page_size: int = 0, step_sec: int = 60,
+                   pad_bytes: int = 0, data_file: str = None, seed: int = 0) -> None:
+    import random
+    import urllib.parse
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    rnd = random.Random(seed)
+    recorded = None
+    if data_file:
+        with open(data_file, encoding="utf-8") as f:
+            recorded = json.load(f)
+        for recs in recorded.values():
+            recs.sort(key=lambda r: r.get("Date", ""))
+
+    @lru_cache(maxsize=4096)
+    def _synthetic_day(pid, day_ord):
+        day = datetime.fromordinal(day_ord)
+        return _synthetic_records([pid], day, day + timedelta(days=1),
+                                  seed=seed * 1_000_003 + pid * 100_003 + day_ord, step_sec=step_sec)
+
+    def _select(name, ids, start, end):
+        # Date у форматі "YYYY.MM.DD HH:MM:SS" — порівнюється як рядок
+        if recorded is not None:
+            return [r for r in recorded.get(name, [])
+                    if r.get("ProcResID") in ids and start <= r.get("Date", "") < end]
+        idx = 0 if name == "GetOperationResult" else 1
+        out = []
+        d0 = datetime.strptime(start[:10], "%Y.%m.%d").toordinal()
+        d1 = datetime.strptime(end[:10], "%Y.%m.%d").toordinal()
+        for day_ord in range(d0, d1 + 1):
+            for pid in sorted(ids):
+                out.extend(r for r in _synthetic_day(pid, day_ord)[idx] if start <= r["Date"] < end)
+        out.sort(key=lambda r: r["Date"])
+        return out
+
+    stats = {"requests": 0, "errors": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            raw = json.dumps(body, separators=(",", ":")).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            stats["requests"] += 1
+            url  = urllib.parse.urlsplit(self.path)
+            q    = dict(urllib.parse.parse_qsl(url.query))
+            name = url.path.rstrip("/").rsplit("/", 1)[-1]
+            delay = latency_ms + (rnd.uniform(0, jitter_ms) if jitter_ms else 0)
+            if delay:
+                time.sleep(delay / 1000)
+            if name not in ("GetOperationResult", "GetMachiningResult"):
+                return self._send(404, {"d": {"code": 404, "message": f"unknown endpoint {name}"}})
+            if error_rate and rnd.random() < error_rate:
+                stats["errors"] += 1
+                if rnd.random() < 0.5:
+                    return self._send(500, {"error": "injected"})
+                return self._send(200, {"d": {"code": 9, "message": "injected error", "data": []}})
+            try:
+                ids   = {int(x) for x in q.get("ID", "").split(",") if x.strip()}
+                start = q["StartDate"].replace("/", ".")
+                end   = q["EndDate"].replace("/", ".")
+                offset = int(q.get("Offset", 0))
+            except Exception as e:
+                return self._send(200, {"d": {"code": 1, "message": f"bad request: {e}", "data": []}})
+            data = _select(name, ids, start, end)
+            if page_size:
+                page = data[offset:offset + page_size]
+            else:
+                page = data
+            if pad_bytes:
+                page = [dict(r, Pad="x" * pad_bytes) for r in page]
+            d = {"code": 0, "message": "", "data": page}
+            if page_size and offset + page_size < len(data):
+                d["next"] = offset + page_size
+            self._send(200, {"d": d})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    log(f"Stub WebAPI on http://127.0.0.1:{port} — "
+        f"{'recorded ' + data_file if data_file else f'synthetic, 1 record / {step_sec} s'}, "
+        f"latency {latency_ms}+{jitter_ms} ms, errors {error_rate:.0%}, "
+        f"page {page_size or '∞'}, pad {pad_bytes} B")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log(f"Stub WebAPI stopped: {stats['requests']} requests, {stats['errors']} injected errors")
+
+
+def write_stub_machines(machines: int, port: int) -> None:
+    """Записує MACHINES_FILE з machines синтетичними станками на stub-api."""
+    cfg = {"sites": [{
+        "site": DEFAULT_SITE,
+        "api_base": f"http://127.0.0.1:{port}",
+        "machines": [{"id": 1001 + i, "name": f"S{1001 + i}_SYNTH", "short": f"S{1001 + i}"}
+                     for i in range(machines)],
+    }]}
+    os.makedirs(os.path.dirname(MACHINES_FILE), exist_ok=True)
+    with open(MACHINES_FILE, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=1)
+    log(f"{MACHINES_FILE}: {machines} synthetic machine(s)")
+
 # =============================================================================
-def kill_old_instances():
-    """Kill any other running instances of factory_monitor.py"""
-    my_pid = os.getpid()
+# ── Local HTTP API ────────────────────────────────────────────────────────────
+# Read-only JSON над history.db для дашборда і інших інструментів у мережі цеху:
+#   /api/machines                                   — реєстр станків
+#   /api/daily      ?from&to&machine&site           — daily_summary
+#   /api/hourly     ?from&to&machine&site           — hourly_stats
+#   /api/cycles     ?from&to&machine&site&program   — cycle_events
+#   /api/downtimes  ?from&to&machine&site&reason    — downtime_events
+#   /api/alarms     ?from&to&machine&site           — downtime_events з причиною "Alarm: …"
+#   /api/timeline   ?from&to&machine&site           — state_raster → відрізки [хв від 00:00)
+#   /api/utilization ?from&to&machine&site&start&end — хвилини площин state_raster у вікні доби
+#                    [start, end) (HH:MM, за замовчуванням 00:00–24:00), сума за діапазон по станку;
+#                    &bucket=N — натомість по добах: хвилини площин по відрах N хв (60 → години)
+#   /api/live       ?since                          — SSE-потік дельт live_events (див. Live updates)
+# Дати — YYYY-MM-DD (за замовчуванням останні 7 діб), machine — назва або короткий код.
+# Відповідь: {"columns": [...], "rows": [[...], ...]}. ETag — від (mtime, розмір) history.db
+# і запиту: If-None-Match → 304 без звернення до БД; готові тіла кешуються за ETag.
+_API_SQL = {
+    "daily":     ("SELECT date,machine,site,run_min,down_min,total_min,cycles,avg_cycle,efficiency "
+                  "FROM daily_summary WHERE {where} ORDER BY date,machine"),
+    "hourly":    ("SELECT date,machine,site,hour,run_min,total_min "
+                  "FROM hourly_stats WHERE {where} ORDER BY date,machine,hour"),
+    "cycles":    ("SELECT date,machine,site,program,start_time,end_time,duration "
+                  "FROM cycle_events WHERE {where} ORDER BY date,machine,id"),
+    "downtimes": ("SELECT date,machine,site,start_time,end_time,duration,reason "
+                  "FROM downtime_events WHERE {where} ORDER BY date,machine,id"),
+    "alarms":    ("SELECT date,machine,site,start_time,end_time,duration,reason "
+                  "FROM downtime_events WHERE {where} AND reason LIKE 'Alarm:%' ORDER BY date,machine,id"),
+    "timeline":  "SELECT date,machine,site,planes FROM state_raster WHERE {where} ORDER BY date,machine",
+    "utilization": "SELECT date,machine,site,planes FROM state_raster WHERE {where} ORDER BY date,machine",
+}
+# Додаткові фільтри за рівністю — лише для таблиць, де є така колонка
+_API_FILTERS = {"cycles": {"program": "program=?"}, "downtimes": {"reason": "reason=?"}}
+_API_COMMON_PARAMS = ("from", "to", "machine", "site")
+_API_EXTRA_PARAMS  = {"utilization": ("start", "end", "bucket")}
+
+def _api_check_params(route: str, q: dict) -> None:
+    """Невідомий для маршруту параметр → ValueError (400), а не SQL-помилка (500)."""
+    if route == "machines":
+        allowed = set()
+    elif route == "live":
+        allowed = {"since"}
+    else:
+        allowed = (set(_API_COMMON_PARAMS) | set(_API_FILTERS.get(route, {}))
+                   | set(_API_EXTRA_PARAMS.get(route, ())))
+    unknown = sorted(set(q) - allowed)
+    if unknown:
+        raise ValueError(f"unknown parameter(s) for /api/{route}: {', '.join(unknown)}; "
+                         f"allowed: {', '.join(sorted(allowed)) or 'none'}")
+
+
+def _api_where(q: dict, route: str = None) -> tuple:
+    """Параметри запиту → (WHERE, args). Невалідні дати / завеликий діапазон → ValueError (400)."""
     try:
-        # Get all python processes with their command lines
-        result = subprocess.run(
-            ['wmic', 'process', 'where',
-             "name like '%python%'",
-             'get', 'ProcessId,CommandLine', '/format:list'],
-            capture_output=True, text=True, timeout=10
-        )
-        lines = result.stdout.strip().split('\n')
+        d_to   = datetime.strptime(q.get("to") or datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d")
+        d_from = datetime.strptime(q["from"], "%Y-%m-%d") if q.get("from") else d_to - timedelta(days=6)
+    except ValueError:
+        raise ValueError("from/to must be YYYY-MM-DD")
+    if d_from > d_to or (d_to - d_from).days >= API_SERVER_MAX_DAYS:
+        raise ValueError(f"date range must be 1..{API_SERVER_MAX_DAYS} days")
+    where = ["date>=?", "date<=?"]
+    args  = [d_from.strftime("%Y-%m-%d"), d_to.strftime("%Y-%m-%d")]
+    if q.get("machine"):
+        where.append("machine=?")
+        args.append(_canonical_machine(q["machine"]))
+    if q.get("site"):
+        where.append("site=?")
+        args.append(q["site"])
+    for key, clause in _API_FILTERS.get(route, {}).items():
+        if q.get(key):
+            where.append(clause)
+            args.append(q[key])
+    return " AND ".join(where), args
+
+
+def _api_minute(v: str, default: int) -> int:
+    """HH:MM → хвилина від 00:00 (0…1440, "24:00" — кінець доби); невалідне → ValueError (400)."""
+    if not v:
+        return default
+    try:
+        h, m = (int(x) for x in v.split(":"))
+    except ValueError:
+        raise ValueError("start/end must be HH:MM")
+    if not (0 <= m < 60 and 0 <= h * 60 + m <= RASTER_SLOTS):
+        raise ValueError("start/end must be within 00:00..24:00")
+    return h * 60 + m
 
-        current_cmd = None
-        current_pid = None
-        killed = 0
 
-        for line in lines:
-            line = line.strip()
-            if line.startswith('CommandLine='):
-                current_cmd = line[len('CommandLine='):]
-            elif line.startswith('ProcessId='):
+def _api_utilization(conn, q: dict, where: str, args: list) -> dict:
+    if q.get("bucket"):
+        try:
+            bucket = int(q["bucket"])
+        except ValueError:
+            bucket = 0
+        if not 1 <= bucket <= RASTER_SLOTS:
+            raise ValueError(f"bucket must be 1..{RASTER_SLOTS} minutes")
+        cur = conn.execute(_API_SQL["utilization"].format(where=where), args)
+        return {"columns": ["date", "machine", "site", "bucket"] + list(RASTER_PLANES),
+                "rows": [[d, m, site, bucket] + [raster_buckets(mask, bucket)
+                                                 for mask in raster_from_blob(blob).values()]
+                         for d, m, site, blob in cur]}
+    start, end = _api_minute(q.get("start"), 0), _api_minute(q.get("end"), RASTER_SLOTS)
+    if end <= start:
+        raise ValueError("end must be after start")
+    totals = load_raster_window(conn, args[0], args[1], start, end,
+                                _canonical_machine(q["machine"]) if q.get("machine") else None,
+                                q.get("site"))
+    return {"columns": ["machine", "site", "from", "to", "start", "end"] + list(RASTER_PLANES),
+            "rows": [[m, _machine_site(m), args[0], args[1], start, end] + [acc[p] for p in RASTER_PLANES]
+                     for m, acc in sorted(totals.items())]}
+
+
+def _api_query(conn, route: str, q: dict) -> dict:
+    if route == "machines":
+        return {"columns": ["name", "short", "site", "chart"],
+                "rows": [[e["name"], e["short"], e["site"], e["name"] in ALL_MACHINES]
+                         for e in _MACHINE_BY_NAME.values()]}
+    where, args = _api_where(q, route)
+    if route == "utilization":
+        return _api_utilization(conn, q, where, args)
+    cur = conn.execute(_API_SQL[route].format(where=where), args)
+    columns = [c[0] for c in cur.description]
+    if route != "timeline":
+        return {"columns": columns, "rows": cur.fetchall()}
+    return {"columns": ["date", "machine", "site"] + list(RASTER_PLANES),
+            "rows": [[d, m, site] + [raster_runs(mask) for mask in raster_from_blob(blob).values()]
+                     for d, m, site, blob in cur]}
+
+
+_STATIC_TYPES = {".html": "text/html; charset=utf-8", ".css": "text/css; charset=utf-8",
+                 ".js": "text/javascript; charset=utf-8"}
+
+def serve_api(host: str = None, port: int = None, pool_size: int = None) -> None:
+    """Запускає read-only HTTP API над history.db (блокує до Ctrl+C).
+    Поза /api/ віддає сам звіт: index.html і static/ з DOWNLOAD_DIR."""
+    import re
+    import gzip
+    import sqlite3
+    import pathlib
+    import urllib.parse
+    from collections import OrderedDict
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    host = API_SERVER_HOST if host is None else host
+    port = port or API_SERVER_PORT
+    pool_size = max(1, pool_size or API_SERVER_POOL)
+    db_uri = pathlib.Path(os.path.abspath(DB_FILE)).as_uri() + "?mode=ro"
+    pool = queue.Queue()
+    for _ in range(pool_size):
+        pool.put(None)                        # з'єднання відкривається при першому використанні
+    cache, cache_lock = OrderedDict(), threading.Lock()
+
+    def _db_stamp() -> str:
+        st = os.stat(DB_FILE)
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def _run(fn, *args):
+        conn = pool.get()
+        try:
+            if conn is None:
+                conn = sqlite3.connect(db_uri, uri=True, check_same_thread=False, timeout=5)
+                conn.execute("PRAGMA query_only=1")
+            return fn(conn, *args)
+        except sqlite3.Error:
+            # Помилка самого запиту не псує з'єднання; закривається лише те, що не відповідає
+            try:
+                if conn is not None:
+                    conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                conn.close()
+                conn = None                   # наступний запит відкриє з'єднання заново
+            raise
+        finally:
+            pool.put(conn)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body=b"", headers=()):
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body and self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _send_json(self, status, obj, headers=()):
+            body = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._send(status, body, (("Content-Type", "application/json; charset=utf-8"),
+                                      ("Access-Control-Allow-Origin", "*")) + tuple(headers))
+
+        def _live(self, q):
+            """SSE: дельти live_events після Last-Event-ID / ?since (без них — лише нові)."""
+            try:
+                since = int(self.headers.get("Last-Event-ID") or q.get("since") or -1)
+                if since < 0:
+                    since = _run(lambda c: c.execute("SELECT COALESCE(MAX(seq),0) FROM live_events")
+                                 .fetchone()[0])
+            except (ValueError, sqlite3.Error) as e:
+                return self._send_json(400 if isinstance(e, ValueError) else 503, {"error": str(e)})
+            self.close_connection = True
+            self.send_response(200)
+            for k, v in (("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache"),
+                         ("Connection", "close"), ("Access-Control-Allow-Origin", "*")):
+                self.send_header(k, v)
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+            stamp, beat = None, time.monotonic()
+            try:
+                self.wfile.write(b"retry: 5000\n\n")
+                self.wfile.flush()
+                while True:
+                    try:
+                        new_stamp = _db_stamp()
+                    except OSError:
+                        new_stamp = None
+                    out = []
+                    if new_stamp and new_stamp != stamp:
+                        rows, gap = _run(live_since, since)
+                        if gap:
+                            out.append('data: {"type":"reload"}\n\n')
+                        for seq, payload in rows:
+                            out.append(f"id: {seq}\ndata: {payload}\n\n")
+                            since = seq
+                        if len(rows) < 100:       # решту дочитаємо наступним колом без паузи
+                            stamp = new_stamp
+                    if not out and time.monotonic() - beat >= LIVE_HEARTBEAT_SEC:
+                        out.append(": ping\n\n")
+                    if out:
+                        self.wfile.write("".join(out).encode("utf-8"))
+                        self.wfile.flush()
+                        beat = time.monotonic()
+                    if stamp == new_stamp:
+                        time.sleep(LIVE_POLL_SEC)
+            except (OSError, sqlite3.Error):
+                pass                              # клієнт закрив з'єднання / БД недоступна — EventSource перепідключиться
+
+        def _static(self, parts):
+            """Звіт з DOWNLOAD_DIR: index.html — no-cache з ETag; static/<назва з хешем> — immutable."""
+            if parts in ([""], ["index.html"]):
+                path, cache_ctl = OUTPUT_HTML, "no-cache"
+            elif (len(parts) == 2 and parts[0] == "static" and parts[1] != _STATIC_MANIFEST
+                  and re.fullmatch(r"[\w-]+(\.[\w-]+)+", parts[1])):
+                path, cache_ctl = os.path.join(STATIC_DIR, parts[1]), "public, max-age=31536000, immutable"
+            else:
+                return self._send_json(404, {"error": "not found"})
+            try:
+                st = os.stat(path)
+            except OSError:
+                return self._send_json(404, {"error": "not found"})
+            ctype = _STATIC_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+            # Стиснута копія з save_report / _write_asset — якщо клієнт її приймає і вона не старша
+            accept, enc = self.headers.get("Accept-Encoding", ""), None
+            for ext, name in ((".br", "br"), (".gz", "gzip")):
                 try:
-                    current_pid = int(line[len('ProcessId='):])
-                except ValueError:
-                    current_pid = None
+                    if name in accept and os.stat(path + ext).st_mtime_ns >= st.st_mtime_ns:
+                        path, enc = path + ext, name
+                        break
+                except OSError:
+                    pass
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + enc if enc else ""}"'
+            common = (("ETag", etag), ("Cache-Control", cache_ctl), ("Vary", "Accept-Encoding"))
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self._send(304, b"", common)
+            with open(path, "rb") as f:
+                body = f.read()
+            self._send(200, body, (("Content-Type", ctype),) + common
+                       + ((("Content-Encoding", enc),) if enc else ()))
+
+        def do_GET(self):
+            url   = urllib.parse.urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            if parts[0] != "api":
+                return self._static(parts)
+            if len(parts) == 1:
+                return self._send_json(200, {"endpoints": ["/api/machines"] + [f"/api/{r}" for r in _API_SQL]
+                                                          + ["/api/live"]})
+            route = parts[1]
+            if route != "machines" and route != "live" and route not in _API_SQL:
+                return self._send_json(404, {"error": f"unknown endpoint /api/{route}"})
+            q = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                _api_check_params(route, q)
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            if route == "live":
+                return self._live(q)
+            gz = "gzip" in self.headers.get("Accept-Encoding", "")
+            try:
+                stamp = _db_stamp()
+            except OSError:
+                return self._send_json(503, {"error": "history.db not found"})
+            etag = 'W/"' + hashlib.sha1(f"{stamp}|{route}|{sorted(q.items())}".encode("utf-8")
+                                        ).hexdigest()[:20] + '"'
+            common = (("ETag", etag), ("Cache-Control", "no-cache"), ("Vary", "Accept-Encoding"),
+                      ("Access-Control-Allow-Origin", "*"))
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self._send(304, b"", common)
+            key = (etag, gz)
+            with cache_lock:
+                body = cache.get(key)
+                if body is not None:
+                    cache.move_to_end(key)
+            if body is None:
+                try:
+                    data = _run(_api_query, route, q)
+                except ValueError as e:
+                    return self._send_json(400, {"error": str(e)})
+                except Exception as e:
+                    log(f"✗ API /api/{route} error: {e}")
+                    return self._send_json(500, {"error": "internal error"})
+                body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                if gz:
+                    body = gzip.compress(body, 6)
+                with cache_lock:
+                    cache[key] = body
+                    while len(cache) > 64:
+                        cache.popitem(last=False)
+            headers = (("Content-Type", "application/json; charset=utf-8"),) + common
+            if gz:
+                headers += (("Content-Encoding", "gzip"),)
+            self._send(200, body, headers)
+
+        do_HEAD = do_GET
+
+        def log_message(self, fmt, *args):
+            log(f"api {self.address_string()} {fmt % args}", "DEBUG")
+
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    log(f"Read-only API on http://{host}:{port}/api — {DB_FILE} (pool {pool_size}); "
+        f"report on http://{host}:{port}/")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
 
-                if current_cmd and current_pid and current_pid != my_pid:
-                    if 'factory_monitor' in current_cmd.lower():
-                        try:
-                            subprocess.run(
-                                ['taskkill', '/PID', str(current_pid), '/F'],
-                                capture_output=True, timeout=5
-                            )
-                            log(f"Killed old instance PID {current_pid}")
-                            killed += 1
-                        except Exception as e:
-                            log(f"Failed to kill PID {current_pid}: {e}")
-
-                current_cmd = None
-                current_pid = None
-
-        if killed:
-            log(f"Killed {killed} old instance(s)")
-        else:
-            log("No old instances found")
+
+# ── Single instance ───────────────────────────────────────────────────────────
+def _pid_alive(pid: int) -> bool:
+    """Чи існує процес pid — без запуску wmic / tasklist."""
+    if not pid or pid <= 0:
+        return False
+    if os.name == "nt":
+        import ctypes
+        k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        h = k32.OpenProcess(0x1000, False, pid)          # PROCESS_QUERY_LIMITED_INFORMATION
+        if not h:
+            return ctypes.get_last_error() == 5          # ERROR_ACCESS_DENIED — процес є
+        try:
+            code = ctypes.c_ulong()
+            return bool(k32.GetExitCodeProcess(h, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            k32.CloseHandle(h)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_LOCK_CREATE_GRACE_SEC = 10      # порожній/недописаний лок молодший за це — інстанс саме його створює
+
+def _read_lock(path: str = None) -> dict:
+    path = path or LOCK_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        if time.time() - mtime < _LOCK_CREATE_GRACE_SEC:
+            return {"pid": 0, "expires": mtime + _LOCK_CREATE_GRACE_SEC, "creating": True}
+        return {"pid": 0, "expires": 0}                  # пошкоджений — вважається простроченим
+
+def _lock_payload() -> bytes:
+    return json.dumps({"pid": os.getpid(), "expires": round(time.time() + LOCK_LEASE_SEC),
+                       "renewed": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}).encode("utf-8")
+
+def _write_lock() -> None:
+    tmp = f"{LOCK_FILE}.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_lock_payload())
+    os.replace(tmp, LOCK_FILE)
+
+def _claim_stale_lock(seen: dict) -> None:
+    """Прибирає прострочений LOCK_FILE: rename у власне ім'я — з кількох претендентів це
+    вдається одному. Якщо перенесений файл уже не той, що визнали простроченим (інший інстанс
+    встиг перехопити), він повертається на місце."""
+    claim = f"{LOCK_FILE}.stale.{os.getpid()}"
+    try:
+        os.rename(LOCK_FILE, claim)
+    except FileNotFoundError:
+        return                                           # прибрав інший претендент
+    if _read_lock(claim) == seen:
+        os.remove(claim)
+        return
+    try:
+        os.link(claim, LOCK_FILE)                        # не перезаписує, якщо лок уже створили
+    except OSError:
+        pass
+    os.remove(claim)
+
+def acquire_instance_lock() -> bool:
+    """Займає LOCK_FILE для цього процесу. False — інший інстанс тримає живий ліз.
+
+    Лок створюється лише через O_EXCL і PID пишеться в той самий дескриптор; прострочений
+    лок спершу атомарно прибирається (_claim_stale_lock), після чого знову O_EXCL.
+    """
+    me = os.getpid()
+    for _attempt in range(3):
+        try:
+            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            cur = _read_lock()
+            if not cur:
+                continue                                 # зник між open і читанням
+            pid, expires = cur.get("pid", 0), cur.get("expires", 0)
+            if pid != me and time.time() < expires and (cur.get("creating") or _pid_alive(pid)):
+                who = "starting instance" if cur.get("creating") else f"instance (PID {pid})"
+                log(f"Another {who} holds {os.path.basename(LOCK_FILE)} until "
+                    f"{datetime.fromtimestamp(expires).strftime('%H:%M:%S')} — exiting")
+                return False
+            if pid and pid != me:
+                log(f"Taking over instance lock from PID {pid} "
+                    f"({'lease expired' if _pid_alive(pid) else 'process gone'})")
+            _claim_stale_lock(cur)
+            continue
+        try:
+            os.write(fd, _lock_payload())
+        finally:
+            os.close(fd)
+        atexit.register(release_instance_lock)
+        return True
+    log(f"✗ Could not take {os.path.basename(LOCK_FILE)} (contended) — exiting")
+    return False
+
+def renew_instance_lock() -> None:
+    """Продовжує ліз, якщо лок ще наш."""
+    try:
+        if _read_lock().get("pid") == os.getpid():
+            _write_lock()
     except Exception as e:
-        log(f"kill_old_instances error: {e} — continuing anyway")
+        log(f"⚠ Instance lock renew error: {e}")
+
+def release_instance_lock() -> None:
+    try:
+        if _read_lock().get("pid") == os.getpid():
+            os.remove(LOCK_FILE)
+    except Exception:
+        pass
 
 
 def main():
     import traceback as _tb
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-    kill_old_instances()
+    t_run, profile = time.perf_counter(), []     # профіль прогону: (крок, perf_counter на його кінці)
+    def _mark(step):
+        profile.append((step, time.perf_counter()))
+        renew_instance_lock()
+
+    if not acquire_instance_lock():
+        return
+    _startup_mark("instance lock")
 
     log("=" * 60)
     log("FACTORY MONITOR START — V14")
     log("=" * 60)
 
-    # Step 2 — fetch data via WebAPI
-    rows, mr_data = fetch_from_api()
-    if not rows:
+    # Step 2 — fetch data via WebAPI. Фетч іде в окремому потоці з повторами (backoff);
+    # якщо за API_FRESH_WAIT_SEC даних немає — публікуємо звіт з останнього знімка і чекаємо далі.
+    fetched = {}
+    retry_deadline = time.monotonic() + API_RETRY_BUDGET_SEC
+    day_rows = load_day_rows(datetime.now().strftime("%Y-%m-%d")) if STREAM_ANALYSIS else None
+    def _fetch_with_retry():
+        for attempt, delay in enumerate((0,) + tuple(API_RETRY_DELAYS), 1):
+            if delay:
+                if time.monotonic() + delay >= retry_deadline:
+                    log(f"WebAPI retry budget ({API_RETRY_BUDGET_SEC} s) exhausted — "
+                        f"leaving further retries to the next run")
+                    return
+                log(f"WebAPI retry {attempt}/{len(API_RETRY_DELAYS) + 1} in {delay} s")
+                time.sleep(delay)
+            at = datetime.now()
+            # Хвіст від попереднього фетчу; порожній (помилка або тиша на всіх станках) — вся доба
+            since = day_rows_since(day_rows) if day_rows else None
+            rows_, mr_ = fetch_from_api(since) if since else ([], [])
+            if rows_:
+                log(f"Incremental fetch from {since.strftime('%H:%M:%S')}: {len(rows_)} new rows")
+                rows_, mr_ = merge_day_rows(day_rows, rows_, mr_, since)
+            else:
+                rows_, mr_ = fetch_from_api()
+            if rows_:
+                fetched["data"] = (rows_, mr_)
+                fetched["at"] = at
+                return
+    fetcher = threading.Thread(target=_fetch_with_retry, name="fetch", daemon=True)
+    fetcher.start()
+    fetcher.join(API_FRESH_WAIT_SEC)
+    if "data" not in fetched:
+        snap = load_snapshot()
+        if snap:
+            log(f"WebAPI not ready after {API_FRESH_WAIT_SEC} s — publishing snapshot "
+                f"(data as of {snap['period_to'].strftime('%d.%m.%Y %H:%M')})")
+            publish_snapshot(snap)
+        # Спроба, що вже йде, може висіти на таймаутах — чекаємо лише до кінця бюджету
+        fetcher.join(max(0.0, retry_deadline - time.monotonic()))
+    if "data" not in fetched:
         log("No data received from API — aborting.")
         sys.exit(1)
+    rows, mr_data = fetched["data"]
 
     log(f"Rows loaded: {len(rows)}")
     log(f"Machines: {sorted(set(r['MachineName'] for r in rows if r.get('MachineName')))}")
@@ -3493,39 +6745,61 @@ def main():
     filtered, period_from, period_to = filter_last_hours(rows, HOURS_BACK)
     date_str = period_to.strftime("%Y-%m-%d")
     log(f"Period: {period_from.strftime('%H:%M')} – {period_to.strftime('%H:%M')} ({len(filtered)} rows)")
+    try:
+        pre_rows, pre_mr = fetch_lookback(period_from, rows, mr_data)
+    except Exception as e:
+        log(f"✗ Look-back unavailable ({e}) — events cut at {period_from.strftime('%H:%M')}")
+        pre_rows, pre_mr = [], []
+    _mark("fetch")
 
     # Step 3 — analyze
+    stream_states = None
+    if STREAM_ANALYSIS:
+        try:
+            _sc = init_db()
+            stream_states = load_stream_state(_sc, date_str)
+            _sc.close()
+        except Exception as e:
+            log(f"✗ Stream checkpoint unavailable ({e}) — full re-analysis")
     try:
-        log("── Step 3: Analyzing cycles ──")
-        cycles = analyze_cycles(filtered)
+        mode = "serial" if ANALYSIS_WORKERS <= 1 else f"{ANALYSIS_WORKERS} processes"
+        log(f"── Step 3: Analyzing cycles / counter / downtime / timeline ({mode}) ──")
+        if stream_states:
+            _resume = min((st["c"]["last_date"] for st in stream_states.values()), default="")
+            log(f"  Resuming cycle/downtime state machines from {_resume}")
+        cycles, downtimes, timeline_data, counter_markers, counter_machines = \
+            analyze_all(pre_rows + filtered,
+                        pre_mr + [r for r in mr_data if not r.get("_ts") or r["_ts"] >= period_from],
+                        period_from, period_to, states=stream_states)
         log(f"  Cycles: {sum(len(v) for v in cycles.values())}")
-
-        log("── Step 3.1: Counter markers ──")
-        counter_markers = get_counter_markers(mr_data, cycles)
-        counter_machines = set(counter_markers.keys())
-        cycles = split_cycles_by_counter(cycles, counter_markers)
-        cycles, counter_markers = apply_start_to_start_cycles(cycles, counter_markers, mr_data)
-        counter_markers = add_runstate_boundary_markers(counter_markers, filtered, counter_machines)
         log(f"  Counter machines: {sorted(counter_machines)}")
-
-        log("── Step 3.2: Downtime ──")
-        downtimes = analyze_downtime(filtered)
-
-        log("── Step 3.3: Timeline ──")
-        timeline_data = build_timeline_data(filtered, period_from, period_to)
-        timeline_data = split_timeline_by_counter(timeline_data, counter_markers, period_from, period_to)
         log("  Timeline done")
     except Exception as e:
         log(f"✗ Analysis error: {e}")
         log(_tb.format_exc())
         sys.exit(1)
 
+    _mark("analyze")
+
+    prev_snap = load_snapshot() if LIVE_EVENTS else None
+    cur_snap  = {"period_from": period_from, "period_to": period_to, "cycles": cycles,
+                 "downtimes": downtimes, "timeline_data": timeline_data,
+                 "counter_markers": counter_markers}
+    save_snapshot(cur_snap)
+
     try:
         conn = init_db()
         save_to_db(conn, date_str, cycles, downtimes)
+        save_state_raster(conn, date_str, filtered)
+        if stream_states is not None:
+            save_stream_state(conn, date_str, stream_states)
+            if date_str == fetched["at"].strftime("%Y-%m-%d"):
+                save_day_rows(date_str, rows, mr_data, fetched["at"])
         log("History saved to DB")
+        if LIVE_EVENTS:
+            record_live_delta(conn, prev_snap, cur_snap)
         try:
-            finalize_yesterday(conn)
+            finalize_yesterday(conn, rows)
         except Exception as _ye:
             log(f"✗ Finalize yesterday error: {_ye}")
             log(_tb.format_exc())
@@ -3534,9 +6808,12 @@ def main():
         log(_tb.format_exc())
         sys.exit(1)
 
+    _mark("db")
+
     # Step 3.5 — load Excel target times
     log("── Step 3.5: Loading Excel target times ──")
     excel_targets = load_target_times()
+    _mark("targets")
 
     # Step 4 — report
     log("── Step 4: Generating report ──")
@@ -3549,21 +6826,106 @@ def main():
 
     conn.close()
 
-    with open(OUTPUT_HTML, "w", encoding="utf-8") as f:
-        f.write(html)
-    log(f"Report saved: {OUTPUT_HTML}")
+    save_report(html)
+    _mark("report")
 
     # Step 5 — publish to GitHub Pages
     log("── Step 5: Publishing to GitHub Pages ──")
     publish_to_github(html)
+    _mark("publish")
 
     # Step 6 — Telegram alert (раз на годину, контролюється маркер-файлом)
     log("── Step 6: Telegram alert check ──")
     check_and_alert(downtimes, period_to, cycles, excel_targets)
+    _mark("alerts")
+
+    log_flush()
+    ls = log_stats()
+    steps = ", ".join(f"{name} {t - t0:.1f}s"
+                      for (name, t), t0 in zip(profile, [t_run] + [t for _, t in profile]))
+    log(f"Run profile: {steps}; total {profile[-1][1] - t_run:.1f}s. "
+        f"Logging: {ls['lines']} lines ({ls['bytes'] / 1024:.0f} KB), {ls['call_sec'] * 1000:.0f} ms in log(), "
+        f"{ls['write_sec'] * 1000:.0f} ms in log-writer")
 
     log("=" * 60)
     log("FACTORY MONITOR COMPLETE")
     log("=" * 60)
 
+    # Step 7 — пропуски в історії добираються у фоні, коли звіт уже опублікований.
+    # Потік не daemon: процес завершиться, коли він закінчить (≤ GAP_HEAL_DAYS_PER_RUN діб).
+    # Лок звільняється вже тут — наступний запуск за розкладом не чекає на добір історії.
+    release_instance_lock()
+    if GAP_HEAL_DAYS_PER_RUN > 0:
+        threading.Thread(target=heal_history_gaps, name="gap-heal").start()
+
+def _cli(argv=None):
+    global LOG_LEVEL, LOG_JSON, PROFILE_STARTUP
+    import argparse
+    parser = argparse.ArgumentParser(description="Factory Machine Monitor")
+    parser.add_argument("--log-level", choices=list(_LOG_LEVELS), default=None,
+                        help=f"default: LOG_LEVEL ({LOG_LEVEL})")
+    parser.add_argument("--log-json", action="store_true", help="write the log file as JSON lines")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="log import/init timings up to the first WebAPI request")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("bench-analysis", help="serial vs process-pool Step 3 on synthetic machines")
+    p.add_argument("--machines", type=int, default=50)
+    p.add_argument("--workers",  type=int, default=None, help="default: os.cpu_count()")
+    p.add_argument("--hours",    type=int, default=HOURS_BACK)
+    p = sub.add_parser("bench-tti", help="time-to-interactive of index.html, lazy vs eager (headless browser)")
+    p.add_argument("--runs",    type=int, default=5)
+    p.add_argument("--port",    type=int, default=8730)
+    p.add_argument("--timeout", type=int, default=300, help="seconds to wait for the result")
+    p = sub.add_parser("backfill", help="re-fetch and re-analyze past days into history.db")
+    p.add_argument("--from", dest="date_from", required=True, metavar="YYYY-MM-DD")
+    p.add_argument("--to",   dest="date_to",   required=True, metavar="YYYY-MM-DD")
+    p.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    p.add_argument("--force", action="store_true", help="redo days already marked done")
+    p = sub.add_parser("serve-api", help="read-only JSON API over history.db")
+    p.add_argument("--host", default=API_SERVER_HOST)
+    p.add_argument("--port", type=int, default=API_SERVER_PORT)
+    p.add_argument("--pool", type=int, default=API_SERVER_POOL, help="read-only SQLite connections")
+    p = sub.add_parser("stub-api", help="local Connect Plan WebAPI stub for load/latency tests")
+    p.add_argument("--port",       type=int,   default=8710)
+    p.add_argument("--latency-ms", type=int,   default=0)
+    p.add_argument("--jitter-ms",  type=int,   default=0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="0..1, HTTP 500 or d.code != 0")
+    p.add_argument("--page-size",  type=int,   default=0, help="records per page (0 — no paging)")
+    p.add_argument("--step-sec",   type=int,   default=60, help="synthetic record interval")
+    p.add_argument("--pad-bytes",  type=int,   default=0, help="filler per record (payload size)")
+    p.add_argument("--data",       default=None, help="recorded responses JSON instead of synthetic")
+    p.add_argument("--seed",       type=int,   default=0)
+    p.add_argument("--machines",   type=int,   default=50)
+    p.add_argument("--write-machines", action="store_true",
+                   help="write MACHINES_FILE with --machines synthetic machines on this stub")
+    args = parser.parse_args(argv)
+    _startup_mark("cli")
+    PROFILE_STARTUP = PROFILE_STARTUP or args.profile_startup
+    # Через оточення — щоб і процеси пулу (spawn заново імпортує модуль) писали так само
+    if args.log_level:
+        LOG_LEVEL = os.environ["FACTORY_MONITOR_LOG_LEVEL"] = args.log_level
+    if args.log_json:
+        LOG_JSON = True
+        os.environ["FACTORY_MONITOR_LOG_JSON"] = "1"
+
+    if args.command == "bench-analysis":
+        bench_analysis(args.machines, args.workers, args.hours)
+    elif args.command == "bench-tti":
+        bench_tti(args.runs, args.port, args.timeout)
+    elif args.command == "stub-api":
+        if args.write_machines:
+            write_stub_machines(args.machines, args.port)
+        serve_stub_api(args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.page_size,
+                       args.step_sec, args.pad_bytes, args.data, args.seed)
+    elif args.command == "serve-api":
+        serve_api(args.host, args.port, args.pool)
+    elif args.command == "backfill":
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        backfill(args.date_from, args.date_to, args.workers, args.force)
+    else:
+        main()
+
+_startup_mark("module")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    _cli()
\ No newline at end of file
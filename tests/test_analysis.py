@@ -0,0 +1,55 @@
+"""Step 3: процесний аналіз по станках (analyze_all, workers > 1) дає той самий результат, що й серійний."""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("FACTORY_MONITOR_DIR", tempfile.mkdtemp(prefix="fm_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory_monitor as fm  # noqa: E402
+
+
+def synthetic_day(machines=6, seed=4, hours=20):
+    day = datetime(2026, 9, 3)
+    ops, mrs = fm._synthetic_records(list(range(1001, 1001 + machines)), day, day + timedelta(hours=hours),
+                                     seed=seed)
+    name_of = lambda pid: f"S{pid}_SYNTH"
+    rows = fm._parse_operation_records(ops, "bench", name_of)
+    mr   = fm._parse_machining_records(mrs, "bench", name_of)
+    return rows, mr, day, rows[-1]["_ts"]
+
+
+class AnalyzeAllTest(unittest.TestCase):
+    def test_shard_roundtrip_matches_serial(self):
+        # Рядки в шарді — кортежі _ROW_FIELDS; після розпакування воркер має мати все,
+        # що читають машини станів (зокрема _mask для downtime_reason)
+        rows, mr, p_from, p_to = synthetic_day()
+        for mname in sorted({r["MachineName"] for r in rows}):
+            m_rows = [r for r in rows if r["MachineName"] == mname]
+            m_mr   = [r for r in mr if r["MachineName"] == mname]
+            shard = (mname, [tuple(r.get(k) for k in fm._ROW_FIELDS) for r in m_rows],
+                     [tuple(r.get(k) for k in fm._MR_FIELDS) for r in m_mr], p_from, p_to, None)
+            got, _state = fm._analyze_shard(shard)
+            self.assertEqual(got, fm._analyze_rows(m_rows, m_mr, p_from, p_to))
+
+    def test_pool_matches_serial(self):
+        rows, mr, p_from, p_to = synthetic_day()
+        serial = fm.analyze_all(rows, mr, p_from, p_to, workers=1)
+        self.assertEqual(fm.analyze_all(rows, mr, p_from, p_to, workers=2, strict=True), serial)
+
+    def test_pool_with_states_matches_serial(self):
+        rows, mr, p_from, p_to = synthetic_day()
+        serial = fm.analyze_all(rows, mr, p_from, p_to, workers=1)
+        cut = p_from + timedelta(hours=11)
+        states = {}
+        part = [r for r in rows if r["_ts"] < cut]
+        fm.analyze_all(part, [m for m in mr if m["_ts"] < cut], p_from, part[-1]["_ts"],
+                       workers=2, states=states, strict=True)
+        states = fm._load_stream_json(fm._dump_stream_json(states))
+        self.assertEqual(fm.analyze_all(rows, mr, p_from, p_to, workers=2, states=states, strict=True), serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""hourly_stats через bucket_intervals (numpy і чистий Python) ≡ старе погодинне _spread."""
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta
+from unittest import mock
+
+os.environ.setdefault("FACTORY_MONITOR_DIR", tempfile.mkdtemp(prefix="fm_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory_monitor as fm  # noqa: E402
+
+DAY = datetime(2026, 9, 3)
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def synthetic_events(seed, machines=4):
+    """Цикли й простої в межах доби DAY, з секундами і межами точно на годинах."""
+    rnd = random.Random(seed)
+    cycles, downtimes = {}, {}
+    for k in range(machines):
+        mname = f"S{1001 + k}_SYNTH"
+        c_list, d_list = [], []
+        t = DAY + timedelta(seconds=rnd.randrange(0, 3 * 3600))
+        while True:
+            if rnd.random() < 0.2:
+                length = timedelta(hours=rnd.randrange(1, 3))          # ціла кількість годин
+                t = t.replace(minute=0, second=0)
+            else:
+                length = timedelta(seconds=rnd.randrange(30, 3 * 3600))
+            end = t + length
+            if end >= DAY + timedelta(days=1):
+                break
+            ev = {"start": t, "end": end, "duration": round(length.total_seconds() / 60, 2)}
+            if rnd.random() < 0.6:
+                c_list.append(dict(ev, program="WF080-920-2"))
+            else:
+                d_list.append(dict(ev, reason="Waiting"))
+            t = end + timedelta(seconds=rnd.choice((0, 0, 17, 300, 3600)))
+        cycles[mname] = c_list
+        run = sum(c["duration"] for c in c_list)
+        down = sum(d["duration"] for d in d_list)
+        downtimes[mname] = {"downtimes": d_list, "total_run": run, "total_down": down,
+                            "total_min": run + down}
+    return cycles, downtimes
+
+
+def spread_reference(cycles, downtimes):
+    """Погодинний розподіл до bucket_intervals (_spread з save_to_db), округлений як у БД."""
+    hr_run = defaultdict(lambda: defaultdict(float))
+    hr_total = defaultdict(lambda: defaultdict(float))
+
+    def _spread(mname, start_dt, end_dt, is_run):
+        cur = start_dt
+        while cur < end_dt:
+            hr_end = cur.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            seg_min = (min(end_dt, hr_end) - cur).total_seconds() / 60
+            if is_run:
+                hr_run[mname][cur.hour] += seg_min
+            hr_total[mname][cur.hour] += seg_min
+            cur = hr_end
+
+    for mname, c_list in cycles.items():
+        for c in c_list:
+            if c.get("start") and c.get("duration"):
+                _spread(mname, c["start"], c.get("end") or c["start"] + timedelta(minutes=c["duration"]), True)
+    for mname, d_data in downtimes.items():
+        for d in d_data["downtimes"]:
+            if d.get("start") and d.get("duration"):
+                _spread(mname, d["start"], d.get("end") or d["start"] + timedelta(minutes=d["duration"]), False)
+    return {(mname, h): (round(hr_run[mname].get(h, 0), 2), round(total, 2))
+            for mname, hours in hr_total.items() for h, total in hours.items()}
+
+
+class HourlyStatsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp(prefix="fm_test_db_")
+        patcher = mock.patch.object(fm, "DB_FILE", os.path.join(tmp, "history.db"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = fm.init_db()
+        self.addCleanup(self.conn.close)
+
+    def saved_hourly(self, cycles, downtimes):
+        date_str = DAY.strftime("%Y-%m-%d")
+        fm.save_to_db(self.conn, date_str, cycles, downtimes)
+        return {(m, h): (run, total) for m, h, run, total in self.conn.execute(
+            "SELECT machine, hour, run_min, total_min FROM hourly_stats WHERE date=?", (date_str,))}
+
+    def check_against_spread(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                cycles, downtimes = synthetic_events(seed)
+                got, want = self.saved_hourly(cycles, downtimes), spread_reference(cycles, downtimes)
+                self.assertEqual(sorted(got), sorted(want))
+                for key, (run, total) in want.items():
+                    self.assertAlmostEqual(got[key][0], run, delta=0.011, msg=key)
+                    self.assertAlmostEqual(got[key][1], total, delta=0.011, msg=key)
+
+    def test_pure_python_matches_spread(self):
+        with mock.patch.object(fm, "_numpy", lambda: None):
+            self.check_against_spread()
+
+    @unittest.skipUnless(HAS_NUMPY, "numpy не встановлено")
+    def test_numpy_matches_spread(self):
+        self.assertIsNotNone(fm._numpy())
+        self.check_against_spread()
+
+    def test_bucket_paths_agree(self):
+        rnd = random.Random(7)
+        starts = [rnd.uniform(-7200, 86400) for _ in range(300)]
+        ends = [s + rnd.choice((0, rnd.uniform(1, 3600), rnd.uniform(3600, 4 * 3600))) for s in starts]
+        with mock.patch.object(fm, "_numpy", lambda: None):
+            pure = fm.bucket_intervals(starts, ends)
+        self.assertAlmostEqual(sum(pure.values()), sum(e - s for s, e in zip(starts, ends)), places=3)
+        if HAS_NUMPY:
+            got = fm.bucket_intervals(starts, ends)
+            self.assertEqual(sorted(got), sorted(pure))
+            for b, sec in pure.items():
+                self.assertAlmostEqual(got[b], sec, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
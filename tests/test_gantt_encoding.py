@@ -0,0 +1,136 @@
+"""_encode_gantt ↔ decodeGantt: декодовані дані дають ту саму картину Batch Gantt.
+
+decodeGantt і групування сесій buildFromRange() перенесені з JS звіту дослівно.
+Еквівалентність — на рівні сесій: _encode_gantt заздалегідь зливає сусідні цикли
+однієї програми з розривом ≤ GANTT_SESSION_GAP_MIN, тож окремі цикли всередині
+сесії після декодування не відновлюються — лише сесії, які з них будує JS.
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+os.environ.setdefault("FACTORY_MONITOR_DIR", tempfile.mkdtemp(prefix="fm_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory_monitor as fm  # noqa: E402
+
+
+def _hm(v):
+    if v == 1440:
+        return "24:00"
+    v = v % 1440
+    return f"{v // 60:02d}:{v % 60:02d}"
+
+
+def decode_gantt(g):
+    """decodeGantt() з JS звіту."""
+    out, n = [], len(g["dd"])
+    if not n:
+        return out
+    day = date.fromisoformat(g["d0"])
+    s, pm = 0, -1
+    for i in range(n):
+        day += timedelta(days=g["dd"][i])
+        s = s + g["s"][i] if i > 0 and g["dd"][i] == 0 and g["m"][i] == pm else g["s"][i]
+        pm = g["m"][i]
+        out.append({"d": day.isoformat(), "m": g["M"][g["m"][i]], "p": g["P"][g["p"][i]],
+                    "s": _hm(s), "e": _hm(s + g["l"][i]), "dur": g["u"][i]})
+    return out
+
+
+def _min(t):
+    h, _, m = t.partition(":")
+    return int(h) * 60 + int(m or 0)
+
+
+def js_sessions(cycles, gap):
+    """Групування сесій з buildFromRange() (без фільтра дат і розкладки по колонках)."""
+    ordered = sorted(cycles, key=lambda c: (c["d"], c["m"], c["s"]))
+    sessions, sess_map = [], {}
+    for c in ordered:
+        key = (c["m"], c["d"], c["p"])
+        sess = sess_map.get(key)
+        if not sess and c["s"]:
+            prev = sess_map.get((c["m"], (date.fromisoformat(c["d"]) - timedelta(days=1)).isoformat(), c["p"]))
+            if prev:
+                if not prev["e"]:
+                    ok = _min(c["s"]) <= gap
+                else:
+                    ok = _min(c["s"]) + 1440 - _min(prev["e"]) <= gap
+                if ok:
+                    sess = sess_map[key] = prev
+        if sess and c["s"]:
+            if not sess["e"]:
+                extend = _min(c["s"]) - _min(sess["s"]) <= gap * 4
+            else:
+                extend = _min(c["s"]) - _min(sess["e"]) <= gap
+            if extend:
+                if c["e"] and (not sess["e_d"] or c["d"] > sess["e_d"]
+                               or (c["d"] == sess["e_d"] and c["e"] > sess["e"])):
+                    sess["e"], sess["e_d"] = c["e"], c["d"]
+                sess["dur"] += c["dur"] or 0
+                continue
+        ns = {"d": c["d"], "m": c["m"], "p": c["p"], "s": c["s"], "e": c["e"],
+              "dur": c["dur"] or 0, "e_d": c["d"]}
+        sessions.append(ns)
+        sess_map[key] = ns
+    return sessions
+
+
+def make_rows(seed, days=6):
+    """Рядки як у generate_html: (дата, станок, програма, start_min, end_min, dur),
+    відсортовані за (дата, станок, start); цикли через північ обрізані до 24:00 / з 00:00."""
+    rnd = random.Random(seed)
+    rows, d0 = [], date(2026, 3, 28)            # через перехід на літній час
+    for k in range(days):
+        if rnd.random() < 0.2:
+            continue                             # день без циклів — dd > 1
+        d = (d0 + timedelta(days=k)).isoformat()
+        for mach in ("M1", "M7", "T3"):
+            t = 0 if rnd.random() < 0.3 else rnd.randrange(0, 300)
+            prog = rnd.choice(("WF861-100L-P2", "WF080-920-2", "WF330-903B"))
+            while t < 1440:
+                length = rnd.randrange(3, 120)
+                end = min(t + length, 1440)
+                rows.append((d, mach, prog, t, end, round((end - t) * rnd.uniform(0.7, 1.0), 2)))
+                t = end + rnd.choice((0, 1, 5, 20, 59, 60, 61, 90, 240))
+                if rnd.random() < 0.25:
+                    prog = rnd.choice(("WF861-100L-P2", "WF080-920-2", "WF330-903B"))
+    return rows
+
+
+def as_cycles(rows):
+    return [{"d": d, "m": m, "p": p, "s": _hm(s), "e": _hm(e), "dur": u} for d, m, p, s, e, u in rows]
+
+
+class EncodeGanttTest(unittest.TestCase):
+    def assertSessionsEqual(self, got, want):
+        self.assertEqual(len(got), len(want))
+        for a, b in zip(got, want):
+            self.assertEqual({k: v for k, v in a.items() if k != "dur"},
+                             {k: v for k, v in b.items() if k != "dur"})
+            self.assertAlmostEqual(a["dur"], b["dur"], places=6)
+
+    def test_lossless_without_merge(self):
+        rows = make_rows(1)
+        self.assertEqual(decode_gantt(fm._encode_gantt(rows, session_gap=-1441)), as_cycles(rows))
+
+    def test_sessions_match_raw_cycles(self):
+        gap = fm.GANTT_SESSION_GAP_MIN
+        for seed in range(40):
+            with self.subTest(seed=seed):
+                rows = make_rows(seed)
+                packed = fm._encode_gantt(rows)
+                self.assertLessEqual(len(packed["dd"]), len(rows))
+                self.assertSessionsEqual(js_sessions(decode_gantt(packed), gap),
+                                         js_sessions(as_cycles(rows), gap))
+
+    def test_empty(self):
+        self.assertEqual(decode_gantt(fm._encode_gantt([])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
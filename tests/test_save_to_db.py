@@ -0,0 +1,115 @@
+"""save_to_db для подій через північ: обрізка 00:00 / 24:00 у списках і хвилини hourly_stats по добах."""
+import os
+import sys
+import tempfile
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta
+from unittest import mock
+
+os.environ.setdefault("FACTORY_MONITOR_DIR", tempfile.mkdtemp(prefix="fm_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory_monitor as fm  # noqa: E402
+
+DAY1 = datetime(2026, 10, 18)
+DAY2 = DAY1 + timedelta(days=1)
+
+
+def hourly_run(cycles, day0):
+    """Хвилини роботи по годинах доби day0 — лише перетин циклів з добою."""
+    out = defaultdict(float)
+    for mname, c_list in cycles.items():
+        for c in c_list:
+            c_end = c.get("end") or c["start"] + timedelta(minutes=c["duration"])
+            cur, end = max(c["start"], day0), min(c_end, day0 + timedelta(days=1))
+            while cur < end:
+                hr_end = cur.replace(minute=0, second=0) + timedelta(hours=1)
+                out[(mname, cur.hour)] += (min(end, hr_end) - cur).total_seconds() / 60
+                cur = hr_end
+    return out
+
+
+class CrossMidnightTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp(prefix="fm_test_db_")
+        patcher = mock.patch.object(fm, "DB_FILE", os.path.join(tmp, "history.db"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = fm.init_db()
+        self.addCleanup(self.conn.close)
+
+    def rows_for(self, table, day):
+        return self.conn.execute(
+            f"SELECT machine, start_time, end_time FROM {table} WHERE date=? ORDER BY machine, start_time",
+            (day.strftime("%Y-%m-%d"),)).fetchall()
+
+    def hourly_for(self, day):
+        return {(m, h): (run, total) for m, h, run, total in self.conn.execute(
+            "SELECT machine, hour, run_min, total_min FROM hourly_stats WHERE date=?",
+            (day.strftime("%Y-%m-%d"),))}
+
+    def test_event_saved_for_both_days(self):
+        # Кожна доба отримує події, що її перетинають (як з analyze_day): цикл M1 і простій M2
+        # тривають через північ і є в обох
+        cycle = {"start": DAY2 - timedelta(minutes=14), "end": DAY2 + timedelta(minutes=10),
+                 "duration": 24, "program": "WF080-920-2"}
+        down = {"start": DAY2 - timedelta(minutes=30), "end": DAY2 + timedelta(minutes=20),
+                "duration": 50, "reason": "Waiting"}
+        before = {"start": DAY2 - timedelta(minutes=60), "end": DAY2 - timedelta(minutes=14),
+                  "duration": 46, "reason": "Waiting"}
+        after = {"start": DAY2 + timedelta(minutes=10), "end": DAY2 + timedelta(minutes=95),
+                 "duration": 85, "reason": "Waiting"}
+        per_day = {DAY1: ({"M1": [cycle], "M2": []}, {"M1": [before], "M2": [down]}),
+                   DAY2: ({"M1": [cycle], "M2": []}, {"M1": [after], "M2": [down]})}
+        for day, (cycles, downs) in per_day.items():
+            downtimes = {m: {"downtimes": d_list, "total_run": 0, "total_down": 0, "total_min": 0}
+                         for m, d_list in downs.items()}
+            fm.save_to_db(self.conn, day.strftime("%Y-%m-%d"), cycles, downtimes)
+
+        self.assertEqual(self.rows_for("cycle_events", DAY1), [("M1", "23:46", "24:00")])
+        self.assertEqual(self.rows_for("cycle_events", DAY2), [("M1", "00:00", "00:10")])
+        self.assertEqual(self.rows_for("downtime_events", DAY1),
+                         [("M1", "23:00", "23:46"), ("M2", "23:30", "24:00")])
+        self.assertEqual(self.rows_for("downtime_events", DAY2),
+                         [("M1", "00:10", "01:35"), ("M2", "00:00", "00:20")])
+        # hourly_stats — лише перетин з добою: 14 хв роботи о 23:00 доби 1, 10 хв о 00:00 доби 2
+        self.assertEqual(self.hourly_for(DAY1), {("M1", 23): (14.0, 60.0), ("M2", 23): (0.0, 30.0)})
+        self.assertEqual(self.hourly_for(DAY2), {("M1", 0): (10.0, 60.0), ("M1", 1): (0.0, 35.0),
+                                                 ("M2", 0): (0.0, 20.0)})
+
+    def test_look_back_attribution(self):
+        # Дві доби синтетичних рядків; кожна зберігається з запасами сусідньої (_save_day)
+        ops, _mrs = fm._synthetic_records(list(range(1001, 1005)), DAY1 - timedelta(hours=1),
+                                          DAY2 + timedelta(days=1, hours=1), seed=3)
+        rows = fm._parse_operation_records(ops, "bench", lambda pid: f"S{pid}_SYNTH")
+        full = fm.analyze_cycles(rows)
+        crossing = [(m, c) for m, c_list in full.items() for c in c_list
+                    if c["start"] < DAY2 < c["end"]]
+        self.assertTrue(crossing)
+
+        day1_rows = [r for r in rows if DAY1 <= r["_ts"] < DAY2]
+        day2_rows = [r for r in rows if DAY2 <= r["_ts"] < DAY2 + timedelta(days=1)]
+        fm._save_day(self.conn, DAY1.strftime("%Y-%m-%d"), day1_rows,
+                     [r for r in rows if r["_ts"] < DAY1], day2_rows)
+        fm._save_day(self.conn, DAY2.strftime("%Y-%m-%d"), day2_rows,
+                     day1_rows, [r for r in rows if r["_ts"] >= DAY2 + timedelta(days=1)])
+
+        day1, day2 = self.rows_for("cycle_events", DAY1), self.rows_for("cycle_events", DAY2)
+        for mname, c in crossing:
+            with self.subTest(machine=mname):
+                self.assertIn((mname, c["start"].strftime("%H:%M"), "24:00"), day1)
+                self.assertIn((mname, "00:00", c["end"].strftime("%H:%M")), day2)
+
+        for day in (DAY1, DAY2):
+            want = hourly_run(full, day)
+            got = self.hourly_for(day)
+            with self.subTest(day=day.date()):
+                self.assertEqual({k for k, v in want.items() if v > 0},
+                                 {k for k, (run, _total) in got.items() if run > 0})
+                for key, run in want.items():
+                    self.assertAlmostEqual(got[key][0], run, delta=0.011, msg=key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Потокові машини станів (stream_analyze + чекпоінт stream_state) ≡ пакетний аналіз усієї доби."""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("FACTORY_MONITOR_DIR", tempfile.mkdtemp(prefix="fm_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import factory_monitor as fm  # noqa: E402
+
+
+def synthetic_rows(day, seed, step_sec):
+    """Доба синтетичних рядків з випадковими прапорцями простою і повторами Date."""
+    rnd = random.Random(seed)
+    ops, mrs = fm._synthetic_records(list(range(1001, 1007)), day - timedelta(hours=1),
+                                     day + timedelta(days=1, minutes=40), seed=seed, step_sec=step_sec)
+    for o in ops:
+        for k in ("PowerOn", "AlarmState", "SetUp", "NoOperator", "Wait", "FeedHoldState"):
+            if rnd.random() < 0.05:
+                o[k] = rnd.choice([0, 1])
+    for i in range(97, len(ops), 97):
+        ops[i]["Date"] = ops[i - 1]["Date"]           # кілька рядків з однаковим Date
+    ops.sort(key=lambda r: r["Date"])
+    name_of = lambda pid: f"S{pid}_SYNTH"
+    return (fm._parse_operation_records(ops, "bench", name_of),
+            fm._parse_machining_records(mrs, "bench", name_of))
+
+
+def checkpoint(states):
+    return fm._load_stream_json(fm._dump_stream_json(states))
+
+
+class StreamAnalyzeTest(unittest.TestCase):
+    def test_chunks_with_checkpoint_match_batch(self):
+        rnd = random.Random(1)
+        for k in range(12):
+            day = datetime(2026, 9, 1) + timedelta(days=k)
+            with self.subTest(day=day.date()):
+                rows, _mr = synthetic_rows(day, k, rnd.choice([20, 30, 60]))
+                batch_c, batch_d = fm.analyze_cycles(rows), fm.analyze_downtime(rows)
+                states, prev = {}, 0
+                for cut in sorted(rnd.sample(range(len(rows)), 6)) + [len(rows)]:
+                    # Наступний фетч частково повторює попередній (перекриття від межі Date)
+                    start = max(0, prev - rnd.randint(0, 30))
+                    while start > 0 and rows[start - 1]["Date"] == rows[start]["Date"]:
+                        start -= 1
+                    cycles, downtimes, _nc, _nd = fm.stream_analyze(states, rows[start:cut])
+                    states = checkpoint(states)
+                    prev = cut
+                self.assertEqual(cycles, batch_c)
+                self.assertEqual(downtimes, batch_d)
+
+    def test_late_rows_fall_back_to_batch(self):
+        day = datetime(2026, 9, 3)
+        rows, mr = synthetic_rows(day, 4, 30)
+        period = [r for r in rows if r["_ts"] >= day]
+        p_to = period[-1]["_ts"]
+        ref = fm.analyze_all(rows, mr, day, p_to, workers=1)
+        cut = day + timedelta(hours=11)
+        late_m = period[0]["MachineName"]
+        # Рядки одного станку 10:40–10:55 доходять лише до наступного запуску
+        first = [r for r in rows if r["_ts"] < cut
+                 and not (r["MachineName"] == late_m and cut - timedelta(minutes=20) <= r["_ts"]
+                          < cut - timedelta(minutes=5))]
+        states = {}
+        fm.analyze_all(first, [m for m in mr if m["_ts"] < cut], day, first[-1]["_ts"],
+                       workers=1, states=states)
+        states = checkpoint(states)
+        self.assertEqual(fm.analyze_all(rows, mr, day, p_to, workers=1, states=states), ref)
+
+
+if __name__ == "__main__":
+    unittest.main()